@@ -0,0 +1,152 @@
+"""Size and load time of the stored chunks of a document by format.
+
+Builds synthetic chunk records like those of `DocumentHandler` (constant metadata, texts of about `--text-chars`
+characters and embeddings of `--dimension` floats) and writes them:
+    - pickle: a DataFrame of float64 embedding lists, the former format.
+    - parquet and arrow: the streamed formats of `ChunkStore`, with float32 embeddings.
+
+For each format the benchmark prints the object size, the write time, and the time to load the chunks and get their
+embeddings as a float32 matrix, from a local file as a reader would after downloading it.
+
+Usage:
+    python benchmarks/bench_chunk_storage.py
+    python benchmarks/bench_chunk_storage.py --chunks 20000 --dimension 3072
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.skills_backend.document_qa.chunk_store import ChunkStore, embedding_matrix, read_chunks  # noqa: E402
+
+
+class LocalS3:
+    """Writes the uploaded objects to a local directory."""
+
+    def __init__(self, directory: str):
+        """Write the objects under `directory`."""
+        self.directory = directory
+        self.parts: Dict[str, List[bytes]] = {}
+
+    def path(self, key: str) -> str:
+        """Return the local path of an object."""
+        return os.path.join(self.directory, os.path.basename(key))
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes) -> None:
+        """Write an object."""
+        with open(self.path(Key), "wb") as file:
+            file.write(Body)
+
+    def upload_fileobj(self, fileobj: Any, bucket: str, key: str) -> None:
+        """Write an object from a file object."""
+        self.put_object(bucket, key, fileobj.read())
+
+    def create_multipart_upload(self, Bucket: str, Key: str) -> Dict[str, str]:
+        """Start a multipart upload."""
+        self.parts[Key] = []
+        return {"UploadId": Key}
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: bytes) -> Dict[str, str]:
+        """Keep a part."""
+        self.parts[UploadId].append(Body)
+        return {"ETag": str(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: dict) -> None:
+        """Write the object from its parts."""
+        self.put_object(Bucket, Key, b"".join(self.parts.pop(UploadId)))
+
+
+def records(chunks: int, dimension: int, text_chars: int) -> List[Dict[str, Any]]:
+    """Build chunk records with random embeddings."""
+    rng = np.random.default_rng(0)
+    words = "the return is due by the fifteenth day of the fourth month after the end of the tax year ".split()
+    result = []
+    for _ in range(chunks):
+        text = " ".join(rng.choice(words, size=text_chars // 5))[:text_chars]
+        result.append(
+            {
+                "Product": "user_upload",
+                "Content": "",
+                "root_link": "",
+                "url": "",
+                "Source": "user_upload",
+                "clean_path": "",
+                "content_type": "pdf",
+                "published_date": "",
+                "file_name": "annual_report.pdf",
+                "raw_text": text,
+                "title": "",
+                "description": "",
+                "chunk_id": str(uuid.uuid4()),
+                "open_ai_embeddings": rng.standard_normal(dimension).tolist(),
+            }
+        )
+    return result
+
+
+def timed(function: Callable[[], Any], repeat: int) -> float:
+    """Return the best time of `repeat` calls, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def load_pickle(path: str) -> np.ndarray:
+    """Load a pickled DataFrame and stack its embeddings, as its readers do."""
+    return np.asarray(pd.read_pickle(path)["open_ai_embeddings"].tolist(), dtype=np.float32)
+
+
+def bench(storage_format: str, s3: LocalS3, chunk_records: List[Dict[str, Any]], batch_size: int, repeat: int) -> None:
+    """Write and load the chunks in a format and print the results."""
+    store = ChunkStore(s3, "bucket", storage_format=storage_format)
+    path = s3.path(store.key("tenant", "user", "doc", storage_format))
+
+    def write() -> None:
+        writer = store.open("tenant", "user", "doc", storage_format)
+        for start in range(0, len(chunk_records), batch_size):
+            writer.write(chunk_records[start : start + batch_size])
+        writer.close()
+
+    if storage_format == "pickle":
+        # The former format, float64 embedding lists in a DataFrame
+        write_ms = timed(lambda: pd.DataFrame(chunk_records).to_pickle(path), repeat)
+        load_ms = timed(lambda: load_pickle(path), repeat)
+    else:
+        write_ms = timed(write, repeat)
+        load_ms = timed(lambda: embedding_matrix(read_chunks(path)), repeat)
+    size_mb = os.path.getsize(path) / 1024 / 1024
+    print(f"  {storage_format:8} {size_mb:8.1f} MB   write {write_ms:9.1f} ms   load {load_ms:9.1f} ms")
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000, help="Number of chunks of the document.")
+    parser.add_argument("--dimension", type=int, default=1536, help="Dimension of the embeddings.")
+    parser.add_argument("--text-chars", type=int, default=2000, help="Length of the chunk texts.")
+    parser.add_argument("--batch-size", type=int, default=64, help="Chunks per written batch.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each measure, the best is kept.")
+    args = parser.parse_args()
+
+    chunk_records = records(args.chunks, args.dimension, args.text_chars)
+    print(f"{args.chunks} chunks, dimension {args.dimension}, texts of {args.text_chars} characters")
+    with tempfile.TemporaryDirectory() as directory:
+        s3 = LocalS3(directory)
+        for storage_format in ("pickle", "parquet", "arrow"):
+            bench(storage_format, s3, chunk_records, args.batch_size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
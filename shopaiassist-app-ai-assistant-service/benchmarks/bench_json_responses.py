@@ -0,0 +1,105 @@
+"""Serialization benchmarks for the largest JSON responses of the API.
+
+Compares, for a long chat history (`GET /chat/{id}/messages`) and a long chat list (`GET /chat`):
+    - default: FastAPI's path before `FastJSONResponse`, the response model dumped to Python objects in JSON mode and
+      rendered by the standard JSONResponse.
+    - fast_dump: The same dump to Python objects, rendered by `FastJSONResponse` (routes returning plain data).
+    - fast_model: The models handed to `FastJSONResponse` directly (the chat list and history routes).
+
+Usage:
+    python benchmarks/bench_json_responses.py
+    python benchmarks/bench_json_responses.py --messages 400 --chats 1000 --repeat 200
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from typing import Any, Callable, Dict, List
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models import AIMessage, Chat, ChatMetadata, HumanMessage  # noqa: E402
+from src.responses import FastJSONResponse  # noqa: E402
+
+ANSWER = (
+    "## message\nTo resolve this issue open the settings page, select the affected entity and run the validation "
+    "again. If the error persists clear the cache and make sure the latest release is installed. " * 6
+    + "\n## retrieved_urls\n- [Troubleshooting guide](https://example.com/kb/troubleshooting)\n"
+    + "- [Release notes](https://example.com/kb/release-notes)\n\n## open_ticket"
+)
+
+
+def build_chat(messages: int) -> Dict[str, Chat]:
+    """Build a chat history response with `messages` question and answer pairs."""
+    history: List[Any] = []
+    for i in range(messages):
+        history.append(
+            HumanMessage(id=f"q-{i}", sent_time="2025-01-01T00:00:00Z", message="Why does my import fail? é")
+        )
+        history.append(
+            AIMessage(
+                id=f"a-{i}",
+                sent_time="2025-01-01T00:00:01Z",
+                message=ANSWER,
+                metadata={
+                    "retrieved_urls": [
+                        {"title": "Troubleshooting guide", "url": "https://example.com/kb/troubleshooting"},
+                        {"title": "Release notes", "url": "https://example.com/kb/release-notes"},
+                    ],
+                    "open_ticket": False,
+                },
+            )
+        )
+    return {"chat": Chat(id="chat", messages=history, name="Import failures", user_id="user")}
+
+
+def build_chats(chats: int) -> List[ChatMetadata]:
+    """Build a chat list response with `chats` chats."""
+    return [
+        ChatMetadata(
+            id=f"chat-{i}",
+            name=f"Chat about the validation error {i}",
+            createdAt="2025-01-01T00:00:00Z",
+            updatedAt="2025-01-02T00:00:00Z",
+            treeItemId=f"chat-{i}",
+            uid="user",
+        )
+        for i in range(chats)
+    ]
+
+
+def bench(name: str, content: Any, annotation: Any, repeat: int) -> None:
+    """Time the serialization paths of one response and print the results."""
+    adapter = TypeAdapter(annotation)
+    paths: Dict[str, Callable[[], bytes]] = {
+        "default": lambda: JSONResponse(adapter.dump_python(content, mode="json")).body,
+        "fast_dump": lambda: FastJSONResponse(adapter.dump_python(content, mode="json")).body,
+        "fast_model": lambda: FastJSONResponse(content).body,
+    }
+    size = len(paths["default"]())
+    print(f"{name} ({size / 1024:.0f} KiB)")
+    baseline = None
+    for path, render in paths.items():
+        seconds = min(timeit.repeat(render, number=repeat, repeat=5)) / repeat
+        baseline = baseline or seconds
+        print(f"  {path:<11} {seconds * 1000:8.3f} ms  x{baseline / seconds:.1f}")
+
+
+def main() -> None:
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200, help="Question and answer pairs in the chat history.")
+    parser.add_argument("--chats", type=int, default=500, help="Chats in the chat list.")
+    parser.add_argument("--repeat", type=int, default=100, help="Serializations per measurement.")
+    args = parser.parse_args()
+
+    bench("GET /chat/{id}/messages", build_chat(args.messages), Dict[str, Chat], args.repeat)
+    bench("GET /chat", build_chats(args.chats), List[ChatMetadata], args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Accuracy and speed of `TokenEstimator` against the real encoding.
+
+For each corpus the texts are cut into pieces of about `--piece-chars` characters, and for each piece the estimate and
+its bounds are compared with the exact token count:
+    - error: mean absolute relative error of the point estimate.
+    - upper/lower violations: pieces whose exact count is above the estimated upper bound or below the estimated lower
+      bound. Both must be 0, otherwise adjust the coefficients or margins of `TokenEstimator`.
+    - speed: time of the estimate and of the exact encoding for the whole corpus.
+    - decided: share of `is_within(piece, --budget)` checks answered without encoding once the encoding is
+      calibrated.
+
+When no corpus has a violation, the benchmark says so: add the encoding to `TokenEstimator.CALIBRATED_ENCODINGS` and
+record the corpora and the results in the commit. Until then `is_within` only trusts the byte count for that encoding.
+
+Without corpus files the benchmark uses built-in samples of chat answers, XML forms, tables of figures, non-English
+text, and base64 and hex lines, which the estimate undercounts and the upper bound must still cover. The encoding
+files must be available (downloaded or in TIKTOKEN_CACHE_DIR).
+
+Usage:
+    python benchmarks/bench_token_estimate.py
+    python benchmarks/bench_token_estimate.py --budget 512 manuals/*.txt forms/*.xml
+"""
+
+import argparse
+import base64
+import hashlib
+import os
+import sys
+import time
+from typing import Dict, List
+
+import tiktoken
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.count_tokens import TokenEstimator  # noqa: E402
+
+SAMPLES = {
+    "chat": (
+        "To resolve this issue open the settings page, select the affected entity and run the validation again. "
+        "If the error persists, clear the cache and make sure the latest release (v24.3.1) is installed.\n"
+        "- [Troubleshooting guide](https://example.com/kb/troubleshooting)\n"
+    ),
+    "xml": (
+        '<Form id="1040" year="2024">\n\t<Line number="1a">Total amount from Form(s) W-2, box 1</Line>\n'
+        '\t<Amount currency="USD">84,512.00</Amount>\n\t<Schedule ref="B" required="false"/>\n</Form>\n'
+    ),
+    "figures": "2024-12-31 | 1,284,993.17 | 0.0425 | 77 | -3,120.50 | ID-000187442\n",
+    "non_english": (
+        "Die Umsatzsteuer-Voranmeldung ist bis zum zehnten Tag nach Ablauf des Voranmeldungszeitraums abzugeben. "
+        "La déclaration doit être déposée avant la date limite. 申告書は期限までに提出してください。\n"
+    ),
+    # Attachments and digests, 76 characters per line as in MIME bodies
+    "base64": base64.encodebytes(hashlib.sha512(b"attachment").digest() * 6).decode(),
+    "hex": "".join(hashlib.sha256(str(i).encode()).hexdigest() + "\n" for i in range(4)),
+}
+
+
+def pieces(text: str, piece_chars: int) -> List[str]:
+    """Cut a text into pieces of about `piece_chars` characters, at line ends when possible."""
+    result, current = [], ""
+    for line in text.splitlines(keepends=True):
+        if current and len(current) + len(line) > piece_chars:
+            result.append(current)
+            current = ""
+        current += line
+    if current:
+        result.append(current)
+    return result
+
+
+def bench(name: str, texts: List[str], estimator: TokenEstimator, budget: int) -> int:
+    """Compare the estimates of the texts with their exact counts, print the results and return the violations."""
+    encoding = estimator.encoding
+    started = time.perf_counter()
+    exact = [len(encoding.encode_ordinary(text)) for text in texts]
+    encode_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    estimates = [estimator.estimate(text) for text in texts]
+    estimate_seconds = time.perf_counter() - started
+
+    error = sum(abs(e - x) / max(x, 1) for e, x in zip(estimates, exact)) / len(texts)
+    upper_violations = sum(x > estimator.estimated_upper_bound(text) for text, x in zip(texts, exact))
+    lower_violations = sum(x < estimator.estimated_lower_bound(text) for text, x in zip(texts, exact))
+
+    estimator.estimated_checks = estimator.exact_checks = 0
+    wrong = sum(estimator.is_within(text, budget) != (x <= budget) for text, x in zip(texts, exact))
+    decided = estimator.estimated_checks / len(texts)
+
+    print(f"{name} ({len(texts)} pieces, {sum(exact)} tokens)")
+    print(f"  error {error:6.1%}   upper violations {upper_violations}   lower violations {lower_violations}")
+    print(f"  estimate {estimate_seconds * 1000:8.2f} ms   encode {encode_seconds * 1000:8.2f} ms")
+    print(f"  is_within({budget}): {decided:.0%} decided without encoding, {wrong} wrong answers")
+    return upper_violations + lower_violations + wrong
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="*", help="Text files to measure, the built-in samples when omitted.")
+    parser.add_argument("--encoding", default="o200k_base", help="The tiktoken encoding.")
+    parser.add_argument("--piece-chars", type=int, default=4000, help="Approximate size of the measured pieces.")
+    parser.add_argument("--budget", type=int, default=1024, help="Token budget of the is_within checks.")
+    args = parser.parse_args()
+
+    # Measured as if calibrated, to see what the estimated bounds would decide
+    estimator = TokenEstimator(tiktoken.get_encoding(args.encoding), calibrated=True)
+    corpora: Dict[str, str] = {}
+    if args.corpus:
+        for path in args.corpus:
+            with open(path, encoding="utf-8", errors="replace") as file:
+                corpora[os.path.basename(path)] = file.read()
+    else:
+        corpora = {name: sample * 400 for name, sample in SAMPLES.items()}
+
+    violations = sum(
+        bench(name, pieces(text, args.piece_chars), estimator, args.budget) for name, text in corpora.items()
+    )
+    if violations:
+        print(f"{args.encoding}: {violations} violations, the estimated bounds must not be trusted for this encoding")
+    else:
+        print(f"{args.encoding}: no violations, it can be added to TokenEstimator.CALIBRATED_ENCODINGS")
+
+
+if __name__ == "__main__":
+    main()
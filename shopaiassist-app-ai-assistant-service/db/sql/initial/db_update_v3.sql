@@ -0,0 +1,2 @@
+ALTER TABLE ct_ai_assistantdb.tb_chat_messages
+    ADD COLUMN IF NOT EXISTS ai_response_markdown TEXT;
@@ -0,0 +1,3 @@
+ALTER TABLE ct_ai_assistantdb.tb_documents
+    ADD COLUMN IF NOT EXISTS status VARCHAR(20) DEFAULT 'ready' NOT NULL,
+    ADD COLUMN IF NOT EXISTS status_detail VARCHAR(500);
@@ -0,0 +1,31 @@
+#!/bin/sh
+# Create the AI assistant schema in the load test database.
+#
+# The production schema partitions its tables with pg_partman, which the stock Postgres image does not ship. The
+# partman calls are skipped here and every partitioned table gets a DEFAULT partition instead.
+set -e
+
+psql_exec() {
+    psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" "$@"
+}
+
+sed -e '/CREATE SCHEMA partman/d' \
+    -e '/CREATE EXTENSION IF NOT EXISTS pg_partman/d' \
+    -e '/SELECT partman.create_parent/,/);/d' \
+    /schema/initial.sql | psql_exec
+
+for update in $(ls /schema/db_update_v*.sql | sort -V); do
+    psql_exec -f "$update"
+done
+
+psql_exec <<'SQL'
+DO $$
+DECLARE
+    partitioned regclass;
+BEGIN
+    FOR partitioned IN SELECT partrelid::regclass FROM pg_partitioned_table LOOP
+        EXECUTE format('CREATE TABLE IF NOT EXISTS %s_default PARTITION OF %s DEFAULT', partitioned, partitioned);
+    END LOOP;
+END
+$$;
+SQL
@@ -0,0 +1,172 @@
+"""Load generator for the product support chat streams.
+
+Drives `POST /chat/{chat_id}/user-message` with N concurrent streams, each from its own user spread over a number
+of tenants, parses the SSE responses and reports time to first token, stream duration, throughput and error rates.
+
+Usage:
+    python loadtest/load_generator.py --concurrency 50 --requests 1000 --tenants 5
+    python loadtest/load_generator.py --concurrency 200 --duration 120 --output reports/loadtest.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+
+QUESTIONS = [
+    "How do I fix the validation error on my return?",
+    "Where can I download the latest release?",
+    "Why does the import of my trial balance fail?",
+    "How do I add a new entity to my workspace?",
+]
+
+
+@dataclass
+class StreamResult:
+    """Outcome of one user message stream."""
+
+    ok: bool = False
+    error: Optional[str] = None
+    ttft: Optional[float] = None
+    duration: float = 0.0
+    fragments: int = 0
+    bytes: int = 0
+
+
+@dataclass
+class LoadTestState:
+    """Shared state of the workers."""
+
+    remaining: Optional[int]
+    deadline: Optional[float]
+    results: List[StreamResult] = field(default_factory=list)
+
+    def take(self) -> bool:
+        """Claim the next request, or return False when the test is over."""
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return False
+        if self.remaining is not None:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+        return True
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)], 4)
+
+
+async def run_stream(client: httpx.AsyncClient, chat_id: str, question: str, debug_timings: bool) -> StreamResult:
+    """Send one user message and consume its SSE stream."""
+    result = StreamResult()
+    started = time.monotonic()
+    headers = {"X-Debug-Timings": "1"} if debug_timings else {}
+    body = {"allowed_skills": [], "chat_history": [], "user_message": {"message": question, "message_type": "text"}}
+    try:
+        async with client.stream("POST", f"/chat/{chat_id}/user-message", json=body, headers=headers) as response:
+            if response.status_code != 200:
+                result.error = f"http_{response.status_code}"
+                return result
+            async for line in response.aiter_lines():
+                result.bytes += len(line) + 1
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:].strip())
+                message_type = event.get("message_type")
+                if message_type == "fragment":
+                    result.fragments += 1
+                    if result.ttft is None:
+                        result.ttft = time.monotonic() - started
+                elif message_type == "status" and event.get("status") == "rejected":
+                    result.error = "rejected"
+                elif "something went wrong" in event.get("message", "") and result.fragments == 0:
+                    result.error = "upstream_error"
+        result.ok = result.error is None and result.fragments > 0
+        if result.error is None and not result.ok:
+            result.error = "empty_answer"
+    except httpx.HTTPError as e:
+        result.error = type(e).__name__
+    finally:
+        result.duration = time.monotonic() - started
+    return result
+
+
+async def worker(worker_id: int, args: argparse.Namespace, state: LoadTestState) -> None:
+    """Create a chat for a user of one of the tenants and send messages until the test is over."""
+    token = f"tenant-{worker_id % args.tenants}.user-{worker_id}"
+    async with httpx.AsyncClient(
+        base_url=args.base_url, cookies={"UDSLongToken": token}, timeout=args.timeout
+    ) as client:
+        response = await client.post("/chat")
+        response.raise_for_status()
+        chat_id = response.json()["id"]
+        question_index = worker_id
+        while state.take():
+            question = QUESTIONS[question_index % len(QUESTIONS)]
+            question_index += 1
+            state.results.append(await run_stream(client, chat_id, question, args.debug_timings))
+
+
+def summarize(results: List[StreamResult], elapsed: float) -> Dict:
+    """Build the report of a load test."""
+    ok = [r for r in results if r.ok]
+    ttfts = [r.ttft for r in ok if r.ttft is not None]
+    durations = [r.duration for r in ok]
+    errors = Counter(r.error for r in results if r.error)
+    return {
+        "streams": len(results),
+        "succeeded": len(ok),
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else None,
+        "errors": dict(errors),
+        "elapsed_seconds": round(elapsed, 2),
+        "streams_per_second": round(len(ok) / elapsed, 2) if elapsed else None,
+        "fragments_per_second": round(sum(r.fragments for r in ok) / elapsed, 1) if elapsed else None,
+        "bytes_per_second": round(sum(r.bytes for r in ok) / elapsed, 1) if elapsed else None,
+        "ttft": {"p50": _percentile(ttfts, 50), "p90": _percentile(ttfts, 90), "p99": _percentile(ttfts, 99)},
+        "duration": {
+            "p50": _percentile(durations, 50),
+            "p90": _percentile(durations, 90),
+            "p99": _percentile(durations, 99),
+        },
+    }
+
+
+async def main(args: argparse.Namespace) -> Dict:
+    """Run the load test and return its report."""
+    deadline = time.monotonic() + args.duration if args.duration else None
+    state = LoadTestState(remaining=None if args.duration else args.requests, deadline=deadline)
+    started = time.monotonic()
+    await asyncio.gather(*(worker(i, args, state) for i in range(args.concurrency)))
+    return summarize(state.results, time.monotonic() - started)
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8080/assisvc", help="Service base URL.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Number of concurrent streams.")
+    parser.add_argument("--requests", type=int, default=100, help="Total number of user messages to send.")
+    parser.add_argument("--duration", type=float, default=None, help="Run for this many seconds instead.")
+    parser.add_argument("--tenants", type=int, default=1, help="Number of tenants the users are spread over.")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds.")
+    parser.add_argument("--debug-timings", action="store_true", help="Request the per-phase timings event.")
+    parser.add_argument("--output", default=None, help="Write the JSON report to this file.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    report = asyncio.run(main(arguments))
+    print(json.dumps(report, indent=2))
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(report, file, indent=2)
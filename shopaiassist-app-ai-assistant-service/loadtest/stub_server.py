@@ -0,0 +1,140 @@
+"""Stand-in for the product support ML API and the authentication services, for local load tests.
+
+The stub emulates the NDJSON stream of `/entry_router` (reformulated query, message fragments at a configurable
+token rate, retrieved URLs and open ticket control chunks) and can inject errors, slow first bytes and streams cut
+mid-answer. It also answers the UDS long token lookup and the client-credentials bearer token request, so the
+service runs end to end without any external dependency.
+
+Behaviour is configured with environment variables at startup and can be changed at runtime with
+`POST /stub/config`:
+    STUB_TOKENS_PER_SECOND: Token generation rate of each stream (default 50, 0 for no delay).
+    STUB_ANSWER_TOKENS: Number of tokens per answer (default 300).
+    STUB_CHUNK_TOKENS: Tokens per message fragment (default 5).
+    STUB_FIRST_BYTE_DELAY: Seconds before the first chunk (default 0.5).
+    STUB_ERROR_RATE: Fraction of requests answered with HTTP 500 (default 0).
+    STUB_DISCONNECT_RATE: Fraction of streams cut before the end (default 0).
+    STUB_TICKET_RATE: Fraction of answers that propose to open a ticket (default 0.1).
+
+Usage:
+    uvicorn --app-dir=. loadtest.stub_server:app --port 9000
+"""
+
+import asyncio
+import json
+import os
+import random
+from typing import AsyncIterator, Dict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "To resolve this issue open the settings page select the affected entity and run the validation again "
+    "If the error persists clear the cache and make sure the latest release is installed"
+).split()
+
+settings: Dict[str, float] = {
+    "tokens_per_second": float(os.getenv("STUB_TOKENS_PER_SECOND", "50")),
+    "answer_tokens": int(os.getenv("STUB_ANSWER_TOKENS", "300")),
+    "chunk_tokens": int(os.getenv("STUB_CHUNK_TOKENS", "5")),
+    "first_byte_delay": float(os.getenv("STUB_FIRST_BYTE_DELAY", "0.5")),
+    "error_rate": float(os.getenv("STUB_ERROR_RATE", "0")),
+    "disconnect_rate": float(os.getenv("STUB_DISCONNECT_RATE", "0")),
+    "ticket_rate": float(os.getenv("STUB_TICKET_RATE", "0.1")),
+}
+
+app = FastAPI(title="Product support ML API stub")
+
+
+def _line(chunk: dict) -> bytes:
+    return (json.dumps(chunk) + "\n").encode("utf-8")
+
+
+async def _answer_stream(query: str) -> AsyncIterator[bytes]:
+    """Yield the NDJSON chunks of one answer."""
+    await asyncio.sleep(settings["first_byte_delay"])
+    yield _line({"reformulated_query": query.strip().rstrip("?")})
+
+    answer_tokens = int(settings["answer_tokens"])
+    chunk_tokens = max(int(settings["chunk_tokens"]), 1)
+    delay = chunk_tokens / settings["tokens_per_second"] if settings["tokens_per_second"] > 0 else 0
+    cut_at = random.randrange(answer_tokens) if random.random() < settings["disconnect_rate"] else None
+    for start in range(0, answer_tokens, chunk_tokens):
+        if cut_at is not None and start >= cut_at:
+            # Abort the connection without finishing the chunked response
+            raise ConnectionAbortedError("Injected disconnect")
+        words = [WORDS[i % len(WORDS)] for i in range(start, min(start + chunk_tokens, answer_tokens))]
+        yield _line({"message": " ".join(words) + " "})
+        if delay:
+            await asyncio.sleep(delay)
+
+    yield _line(
+        {
+            "retrieved_urls": [
+                {"title": "Troubleshooting guide", "url": "https://example.com/kb/troubleshooting"},
+                {"title": "Release notes", "url": "https://example.com/kb/release-notes"},
+            ]
+        }
+    )
+    if random.random() < settings["ticket_rate"]:
+        yield _line(
+            {
+                "open_ticket": True,
+                "ticket_subject": "Validation keeps failing",
+                "ticket_description": query,
+                "ticket_product": "Load Test Product",
+            }
+        )
+    else:
+        yield _line({"open_ticket": False})
+
+
+@app.post("/entry_router")
+async def entry_router(request: Request):
+    """Emulate the product support entry router NDJSON stream."""
+    data = await request.json()
+    if random.random() < settings["error_rate"]:
+        return JSONResponse(status_code=500, content={"detail": "Injected error"})
+    return StreamingResponse(_answer_stream(data.get("query", "")), media_type="application/x-ndjson")
+
+
+@app.get("/auth/{uds_long_token}")
+async def uds_auth(uds_long_token: str):
+    """Emulate the UDS long token lookup.
+
+    Tokens of the form `<tenant>.<user>` are mapped to that tenant and user, so that load generators can spread the
+    load over several tenants.
+    """
+    tenant, _, user = uds_long_token.partition(".")
+    x500 = f"uid={user or tenant}, o=SHOPAIASSIST, ou={tenant}"
+    return {
+        "Status": "Authenticated",
+        "FullName": f"Load Test {user}",
+        "FirstName": "Load",
+        "LastName": "Test",
+        "EmailAddress": f"{user or tenant}@loadtest.local",
+        "SHOPAIASSISTUserX500": x500,
+        "UserX500": x500,
+    }
+
+
+@app.post("/jwt")
+async def bearer_token():
+    """Emulate the client-credentials bearer token endpoint."""
+    return {"access_token": "loadtest-token", "expires_in": 3600}
+
+
+@app.get("/stub/config")
+async def get_config():
+    """Return the current stub behaviour."""
+    return settings
+
+
+@app.post("/stub/config")
+async def update_config(request: Request):
+    """Change the stub behaviour, e.g. to inject errors in the middle of a load test."""
+    updates = await request.json()
+    for key, value in updates.items():
+        if key in settings:
+            settings[key] = type(settings[key])(value)
+    return settings
@@ -9,8 +9,23 @@ The tokenization process is managed through the `tiktoken` library, specifically
 is useful for applications that need to estimate or manage the token usage, such as in natural language processing
 tasks where token limits are imposed by APIs.
 
+Counting runs before every chat completion, mostly on the same system prompts and tool descriptions. The counts of
+texts up to `cache_max_chars` are kept in an LRU keyed by the hash of the text, the other texts are encoded in one
+batch, and inputs larger than `offload_min_chars` are counted in a worker thread so that a long history does not block
+the event loop.
+
+Many callers only need to know whether a text fits a budget. `TokenEstimator` estimates token counts from byte class
+counts (spaces, ASCII letters, digits, symbols, non-ASCII bytes, line breaks). The estimate is a heuristic: its
+coefficients are fitted on text made of words, and runs without whitespace of at least `LONG_RUN_BYTES` bytes (base64,
+hex, URLs) count for their byte length. The only bound that holds for every BPE encoding is the UTF-8 byte count, so
+`is_within` answers without encoding when the byte count fits the budget, and otherwise encodes the text. The estimated
+bounds also decide `is_within` only for the encodings in `CALIBRATED_ENCODINGS`, those for which
+`benchmarks/bench_token_estimate.py` reported no bound violation; the benchmark must be rerun per encoding and when the
+coefficients change. The rate limit accounting uses `approximate_count`, which needs no guarantee.
+
 Classes:
     CountTokens: A class to encapsulate the token counting logic.
+    TokenEstimator: Fast token count estimates with upper and lower bounds, usable as a tokenizer.
 
 Example usage:
     counter = CountTokens()
@@ -26,8 +41,187 @@ Dependencies:
 This module assumes that the message and tool inputs are structured as dictionaries with specific keys,
 such as 'content', 'name', and 'description'.
 """
+
+import asyncio
+import hashlib
+import json
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, FrozenSet, List, Optional, Tuple
+
 import tiktoken
 
+_ASCII_LETTERS = bytes(range(ord("A"), ord("Z") + 1)) + bytes(range(ord("a"), ord("z") + 1))
+_DIGITS = b"0123456789"
+_ASCII = bytes(range(128))
+_LINE_BREAKS = b"\t\n\r"
+
+
+class TokenEstimator:
+    """Fast token count estimates, and upper and lower bounds that hold for the encoding.
+
+    The estimator also delegates `encode` and `decode` to the encoding, so it can be passed wherever a tokenizer is
+    expected and callers checking a budget use `is_within`.
+    """
+
+    # Tokens per byte class, recalibrate with benchmarks/bench_token_estimate.py
+    SPACE_TOKENS = 0.5
+    LETTER_TOKENS = 0.12
+    DIGIT_TOKENS = 0.5
+    SYMBOL_TOKENS = 0.7
+    NON_ASCII_BYTE_TOKENS = 0.3
+    LINE_BREAK_TOKENS = 1.0
+    # The benchmark checks that the real count stays within [estimated_lower_bound, estimated_upper_bound]
+    UPPER_MARGIN = 1.3
+    LOWER_MARGIN = 1.6
+    # Runs without whitespace at least this long are bounded by their byte length rather than estimated
+    LONG_RUN_BYTES = 16
+    # Encodings for which the benchmark reported no violation of the estimated bounds, none has been measured yet
+    CALIBRATED_ENCODINGS: FrozenSet[str] = frozenset()
+
+    def __init__(self, encoding: Any, calibrated: Optional[bool] = None):
+        """Initialize the estimator.
+
+        Args:
+            encoding (Any): The tiktoken encoding used when the bounds are not conclusive.
+            calibrated (Optional[bool], optional): Whether the estimated bounds hold for the encoding. Defaults to None,
+                whether the encoding is in `CALIBRATED_ENCODINGS`.
+        """
+        self.encoding = encoding
+        if calibrated is None:
+            calibrated = getattr(encoding, "name", None) in self.CALIBRATED_ENCODINGS
+        self.calibrated = calibrated
+        self._long_run = re.compile(rb"\S{%d,}" % self.LONG_RUN_BYTES)
+        self.estimated_checks = 0
+        self.exact_checks = 0
+
+    def encode(self, text: str) -> List[int]:
+        """Encode a text with the encoding."""
+        return self.encoding.encode(text)
+
+    def decode(self, tokens: List[int]) -> str:
+        """Decode tokens with the encoding."""
+        return self.encoding.decode(tokens)
+
+    def estimate(self, text: str) -> float:
+        """Estimate the number of tokens of a text from its byte classes.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            float: The point estimate of the number of tokens.
+        """
+        return self._estimate(text.encode("utf-8"))
+
+    def _estimate(self, data: bytes) -> float:
+        size = len(data)
+        # bytes.translate with a delete set counts a byte class in C, much faster than regular expressions
+        letters = size - len(data.translate(None, _ASCII_LETTERS))
+        digits = size - len(data.translate(None, _DIGITS))
+        non_ascii = len(data.translate(None, _ASCII))
+        spaces = data.count(b" ")
+        line_breaks = size - len(data.translate(None, _LINE_BREAKS))
+        symbols = size - letters - digits - non_ascii - spaces - line_breaks
+        return (
+            self.SPACE_TOKENS * spaces
+            + self.LETTER_TOKENS * letters
+            + self.DIGIT_TOKENS * digits
+            + self.SYMBOL_TOKENS * symbols
+            + self.NON_ASCII_BYTE_TOKENS * non_ascii
+            + self.LINE_BREAK_TOKENS * line_breaks
+        )
+
+    def approximate_count(self, text: str) -> int:
+        """Return the estimate with its margin, for accounting that does not need a guaranteed bound.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            int: The approximate number of tokens, never above the number of UTF-8 bytes of the text.
+        """
+        return self._estimated_upper_bound(text.encode("utf-8"))
+
+    def estimated_upper_bound(self, text: str) -> int:
+        """Return the upper bound derived from the estimate, which only holds for a calibrated encoding.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            int: The estimated upper bound, never above the number of UTF-8 bytes of the text.
+        """
+        return self._estimated_upper_bound(text.encode("utf-8"))
+
+    def _estimated_upper_bound(self, data: bytes) -> int:
+        words = self._long_run.sub(b"", data)
+        long_run_bytes = len(data) - len(words)
+        return min(len(data), math.ceil(self._estimate(words) * self.UPPER_MARGIN) + 1 + long_run_bytes)
+
+    def estimated_lower_bound(self, text: str) -> int:
+        """Return the lower bound derived from the estimate, which only holds for a calibrated encoding.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            int: The estimated lower bound.
+        """
+        return math.floor(self.estimate(text) / self.LOWER_MARGIN)
+
+    def upper_bound(self, text: str) -> int:
+        """Return an upper bound of the number of tokens of a text.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            int: The estimated upper bound for a calibrated encoding, otherwise the number of UTF-8 bytes.
+        """
+        data = text.encode("utf-8")
+        return self._estimated_upper_bound(data) if self.calibrated else len(data)
+
+    def lower_bound(self, text: str) -> int:
+        """Return a lower bound of the number of tokens of a text.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            int: The estimated lower bound for a calibrated encoding, otherwise 1 for a non-empty text.
+        """
+        if self.calibrated:
+            return self.estimated_lower_bound(text)
+        return 1 if text else 0
+
+    def is_within(self, text: str, max_tokens: int) -> bool:
+        """Check whether a text has at most `max_tokens` tokens, encoding it only when the bounds are not conclusive.
+
+        Args:
+            text (str): The text.
+            max_tokens (int): The token budget.
+
+        Returns:
+            bool: True if the text fits the budget.
+        """
+        data = text.encode("utf-8")
+        # No encoding produces more tokens than bytes
+        if len(data) <= max_tokens:
+            self.estimated_checks += 1
+            return True
+        if self.calibrated:
+            if self._estimated_upper_bound(data) <= max_tokens:
+                self.estimated_checks += 1
+                return True
+            if math.floor(self._estimate(data) / self.LOWER_MARGIN) > max_tokens:
+                self.estimated_checks += 1
+                return False
+        self.exact_checks += 1
+        return len(self.encoding.encode_ordinary(text)) <= max_tokens
+
 
 class CountTokens:
     """A class to count the number of tokens used in messages and tools.
@@ -36,66 +230,178 @@ class CountTokens:
     number of tokens used in a given set of messages or tools.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        encoding: Optional[Any] = None,
+        cache_size: int = 4096,
+        cache_max_chars: int = 32768,
+        offload_min_chars: int = 20000,
+    ):
         """Initializes CountTokens with a specific encoding.
 
         The encoding is set to 'o200k_base', which is used for tokenization
         of messages and tools.
+
+        Args:
+            encoding (Optional[Any], optional): The tiktoken encoding. Defaults to None, 'o200k_base'.
+            cache_size (int, optional): Maximum number of token counts kept in the cache. Defaults to 4096.
+            cache_max_chars (int, optional): Texts longer than this are not cached. Defaults to 32768.
+            offload_min_chars (int, optional): Inputs with at least this many characters are counted in a worker
+                thread. Defaults to 20000.
         """
         # cl100k_base = tiktoken.get_encoding("cl100k_base")
         # Models covered: gpt-4, gpt-3.5-turbo, text-embedding-ada-002, text-embedding-3-small, text-embedding-3-large
-        cl200k_base = tiktoken.get_encoding("o200k_base")
-        self.encoding = cl200k_base
+        self.encoding = encoding or tiktoken.get_encoding("o200k_base")
+        self.estimator = TokenEstimator(self.encoding)
+        self.cache_size = cache_size
+        self.cache_max_chars = cache_max_chars
+        self.offload_min_chars = offload_min_chars
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
 
-    async def num_tokens_from_messages(self, messages):
-        """Calculate the number of tokens used by a list of messages.
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def count_texts_sync(self, texts: List[str], cache: bool = True) -> List[int]:
+        """Count the tokens of each text, blocking.
 
         Args:
-            messages (list): A list of message dictionaries to be tokenized.
+            texts (List[str]): The texts to count.
+            cache (bool, optional): Whether to use the cache, disable it for texts that are not seen again (e.g.
+                document chunks). Defaults to True.
 
         Returns:
-            int: The total number of tokens used by the messages.
+            List[int]: The number of tokens of each text.
+        """
+        counts: List[Optional[int]] = [None] * len(texts)
+        keys = {}
+        if cache:
+            with self._lock:
+                for i, text in enumerate(texts):
+                    if len(text) > self.cache_max_chars:
+                        continue
+                    keys[i] = self._key(text)
+                    if keys[i] in self._cache:
+                        self._cache.move_to_end(keys[i])
+                        counts[i] = self._cache[keys[i]]
+
+        missing = [i for i, count in enumerate(counts) if count is None]
+        if missing:
+            # encode_ordinary counts special tokens typed by users as text instead of raising
+            encoded = self.encoding.encode_ordinary_batch([texts[i] for i in missing])
+            for i, tokens in zip(missing, encoded):
+                counts[i] = len(tokens)
+
+        if keys:
+            with self._lock:
+                for i in missing:
+                    if i in keys:
+                        self._cache[keys[i]] = counts[i]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return counts
+
+    async def count_texts(self, texts: List[str], cache: bool = True) -> List[int]:
+        """Count the tokens of each text, in a worker thread for large inputs.
+
+        Args:
+            texts (List[str]): The texts to count.
+            cache (bool, optional): Whether to use the cache. Defaults to True.
+
+        Returns:
+            List[int]: The number of tokens of each text.
         """
+        if sum(len(text) for text in texts) >= self.offload_min_chars:
+            return await asyncio.to_thread(self.count_texts_sync, texts, cache)
+        return self.count_texts_sync(texts, cache)
+
+    @staticmethod
+    def _message_texts(messages) -> Tuple[int, List[str]]:
+        """Return the fixed token overhead of messages and the texts to encode."""
         # Refer sample notebook from openai for logic:
         # https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
         tokens_per_message = 3
         tokens_per_name = 1
         num_tokens = 0
+        texts = []
         for message in messages:
             num_tokens += tokens_per_message
             for key, value in message.items():
-                num_tokens += len(self.encoding.encode(value))
+                if value is None:
+                    continue
+                texts.append(value if isinstance(value, str) else json.dumps(value, default=str))
                 if key == "name":
                     num_tokens += tokens_per_name
         num_tokens += 3
-        return num_tokens
-
-    async def count_tools(self, tools):
-        """Calculate the number of tokens used by a list of tools.
-
-        Args:
-            tools (list): A list of tool dictionaries, each containing a function with parameters.
+        return num_tokens, texts
 
-        Returns:
-            int: The total number of tokens used by the tools.
-        """
+    @staticmethod
+    def _tool_texts(tools) -> Tuple[int, List[str]]:
+        """Return the fixed token overhead of tools and the texts to encode."""
         tokens_per_tool = 3
         num_tokens = 0
+        texts = []
         for tool in tools:
             num_tokens += tokens_per_tool
             for key, value in tool["function"].items():
                 if key == "name" or key == "description":
-                    num_tokens += len(self.encoding.encode(value))
+                    texts.append(value)
                 if key == "parameters":
                     num_tokens += 2
                     for _param_key, param_value in value["properties"].items():
-                        for param_key_1, param_value_1 in param_value.items():
-                            if param_key_1 == "type":
-                                pass
-                            if param_key_1 == "description":
-                                num_tokens += len(self.encoding.encode(param_value_1))
+                        if "description" in param_value:
+                            texts.append(param_value["description"])
+        return num_tokens, texts
 
-        return num_tokens
+    async def num_tokens_from_messages(self, messages):
+        """Calculate the number of tokens used by a list of messages.
+
+        Args:
+            messages (list): A list of message dictionaries to be tokenized.
+
+        Returns:
+            int: The total number of tokens used by the messages.
+        """
+        num_tokens, texts = self._message_texts(messages)
+        return num_tokens + sum(await self.count_texts(texts))
+
+    async def count_tools(self, tools):
+        """Calculate the number of tokens used by a list of tools.
+
+        Args:
+            tools (list): A list of tool dictionaries, each containing a function with parameters.
+
+        Returns:
+            int: The total number of tokens used by the tools.
+        """
+        num_tokens, texts = self._tool_texts(tools)
+        return num_tokens + sum(await self.count_texts(texts))
+
+    def estimate(self, text: str) -> int:
+        """Estimate the number of tokens of a text without encoding it.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            int: The approximate number of tokens, not a guaranteed bound.
+        """
+        return self.estimator.approximate_count(text)
+
+    def estimate_count_tokens(self, messages, tools) -> int:
+        """Estimate the total number of tokens used by messages and tools without encoding them.
+
+        Args:
+            messages (list): A list of message dictionaries.
+            tools (list): A list of tool dictionaries, each containing a function with parameters.
+
+        Returns:
+            int: The approximate number of tokens used by both the messages and tools.
+        """
+        message_tokens, message_texts = self._message_texts(messages)
+        tool_tokens, tool_texts = self._tool_texts(tools)
+        return message_tokens + tool_tokens + sum(self.estimate(text) for text in message_texts + tool_texts)
 
     async def get_count_tokens(self, messages, tools):
         """Calculate the total number of tokens used by messages and tools combined.
@@ -0,0 +1,90 @@
+"""Credentials loaded once and refreshed in the background.
+
+Secrets used on the request path (e.g. the Azure OpenAI API keys) must not be fetched from Secrets Manager while a
+user waits. A `CredentialManager` fetches its secret once at startup and builds the object that uses it (typically an
+API client). A background task then re-fetches the secret periodically in a worker thread, and rebuilds the object
+only when the secret actually changed. The new object replaces the old one with a single attribute assignment, so
+requests always see a complete client and never block on the refresh.
+
+Classes:
+    CredentialManager: Keeps a secret and the object built from it fresh in the background.
+"""
+
+import asyncio
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+
+from loguru import logger
+
+T = TypeVar("T")
+
+
+class CredentialManager(Generic[T]):
+    """Keeps a secret and the object built from it fresh in the background."""
+
+    def __init__(
+        self,
+        name: str,
+        fetch_secret: Callable[[], Dict[str, Any]],
+        build: Callable[[Dict[str, Any]], T],
+        refresh_seconds: float = 1800,
+        retry_seconds: float = 60,
+    ):
+        """Initialize the credential manager and load the secret.
+
+        Args:
+            name (str): Name of the credentials, for logging.
+            fetch_secret (Callable[[], Dict[str, Any]]): Blocking function returning the current secret.
+            build (Callable[[Dict[str, Any]], T]): Builds the object using the secret, e.g. an API client.
+            refresh_seconds (float, optional): Interval between refreshes. Defaults to 1800.
+            retry_seconds (float, optional): Delay before retrying a failed refresh. Defaults to 60.
+        """
+        self.name = name
+        self.fetch_secret = fetch_secret
+        self.build = build
+        self.refresh_seconds = refresh_seconds
+        self.retry_seconds = retry_seconds
+
+        self.secret = fetch_secret()
+        self.value: T = build(self.secret)
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self) -> bool:
+        """Fetch the secret in a worker thread and rebuild the object if the secret changed.
+
+        Returns:
+            bool: True if the object was rebuilt.
+        """
+        secret = await asyncio.to_thread(self.fetch_secret)
+        if secret == self.secret:
+            return False
+        value = self.build(secret)
+        self.secret, self.value = secret, value
+        logger.info(f"Credentials {self.name} rotated")
+        return True
+
+    async def _refresh_loop(self) -> None:
+        delay = self.refresh_seconds
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.refresh()
+                delay = self.refresh_seconds
+            except Exception as e:
+                # Keep serving the current credentials until a refresh succeeds
+                logger.error(f"Error refreshing credentials {self.name}: {e}")
+                delay = self.retry_seconds
+
+    def start(self) -> None:
+        """Start refreshing in the background. Must be called from the event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        """Stop refreshing."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -15,7 +15,7 @@ import uuid
 from datetime import datetime, timezone, timedelta
 from fastapi import HTTPException
 from loguru import logger
-from typing import Optional, List, Union, Dict
+from typing import Any, Optional, List, Union, Dict
 from src.models import (
     Authentication,
     Chat,
@@ -29,6 +29,7 @@ from src.models import (
     SupportCaseModel,
     SupportCaseResponse,
 )
+from src.utils import load_local_secret
 
 
 class ChatManagement:
@@ -54,6 +55,9 @@ class ChatManagement:
         Returns a dictionary with 'username' and 'password'.
         """
         try:
+            local_secret = load_local_secret(config["database"]["access_info_secret"])
+            if local_secret is not None:
+                return local_secret
             secretsmanager = boto3.client("secretsmanager", region_name=config["credentials"]["region_name"])
             secret_response = secretsmanager.get_secret_value(SecretId=config["database"]["access_info_secret"])
             credentials = json.loads(secret_response["SecretString"])
@@ -294,6 +298,7 @@ class ChatManagement:
                     message_type,
                     user_query,
                     ai_response,
+                    ai_response_markdown,
                     retrieved_urls,
                     open_ticket,
                     ai_ticket_subject,
@@ -328,12 +333,14 @@ class ChatManagement:
                             messages.append(user_message)
 
                         elif row["ai_response"] is not None:
+                            # Serve the markdown rendered while streaming, rows written before it was stored are
+                            # rendered by the caller
                             ai_message = AIMessage(
                                 id=str(row["bot_response_id"]),
                                 sent_time=row["created_timestamp"].strftime("%Y-%m-%dT%H:%M:%SZ"),
                                 sender=row["sender"],
                                 message_type=row["message_type"],
-                                message=row["ai_response"],
+                                message=row["ai_response_markdown"] or row["ai_response"],
                                 document_id=str(row["document_id"]),
                                 metadata={
                                     "retrieved_urls": row["retrieved_urls"],
@@ -341,13 +348,11 @@ class ChatManagement:
                                 },
                             )
                             if row["ai_ticket_subject"] and row["ai_ticket_description"] and row["ai_ticket_product"]:
-                                ai_message.metadata["ticket_info"] = (
-                                    {
-                                        "case_subject": row["ai_ticket_subject"],
-                                        "case_description": row["ai_ticket_description"],
-                                        "product": row["ai_ticket_product"],
-                                    },
-                                )
+                                ai_message.metadata["ticket_info"] = {
+                                    "case_subject": row["ai_ticket_subject"],
+                                    "case_description": row["ai_ticket_description"],
+                                    "product": row["ai_ticket_product"],
+                                }
                             messages.append(ai_message)
 
             return Chat(
@@ -410,6 +415,95 @@ class ChatManagement:
             logger.error(f"Error getting chat info: {e}")
             raise
 
+    async def get_chats_version(self, auth: Authentication, conn: AsyncConnectionPool, time_period: int = 90) -> Dict:
+        """Retrieve what the chat list of a user depends on, without loading the chats.
+
+        Renaming a chat does not update its last updated timestamp, so the titles are part of the version.
+
+        Args:
+            auth (Authentication): Authentication object containing user details
+            conn (AsyncConnectionPool): Database connection pool
+            time_period (int): Number of days to look back for chats (default: 90)
+
+        Returns:
+            Dict: The number of chats, the latest update and a hash of the chat titles.
+        """
+        try:
+            cutoff_date = datetime.now(timezone.utc) - timedelta(days=time_period)
+            query = """
+                SELECT
+                    COUNT(*) AS chat_count,
+                    MAX(last_updated_timestamp) AS last_updated_timestamp,
+                    MD5(STRING_AGG(chat_id::text || ':' || COALESCE(chat_title, ''), ',' ORDER BY chat_id)) AS titles
+                FROM ct_ai_assistantdb.tb_chats
+                WHERE user_id = %(user_id)s
+                AND email_address = %(email_address)s
+                AND tenant_id = %(tenant_id)s
+                AND org_id = %(org_id)s
+                AND last_updated_timestamp >= %(cutoff_date)s;
+            """
+            data = {
+                "user_id": auth.user_id,
+                "email_address": auth.EmailAddress,
+                "tenant_id": auth.tenant_id,
+                "org_id": auth.org_id,
+                "cutoff_date": cutoff_date,
+            }
+            async with conn.connection() as aconn:
+                async with aconn.cursor(row_factory=dict_row) as cursor:
+                    await cursor.execute(query, data)
+                    return await cursor.fetchone()
+        except Exception as e:
+            logger.error(f"Error getting chats version: {e}")
+            raise
+
+    async def get_chat_version(self, chat_id: str, auth: Authentication, conn: AsyncConnectionPool) -> Dict:
+        """Retrieve what a chat with its messages depends on, without loading the messages.
+
+        Args:
+            chat_id (str): The ID of the chat.
+            auth (Authentication): Authentication object containing user details
+            conn (AsyncConnectionPool): Database connection pool
+
+        Returns:
+            Dict: The chat title, its last updated timestamp and number of messages.
+        """
+        try:
+            query = """
+                SELECT
+                    c.chat_title,
+                    c.last_updated_timestamp,
+                    (
+                        SELECT COUNT(*)
+                        FROM ct_ai_assistantdb.tb_chat_messages m
+                        WHERE m.chat_id = c.chat_id
+                    ) AS message_count
+                FROM ct_ai_assistantdb.tb_chats c
+                WHERE c.chat_id = %(chat_id)s AND c.user_id = %(user_id)s AND c.email_address = %(email_address)s
+                    AND c.tenant_id = %(tenant_id)s AND c.org_id = %(org_id)s;
+            """
+            data = {
+                "chat_id": chat_id,
+                "user_id": auth.user_id,
+                "email_address": auth.EmailAddress,
+                "tenant_id": auth.tenant_id,
+                "org_id": auth.org_id,
+            }
+            async with conn.connection() as aconn:
+                async with aconn.cursor(row_factory=dict_row) as cursor:
+                    await cursor.execute(query, data)
+                    result = await cursor.fetchone()
+
+            if result is None:
+                raise HTTPException(status_code=404, detail=f"Chat {chat_id} not found or user does not have access")
+            return result
+        except psycopg.errors.InvalidTextRepresentation as e:
+            logger.error(f"Invalid Data Format: {str(e)}")
+            raise HTTPException(status_code=422, detail=f"Invalid Data Format: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error getting chat version: {e}")
+            raise
+
     async def update_chat_last_updated_timestamp(self, chat_id: str, conn: AsyncConnectionPool) -> None:
         """Update the last updated timestamp of a chat."""
         try:
@@ -576,14 +670,14 @@ class ChatManagement:
                     insert_query = """
                         INSERT INTO ct_ai_assistantdb.tb_chat_messages
                         (chat_id, user_query_id, bot_response_id, created_timestamp, sender, message_type,
-                            ai_response, user_id, email_address, tenant_id, org_id, products, reformulated_query,
-                            product_line, sources, retrieved_urls, open_ticket, account_type, document_id,
-                            search_scope, ai_ticket_subject, ai_ticket_description, ai_ticket_product)
+                            ai_response, ai_response_markdown, user_id, email_address, tenant_id, org_id, products,
+                            reformulated_query, product_line, sources, retrieved_urls, open_ticket, account_type,
+                            document_id, search_scope, ai_ticket_subject, ai_ticket_description, ai_ticket_product)
                         VALUES (%(chat_id)s, %(user_query_id)s, %(bot_response_id)s, %(created_timestamp)s, %(sender)s,
-                            %(message_type)s, %(ai_response)s, %(user_id)s, %(email_address)s, %(tenant_id)s,
-                            %(org_id)s, %(products)s, %(reformulated_query)s, %(product_line)s, %(sources)s,
-                            %(retrieved_urls)s, %(open_ticket)s, %(account_type)s, %(document_id)s, %(search_scope)s,
-                            %(ai_ticket_subject)s, %(ai_ticket_description)s, %(ai_ticket_product)s)
+                            %(message_type)s, %(ai_response)s, %(ai_response_markdown)s, %(user_id)s, %(email_address)s,
+                            %(tenant_id)s, %(org_id)s, %(products)s, %(reformulated_query)s, %(product_line)s,
+                            %(sources)s, %(retrieved_urls)s, %(open_ticket)s, %(account_type)s, %(document_id)s,
+                            %(search_scope)s, %(ai_ticket_subject)s, %(ai_ticket_description)s, %(ai_ticket_product)s)
                         RETURNING user_query_id;
                     """
                     data = {
@@ -596,6 +690,10 @@ class ChatManagement:
                         "ai_response": complete_response.ai_message
                         if complete_response.ai_message is not None
                         else "Sorry, something went wrong. Please try again.",
+                        # The markdown shown while streaming, kept so that chat history reads do not render it again
+                        "ai_response_markdown": complete_response.message
+                        if complete_response.message.startswith("## message")
+                        else None,
                         "user_id": auth.user_id,
                         "email_address": auth.EmailAddress,
                         "tenant_id": auth.tenant_id,
@@ -628,6 +726,38 @@ class ChatManagement:
             logger.error(f"Error logging product support response: {e}")
             raise
 
+    async def backfill_ai_response_markdown(
+        self, chat_id: str, rendered_messages: Dict[str, str], conn: AsyncConnectionPool
+    ) -> None:
+        """Store the markdown rendered on read for AI messages written before it was persisted.
+
+        Failures are only logged, the rows are rendered again on the next read.
+
+        Args:
+            chat_id (str): The chat the messages belong to.
+            rendered_messages (Dict[str, str]): The rendered markdown keyed by bot response ID.
+            conn (AsyncConnectionPool): The database connection pool.
+        """
+        try:
+            query = """
+                UPDATE ct_ai_assistantdb.tb_chat_messages
+                SET ai_response_markdown = %(ai_response_markdown)s
+                WHERE chat_id = %(chat_id)s
+                    AND bot_response_id = %(bot_response_id)s
+                    AND sender = 'ai'
+                    AND ai_response_markdown IS NULL;
+            """
+            params = [
+                {"chat_id": chat_id, "bot_response_id": bot_response_id, "ai_response_markdown": markdown}
+                for bot_response_id, markdown in rendered_messages.items()
+            ]
+            async with conn.connection() as aconn:
+                async with aconn.cursor() as cursor:
+                    await cursor.executemany(query, params)
+                    await aconn.commit()
+        except Exception as e:
+            logger.error(f"Error backfilling AI response markdown for chat {chat_id}: {e}")
+
     async def rename_chat(self, chat_id: str, new_title: str, auth: Authentication, conn: AsyncConnectionPool) -> None:
         """Rename a chat."""
         try:
@@ -921,6 +1051,7 @@ class ChatManagement:
         user_query_id: str,
         auth: Authentication,
         conn: AsyncConnectionPool,
+        status: str = "ready",
     ):
         """Log document upload information to the database.
 
@@ -932,6 +1063,8 @@ class ChatManagement:
             user_query_id (str): The ID of the user query associated with the document, if any.
             auth (Authentication): The authentication object.
             conn (AsyncConnectionPool): The database connection pool.
+            status (str, optional): The processing status of the document, "processing" while it is processed in
+                the background. Defaults to "ready".
 
         Returns:
             str: The file_id of the inserted record.
@@ -942,12 +1075,14 @@ class ChatManagement:
         try:
             query = """
                 INSERT INTO ct_ai_assistantdb.tb_documents
-                (document_id, user_query_id, org_id, tenant_id, user_id, file_name, file_size, file_type, is_active)
+                (document_id, user_query_id, org_id, tenant_id, user_id, file_name, file_size, file_type, is_active,
+                    status)
                 VALUES (%(document_id)s, %(user_query_id)s, %(org_id)s, %(tenant_id)s, %(user_id)s, %(file_name)s,
-                    %(file_size)s, %(file_type)s, true)
+                    %(file_size)s, %(file_type)s, true, %(status)s)
                 RETURNING file_id;
             """
             data = {
+                "status": status,
                 "document_id": document_id,
                 "user_query_id": user_query_id,
                 "org_id": auth.org_id,
@@ -1028,6 +1163,91 @@ class ChatManagement:
             logger.error(f"Error updating document status: {e}")
             raise HTTPException(status_code=500, detail=f"Error updating document status: {str(e)}")
 
+    async def update_document_processing_status(
+        self,
+        document_id: str,
+        status: str,
+        status_detail: Optional[str],
+        auth: Authentication,
+        conn: AsyncConnectionPool,
+    ):
+        """Record the outcome of the background processing of a document.
+
+        Documents that failed or were cancelled are also marked as inactive, so they are not offered for questions.
+
+        Args:
+            document_id (str): The ID of the document.
+            status (str): The processing status: "ready", "failed" or "cancelled".
+            status_detail (Optional[str]): The error of a failed processing.
+            auth (Authentication): The authentication object of the user who uploaded the document.
+            conn (AsyncConnectionPool): The database connection pool.
+
+        Raises:
+            HTTPException: If there is an error updating the document.
+        """
+        try:
+            query = """
+                UPDATE ct_ai_assistantdb.tb_documents
+                SET status = %(status)s, status_detail = %(status_detail)s,
+                    is_active = is_active AND %(status)s = 'ready', updated_timestamp = NOW()
+                WHERE document_id = %(document_id)s AND tenant_id = %(tenant_id)s AND user_id = %(user_id)s;
+            """
+            data = {
+                "status": status,
+                "status_detail": status_detail[:500] if status_detail else None,
+                "document_id": document_id,
+                "tenant_id": auth.tenant_id,
+                "user_id": auth.user_id or auth.EmailAddress,
+            }
+            async with conn.connection() as aconn:
+                async with aconn.cursor() as cursor:
+                    await cursor.execute(query, data)
+                    await aconn.commit()
+
+        except Exception as e:
+            logger.error(f"Error updating document processing status: {e}")
+            raise HTTPException(status_code=500, detail=f"Error updating document processing status: {str(e)}")
+
+    async def get_document_processing_status(
+        self, document_id: str, auth: Authentication, conn: AsyncConnectionPool
+    ) -> Optional[Dict[str, Any]]:
+        """Retrieve the processing status of a document of the user.
+
+        Args:
+            document_id (str): The ID of the document.
+            auth (Authentication): The authentication object.
+            conn (AsyncConnectionPool): The database connection pool.
+
+        Returns:
+            Optional[Dict[str, Any]]: The file name, status, status detail and whether the document is active (not
+                deleted), None if the user has no such document.
+
+        Raises:
+            HTTPException: If there is an error reading the document.
+        """
+        try:
+            query = """
+                SELECT file_name, status, status_detail, is_active
+                FROM ct_ai_assistantdb.tb_documents
+                WHERE document_id = %(document_id)s AND tenant_id = %(tenant_id)s AND user_id = %(user_id)s;
+            """
+            data = {
+                "document_id": document_id,
+                "tenant_id": auth.tenant_id,
+                "user_id": auth.user_id or auth.EmailAddress,
+            }
+            async with conn.connection() as aconn:
+                async with aconn.cursor(row_factory=dict_row) as cursor:
+                    await cursor.execute(query, data)
+                    return await cursor.fetchone()
+
+        except psycopg.errors.InvalidTextRepresentation as e:
+            logger.error(f"Invalid Data Format: {str(e)}")
+            raise HTTPException(status_code=422, detail=f"Invalid Data Format: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error reading document processing status: {e}")
+            raise HTTPException(status_code=500, detail=f"Error reading document processing status: {str(e)}")
+
     async def log_support_case(
         self,
         ticket_id: str,
@@ -0,0 +1,215 @@
+"""Pool of Azure OpenAI deployments with least-outstanding-requests routing and failover.
+
+A single Azure OpenAI deployment throttles all the requests of the service once it reaches its quota. The secrets can
+list several deployments (endpoint and key pairs) for the same model, and a `DeploymentPool` spreads the requests over
+them: each call goes to the healthy deployment with the fewest requests in flight, ties going to the one with the
+fewest recent errors and the lowest latency. A deployment that answers with a 429, a 5xx or a connection error is put
+in cooldown (for its retry-after when it gives one) and the call fails over to the next deployment.
+
+Request latency, errors and requests in flight are reported per deployment as Prometheus metrics, and `stats` returns
+them for logging.
+
+Classes:
+    Deployment: One deployment of a pool, its client and its health.
+    DeploymentPool: Routes calls over deployments by least outstanding requests and fails over on errors.
+"""
+
+import time
+from typing import Any, Awaitable, Callable, Dict, Generic, List, Optional, Set, TypeVar
+
+from loguru import logger
+from openai import APIConnectionError, APIStatusError, RateLimitError
+from prometheus_client import Counter, Gauge, Histogram
+
+DEPLOYMENT_REQUEST_SECONDS = Histogram(
+    "openai_deployment_request_seconds",
+    "Duration of the requests to each Azure OpenAI deployment.",
+    ["pool", "deployment"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+DEPLOYMENT_ERRORS = Counter(
+    "openai_deployment_errors_total", "Failed requests to each Azure OpenAI deployment.", ["pool", "deployment", "kind"]
+)
+DEPLOYMENT_OUTSTANDING = Gauge(
+    "openai_deployment_outstanding_requests",
+    "Requests in flight to each Azure OpenAI deployment.",
+    ["pool", "deployment"],
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Weight of the last request in the moving averages of the latency and the error rate
+_EWMA_ALPHA = 0.2
+
+
+class Deployment(Generic[T]):
+    """One deployment of a pool, its client and its health."""
+
+    def __init__(self, name: str, client: T):
+        """Initialize a healthy deployment.
+
+        Args:
+            name (str): Name of the deployment, used in the metrics.
+            client (T): The client of the deployment.
+        """
+        self.name = name
+        self.client = client
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def healthy(self, now: float) -> bool:
+        """Whether the deployment is out of cooldown."""
+        return now >= self.cooldown_until
+
+    def score(self) -> tuple:
+        """Sort key of the deployment, lower is better."""
+        return (self.outstanding, round(self.error_ewma, 2), self.latency_ewma or 0.0)
+
+
+class DeploymentPool(Generic[T]):
+    """Routes calls over deployments by least outstanding requests and fails over on throttling and server errors."""
+
+    def __init__(self, name: str, deployments: List[Deployment[T]], cooldown_seconds: float = 10.0):
+        """Initialize the pool.
+
+        Args:
+            name (str): Name of the pool, used in the metrics.
+            deployments (List[Deployment[T]]): The deployments, at least one.
+            cooldown_seconds (float, optional): Base cooldown of a failing deployment, doubled with each consecutive
+                failure up to 8 times. Defaults to 10.0.
+        """
+        if not deployments:
+            raise ValueError(f"Deployment pool {name} needs at least one deployment")
+        self.name = name
+        self.deployments = deployments
+        self.cooldown_seconds = cooldown_seconds
+
+    @property
+    def primary(self) -> T:
+        """The client of the first deployment, for callers that are not routed."""
+        return self.deployments[0].client
+
+    def pick(self, exclude: Optional[Set[str]] = None) -> Optional[Deployment[T]]:
+        """Pick the deployment for the next call.
+
+        Args:
+            exclude (Optional[Set[str]], optional): Names of the deployments already tried by the call.
+
+        Returns:
+            Optional[Deployment[T]]: The healthy deployment with the best score, or the one leaving its cooldown first
+                when none is healthy. None when all the deployments were tried.
+        """
+        candidates = [d for d in self.deployments if d.name not in (exclude or set())]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        healthy = [d for d in candidates if d.healthy(now)]
+        if healthy:
+            return min(healthy, key=Deployment.score)
+        return min(candidates, key=lambda d: d.cooldown_until)
+
+    async def call(self, request: Callable[[Deployment[T]], Awaitable[R]]) -> R:
+        """Run a request on the best deployment, failing over to the others on throttling and server errors.
+
+        Args:
+            request (Callable[[Deployment[T]], Awaitable[R]]): Sends the request with the client of a deployment.
+
+        Returns:
+            R: The result of the request.
+
+        Raises:
+            Exception: The error of the last deployment tried, or any error that is not worth a failover.
+        """
+        tried: Set[str] = set()
+        while True:
+            deployment = self.pick(tried)
+            tried.add(deployment.name)
+            deployment.outstanding += 1
+            DEPLOYMENT_OUTSTANDING.labels(pool=self.name, deployment=deployment.name).inc()
+            started = time.monotonic()
+            try:
+                result = await request(deployment)
+            except (RateLimitError, APIStatusError, APIConnectionError) as e:
+                kind = _error_kind(e)
+                if kind is None:
+                    raise
+                self._record_failure(deployment, kind, e)
+                if len(tried) == len(self.deployments):
+                    raise
+                logger.warning(f"Deployment {self.name}/{deployment.name} failed with {kind}, failing over")
+                continue
+            else:
+                self._record_success(deployment, time.monotonic() - started)
+                return result
+            finally:
+                deployment.outstanding -= 1
+                DEPLOYMENT_OUTSTANDING.labels(pool=self.name, deployment=deployment.name).dec()
+
+    def _record_success(self, deployment: Deployment[T], latency: float) -> None:
+        deployment.requests += 1
+        deployment.consecutive_failures = 0
+        deployment.error_ewma *= 1 - _EWMA_ALPHA
+        if deployment.latency_ewma is None:
+            deployment.latency_ewma = latency
+        else:
+            deployment.latency_ewma += _EWMA_ALPHA * (latency - deployment.latency_ewma)
+        DEPLOYMENT_REQUEST_SECONDS.labels(pool=self.name, deployment=deployment.name).observe(latency)
+
+    def _record_failure(self, deployment: Deployment[T], kind: str, error: Exception) -> None:
+        deployment.requests += 1
+        deployment.errors += 1
+        deployment.consecutive_failures += 1
+        deployment.error_ewma += _EWMA_ALPHA * (1 - deployment.error_ewma)
+        cooldown = _retry_after(error)
+        if cooldown is None:
+            cooldown = self.cooldown_seconds * 2 ** min(deployment.consecutive_failures - 1, 3)
+        deployment.cooldown_until = max(deployment.cooldown_until, time.monotonic() + cooldown)
+        DEPLOYMENT_ERRORS.labels(pool=self.name, deployment=deployment.name, kind=kind).inc()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return the requests, errors, latency and health of each deployment.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: The statistics, by deployment name.
+        """
+        now = time.monotonic()
+        return {
+            d.name: {
+                "outstanding": d.outstanding,
+                "requests": d.requests,
+                "errors": d.errors,
+                "latency_ewma": d.latency_ewma,
+                "healthy": d.healthy(now),
+            }
+            for d in self.deployments
+        }
+
+
+def _error_kind(error: Exception) -> Optional[str]:
+    """Classify an error worth a failover, None for the others (e.g. a bad request)."""
+    if isinstance(error, RateLimitError):
+        return "throttled"
+    if isinstance(error, APIStatusError):
+        return "server_error" if error.status_code >= 500 else None
+    return "connection_error"
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Read the retry-after of a throttled response, in seconds."""
+    if not isinstance(error, RateLimitError):
+        return None
+    headers = error.response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
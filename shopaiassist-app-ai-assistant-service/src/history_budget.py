@@ -0,0 +1,142 @@
+"""Token budget of the chat history sent with upstream requests.
+
+Clients send the whole chat history with each question, and a pasted log can make it hundreds of thousands of tokens.
+A `HistoryBudgeter` keeps the most recent messages that fit a token budget and truncates single messages over a
+per-message limit, keeping their beginning and end. Token counts come from the cached counter of `CountTokens`, so the
+history sent again at every turn is only encoded once. The number of tokens dropped is exported per consumer.
+
+Classes:
+    HistoryBudgeter: Trims a chat history to a token budget.
+"""
+
+import asyncio
+from typing import List, Tuple
+
+from loguru import logger
+from prometheus_client import Counter
+
+from src.count_tokens import CountTokens
+from src.models import ChatMessage
+
+HISTORY_DROPPED_TOKENS = Counter(
+    "chat_history_dropped_tokens_total", "Chat history tokens dropped to fit the token budget.", ["consumer"]
+)
+HISTORY_TRIMMED_REQUESTS = Counter(
+    "chat_history_trimmed_total", "Requests whose chat history was trimmed to fit the token budget.", ["consumer"]
+)
+
+# Tokens added by the chat format to each message
+_TOKENS_PER_MESSAGE = 4
+_TRUNCATION_MARKER = "\n[... {} tokens truncated ...]\n"
+
+
+class HistoryBudgeter:
+    """Trims a chat history to a token budget."""
+
+    def __init__(
+        self,
+        counter: CountTokens,
+        consumer: str,
+        max_tokens: int = 8000,
+        max_message_tokens: int = 2000,
+        keep_oldest: bool = False,
+    ):
+        """Initialize the budgeter.
+
+        Args:
+            counter (CountTokens): The token counter.
+            consumer (str): Name of the consumer of the history, used in the metrics.
+            max_tokens (int, optional): Token budget of the whole history. Defaults to 8000.
+            max_message_tokens (int, optional): Messages over this size are truncated. Defaults to 2000.
+            keep_oldest (bool, optional): Keep the oldest messages instead of the most recent ones, e.g. to name a
+                chat from its beginning. Defaults to False.
+        """
+        self.counter = counter
+        self.consumer = consumer
+        self.max_tokens = max_tokens
+        self.max_message_tokens = max_message_tokens
+        self.keep_oldest = keep_oldest
+
+    @classmethod
+    def from_config(cls, config: dict, consumer: str, counter: CountTokens, **kwargs) -> "HistoryBudgeter":
+        """Create a budgeter from the `history_budget.<consumer>` configuration section.
+
+        Args:
+            config (dict): The application configuration.
+            consumer (str): The consumer of the history, e.g. "product_support".
+            counter (CountTokens): The token counter.
+            **kwargs: Defaults of the settings missing from the configuration.
+
+        Returns:
+            HistoryBudgeter: The configured budgeter.
+        """
+        settings = {**kwargs, **config.get("history_budget", {}).get(consumer, {})}
+        return cls(counter, consumer, **settings)
+
+    def _truncate(self, text: str) -> Tuple[str, int]:
+        """Keep the beginning and the end of a text within the per-message limit.
+
+        Returns:
+            Tuple[str, int]: The truncated text and its number of tokens.
+        """
+        tokens = self.counter.encoding.encode_ordinary(text)
+        head = self.max_message_tokens // 2
+        tail = self.max_message_tokens - head
+        marker = _TRUNCATION_MARKER.format(len(tokens) - self.max_message_tokens)
+        truncated = self.counter.encoding.decode(tokens[:head]) + marker + self.counter.encoding.decode(tokens[-tail:])
+        return truncated, self.max_message_tokens + self.counter.count_texts_sync([marker])[0]
+
+    def trim_sync(self, chat_history: List[ChatMessage]) -> Tuple[List[ChatMessage], int]:
+        """Trim a chat history to the budget, blocking.
+
+        Args:
+            chat_history (List[ChatMessage]): The chat history, oldest message first.
+
+        Returns:
+            Tuple[List[ChatMessage], int]: The kept messages, oldest first, and the number of tokens dropped.
+        """
+        counts = self.counter.count_texts_sync([message.content for message in chat_history])
+        order = range(len(chat_history)) if self.keep_oldest else range(len(chat_history) - 1, -1, -1)
+
+        kept: List[ChatMessage] = []
+        used = 0
+        dropped = 0
+        for position, i in enumerate(order):
+            message, tokens = chat_history[i], counts[i]
+            if tokens > self.max_message_tokens:
+                content, new_tokens = self._truncate(message.content)
+                dropped += tokens - new_tokens
+                message, tokens = message.model_copy(update={"content": content}), new_tokens
+            if used + tokens + _TOKENS_PER_MESSAGE > self.max_tokens:
+                dropped += tokens + sum(counts[j] for j in list(order)[position + 1 :])
+                break
+            used += tokens + _TOKENS_PER_MESSAGE
+            kept.append(message)
+
+        if not self.keep_oldest:
+            kept.reverse()
+        return kept, max(dropped, 0)
+
+    async def trim(self, chat_history: List[ChatMessage]) -> List[ChatMessage]:
+        """Trim a chat history to the budget, in a worker thread for long histories.
+
+        Args:
+            chat_history (List[ChatMessage]): The chat history, oldest message first.
+
+        Returns:
+            List[ChatMessage]: The kept messages, oldest first.
+        """
+        if not chat_history:
+            return chat_history
+        if sum(len(message.content) for message in chat_history) >= self.counter.offload_min_chars:
+            kept, dropped = await asyncio.to_thread(self.trim_sync, chat_history)
+        else:
+            kept, dropped = self.trim_sync(chat_history)
+        if dropped:
+            HISTORY_DROPPED_TOKENS.labels(consumer=self.consumer).inc(dropped)
+            HISTORY_TRIMMED_REQUESTS.labels(consumer=self.consumer).inc()
+            logger.info(
+                f"Trimmed {self.consumer} chat history from {len(chat_history)} to {len(kept)} messages, "
+                f"{dropped} tokens dropped"
+            )
+        return kept
@@ -28,18 +28,21 @@ Dependencies:
 The module assumes the presence of configuration settings for Salesforce and OpenAI integrations, and it uses logging
 to track API activity and errors.
 """
-from fastapi import FastAPI, HTTPException, UploadFile, Depends, Header, Query, APIRouter
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, UploadFile, Depends, Header, Query, APIRouter, Request, BackgroundTasks
+from fastapi.responses import Response, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 import urllib.parse
 import json
-import os
+import time
 import uuid
 from loguru import logger
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional
 import traceback
+from contextlib import asynccontextmanager
 from datetime import datetime
 from sse_starlette.sse import EventSourceResponse
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
 from src.models import (
     SupportCaseModel,
@@ -55,18 +58,32 @@ from src.models import (
     RenameChatRequest,
     GenerateNameRequest,
     GenerateNameResponse,
+    ChatMessage,
     DocumentUploadResponse,
     DocumentDeleteResponse,
+    DocumentStatusResponse,
+    DocumentSearchRequest,
+    DocumentSearchResponse,
+    DocumentSearchResult,
 )
 from src.db import ChatManagement
-from src.utils import load_config, load_json_from_S3, get_salesforce_products_in_env
+from src.responses import FastJSONResponse
+from src.utils import load_config, load_json_from_S3, get_salesforce_products_in_env, make_etag, etag_matches
 from src.sf_case_creation import SFCreateCase
 from src.openai_utils import OpenaiUtils
+from src.history_budget import HistoryBudgeter
 from src.auth import authorize
 from src.s3_logging import S3Logger
 from src.skills_backend.document_qa.document_handler import DocumentHandler
+from src.skills_backend.document_qa.document_jobs import DocumentJob, DocumentJobManager
 from src.skills_backend.product_support.product_support import product_support, format_message_with_markdown
+from src.skills_backend.product_support.admission import AdmissionController
+from src.skills_backend.product_support.answer_cache import AnswerCache
+from src.skills_backend.product_support.stream_registry import StreamRegistry
+from src.skills_backend.product_support.circuit_breaker import CircuitBreaker, CircuitState
+from src.skills_backend.product_support.stream_timings import RequestStartMiddleware, StreamTimings
 from src.skills_backend.chat_summarization.summarize_chat import summarize_chat
+from src.skills_backend.chat_summarization.title_service import TitleGenerationService
 
 
 class AIAssistantAPI:
@@ -89,20 +106,48 @@ class AIAssistantAPI:
             docs_url="/assisvc/docs",
             redoc_url="/assisvc/redoc",
             openapi_url="/assisvc/openapi.json",
+            default_response_class=FastJSONResponse,
+            lifespan=self.lifespan,
         )
         self.config = config
         self.openai_chat = openai_chat
         self.chat_logger = chat_logger
         self.chat_mngmt = chat_mngmt
         self.salesforce_prod_mapping = salesforce_prod_mapping
-        self.document_handler = DocumentHandler()
-        self.chat_model_secrets = openai_chat.get_parameter_from_secret(
-            config["credentials"]["chat_model_secret"],
-            config["credentials"]["region_name"],
+        self.document_handler = DocumentHandler(openai_utils=openai_chat)
+        self.document_jobs = DocumentJobManager.from_config(config, self._process_document, self._store_document_status)
+        self.admission_controller = AdmissionController.from_config(config)
+        self.answer_cache = AnswerCache.from_config(config)
+        self.stream_registry = StreamRegistry.from_config(config)
+        self.circuit_breaker = CircuitBreaker.from_config(config)
+        self.history_budgeter = HistoryBudgeter.from_config(config, "product_support", openai_chat.ct)
+        # Titles are named from the beginning of the chat and only need a short prompt
+        self.title_history_budgeter = HistoryBudgeter.from_config(
+            config, "summarize_chat", openai_chat.ct, max_tokens=2000, max_message_tokens=500, keep_oldest=True
         )
+        self.title_service = TitleGenerationService.from_config(config, self._generate_title, self._store_title)
+        self.chat_model_secrets = openai_chat.chat_credentials.secret
         self.setup_middleware()
         self.setup_routes()
 
+    @asynccontextmanager
+    async def lifespan(self, app: FastAPI) -> AsyncIterator[None]:
+        """Run the background tasks of the application while it serves requests.
+
+        Args:
+            app (FastAPI): The application.
+        """
+        self.openai_chat.start_credential_refresh()
+        self.title_service.start()
+        try:
+            yield
+        finally:
+            # Streams first, they hold upstream connections and admission slots
+            await self.stream_registry.stop()
+            await self.document_jobs.stop()
+            await self.title_service.stop()
+            await self.openai_chat.close()
+
     def setup_middleware(self):
         """Set up middleware for the FastAPI application."""
         self.app.add_middleware(
@@ -112,6 +157,15 @@ class AIAssistantAPI:
             allow_methods=["*"],
             allow_headers=["*"],
         )
+        # Event streams are left uncompressed by the middleware (Starlette 0.46 and later, see pyproject.toml), so only
+        # the JSON responses are compressed
+        compression = self.config.get("compression", {})
+        self.app.add_middleware(
+            GZipMiddleware,
+            minimum_size=compression.get("minimum_size", 1024),
+            compresslevel=compression.get("compresslevel", 5),
+        )
+        self.app.add_middleware(RequestStartMiddleware)
 
     def setup_routes(self):
         """Set up API routes for the FastAPI application using APIRouters."""
@@ -131,6 +185,7 @@ class AIAssistantAPI:
         """Create router for health check endpoints."""
         router = APIRouter(tags=["Health"])
         router.get("/actuator/health")(self.health_check)
+        router.get("/actuator/prometheus")(self.prometheus_metrics)
         return router
 
     def _create_chat_router(self) -> APIRouter:
@@ -142,15 +197,21 @@ class AIAssistantAPI:
         router.delete("/chat/{chat_id}")(self.delete_chat)
         router.get("/chat/{chat_id}/messages")(self.get_chat_with_messages)
         router.post("/chat/{chat_id}/user-message")(self.create_user_message)
+        router.get("/chat/{chat_id}/user-message/{bot_resp_id}/stream")(self.resume_user_message_stream)
         router.post("/chat/{chat_id}/ai-message")(self.create_ai_message)
         router.post("/chat/{chat_id}/rename")(self.rename_chat)
         router.post("/chat/{chat_id}/generate-name")(self.generate_chat_name)
+        router.get("/chat/{chat_id}/generate-name")(self.get_generated_chat_name)
         return router
 
     def _create_document_router(self) -> APIRouter:
         """Create router for document management endpoints."""
         router = APIRouter(tags=["Document Management"])
-        router.post("/documents/upload")(self.upload_document)
+        router.post("/documents/upload", status_code=202)(self.upload_document)
+        router.get("/documents/{document_id}/status")(self.get_document_status)
+        router.get("/documents/{document_id}/events")(self.stream_document_status)
+        router.post("/documents/{document_id}/cancel")(self.cancel_document_processing)
+        router.post("/documents/{document_id}/search")(self.search_document)
         router.delete("/documents/{document_id}")(self.delete_document)
         return router
 
@@ -167,9 +228,22 @@ class AIAssistantAPI:
         """Health check endpoint for the API.
 
         Returns:
-            dict: A simple greeting message.
+            dict | JSONResponse: A simple greeting message and the state of the upstream circuit breakers. A 503
+                response if the product support circuit is open and configured to fail the health check.
         """
-        return {"Hello": "World"}
+        breaker_health = self.circuit_breaker.health()
+        content = {"Hello": "World", "circuit_breakers": {self.circuit_breaker.name: breaker_health}}
+        if self.circuit_breaker.unhealthy_when_open and breaker_health["state"] == CircuitState.OPEN.value:
+            return JSONResponse(status_code=503, content=content)
+        return content
+
+    async def prometheus_metrics(self) -> Response:
+        """Expose the service metrics in Prometheus text format.
+
+        Returns:
+            Response: The current values of all registered metrics.
+        """
+        return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
     async def log_entry_point(self, entry_point_req: EntryPointModel, auth: Authentication = Depends(authorize)):
         """Endpoint to log entry point for a given message."""
@@ -181,11 +255,7 @@ class AIAssistantAPI:
                 tenant=entry_point_req.tenant_id,
             )
 
-            async def json_generator():
-                data = json.dumps({"code": 200, "message": "Entry Point logged successfully."})
-                yield data
-
-            return StreamingResponse(json_generator(), media_type="application/json")
+            return {"code": 200, "message": "Entry Point logged successfully."}
 
         except HTTPException as http_ex:
             raise http_ex
@@ -275,7 +345,7 @@ class AIAssistantAPI:
             req (FeedbackModel): The feedback_symbol, comments, chat_id, user_query_id, bot_resp_id.
 
         Returns:
-            StreamingResponse: A streaming response of Feedback is recieved
+            Dict[str, Any]: Confirmation that the feedback was received.
 
         Raises:
             HTTPException: If there is an error processing feedback.
@@ -297,11 +367,7 @@ class AIAssistantAPI:
             )
             await self.chat_mngmt.log_feedback(feedback, auth, self.chat_mngmt.conn_write)
 
-            async def json_generator():
-                data = json.dumps({"code": 200, "message": "Feedback received successfully."})
-                yield data
-
-            return StreamingResponse(json_generator(), media_type="application/json")
+            return {"code": 200, "message": "Feedback received successfully."}
 
         except HTTPException as http_ex:
             raise http_ex
@@ -312,25 +378,44 @@ class AIAssistantAPI:
         self,
         sort_by: str = Query(default="date", regex="^(date|name)$"),
         time_period: int = Query(default=90, ge=1),
+        if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
         auth: Authentication = Depends(authorize),
     ) -> List[ChatMetadata]:
         """Retrieve a list of all chats for the user.
 
+        The response carries an ETag; when the client sends it back in If-None-Match and no chat changed, a 304 is
+        returned without loading the chats.
+
         Args:
             sort_by (str): Sort order for chats. Options:
                 - "date": Sort by last updated timestamp (default)
                 - "name": Sort by chat title alphabetically
             time_period (int): Number of days to look back for chat updates (default: 90 days)
+            if_none_match (Optional[str]): The ETag of the client's copy of the list.
             auth (Authentication): Authentication dependency
 
         Returns:
             List[ChatMetadata]: List of chat metadata objects sorted according to sort_by parameter
         """
         try:
+            version = await self.chat_mngmt.get_chats_version(auth, self.chat_mngmt.conn_read, time_period=time_period)
+            etag = make_etag(
+                "chats",
+                sort_by,
+                time_period,
+                version["chat_count"],
+                version["last_updated_timestamp"],
+                version["titles"],
+            )
+            headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers=headers)
+
             chats: List[ChatMetadata] = await self.chat_mngmt.get_chats_from_user(
                 auth, self.chat_mngmt.conn_read, sort_by=sort_by, time_period=time_period
             )
-            return chats
+            # Serialize the models straight to bytes, the list can hold hundreds of chats
+            return FastJSONResponse(chats, headers=headers)
 
         except HTTPException as http_ex:
             raise http_ex
@@ -359,24 +444,49 @@ class AIAssistantAPI:
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
-    async def get_chat_with_messages(self, chat_id: str, auth: Authentication = Depends(authorize)) -> Dict[str, Chat]:
-        """Retrieve a chat with its messages for the authorized user."""
+    async def get_chat_with_messages(
+        self,
+        chat_id: str,
+        background_tasks: BackgroundTasks,
+        if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+        auth: Authentication = Depends(authorize),
+    ) -> Dict[str, Chat]:
+        """Retrieve a chat with its messages for the authorized user.
+
+        AI messages are served with the markdown stored when they were streamed. Older messages are rendered here and
+        the result is written back after the response is sent.
+
+        The response carries an ETag derived from the chat's last update and message count; when the client sends it
+        back in If-None-Match and the chat did not change, a 304 is returned without loading the messages.
+        """
         try:
+            version = await self.chat_mngmt.get_chat_version(chat_id, auth, self.chat_mngmt.conn_read)
+            etag = make_etag(
+                "chat", chat_id, version["chat_title"], version["last_updated_timestamp"], version["message_count"]
+            )
+            headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers=headers)
+
             chat: Chat = await self.chat_mngmt.get_chat_with_messages(chat_id, auth, self.chat_mngmt.conn_read)
 
+            backfill: Dict[str, str] = {}
             for message in chat.messages:
-                if message.sender == "ai":
-                    original_message = message.message
-
-                    formatted_message = format_message_with_markdown(
-                        message=original_message,
+                if message.sender == "ai" and not message.message.startswith("## message"):
+                    message.message = format_message_with_markdown(
+                        message=message.message,
                         retrieved_urls=message.metadata["retrieved_urls"],
                         open_ticket=message.metadata["open_ticket"],
                         ticket_info=message.metadata["ticket_info"] if "ticket_info" in message.metadata else {},
                     )
-                    message.message = formatted_message
+                    backfill[message.id] = message.message
 
-            return {"chat": chat}
+            if backfill:
+                background_tasks.add_task(
+                    self.chat_mngmt.backfill_ai_response_markdown, chat_id, backfill, self.chat_mngmt.conn_write
+                )
+
+            return FastJSONResponse({"chat": chat}, headers=headers)
 
         except HTTPException as http_ex:
             raise http_ex
@@ -401,22 +511,87 @@ class AIAssistantAPI:
         self,
         chat_id: str,
         user_message_req: UserMessageRequest,
+        request: Request,
         products: Optional[str] = Header(None, alias="X-Op-Product-Id"),
+        debug_timings: Optional[str] = Header(None, alias="X-Debug-Timings"),
         auth: Authentication = Depends(authorize),
     ):
-        """Receive a user message and add it to the chat. Streams back an AI generated response."""
+        """Receive a user message and add it to the chat. Streams back an AI generated response.
+
+        With the X-Debug-Timings header set, the stream ends with an event holding the per-phase timing breakdown.
+        """
         try:
             logger.info(f"Received User message for chat: {chat_id}")
-            chat = await self.chat_mngmt.get_chat_info(chat_id, auth, self.chat_mngmt.conn_read)
+            received_at = getattr(request.state, "received_at", time.monotonic())
+            timings = StreamTimings(auth.tenant_id, auth.org_id, started=received_at)
+            timings.add("auth", time.monotonic() - received_at)
+            with timings.phase("get_chat_info"):
+                chat = await self.chat_mngmt.get_chat_info(chat_id, auth, self.chat_mngmt.conn_read)
 
             if products:
                 products = json.loads(urllib.parse.unquote(products)).get("product_list", [])
 
-            # Forward message to ML API for now
+            # Forward message to ML API for now. The answer is produced in the background so that the client can
+            # resume the stream with Last-Event-ID if its connection drops.
+            bot_resp_id = str(uuid.uuid4())
+            stream = self.stream_registry.start(
+                bot_resp_id,
+                chat_id,
+                auth.user_id,
+                product_support(
+                    chat,
+                    user_message_req,
+                    products,
+                    auth,
+                    self.config,
+                    self.openai_chat,
+                    self.chat_mngmt,
+                    admission_controller=self.admission_controller,
+                    answer_cache=self.answer_cache,
+                    chat_logger=self.chat_logger,
+                    circuit_breaker=self.circuit_breaker,
+                    history_budgeter=self.history_budgeter,
+                    bot_resp_id=bot_resp_id,
+                    timings=timings,
+                    debug_timings=debug_timings is not None and debug_timings.lower() in ("1", "true", "yes"),
+                ),
+            )
             return EventSourceResponse(
-                product_support(chat, user_message_req, products, auth, self.config, self.openai_chat, self.chat_mngmt),
+                stream.follow(),
                 media_type="text/event-stream",
                 ping=30,
+                headers={"X-Bot-Response-Id": bot_resp_id},
+            )
+        except HTTPException as http_ex:
+            raise http_ex
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    async def resume_user_message_stream(
+        self,
+        chat_id: str,
+        bot_resp_id: str,
+        last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+        auth: Authentication = Depends(authorize),
+    ):
+        """Resume an AI response stream after a dropped connection.
+
+        Replays the events after Last-Event-ID and then follows the live stream. Streams can be resumed while they
+        are in flight and for a short time after they finished.
+        """
+        try:
+            stream = self.stream_registry.get(bot_resp_id)
+            if stream is None or stream.chat_id != chat_id or stream.owner != auth.user_id:
+                raise HTTPException(status_code=404, detail=f"Stream {bot_resp_id} not found or expired")
+            if last_event_id is not None and not last_event_id.isdigit():
+                raise HTTPException(status_code=400, detail="Last-Event-ID must be an event id of this stream")
+
+            logger.info(f"Resuming stream {bot_resp_id} for chat {chat_id} after event {last_event_id}")
+            return EventSourceResponse(
+                stream.follow(int(last_event_id) if last_event_id is not None else None),
+                media_type="text/event-stream",
+                ping=30,
+                headers={"X-Bot-Response-Id": bot_resp_id},
             )
         except HTTPException as http_ex:
             raise http_ex
@@ -450,10 +625,22 @@ class AIAssistantAPI:
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
+    async def _generate_title(self, chat_history: List[ChatMessage]) -> str:
+        """Generate the title of a chat history, for the title generation service."""
+        return await summarize_chat(self.openai_chat, chat_history, history_budgeter=self.title_history_budgeter)
+
+    async def _store_title(self, chat_id: str, title: str, auth: Authentication) -> None:
+        """Store the title of a chat, for the title generation service."""
+        await self.chat_mngmt.update_chat_title(chat_id, title, auth, self.chat_mngmt.conn_write)
+
     async def generate_chat_name(
         self, chat_id: str, request: GenerateNameRequest, auth: Authentication = Depends(authorize)
     ) -> GenerateNameResponse:
-        """Generate a name for a chat, taking into consideration the conversation history."""
+        """Generate a name for a chat, taking into consideration the conversation history.
+
+        The name is generated in the background. The response carries a provisional name made from the first user
+        message with the status "pending", `GET /chat/{chat_id}/generate-name` returns the final name once stored.
+        """
         try:
             chat_info = await self.chat_mngmt.get_chat_info(chat_id, auth, self.chat_mngmt.conn_read)
             if chat_info is None:
@@ -463,9 +650,31 @@ class AIAssistantAPI:
                 raise HTTPException(status_code=400, detail="No chat_history provided.")
 
             # Generate name from provided chat history
-            new_chat_name = await summarize_chat(self.openai_chat, request.chat_history)
-            await self.chat_mngmt.update_chat_title(chat_id, new_chat_name, auth, self.chat_mngmt.conn_write)
-            return GenerateNameResponse(name=new_chat_name)
+            job = self.title_service.submit(chat_id, request.chat_history, auth)
+            return GenerateNameResponse(name=job.name, status=job.status)
+
+        except HTTPException as http_ex:
+            raise http_ex
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    async def get_generated_chat_name(
+        self,
+        chat_id: str,
+        wait: float = Query(default=0, ge=0, le=30, description="Seconds to wait for a pending name."),
+        auth: Authentication = Depends(authorize),
+    ) -> GenerateNameResponse:
+        """Return the name being generated for a chat, optionally waiting until it is ready."""
+        try:
+            chat_info = await self.chat_mngmt.get_chat_info(chat_id, auth, self.chat_mngmt.conn_read)
+            if chat_info is None:
+                raise HTTPException(status_code=404, detail=f"Chat {chat_id} not found or user does not have access")
+
+            job = await self.title_service.wait(chat_id, wait)
+            if job is None:
+                # No generation in progress or remembered, the stored title is final
+                return GenerateNameResponse(name=chat_info.name, status="ready")
+            return GenerateNameResponse(name=job.name, status=job.status)
 
         except HTTPException as http_ex:
             raise http_ex
@@ -475,63 +684,59 @@ class AIAssistantAPI:
     async def upload_document(
         self, file: UploadFile, auth: Authentication = Depends(authorize)
     ) -> DocumentUploadResponse:
-        """Upload and process a document.
-
-        This endpoint accepts .docx and .xml files, processes them to extract text,
-        generates embeddings, and stores the original document and embeddings in S3.
-        It also logs the document information to the database.
+        """Accept a document and process it in the background.
 
-        If a chat_id is provided, it will create a file message in the chat and return
-        a message object. Otherwise, it will just return document upload information.
+        This endpoint accepts .pdf and .xml files. The upload is spooled to disk, logged to the database with the
+        status "processing" and answered at once with its document ID. Text extraction, embeddings and the upload to
+        S3 run in the background; follow them with `GET /documents/{document_id}/status` or the progress stream of
+        `GET /documents/{document_id}/events`.
 
         Args:
             file (UploadFile): The document file to upload.
             auth (Authentication): The authentication object.
 
         Returns:
-            DocumentUploadResponse: Response containing document ID and status,
-                or a message object if chat_id is provided.
+            DocumentUploadResponse: Response containing document ID and the status "processing".
 
         Raises:
-            HTTPException: If there is an error processing the document.
+            HTTPException: If the file type is not supported, the file is too large or it cannot be logged.
         """
         try:
             logger.info(f"Received document upload request: {file.filename}")
 
-            # Get file size (convert from bytes to KB)
-            file.file.seek(0, os.SEEK_END)
-            file_size = file.file.tell() // 1024
-            file.file.seek(0)
-
-            # Process the document
-            result = await self.document_handler.process_document(
-                file=file, tenant_id=auth.tenant_id or "unknown", user_id=auth.user_id or auth.EmailAddress
-            )
+            # Spool the upload to disk, checking its type and size on the way
+            upload = await self.document_handler.spool(file)
+            document_id = str(uuid.uuid4())
 
             # Extract file extension
-            file_extension = os.path.splitext(str(file.filename))[1].lower()
-            file_type = file_extension[1:] if file_extension.startswith(".") else file_extension
+            file_type = upload.extension[1:]
 
             # Generate a UUID for the message
             message_id = str(uuid.uuid4())
 
-            # Log document upload to database
-            await self.chat_mngmt.log_document_upload(
-                document_id=result["document_id"],
-                file_name=file.filename,
-                file_type=file_type,
-                file_size=file_size,
-                user_query_id=message_id,
-                auth=auth,
-                conn=self.chat_mngmt.conn_write,
-            )
+            # Log document upload to database, the status is updated when the processing ends
+            try:
+                await self.chat_mngmt.log_document_upload(
+                    document_id=document_id,
+                    file_name=file.filename,
+                    file_type=file_type,
+                    file_size=upload.size // 1024,
+                    user_query_id=message_id,
+                    auth=auth,
+                    conn=self.chat_mngmt.conn_write,
+                    status="processing",
+                )
+            except Exception:
+                upload.close()
+                raise
 
-            logger.info(f"Document processed and logged successfully: {result['document_id']}")
+            self.document_jobs.submit(document_id, upload, auth)
+            logger.info(f"Document accepted for processing: {document_id}")
             return DocumentUploadResponse(
-                document_id=result["document_id"],
+                document_id=document_id,
                 filename=file.filename,
-                status="success",
-                message=f"Document '{file.filename}' was uploaded successfully.",
+                status="processing",
+                message=f"Document '{file.filename}' was uploaded and is being processed.",
             )
 
         except HTTPException as http_ex:
@@ -541,6 +746,146 @@ class AIAssistantAPI:
             logger.error(f"Error uploading document: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Error uploading document: {str(e)}")
 
+    async def _process_document(self, job: DocumentJob) -> Dict[str, Any]:
+        """Process the document of a job, for the document job manager."""
+        return await self.document_handler.process_upload(
+            job.upload, job.document_id, job.tenant_id, job.owner, progress=job.report
+        )
+
+    async def _store_document_status(self, job: DocumentJob) -> None:
+        """Store the final status of a document job, for the document job manager."""
+        await self.chat_mngmt.update_document_processing_status(
+            job.document_id, job.status, job.error, job.auth, self.chat_mngmt.conn_write
+        )
+
+    def _own_document_job(self, document_id: str, auth: Authentication) -> Optional[DocumentJob]:
+        """Return the job of a document processed by this instance for the user, if any."""
+        job = self.document_jobs.get(document_id)
+        if job is None or job.owner != (auth.user_id or auth.EmailAddress) or job.auth.tenant_id != auth.tenant_id:
+            return None
+        return job
+
+    async def get_document_status(
+        self, document_id: str, auth: Authentication = Depends(authorize)
+    ) -> DocumentStatusResponse:
+        """Return the processing status of a document.
+
+        Documents processed by this instance report their current stage and progress, the others the status stored
+        in the database.
+
+        Raises:
+            HTTPException: 404 if the user has no such document.
+        """
+        try:
+            job = self._own_document_job(document_id, auth)
+            if job is not None:
+                return DocumentStatusResponse(**job.snapshot())
+
+            row = await self.chat_mngmt.get_document_processing_status(document_id, auth, self.chat_mngmt.conn_read)
+            if row is None:
+                raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+            return DocumentStatusResponse(
+                document_id=document_id, filename=row["file_name"], status=row["status"], error=row["status_detail"]
+            )
+        except HTTPException as http_ex:
+            raise http_ex
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    async def stream_document_status(
+        self,
+        document_id: str,
+        last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+        auth: Authentication = Depends(authorize),
+    ):
+        """Stream the processing progress of a document as server-sent events.
+
+        Each "progress" event carries the status of `GET /documents/{document_id}/status`. The stream replays the
+        events after Last-Event-ID and ends when the processing ends. For a document not processed by this instance,
+        the stored status is sent as a single event.
+        """
+        try:
+            job = self._own_document_job(document_id, auth)
+            if job is None:
+                status = await self.get_document_status(document_id, auth)
+
+                async def stored_status() -> AsyncIterator[dict]:
+                    yield {"event": "progress", "data": status.model_dump_json()}
+
+                return EventSourceResponse(stored_status(), media_type="text/event-stream")
+
+            if last_event_id is not None and not last_event_id.isdigit():
+                raise HTTPException(status_code=400, detail="Last-Event-ID must be an event id of this stream")
+            return EventSourceResponse(
+                job.follow(int(last_event_id) if last_event_id is not None else None),
+                media_type="text/event-stream",
+                ping=30,
+            )
+        except HTTPException as http_ex:
+            raise http_ex
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    async def cancel_document_processing(
+        self, document_id: str, auth: Authentication = Depends(authorize)
+    ) -> DocumentStatusResponse:
+        """Cancel the processing of a document.
+
+        Raises:
+            HTTPException: 404 if the document is not being processed by this instance for the user, 409 if its
+                processing already ended.
+        """
+        job = self._own_document_job(document_id, auth)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Document {document_id} is not being processed")
+        if not await self.document_jobs.cancel(document_id):
+            raise HTTPException(status_code=409, detail=f"Processing of document {document_id} already ended")
+        logger.info(f"Processing of document {document_id} cancelled by the user")
+        return DocumentStatusResponse(**job.snapshot())
+
+    async def search_document(
+        self, document_id: str, req: DocumentSearchRequest, auth: Authentication = Depends(authorize)
+    ) -> DocumentSearchResponse:
+        """Search the chunks of an uploaded document most similar to a query.
+
+        The chunks are searched in process, the index of the document is loaded from S3 on the first search and kept
+        in memory while it is searched.
+
+        Args:
+            document_id (str): The ID of the document.
+            req (DocumentSearchRequest): The query and the number of chunks to return.
+            auth (Authentication): The authentication object.
+
+        Returns:
+            DocumentSearchResponse: The most similar chunks with their scores and page ranges.
+
+        Raises:
+            HTTPException: 404 if the user has no such document, 409 if it is not ready to be searched.
+        """
+        try:
+            row = await self.chat_mngmt.get_document_processing_status(document_id, auth, self.chat_mngmt.conn_read)
+            if row is None or not row["is_active"]:
+                raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+            if row["status"] != "ready":
+                raise HTTPException(status_code=409, detail=f"Document {document_id} is {row['status']}")
+
+            results = await self.document_handler.search_document(
+                tenant_id=auth.tenant_id or "unknown",
+                user_id=auth.user_id or auth.EmailAddress,
+                document_id=document_id,
+                query=req.query,
+                top_k=req.top_k,
+            )
+            return DocumentSearchResponse(
+                document_id=document_id, results=[DocumentSearchResult(**result) for result in results]
+            )
+        except HTTPException as http_ex:
+            logger.error(f"Error searching document: {http_ex.detail}")
+            raise http_ex
+        except Exception as e:
+            logger.error(f"Error searching document: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Error searching document: {str(e)}")
+
     async def delete_document(
         self, document_id: str, auth: Authentication = Depends(authorize)
     ) -> DocumentDeleteResponse:
@@ -559,6 +904,11 @@ class AIAssistantAPI:
         try:
             logger.info(f"Received document delete request: {document_id}")
 
+            # Stop the processing of the document, if it is still running
+            cancelled = False
+            if self._own_document_job(document_id, auth) is not None:
+                cancelled = await self.document_jobs.cancel(document_id)
+
             # Delete the document from S3
             success = await self.document_handler.delete_from_s3(
                 tenant_id=auth.tenant_id or "unknown",
@@ -566,7 +916,8 @@ class AIAssistantAPI:
                 document_id=document_id,
             )
 
-            if not success:
+            # A document cancelled before it was stored has nothing in S3
+            if not success and not cancelled:
                 raise HTTPException(status_code=404, detail=f"Document {document_id} not found or could not be deleted")
 
             # Update status in db
@@ -490,6 +490,42 @@ class ResponseChunkProductSupport(BaseModel):
     invite_db_selection: bool = False
 
 
+class StreamStatusMessage(BaseModel):
+    """Represents a control event sent on the product support stream instead of AI content.
+
+    Attributes:
+        id (str): The ID of the AI response the status refers to.
+        message_type (str): Always "status" for status events.
+        status (str): The status of the stream ("queued" or "rejected").
+        code (int): HTTP-like status code describing the event (202 for queued, 429 for rejected).
+        message (str): A human readable description of the status.
+        queue_position (int | None): Position in the wait queue when the request is queued.
+        retry_after (int | None): Seconds the client should wait before retrying a rejected request.
+    """
+
+    id: str = ""
+    message_type: str = "status"
+    status: str
+    code: int
+    message: str = ""
+    queue_position: int | None = None
+    retry_after: int | None = None
+
+
+class StreamTimingsMessage(BaseModel):
+    """Represents the timing breakdown sent as the last event of a product support stream on request.
+
+    Attributes:
+        id (str): The ID of the AI response the timings refer to.
+        message_type (str): Always "timings" for timing events.
+        timings (Dict[str, Any]): Seconds spent per phase, time to first token, gap percentiles and stream sizes.
+    """
+
+    id: str = ""
+    message_type: str = "timings"
+    timings: Dict[str, Any] = Field(default_factory=dict)
+
+
 class RenameChatRequest(BaseModel):
     """Represents the request model for renaming a chat.
 
@@ -514,10 +550,13 @@ class GenerateNameResponse(BaseModel):
     """Represents the response model for generating a chat name.
 
     Attributes:
-        name (str): The generated chat name.
+        name (str): The generated chat name, or the provisional name while it is being generated.
+        status (str): "pending" while the name is being generated, "ready" once generated, "failed" if the
+            generation failed and the provisional name was kept.
     """
 
     name: str
+    status: Literal["pending", "ready", "failed"] = "ready"
 
 
 class DocumentUploadResponse(BaseModel):
@@ -548,3 +587,66 @@ class DocumentDeleteResponse(BaseModel):
     document_id: str
     status: str
     message: str
+
+
+class DocumentStatusResponse(BaseModel):
+    """Represents the processing status of an uploaded document.
+
+    Attributes:
+        document_id (str): The ID of the document.
+        filename (str | None): The name of the uploaded file.
+        status (str): "processing" while the document is processed, then "ready", "failed" or "cancelled".
+        stage (str | None): The last stage reached: queued, started, validated, parsed, chunked, embedded or stored.
+            None when the status comes from the database.
+        progress (Dict[str, Any]): Details of the stage, e.g. the number of chunks embedded and their total.
+        error (str | None): The error of a failed processing.
+    """
+
+    document_id: str
+    filename: str | None = None
+    status: Literal["processing", "ready", "failed", "cancelled"]
+    stage: str | None = None
+    progress: Dict[str, Any] = Field(default_factory=dict)
+    error: str | None = None
+
+
+class DocumentSearchRequest(BaseModel):
+    """Represents a search in the chunks of an uploaded document.
+
+    Attributes:
+        query (str): The text to search for.
+        top_k (int): The number of chunks to return, from 1 to 50.
+    """
+
+    query: str = Field(min_length=1)
+    top_k: int = Field(default=5, ge=1, le=50)
+
+
+class DocumentSearchResult(BaseModel):
+    """Represents a chunk of a document found by a search.
+
+    Attributes:
+        chunk_id (str): The ID of the chunk.
+        text (str): The text of the chunk.
+        score (float): The cosine similarity of the chunk with the query.
+        start_page (int | None): The first page of the chunk, None for documents without pages.
+        end_page (int | None): The last page of the chunk, None for documents without pages.
+    """
+
+    chunk_id: str
+    text: str
+    score: float
+    start_page: int | None = None
+    end_page: int | None = None
+
+
+class DocumentSearchResponse(BaseModel):
+    """Represents the response model for a document search.
+
+    Attributes:
+        document_id (str): The ID of the searched document.
+        results (List[DocumentSearchResult]): The most similar chunks, the most similar first.
+    """
+
+    document_id: str
+    results: List[DocumentSearchResult]
@@ -2,36 +2,96 @@
 
 Classes:
     - OpenaiUtils: A utility class that handles authentication with OpenAI via Azure and provides methods for chat
-    completions and retrieving embeddings.
+    completions and retrieving embeddings. The API keys are loaded at startup and refreshed in the background, the
+    clients share one HTTP connection pool across key rotations. Requests are spread over the deployments listed in
+    the secrets.
 
 Functions:
-    - authenticate_openai: Authenticates and initializes the OpenAI client for chat models.
-    - authenticate_openai_embedding: Authenticates and initializes the OpenAI client for embedding models.
     - get_parameter_from_secret: Retrieves configuration parameters from AWS Secrets Manager.
     - chat_completion: Performs chat completions with specified parameters and returns the response and token count.
     - chat_completion_stream: Performs streaming chat completions and yields parts of the response.
     - get_embedding: Retrieves text embeddings using specified OpenAI models.
+    - get_embeddings: Retrieves the embeddings of many texts with batched, concurrent requests.
+    - pack_embedding_batches: Groups texts into embedding requests within the input count and token limits.
 
 Dependencies:
     - boto3: For accessing AWS Secrets Manager.
     - openai: For interacting with OpenAI's models via Azure.
     - tenacity: For retry logic in API requests.
     - src.utils: Custom utility functions for loading configurations and caching.
+    - src.credentials: Keeps the API keys and clients fresh in the background.
+    - src.rate_governor: Keeps the requests within the rate limits of the deployments.
+    - src.deployment_pool: Routes the requests over several deployments and fails over between them.
     - src.count_tokens: A module for counting tokens in messages.
 
 The module relies on environment-specific configurations loaded from secrets and assumes the presence of specific
 models and credentials.
 """
-from typing import Dict, List, Optional, Any, Tuple, AsyncGenerator
+from typing import Awaitable, Callable, Dict, List, Optional, Any, Tuple, AsyncGenerator
+import asyncio
 from loguru import logger
 import boto3
-from openai import AsyncAzureOpenAI, AzureOpenAI
+from openai import AsyncAzureOpenAI, AzureOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, RateLimitError
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 import json
-from src.utils import load_config, ttl_cache
+from src.credentials import CredentialManager
+from src.deployment_pool import Deployment, DeploymentPool
+from src.rate_governor import Priority, RateGovernor
+from src.utils import load_config, load_local_secret
 from src import count_tokens
 
 
+def pack_embedding_batches(token_counts: List[int], max_inputs: int, max_tokens: int) -> List[Tuple[int, int]]:
+    """Group consecutive texts into embedding requests within the input count and token limits of the API.
+
+    A text larger than `max_tokens` on its own gets a request of its own.
+
+    Args:
+        token_counts (List[int]): The number of tokens of each text, in order.
+        max_inputs (int): The maximum number of texts per request.
+        max_tokens (int): The maximum number of tokens per request.
+
+    Returns:
+        List[Tuple[int, int]]: The start (inclusive) and end (exclusive) index of the texts of each request.
+    """
+    batches = []
+    start, tokens = 0, 0
+    for i, count in enumerate(token_counts):
+        if i > start and (i - start >= max_inputs or tokens + count > max_tokens):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += count
+    if start < len(token_counts):
+        batches.append((start, len(token_counts)))
+    return batches
+
+
+def deployment_settings(secret: Dict[str, Any], endpoint_key: str, deployments_key: str) -> List[Dict[str, Any]]:
+    """Read the deployments of a model from its secret.
+
+    The secret lists the deployments under `deployments_key`, each with a `name`, an `endpoint` and optionally its own
+    `api_key` and `api_version`. Secrets without the list describe a single deployment with `endpoint_key`.
+
+    Args:
+        secret (Dict[str, Any]): The model secret.
+        endpoint_key (str): The key of the endpoint of a single deployment.
+        deployments_key (str): The key of the list of deployments.
+
+    Returns:
+        List[Dict[str, Any]]: The name, endpoint, API key and API version of each deployment.
+    """
+    entries = secret.get(deployments_key) or [{"name": "primary", "endpoint": secret[endpoint_key]}]
+    return [
+        {
+            "name": entry.get("name", f"deployment-{i}"),
+            "endpoint": entry["endpoint"],
+            "api_key": entry.get("api_key", secret.get("api_key")),
+            "api_version": entry.get("api_version", secret.get("api_version")),
+        }
+        for i, entry in enumerate(entries)
+    ]
+
+
 class OpenaiUtils:
     """Utility class for interacting with OpenAI's API via Azure.
 
@@ -40,50 +100,123 @@ class OpenaiUtils:
     """
 
     def __init__(self):
-        """Initializes OpenaiUtils with configurations and authenticates OpenAI."""
+        """Initializes OpenaiUtils with configurations and loads the OpenAI credentials."""
         self.models = {
             "gpt-4": "gpt-4",
         }
         self.ct = count_tokens.CountTokens()
         self.config = load_config()
-        self.authenticate_openai()
-        self.authenticate_openai_embedding()
 
-    @ttl_cache(ttl=1800)
-    def authenticate_openai_embedding(self):
-        """Authenticate with Azure OpenAI for embedding models.
+        # Connection pools shared by all the clients, they are kept when a client is rebuilt after a key rotation
+        self.http_client = DefaultAsyncHttpxClient()
+        self.sync_http_client = DefaultHttpxClient()
 
-        Retrieves secrets from AWS Secrets Manager and initializes the
-        AzureOpenAI client for embedding models.
-        """
-        embedding_model_secrets = self.get_parameter_from_secret(
-            self.config["credentials"]["embedding_model_secret"],
-            self.config["credentials"]["region_name"],
+        credentials = self.config["credentials"]
+        refresh_seconds = credentials.get("refresh_seconds", 1800)
+        self.chat_credentials = CredentialManager(
+            "chat_model",
+            lambda: self.get_parameter_from_secret(credentials["chat_model_secret"], credentials["region_name"]),
+            self._build_chat_pool,
+            refresh_seconds=refresh_seconds,
         )
-        OPENAI_API_KEY = embedding_model_secrets["api_key"]
-        api_version = embedding_model_secrets["api_version"]
-        azure_endpoint = embedding_model_secrets["embedding_model_endpoint"]
-        self.openai_sync_client = AzureOpenAI(
-            api_key=OPENAI_API_KEY, api_version=api_version, azure_endpoint=azure_endpoint
+        self.embedding_credentials = CredentialManager(
+            "embedding_model",
+            lambda: self.get_parameter_from_secret(credentials["embedding_model_secret"], credentials["region_name"]),
+            self._build_embedding_clients,
+            refresh_seconds=refresh_seconds,
         )
+        self.rate_governor = RateGovernor.from_config(self.config)
+
+    def _build_pool(self, name: str, deployments: List[Dict[str, Any]]) -> DeploymentPool[AsyncAzureOpenAI]:
+        """Build a pool of Azure OpenAI clients, one per deployment, using the shared connection pool."""
+        return DeploymentPool(
+            name,
+            [
+                Deployment(
+                    deployment["name"],
+                    AsyncAzureOpenAI(
+                        api_key=deployment["api_key"],
+                        api_version=deployment["api_version"],
+                        azure_endpoint=deployment["endpoint"],
+                        http_client=self.http_client,
+                    ),
+                )
+                for deployment in deployments
+            ],
+            cooldown_seconds=self.config.get("deployment_pool", {}).get("cooldown_seconds", 10.0),
+        )
+
+    def _build_chat_pool(self, chat_model_secret: Dict[str, Any]) -> DeploymentPool[AsyncAzureOpenAI]:
+        """Build the pool of Azure OpenAI clients for chat models.
+
+        Args:
+            chat_model_secret (Dict[str, Any]): The chat model secret.
 
-    @ttl_cache(ttl=1800)
-    def authenticate_openai(self):
-        """Authenticate with Azure OpenAI for chat models.
+        Returns:
+            DeploymentPool[AsyncAzureOpenAI]: The clients of the chat deployments.
+        """
+        deployments = deployment_settings(chat_model_secret, "chat_model_endpoint_gpt-4.1", "chat_model_deployments")
+        return self._build_pool("chat", deployments)
+
+    def _build_embedding_clients(
+        self, embedding_model_secrets: Dict[str, Any]
+    ) -> Tuple[AzureOpenAI, DeploymentPool[AsyncAzureOpenAI]]:
+        """Build the synchronous client and the pool of asynchronous clients for embedding models.
+
+        Args:
+            embedding_model_secrets (Dict[str, Any]): The embedding model secret.
 
-        Retrieves secrets from AWS Secrets Manager and initializes the
-        AsyncAzureOpenAI client for chat models.
+        Returns:
+            Tuple[AzureOpenAI, DeploymentPool[AsyncAzureOpenAI]]: The synchronous client of the first deployment and
+                the asynchronous clients of all the deployments, using the shared connection pools.
         """
-        chat_model_secret = self.get_parameter_from_secret(
-            self.config["credentials"]["chat_model_secret"],
-            self.config["credentials"]["region_name"],
+        deployments = deployment_settings(
+            embedding_model_secrets, "embedding_model_endpoint", "embedding_model_deployments"
         )
-        OPENAI_API_KEY = chat_model_secret["api_key"]
-        api_version = chat_model_secret["api_version"]
-        azure_endpoint = chat_model_secret["chat_model_endpoint_gpt-4.1"]
-        self.openai_client = AsyncAzureOpenAI(
-            api_key=OPENAI_API_KEY, api_version=api_version, azure_endpoint=azure_endpoint
+        sync_client = AzureOpenAI(
+            api_key=deployments[0]["api_key"],
+            api_version=deployments[0]["api_version"],
+            azure_endpoint=deployments[0]["endpoint"],
+            http_client=self.sync_http_client,
         )
+        return sync_client, self._build_pool("embedding", deployments)
+
+    @property
+    def chat_pool(self) -> DeploymentPool[AsyncAzureOpenAI]:
+        """The current clients of the chat deployments."""
+        return self.chat_credentials.value
+
+    @property
+    def embedding_pool(self) -> DeploymentPool[AsyncAzureOpenAI]:
+        """The current asynchronous clients of the embedding deployments."""
+        return self.embedding_credentials.value[1]
+
+    @property
+    def openai_client(self) -> AsyncAzureOpenAI:
+        """The current client of the first chat deployment."""
+        return self.chat_pool.primary
+
+    @property
+    def openai_sync_client(self) -> AzureOpenAI:
+        """The current synchronous client for embedding models."""
+        return self.embedding_credentials.value[0]
+
+    @property
+    def openai_embedding_client(self) -> AsyncAzureOpenAI:
+        """The current asynchronous client of the first embedding deployment."""
+        return self.embedding_pool.primary
+
+    def start_credential_refresh(self) -> None:
+        """Start refreshing the credentials in the background. Must be called from the event loop."""
+        self.chat_credentials.start()
+        self.embedding_credentials.start()
+
+    async def close(self) -> None:
+        """Stop refreshing the credentials and close the connection pools."""
+        await self.chat_credentials.stop()
+        await self.embedding_credentials.stop()
+        await self.http_client.aclose()
+        self.sync_http_client.close()
 
     def get_parameter_from_secret(self, secret_name, region_name="us-east-1"):
         """Retrieve secrets from AWS Secrets Manager.
@@ -98,6 +231,10 @@ class OpenaiUtils:
         Raises:
             Exception: If there is an error retrieving the secret.
         """
+        local_secret = load_local_secret(secret_name)
+        if local_secret is not None:
+            return local_secret
+
         try:
             # Create a Secrets Manager client
             client = boto3.client(service_name="secretsmanager", region_name=region_name)
@@ -108,6 +245,36 @@ class OpenaiUtils:
 
         return json.loads(get_secret_value_response["SecretString"])
 
+    async def _send(
+        self,
+        deployment: Deployment[AsyncAzureOpenAI],
+        model: str,
+        token_count: int,
+        priority: Priority,
+        create: Callable[[AsyncAzureOpenAI], Awaitable[Any]],
+    ) -> Any:
+        """Send a request to a deployment within its rate limits.
+
+        Args:
+            deployment (Deployment[AsyncAzureOpenAI]): The deployment picked by the pool.
+            model (str): The model deployment name.
+            token_count (int): The estimated number of tokens of the request.
+            priority (Priority): The priority of the request.
+            create (Callable[[AsyncAzureOpenAI], Awaitable[Any]]): Sends the request with `with_raw_response`.
+
+        Returns:
+            Any: The parsed response.
+        """
+        limit_key = f"{deployment.name}/{model}"
+        await self.rate_governor.acquire(limit_key, token_count, priority)
+        try:
+            raw_response = await create(deployment.client)
+        except RateLimitError as e:
+            self.rate_governor.update_from_headers(limit_key, e.response.headers, throttled=True)
+            raise
+        self.rate_governor.update_from_headers(limit_key, raw_response.headers)
+        return raw_response.parse()
+
     @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6))
     async def chat_completion(
         self,
@@ -116,6 +283,7 @@ class OpenaiUtils:
         temperature: float = 0.0,
         tools: Optional[List[Dict[str, Any]]] = None,
         tool_choice: Any = None,
+        priority: Priority = Priority.INTERACTIVE,
     ) -> Tuple[Any, int]:
         """Perform a chat completion with OpenAI models.
 
@@ -125,15 +293,17 @@ class OpenaiUtils:
             temperature (float, optional): The sampling temperature. Defaults to 0.0.
             tools (Optional[List[Dict[str, Any]]], optional): A list of tools to use. Defaults to None.
             tool_choice (Any, optional): Specific tool choice. Defaults to None.
+            priority (Priority, optional): The priority of the request when the deployment is at its rate limit.
+                Defaults to Priority.INTERACTIVE.
 
         Returns:
-            Tuple[Any, int]: The response from the model and the token count.
+            Tuple[Any, int]: The response from the model and the approximate token count.
         """
-        token_count = await self.ct.get_count_tokens(messages, tools or [])
+        # An approximate count is enough for the rate limits, the exact count would encode the whole history
+        token_count = self.ct.estimate_count_tokens(messages, tools or [])
 
-        try:
-            self.authenticate_openai()
-            response = await self.openai_client.chat.completions.create(
+        def create(client: AsyncAzureOpenAI) -> Awaitable[Any]:
+            return client.chat.completions.with_raw_response.create(
                 model=model,
                 temperature=temperature,
                 messages=messages,
@@ -141,6 +311,11 @@ class OpenaiUtils:
                 tools=tools,
                 tool_choice=tool_choice,
             )
+
+        try:
+            response = await self.chat_pool.call(
+                lambda deployment: self._send(deployment, model, token_count, priority, create)
+            )
         except Exception as e:
             logger.error(f"Error in chat_completion: {e}")
 
@@ -164,10 +339,18 @@ class OpenaiUtils:
         Yields:
             str: The content of each message part from the stream.
         """
-        try:
-            stream = await self.openai_client.chat.completions.create(
+
+        def create(client: AsyncAzureOpenAI) -> Awaitable[Any]:
+            return client.chat.completions.with_raw_response.create(
                 model=model, temperature=temperature, messages=messages, stream=True, tools=tools
             )
+
+        try:
+            token_count = self.ct.estimate_count_tokens(messages, tools or [])
+            # Failover only applies until the stream starts
+            stream = await self.chat_pool.call(
+                lambda deployment: self._send(deployment, model, token_count, Priority.INTERACTIVE, create)
+            )
             async for resp in stream:
                 try:
                     content = resp.choices[0].delta.content or ""
@@ -189,7 +372,6 @@ class OpenaiUtils:
             List[float]: The embedding vector.
         """
         try:
-            self.authenticate_openai_embedding()
             response = self.openai_sync_client.embeddings.create(
                 model=model,
                 input=[text],
@@ -198,3 +380,76 @@ class OpenaiUtils:
             logger.error(f"Error in get_embedding: {e}")
 
         return response.data[0].embedding
+
+    async def get_embeddings(
+        self,
+        texts: List[str],
+        model="text-embedding-ada-002",
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> List[List[float]]:
+        """Retrieve the embeddings of many texts, in order.
+
+        The texts are packed into as few requests as the input count and token limits of the embeddings API allow
+        (`document_qa.embedding_batch` in the config), and a bounded number of requests run concurrently. Each request
+        is retried on its own.
+
+        Args:
+            texts (List[str]): The texts to embed.
+            model (str, optional): The embedding model to use. Defaults to "text-embedding-ada-002".
+            on_progress (Optional[Callable[[int], None]], optional): Called with the number of texts embedded so far
+                after each request. Defaults to None.
+
+        Returns:
+            List[List[float]]: The embedding vector of each text.
+        """
+        batch_config = self.config.get("document_qa", {}).get("embedding_batch", {})
+        token_counts = await self.ct.count_texts(texts, cache=False)
+        batches = pack_embedding_batches(
+            token_counts,
+            max_inputs=batch_config.get("max_inputs", 256),
+            max_tokens=batch_config.get("max_tokens", 100000),
+        )
+        semaphore = asyncio.Semaphore(batch_config.get("max_concurrency", 4))
+        embedded = 0
+
+        async def embed(start: int, end: int) -> List[List[float]]:
+            nonlocal embedded
+            async with semaphore:
+                embeddings = await self._embed_batch(texts[start:end], model, sum(token_counts[start:end]))
+            embedded += end - start
+            if on_progress is not None:
+                on_progress(embedded)
+            return embeddings
+
+        results = await asyncio.gather(*(embed(start, end) for start, end in batches))
+        logger.info(f"Embedded {len(texts)} texts with {len(batches)} requests")
+        return [embedding for batch in results for embedding in batch]
+
+    @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(6), reraise=True)
+    async def _embed_batch(self, texts: List[str], model: str, token_count: int) -> List[List[float]]:
+        """Retrieve the embeddings of one batch of texts with a single request.
+
+        Embeddings are bulk work: when the deployment is at its rate limit, interactive requests go first. The batch
+        goes to the least busy embedding deployment and fails over to the others.
+
+        Args:
+            texts (List[str]): The texts of the batch.
+            model (str): The embedding model to use.
+            token_count (int): The number of tokens of the texts.
+
+        Returns:
+            List[List[float]]: The embedding vector of each text, in order.
+        """
+
+        def create(client: AsyncAzureOpenAI) -> Awaitable[Any]:
+            return client.embeddings.with_raw_response.create(model=model, input=texts)
+
+        try:
+            response = await self.embedding_pool.call(
+                lambda deployment: self._send(deployment, model, token_count, Priority.BULK, create)
+            )
+        except Exception as e:
+            logger.error(f"Error in get_embeddings for a batch of {len(texts)} texts: {e}")
+            raise
+        # The API returns the embeddings with the index of their input, sort to be safe
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
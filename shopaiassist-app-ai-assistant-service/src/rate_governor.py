@@ -0,0 +1,232 @@
+"""Client-side request and token rate governor for Azure OpenAI deployments.
+
+Chat titles, chat summaries and document embeddings share the quota of the Azure OpenAI deployments. Without a
+client-side limit they only find the quota through 429 responses and retries with long back-offs. The `RateGovernor`
+keeps a requests-per-minute and a tokens-per-minute token bucket per deployment and makes callers wait for capacity
+before sending a request. Waiting callers are served by priority, so interactive requests overtake bulk embeddings.
+
+The limits start from the configuration and follow the rate limit headers of the responses: the limit headers resize
+the buckets, the remaining headers lower their level when the server saw more usage than we did (e.g. other
+replicas), and the retry-after header of a 429 pauses the deployment. Azure OpenAI sends the remaining headers without
+the limit headers: a remaining count is what is left at that moment, not the capacity, so a bucket without a known
+limit stays unlimited until a limit header or the configuration gives one.
+
+Classes:
+    Priority: Priority of a request, lower values are served first.
+    TokenBucket: Token bucket refilled continuously up to a per-minute capacity.
+    RateGovernor: Per-deployment RPM and TPM buckets with a priority queue of waiting callers.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from loguru import logger
+from prometheus_client import Histogram
+
+RATE_GOVERNOR_WAIT_SECONDS = Histogram(
+    "openai_rate_governor_wait_seconds",
+    "Time requests waited for rate limit capacity before being sent to Azure OpenAI.",
+    ["deployment", "priority"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+
+class Priority(IntEnum):
+    """Priority of a request, lower values are served first."""
+
+    INTERACTIVE = 0
+    BULK = 1
+
+
+class TokenBucket:
+    """Token bucket refilled continuously up to a per-minute capacity. A capacity of None means unlimited."""
+
+    def __init__(self, per_minute: Optional[float]):
+        """Initialize a full bucket.
+
+        Args:
+            per_minute (Optional[float]): The capacity, refilled over a minute. None for no limit.
+        """
+        self.per_minute = per_minute
+        self.level = per_minute or 0.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.per_minute is not None:
+            self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        """Return how long to wait before `amount` can be taken, 0 if it can be taken now."""
+        if self.per_minute is None:
+            return 0.0
+        self._refill(now)
+        # A request larger than the bucket would wait forever, it only needs a full bucket
+        amount = min(amount, self.per_minute)
+        return max(0.0, (amount - self.level) * 60 / self.per_minute)
+
+    def take(self, amount: float, now: float) -> None:
+        """Take `amount` from the bucket."""
+        if self.per_minute is not None:
+            self._refill(now)
+            self.level -= min(amount, self.per_minute)
+
+    def resize(self, per_minute: float) -> None:
+        """Change the capacity, keeping the current level within it."""
+        self._refill(time.monotonic())
+        # An unlimited bucket that gets a limit starts full
+        self.level = per_minute if self.per_minute is None else min(self.level, per_minute)
+        self.per_minute = per_minute
+
+    def lower_to(self, remaining: float) -> None:
+        """Lower the level to what the server reports as remaining."""
+        if self.per_minute is not None:
+            self._refill(time.monotonic())
+            self.level = min(self.level, remaining)
+
+
+class _Deployment:
+    """Buckets, pause and waiting callers of one deployment."""
+
+    def __init__(self, rpm: Optional[float], tpm: Optional[float]):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self.waiters: List[Tuple[int, int]] = []
+        self.condition = asyncio.Condition()
+
+    def delay(self, tokens: float, now: float) -> float:
+        return max(self.paused_until - now, self.requests.delay(1, now), self.tokens.delay(tokens, now))
+
+
+class RateGovernor:
+    """Per-deployment requests-per-minute and tokens-per-minute buckets with a priority queue of waiting callers."""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        default_rpm: Optional[float] = None,
+        default_tpm: Optional[float] = None,
+        deployments: Optional[Dict[str, dict]] = None,
+    ):
+        """Initialize the governor.
+
+        Args:
+            enabled (bool, optional): Whether requests are governed. Defaults to True.
+            default_rpm (Optional[float], optional): Requests per minute of deployments without an override.
+                Defaults to None, no limit until the response headers give one.
+            default_tpm (Optional[float], optional): Tokens per minute of deployments without an override. Defaults to
+                None, no limit until the response headers give one.
+            deployments (Optional[Dict[str, dict]], optional): Per-deployment `rpm` and `tpm` overrides, by
+                "<endpoint>/<model>" or by model.
+        """
+        self.enabled = enabled
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.overrides = deployments or {}
+        self._deployments: Dict[str, _Deployment] = {}
+        self._sequence = itertools.count()
+
+    @classmethod
+    def from_config(cls, config: dict) -> "RateGovernor":
+        """Create a rate governor from the `openai_rate_limits` configuration section.
+
+        Args:
+            config (dict): The application configuration.
+
+        Returns:
+            RateGovernor: The configured rate governor.
+        """
+        settings = config.get("openai_rate_limits", {})
+        return cls(
+            enabled=settings.get("enabled", True),
+            default_rpm=settings.get("rpm"),
+            default_tpm=settings.get("tpm"),
+            deployments=settings.get("deployments", {}),
+        )
+
+    def _deployment(self, name: str) -> _Deployment:
+        if name not in self._deployments:
+            # Limits are keyed by "<endpoint>/<model>", the overrides can be given for the model on every endpoint
+            override = self.overrides.get(name) or self.overrides.get(name.rsplit("/", 1)[-1], {})
+            self._deployments[name] = _Deployment(
+                override.get("rpm", self.default_rpm), override.get("tpm", self.default_tpm)
+            )
+        return self._deployments[name]
+
+    async def acquire(self, deployment: str, tokens: int, priority: Priority = Priority.INTERACTIVE) -> None:
+        """Wait until a request of `tokens` tokens may be sent to a deployment, and account for it.
+
+        Args:
+            deployment (str): The Azure OpenAI deployment.
+            tokens (int): The estimated number of tokens of the request.
+            priority (Priority, optional): The priority of the request. Defaults to Priority.INTERACTIVE.
+        """
+        if not self.enabled:
+            return
+        state = self._deployment(deployment)
+        entry = (int(priority), next(self._sequence))
+        started = time.monotonic()
+        async with state.condition:
+            heapq.heappush(state.waiters, entry)
+            try:
+                while True:
+                    if state.waiters[0] != entry:
+                        await state.condition.wait()
+                        continue
+                    now = time.monotonic()
+                    delay = state.delay(tokens, now)
+                    if delay <= 0:
+                        state.requests.take(1, now)
+                        state.tokens.take(tokens, now)
+                        break
+                    try:
+                        # Woken early when a caller with a higher priority arrives or a pause is lifted
+                        await asyncio.wait_for(state.condition.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                state.waiters.remove(entry)
+                heapq.heapify(state.waiters)
+                state.condition.notify_all()
+        RATE_GOVERNOR_WAIT_SECONDS.labels(deployment=deployment, priority=priority.name.lower()).observe(
+            time.monotonic() - started
+        )
+
+    def update_from_headers(self, deployment: str, headers: Mapping[str, str], throttled: bool = False) -> None:
+        """Adapt the limits of a deployment to the rate limit headers of a response.
+
+        Args:
+            deployment (str): The Azure OpenAI deployment.
+            headers (Mapping[str, str]): The response headers.
+            throttled (bool, optional): Whether the response was a 429. Defaults to False.
+        """
+        if not self.enabled:
+            return
+        state = self._deployment(deployment)
+        for bucket, kind in ((state.requests, "requests"), (state.tokens, "tokens")):
+            limit = _number(headers.get(f"x-ratelimit-limit-{kind}"))
+            if limit:
+                bucket.resize(limit)
+            remaining = _number(headers.get(f"x-ratelimit-remaining-{kind}"))
+            if remaining is not None:
+                # Only lowers the level of a bucket with a known limit, the capacity never follows what is left
+                bucket.lower_to(remaining)
+
+        if throttled:
+            retry_after_ms = _number(headers.get("retry-after-ms"))
+            retry_after = retry_after_ms / 1000 if retry_after_ms is not None else _number(headers.get("retry-after"))
+            pause = retry_after if retry_after is not None else 1.0
+            state.paused_until = max(state.paused_until, time.monotonic() + pause)
+            logger.warning(f"Azure OpenAI deployment {deployment} throttled, pausing for {pause:.1f}s")
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
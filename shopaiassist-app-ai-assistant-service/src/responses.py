@@ -0,0 +1,30 @@
+"""Response classes for the AI Assistant API.
+
+Classes:
+    FastJSONResponse: JSON response serialized by pydantic-core, used as the default response class of the API.
+
+FastAPI's default JSONResponse goes through the standard library `json` module after converting the content to plain
+Python objects. `FastJSONResponse` renders with `pydantic_core.to_json` instead, which writes bytes directly from
+Rust and also accepts pydantic models, so handlers returning large models (chat history, chat list) can hand them over
+without the intermediate dict. See `benchmarks/bench_json_responses.py` for the measured difference.
+"""
+
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic_core import to_json
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with pydantic-core, accepting plain data as well as pydantic models."""
+
+    def render(self, content: Any) -> bytes:
+        """Serialize the content to JSON bytes.
+
+        Args:
+            content (Any): The content, plain JSON data or (containers of) pydantic models.
+
+        Returns:
+            bytes: The UTF-8 encoded JSON body.
+        """
+        return to_json(content)
@@ -4,16 +4,21 @@ This module provides a function to summarize a chat conversation by generating a
 of the messages.
 """
 from loguru import logger
-from typing import List
+from typing import List, Optional
+from src.history_budget import HistoryBudgeter
 from src.models import ChatMessage
 
 
-async def summarize_chat(openai_chat, chat_history: List[ChatMessage]) -> str:
+async def summarize_chat(
+    openai_chat, chat_history: List[ChatMessage], history_budgeter: Optional[HistoryBudgeter] = None
+) -> str:
     """Summarize the chat conversation by generating a title based on the content of the messages.
 
     Args:
         openai_chat: The OpenAI chat client instance.
         chat_history (List[ChatMessage]): The chat history to be summarized.
+        history_budgeter (Optional[HistoryBudgeter]): Trims the first messages to the token budget of the title
+            prompt. Defaults to None, the first messages are sent as is.
 
     Returns:
         str: The generated title for the chat conversation.
@@ -31,7 +36,10 @@ Follow these instructions when composing a response:
         {"role": "system", "content": system_prompt},
     ]
     # Process the first 5 messages from chat history
-    messages.extend(message.model_dump() for message in chat_history[:5])
+    history = chat_history[:5]
+    if history_budgeter is not None:
+        history = await history_budgeter.trim(history)
+    messages.extend(message.model_dump() for message in history)
 
     response = None
     try:
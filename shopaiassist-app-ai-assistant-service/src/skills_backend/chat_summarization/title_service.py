@@ -0,0 +1,223 @@
+"""Chat title generation in the background.
+
+Naming a chat takes a full chat completion, and every new chat asks for one. The `TitleGenerationService` answers the
+request at once with a provisional title made from the first user message, and generates the final title with a
+bounded number of background workers. Requests for a chat that is already waiting for its title are merged into the
+pending job, so bursts of requests for the same chat cost a single completion. The title is stored with
+`update_chat_title` once generated, and clients follow the job with the status endpoint, optionally waiting for it.
+
+Classes:
+    TitleJob: The title generation of one chat.
+    TitleGenerationService: Queue of title generation jobs served by background workers.
+
+Functions:
+    provisional_title: Builds a title from the first user message of a chat.
+"""
+
+import asyncio
+import re
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from loguru import logger
+from prometheus_client import Counter, Gauge
+
+from src.models import Authentication, ChatMessage
+
+TITLE_JOBS = Counter("chat_title_jobs_total", "Chat title generation jobs by outcome.", ["outcome"])
+TITLE_QUEUE_SIZE = Gauge("chat_title_queue_size", "Chat title generation jobs waiting for a worker.")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def provisional_title(chat_history: List[ChatMessage], max_words: int = 8, max_chars: int = 60) -> str:
+    """Build a title from the first user message of a chat.
+
+    Args:
+        chat_history (List[ChatMessage]): The chat history.
+        max_words (int, optional): Maximum number of words of the title. Defaults to 8.
+        max_chars (int, optional): Maximum length of the title. Defaults to 60.
+
+    Returns:
+        str: The first words of the first user message, "New chat" when there is none.
+    """
+    first = next((message.content for message in chat_history if message.role == "user"), "")
+    words = _WHITESPACE.sub(" ", first).strip().split(" ")
+    title = " ".join(words[:max_words])
+    if len(title) > max_chars:
+        title = title[:max_chars].rsplit(" ", 1)[0] or title[:max_chars]
+    if not title:
+        return "New chat"
+    return title + ("..." if title != " ".join(words) else "")
+
+
+class TitleJob:
+    """The title generation of one chat."""
+
+    def __init__(self, chat_id: str, chat_history: List[ChatMessage], auth: Authentication):
+        """Initialize a pending job.
+
+        Args:
+            chat_id (str): The chat to name.
+            chat_history (List[ChatMessage]): The chat history to name it from.
+            auth (Authentication): The authentication of the user who asked for the title.
+        """
+        self.chat_id = chat_id
+        self.chat_history = chat_history
+        self.auth = auth
+        self.name = provisional_title(chat_history)
+        # "pending" until the title is generated, then "ready", or "failed" if the provisional title was kept
+        self.status = "pending"
+        self.running = False
+        self.finished_at: Optional[float] = None
+        self.done = asyncio.Event()
+
+
+class TitleGenerationService:
+    """Queue of title generation jobs served by a bounded number of background workers."""
+
+    def __init__(
+        self,
+        generate: Callable[[List[ChatMessage]], Awaitable[str]],
+        store: Callable[[str, str, Authentication], Awaitable[None]],
+        max_concurrency: int = 4,
+        retention_seconds: float = 600,
+    ):
+        """Initialize the service.
+
+        Args:
+            generate (Callable[[List[ChatMessage]], Awaitable[str]]): Generates the title of a chat history, returns
+                an empty string on failure.
+            store (Callable[[str, str, Authentication], Awaitable[None]]): Stores the title of a chat.
+            max_concurrency (int, optional): Number of titles generated at the same time. Defaults to 4.
+            retention_seconds (float, optional): How long finished jobs can be queried. Defaults to 600.
+        """
+        self.generate = generate
+        self.store = store
+        self.max_concurrency = max_concurrency
+        self.retention_seconds = retention_seconds
+        self.jobs: Dict[str, TitleJob] = {}
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+
+    @classmethod
+    def from_config(
+        cls,
+        config: dict,
+        generate: Callable[[List[ChatMessage]], Awaitable[str]],
+        store: Callable[[str, str, Authentication], Awaitable[None]],
+    ) -> "TitleGenerationService":
+        """Create the service from the `title_generation` configuration section.
+
+        Args:
+            config (dict): The application configuration.
+            generate (Callable[[List[ChatMessage]], Awaitable[str]]): Generates the title of a chat history.
+            store (Callable[[str, str, Authentication], Awaitable[None]]): Stores the title of a chat.
+
+        Returns:
+            TitleGenerationService: The configured service.
+        """
+        settings = config.get("title_generation", {})
+        return cls(
+            generate,
+            store,
+            max_concurrency=settings.get("max_concurrency", 4),
+            retention_seconds=settings.get("retention_seconds", 600),
+        )
+
+    def start(self) -> None:
+        """Start the workers. Must be called from the event loop."""
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+
+    async def stop(self) -> None:
+        """Stop the workers, pending jobs are abandoned."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _forget_finished(self) -> None:
+        cutoff = time.monotonic() - self.retention_seconds
+        for chat_id in [c for c, job in self.jobs.items() if job.finished_at is not None and job.finished_at < cutoff]:
+            del self.jobs[chat_id]
+
+    def submit(self, chat_id: str, chat_history: List[ChatMessage], auth: Authentication) -> TitleJob:
+        """Ask for the title of a chat.
+
+        A chat already waiting for its title keeps its place in the queue and is named from the latest history.
+
+        Args:
+            chat_id (str): The chat to name.
+            chat_history (List[ChatMessage]): The chat history to name it from.
+            auth (Authentication): The authentication of the user.
+
+        Returns:
+            TitleJob: The job, its name is the provisional title until the final one is generated.
+        """
+        self._forget_finished()
+        job = self.jobs.get(chat_id)
+        if job is not None and job.status == "pending":
+            if not job.running:
+                job.chat_history, job.auth = chat_history, auth
+            TITLE_JOBS.labels(outcome="coalesced").inc()
+            return job
+
+        job = TitleJob(chat_id, chat_history, auth)
+        self.jobs[chat_id] = job
+        self._queue.put_nowait(chat_id)
+        TITLE_QUEUE_SIZE.set(self._queue.qsize())
+        return job
+
+    def get(self, chat_id: str) -> Optional[TitleJob]:
+        """Return the current or last title job of a chat, None if there is none."""
+        return self.jobs.get(chat_id)
+
+    async def wait(self, chat_id: str, timeout: float) -> Optional[TitleJob]:
+        """Wait until the title job of a chat is finished, at most `timeout` seconds.
+
+        Args:
+            chat_id (str): The chat.
+            timeout (float): Maximum time to wait.
+
+        Returns:
+            Optional[TitleJob]: The job, finished or not, None if the chat has no job.
+        """
+        job = self.jobs.get(chat_id)
+        if job is not None and timeout > 0:
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            chat_id = await self._queue.get()
+            TITLE_QUEUE_SIZE.set(self._queue.qsize())
+            job = self.jobs.get(chat_id)
+            try:
+                if job is not None and job.status == "pending" and not job.running:
+                    await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: TitleJob) -> None:
+        job.running = True
+        try:
+            title = await self.generate(job.chat_history)
+            if title:
+                await self.store(job.chat_id, title, job.auth)
+                job.name, job.status = title, "ready"
+            else:
+                # Keep the provisional title rather than leaving the chat unnamed
+                job.status = "failed"
+                await self.store(job.chat_id, job.name, job.auth)
+        except Exception as e:
+            logger.error(f"Error generating the title of chat {job.chat_id}: {e}")
+            job.status = "failed"
+        finally:
+            job.running = False
+            job.finished_at = time.monotonic()
+            job.done.set()
+            TITLE_JOBS.labels(outcome=job.status).inc()
@@ -0,0 +1,464 @@
+"""Storage of the embedded chunks of uploaded documents in S3.
+
+Chunks used to be gathered into a DataFrame of float64 embedding lists, pickled into memory and uploaded at the end:
+large objects, slow to load, and unsafe to unpickle for their readers. A `ChunkStore` opens a `ChunkWriter` per
+document, which receives the chunk records batch by batch as they are embedded:
+    - "arrow" (default): an Arrow IPC file, one record batch per batch of chunks. Uncompressed, so readers can
+      memory-map it and use the embeddings without copying or decoding them (`read_chunks` and `embedding_matrix`).
+    - "parquet": a Parquet file, one row group per batch of chunks. Smaller, but decoded when read.
+    - "pickle": a pickled DataFrame uploaded once complete, as before, for the readers not yet reading the columnar
+      formats.
+
+In the columnar formats the embeddings are a `FixedSizeList<float32>` column, a contiguous float32 matrix, and the
+metadata columns holding the same value for every chunk of a document are dictionary-encoded. The objects are streamed
+to S3 with a multipart upload in parts of `part_size_bytes`, so memory stays bounded by a part and a batch whatever the
+size of the document. `benchmarks/bench_chunk_storage.py` compares the size and load time of the formats.
+
+The object key is `tenant_id=<tenant>/user_id=<user>/<document_id>_<file name>` with the extension of the format, so
+deleting the document by prefix deletes it in every format.
+
+Classes:
+    S3MultipartSink: Write-only file object uploading to S3 in parts.
+    ChunkWriter: Receives the chunk records of one document and stores them.
+    ArrowChunkWriter: Streams the records to an Arrow IPC file in S3.
+    ParquetChunkWriter: Streams the records to a Parquet file in S3.
+    PickleChunkWriter: Uploads the records as a pickled DataFrame.
+    ChunkStore: Opens the chunk writers of documents.
+
+Functions:
+    chunk_schema: Returns the schema of the chunk records in the columnar formats.
+    read_chunks: Reads the chunks stored in a local file in a columnar format.
+    embedding_matrix: Returns the embeddings of read chunks as a float32 matrix.
+"""
+
+from abc import ABC, abstractmethod
+from io import BytesIO
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from loguru import logger
+
+# Columns holding the same value for every chunk of a document, dictionary-encoded
+DICTIONARY_COLUMNS = [
+    "Product",
+    "Content",
+    "root_link",
+    "url",
+    "Source",
+    "clean_path",
+    "content_type",
+    "published_date",
+    "file_name",
+    "title",
+    "description",
+]
+# Pages of the document covered by a chunk, 1-based and null for documents without pages
+PAGE_COLUMNS = ["start_page", "end_page"]
+EMBEDDING_COLUMN = "open_ai_embeddings"
+# Columns of the chunk records, in the order of the former DataFrame and then the page range
+COLUMNS = [*DICTIONARY_COLUMNS[:9], "raw_text", *DICTIONARY_COLUMNS[9:], "chunk_id", *PAGE_COLUMNS, EMBEDDING_COLUMN]
+
+# S3 rejects multipart uploads with parts under 5MB, except the last one
+_MIN_PART_SIZE = 5 * 1024 * 1024
+
+# Extensions of the stored objects by format
+_EXTENSIONS = {"arrow": ".arrow", "parquet": ".parquet", "pickle": ".pkl"}
+
+
+def chunk_schema(dimension: int) -> pa.Schema:
+    """Return the schema of the chunk records in the columnar formats.
+
+    Args:
+        dimension (int): The dimension of the embeddings.
+
+    Returns:
+        pa.Schema: The schema, with dictionary-encoded metadata, int32 pages and `FixedSizeList<float32>` embeddings.
+    """
+    fields = []
+    for name in COLUMNS:
+        if name == EMBEDDING_COLUMN:
+            fields.append((name, pa.list_(pa.float32(), dimension)))
+        elif name in DICTIONARY_COLUMNS:
+            fields.append((name, pa.dictionary(pa.int32(), pa.string())))
+        elif name in PAGE_COLUMNS:
+            fields.append((name, pa.int32()))
+        else:
+            fields.append((name, pa.string()))
+    return pa.schema(fields)
+
+
+class S3MultipartSink:
+    """Write-only file object uploading to S3 in parts.
+
+    Objects smaller than a part are uploaded with a single put when closed.
+    """
+
+    def __init__(self, s3_client: Any, bucket: str, key: str, part_size: int = 8 * 1024 * 1024):
+        """Initialize the sink, nothing is uploaded before the first part is full.
+
+        Args:
+            s3_client (Any): The boto3 S3 client.
+            bucket (str): The bucket.
+            key (str): The key of the object.
+            part_size (int, optional): Size of the uploaded parts, at least 5MB. Defaults to 8MB.
+        """
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, _MIN_PART_SIZE)
+        self.closed = False
+        self._buffer = bytearray()
+        self._position = 0
+        self._upload_id: Optional[str] = None
+        self._parts: List[Dict[str, Any]] = []
+
+    def writable(self) -> bool:
+        """Return True, the sink is writable."""
+        return True
+
+    def write(self, data: bytes) -> int:
+        """Buffer data and upload the full parts.
+
+        Args:
+            data (bytes): The data to write.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[: self.part_size]))
+            del self._buffer[: self.part_size]
+        return len(data)
+
+    def tell(self) -> int:
+        """Return the number of bytes written."""
+        return self._position
+
+    def flush(self) -> None:
+        """Do nothing, parts are uploaded once full."""
+
+    def _upload_part(self, data: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = self.s3_client.create_multipart_upload(Bucket=self.bucket, Key=self.key)["UploadId"]
+        part_number = len(self._parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, PartNumber=part_number, Body=data
+        )
+        self._parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+
+    def close(self) -> None:
+        """Upload the rest of the data and complete the upload."""
+        if self.closed:
+            return
+        self.closed = True
+        if self._upload_id is None:
+            self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer))
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, MultipartUpload={"Parts": self._parts}
+            )
+        self._buffer = bytearray()
+
+    def abort(self) -> None:
+        """Abort the upload, the uploaded parts are deleted."""
+        self.closed = True
+        self._buffer = bytearray()
+        if self._upload_id is not None:
+            try:
+                self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+            except Exception as e:
+                logger.error(f"Error aborting the upload of s3://{self.bucket}/{self.key}: {e}")
+
+
+class ChunkWriter(ABC):
+    """Receives the chunk records of one document and stores them. The methods block, call them in a thread."""
+
+    def __init__(self, bucket: str, key: str):
+        """Initialize the writer.
+
+        Args:
+            bucket (str): The bucket.
+            key (str): The key of the object.
+        """
+        self.bucket = bucket
+        self.key = key
+
+    @property
+    def uri(self) -> str:
+        """The S3 URI of the stored chunks."""
+        return f"s3://{self.bucket}/{self.key}"
+
+    @abstractmethod
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        """Write a batch of chunk records."""
+
+    @abstractmethod
+    def close(self) -> str:
+        """Complete the storage of the chunks and return their S3 URI."""
+
+    @abstractmethod
+    def abort(self) -> None:
+        """Drop the chunks, nothing is left in S3."""
+
+
+class _BatchEncoder:
+    """Encodes batches of chunk records as record batches of one document.
+
+    The dictionaries only grow from a batch to the next, so the file formats store each value once.
+    """
+
+    def __init__(self):
+        """Initialize the encoder, the schema is known with the first embedding."""
+        self.schema: Optional[pa.Schema] = None
+        self.dictionaries: Dict[str, Dict[str, int]] = {name: {} for name in DICTIONARY_COLUMNS}
+
+    def encode(self, records: List[Dict[str, Any]]) -> pa.RecordBatch:
+        """Encode a batch of chunk records.
+
+        Args:
+            records (List[Dict[str, Any]]): The records.
+
+        Returns:
+            pa.RecordBatch: The record batch.
+
+        Raises:
+            ValueError: If the embeddings do not all have the dimension of the first one.
+        """
+        embeddings = np.asarray([record[EMBEDDING_COLUMN] for record in records], dtype=np.float32)
+        if self.schema is None:
+            self.schema = chunk_schema(embeddings.shape[1] if embeddings.ndim == 2 else 0)
+        dimension = self.schema.field(EMBEDDING_COLUMN).type.list_size
+        if records and (embeddings.ndim != 2 or embeddings.shape[1] != dimension):
+            raise ValueError(f"Embeddings of chunks must all have dimension {dimension}")
+
+        arrays = []
+        for name in COLUMNS:
+            if name == EMBEDDING_COLUMN:
+                arrays.append(pa.FixedSizeListArray.from_arrays(pa.array(embeddings.reshape(-1)), dimension))
+            elif name in DICTIONARY_COLUMNS:
+                dictionary = self.dictionaries[name]
+                indices = [dictionary.setdefault(record.get(name) or "", len(dictionary)) for record in records]
+                arrays.append(
+                    pa.DictionaryArray.from_arrays(
+                        pa.array(indices, pa.int32()), pa.array(list(dictionary), pa.string())
+                    )
+                )
+            elif name in PAGE_COLUMNS:
+                arrays.append(pa.array([record.get(name) for record in records], pa.int32()))
+            else:
+                arrays.append(pa.array([record.get(name) for record in records], pa.string()))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+
+class _ColumnarChunkWriter(ChunkWriter):
+    """Streams the chunk records to a columnar file in S3, opened with the schema of the first batch."""
+
+    def __init__(self, s3_client: Any, bucket: str, key: str, part_size: int = 8 * 1024 * 1024):
+        """Initialize the writer.
+
+        Args:
+            s3_client (Any): The boto3 S3 client.
+            bucket (str): The bucket.
+            key (str): The key of the object.
+            part_size (int, optional): Size of the parts of the multipart upload. Defaults to 8MB.
+        """
+        super().__init__(bucket, key)
+        self.sink = S3MultipartSink(s3_client, bucket, key, part_size)
+        self._encoder = _BatchEncoder()
+        self._writer: Any = None
+
+    @abstractmethod
+    def _open(self, schema: pa.Schema) -> Any:
+        """Open the file writer on the sink, with the schema of the chunk records."""
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        """Write a batch of chunk records."""
+        batch = self._encoder.encode(records)
+        if self._writer is None:
+            self._writer = self._open(batch.schema)
+        self._writer.write_batch(batch)
+
+    def close(self) -> str:
+        """Write the footer of the file and complete the upload."""
+        if self._writer is None:
+            self._writer = self._open(chunk_schema(0))
+        self._writer.close()
+        self.sink.close()
+        return self.uri
+
+    def abort(self) -> None:
+        """Abort the upload."""
+        self.sink.abort()
+
+
+class ArrowChunkWriter(_ColumnarChunkWriter):
+    """Streams the chunk records to an uncompressed Arrow IPC file in S3, one record batch per batch."""
+
+    def _open(self, schema: pa.Schema) -> pa.ipc.RecordBatchFileWriter:
+        # The dictionaries grow between batches, the file format only accepts them as deltas
+        return pa.ipc.new_file(self.sink, schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+
+class ParquetChunkWriter(_ColumnarChunkWriter):
+    """Streams the chunk records to a Parquet file in S3, one row group per batch."""
+
+    def _open(self, schema: pa.Schema) -> pq.ParquetWriter:
+        # Dictionary pages only pay off for the metadata, not for the texts, IDs and embeddings
+        return pq.ParquetWriter(self.sink, schema, use_dictionary=DICTIONARY_COLUMNS)
+
+
+class PickleChunkWriter(ChunkWriter):
+    """Gathers the chunk records and uploads them as a pickled DataFrame."""
+
+    def __init__(self, s3_client: Any, bucket: str, key: str):
+        """Initialize the writer.
+
+        Args:
+            s3_client (Any): The boto3 S3 client.
+            bucket (str): The bucket.
+            key (str): The key of the object.
+        """
+        super().__init__(bucket, key)
+        self.s3_client = s3_client
+        self.records: List[Dict[str, Any]] = []
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        """Keep a batch of chunk records."""
+        self.records.extend(records)
+
+    def close(self) -> str:
+        """Pickle the records as a DataFrame and upload it."""
+        pickle_buffer = BytesIO()
+        pd.DataFrame(self.records).to_pickle(pickle_buffer)
+        pickle_buffer.seek(0)
+        self.s3_client.upload_fileobj(pickle_buffer, self.bucket, self.key)
+        self.records = []
+        return self.uri
+
+    def abort(self) -> None:
+        """Drop the records."""
+        self.records = []
+
+
+class ChunkStore:
+    """Opens the chunk writers of documents in the upload bucket."""
+
+    def __init__(
+        self, s3_client: Any, bucket: str, storage_format: str = "arrow", part_size_bytes: int = 8 * 1024 * 1024
+    ):
+        """Initialize the store.
+
+        Args:
+            s3_client (Any): The boto3 S3 client.
+            bucket (str): The bucket of the uploaded documents.
+            storage_format (str, optional): "arrow", "parquet" or "pickle". Defaults to "arrow".
+            part_size_bytes (int, optional): Size of the parts of the columnar uploads. Defaults to 8MB.
+        """
+        if storage_format not in _EXTENSIONS:
+            raise ValueError(f"Unsupported chunk storage format: {storage_format}")
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.format = storage_format
+        self.part_size_bytes = part_size_bytes
+
+    @classmethod
+    def from_config(cls, config: dict, s3_client: Any, bucket: str) -> "ChunkStore":
+        """Create a store from the `document_qa.storage` configuration section.
+
+        Args:
+            config (dict): The application configuration.
+            s3_client (Any): The boto3 S3 client.
+            bucket (str): The bucket of the uploaded documents.
+
+        Returns:
+            ChunkStore: The configured store.
+        """
+        settings = config.get("document_qa", {}).get("storage", {})
+        return cls(
+            s3_client,
+            bucket,
+            storage_format=settings.get("format", "arrow"),
+            part_size_bytes=settings.get("part_size_bytes", 8 * 1024 * 1024),
+        )
+
+    def key(self, tenant_id: str, user_id: str, document_id: str, stem: str) -> str:
+        """Build the key of the chunks of a document.
+
+        Args:
+            tenant_id (str): The tenant ID.
+            user_id (str): The user ID.
+            document_id (str): The document ID.
+            stem (str): The file name without its extension.
+
+        Returns:
+            str: The key, with the extension of the format.
+        """
+        return f"tenant_id={tenant_id}/user_id={user_id}/{document_id}_{stem}{_EXTENSIONS[self.format]}"
+
+    def open(self, tenant_id: str, user_id: str, document_id: str, stem: str) -> ChunkWriter:
+        """Open the writer of the chunks of a document.
+
+        Args:
+            tenant_id (str): The tenant ID.
+            user_id (str): The user ID.
+            document_id (str): The document ID.
+            stem (str): The file name without its extension.
+
+        Returns:
+            ChunkWriter: The writer, to be closed or aborted.
+        """
+        key = self.key(tenant_id, user_id, document_id, stem)
+        if self.format == "arrow":
+            return ArrowChunkWriter(self.s3_client, self.bucket, key, self.part_size_bytes)
+        if self.format == "parquet":
+            return ParquetChunkWriter(self.s3_client, self.bucket, key, self.part_size_bytes)
+        return PickleChunkWriter(self.s3_client, self.bucket, key)
+
+
+def read_chunks(path: str) -> pa.Table:
+    """Read the chunks stored in a local file in a columnar format, e.g. downloaded from S3.
+
+    Arrow files are memory-mapped and not copied: the table, and the matrix of `embedding_matrix` when the file has a
+    single record batch, point into the mapped file. Parquet files are memory-mapped but decoded.
+
+    Args:
+        path (str): The path of an ".arrow" or ".parquet" file.
+
+    Returns:
+        pa.Table: The chunks.
+
+    Raises:
+        ValueError: If the file is not in a columnar format.
+    """
+    if path.endswith(_EXTENSIONS["arrow"]):
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).read_all()
+    if path.endswith(_EXTENSIONS["parquet"]):
+        return pq.read_table(path, memory_map=True)
+    raise ValueError(f"Not a columnar chunk file: {path}")
+
+
+def embedding_matrix(table: pa.Table) -> np.ndarray:
+    """Return the embeddings of chunks as a float32 matrix, one row per chunk.
+
+    The matrix is a view of the table when the embeddings are in one contiguous array, one copy otherwise.
+
+    Args:
+        table (pa.Table): The chunks, e.g. from `read_chunks`.
+
+    Returns:
+        np.ndarray: The (chunks, dimension) matrix.
+    """
+    column = table.column(EMBEDDING_COLUMN)
+    dimension = column.type.list_size
+    values = [chunk.flatten().to_numpy(zero_copy_only=True) for chunk in column.chunks]
+    if len(values) == 1:
+        return values[0].reshape(-1, dimension)
+    return np.concatenate(values or [np.empty(0, np.float32)]).reshape(-1, dimension)
@@ -1,12 +1,14 @@
 """Handles document uploads, processing, and storage.
 
 This module provides functionality for:
+    - Spooling uploads to a temp file once, shared by validation and parsing.
     - Validating document types (.docx and .xml).
     - Extracting text from documents.
     - Chunking text into manageable pieces.
-    - Generating embeddings using OpenAI.
-    - Storing documents and embeddings in S3.
+    - Generating embeddings using OpenAI, reusing cached embeddings of already seen chunks.
+    - Chunking, embedding and storing documents as a pipeline, the chunks streamed to S3 as they are embedded.
     - Deleting documents from S3.
+    - Searching the chunks of a document in process, with an LRU cache of document indexes.
 
 Classes:
     DocumentHandler: Handles document processing and storage operations.
@@ -20,27 +22,31 @@ Dependencies:
     - src.openai_utils: For generating embeddings.
     - src.utils: For loading configuration.
 """
+import asyncio
 import os
+import tempfile
 import uuid
 import boto3
 import pandas as pd
-from io import BytesIO
 import docx
 import tiktoken
-from typing import List, Dict, Tuple, BinaryIO
+from typing import Any, Callable, Iterator, List, Dict, Optional, Tuple, BinaryIO
 from fastapi import UploadFile, HTTPException
 from loguru import logger
-import tempfile
 from pathlib import Path
-from tqdm import tqdm
 from langchain_text_splitters import CharacterTextSplitter
 import xml.etree.ElementTree as ET
 from PyPDF2 import PdfReader
-from concurrent.futures import ThreadPoolExecutor
 
 from src.utils import load_config
+from src.count_tokens import TokenEstimator
 from src.openai_utils import OpenaiUtils
-from src.skills_backend.document_qa.trlabs_smartPDFParser.file_reader import DocTreePDFReader
+from src.skills_backend.document_qa.embedding_cache import EmbeddingCache
+from src.skills_backend.document_qa.spooled_upload import SpooledUpload, spool_upload
+from src.skills_backend.document_qa.layout_parser_client import LayoutParserClient, LayoutParserError
+from src.skills_backend.document_qa.chunk_store import ChunkStore, ChunkWriter, read_chunks
+from src.skills_backend.document_qa.ingest_pipeline import IngestPipeline
+from src.skills_backend.document_qa.vector_index import DocumentIndex, DocumentIndexCache
 
 
 class FileParseError(Exception):
@@ -49,77 +55,139 @@ class FileParseError(Exception):
     pass
 
 
+# Receives the stage reached by the processing of a document and its details, e.g. ("embedded", {"done": 3})
+ProgressCallback = Callable[..., None]
+
+
 class DocumentHandler:
     """Handler for document processing and storage operations."""
 
-    def __init__(self):
-        """Initialize the DocumentHandler with configuration settings."""
+    def __init__(self, openai_utils: Optional[OpenaiUtils] = None):
+        """Initialize the DocumentHandler with configuration settings.
+
+        Args:
+            openai_utils (Optional[OpenaiUtils], optional): OpenAI utilities to share with the rest of the
+                application, so that credentials and connection pools are not duplicated. Defaults to a new instance.
+        """
         self.config = load_config()
         self.document_upload_dir = self.config["document_qa"]["document_upload_dir"]
         self.s3_client = boto3.client("s3")
-        self.openai_utils = OpenaiUtils()
-        self.pdf_parser = DocTreePDFReader(self.config["document_qa"]["pdf_parser_url"])
-        self.tokenizer = tiktoken.encoding_for_model(self.config["document_qa"]["embedding_model"])
+        self.openai_utils = openai_utils or OpenaiUtils()
+        self.embedding_deployment = self.config["document_qa"].get("embedding_deployment", "text-embedding-ada-002")
+        self.embedding_cache = EmbeddingCache.from_config(self.config)
+        # The layout parser is called on the connection pool shared with the OpenAI clients
+        self.pdf_parser = LayoutParserClient.from_config(self.config, self.openai_utils.http_client)
+        # The chunking only checks chunks against the chunk size, the estimator skips encoding those that fit in bytes
+        self.tokenizer = TokenEstimator(tiktoken.encoding_for_model(self.config["document_qa"]["embedding_model"]))
         self.bucket_name = self.document_upload_dir.split("/")[2]
+        self.chunk_store = ChunkStore.from_config(self.config, self.s3_client, self.bucket_name)
+        self.ingest_pipeline = IngestPipeline.from_config(self.config)
+        self.index_cache = DocumentIndexCache.from_config(self.config)
         self.max_file_size = 10 * 1024 * 1024  # 10MB in bytes
         self.supported_file_types = [".pdf", ".xml"]  # , ".docx"]
+        # Uploads are spooled under temp/ in the project root
+        self.spool_dir = str(Path(__file__).parent.parent.parent.parent / "temp")
 
-    def _generate_embedding_for_chunk(self, chunk_content: str) -> List[float]:
-        """Generate embedding for a single chunk - thread-safe helper method.
+    async def _embed_chunks(self, chunks: List[str], progress: Optional[ProgressCallback] = None) -> List[List[float]]:
+        """Generate the embeddings of chunks, only sending the chunks missing from the embedding cache to Azure.
 
         Args:
-            chunk_content (str): The text content to generate embedding for.
+            chunks (List[str]): The chunk texts.
+            progress (Optional[ProgressCallback], optional): Receives the "embedded" stage with the number of chunks
+                embedded so far. Defaults to None.
 
         Returns:
-            List[float]: The embedding vector.
+            List[List[float]]: The embedding of each chunk, in order.
         """
-        return self.openai_utils.get_embedding(chunk_content)
 
-    async def validate_document(self, file: UploadFile) -> bool:
-        """Validate the document file type, size, and content.
+        def report(cached: int) -> Optional[Callable[[int], None]]:
+            if progress is None:
+                return None
+            progress("embedded", done=cached, total=len(chunks))
+            return lambda embedded: progress("embedded", done=cached + embedded, total=len(chunks))
 
-        Args:
-            file (UploadFile): The uploaded file object.
+        if not self.embedding_cache.enabled:
+            return await self.openai_utils.get_embeddings(
+                chunks, model=self.embedding_deployment, on_progress=report(0)
+            )
 
-        Returns:
-            bool: True if the document is valid, False otherwise.
+        embeddings = await asyncio.to_thread(self.embedding_cache.get_many, self.embedding_deployment, chunks)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        logger.info(f"Embedding cache: {len(chunks) - len(missing)} of {len(chunks)} chunks cached")
+        on_progress = report(len(chunks) - len(missing))
+        if missing:
+            missing_chunks = [chunks[i] for i in missing]
+            new_embeddings = await self.openai_utils.get_embeddings(
+                missing_chunks, model=self.embedding_deployment, on_progress=on_progress
+            )
+            await asyncio.to_thread(
+                self.embedding_cache.put_many, self.embedding_deployment, missing_chunks, new_embeddings
+            )
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = embedding
+        return embeddings
 
-        Raises:
-            HTTPException: If the document is invalid.
-        """
-        # Check file size
-        file.file.seek(0, os.SEEK_END)
-        file_size = file.file.tell()
-        file.file.seek(0)
+    def validate_file_type(self, filename: Optional[str]) -> None:
+        """Check the file type from the file name, before reading the upload.
 
-        if file_size > self.max_file_size:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File size exceeds the maximum allowed size of {self.max_file_size / (1024 * 1024)}MB",
-            )
+        Args:
+            filename (Optional[str]): The name of the uploaded file.
 
-        # Check file type
-        file_extension = os.path.splitext(str(file.filename))[1].lower()
+        Raises:
+            HTTPException: If the file type is not supported.
+        """
+        file_extension = os.path.splitext(str(filename))[1].lower()
         if file_extension not in self.supported_file_types:
             raise HTTPException(
                 status_code=400,
                 detail=f"Unsupported file type. Supported types are: {', '.join(self.supported_file_types)}",
             )
 
+    async def spool(self, file: UploadFile) -> SpooledUpload:
+        """Check the file type and stream the upload to a temp file, within the maximum file size.
+
+        Args:
+            file (UploadFile): The uploaded file object.
+
+        Returns:
+            SpooledUpload: The spooled upload, to be closed by the caller.
+
+        Raises:
+            HTTPException: If the file type is not supported (400) or the file is too large (413).
+        """
+        self.validate_file_type(file.filename)
+        return await spool_upload(file, self.max_file_size, self.spool_dir)
+
+    async def validate_document(self, upload: SpooledUpload) -> bool:
+        """Validate the content of a spooled document.
+
+        The file type and size are checked while spooling, see `spool`.
+
+        Args:
+            upload (SpooledUpload): The spooled upload.
+
+        Returns:
+            bool: True if the document is valid, False otherwise.
+
+        Raises:
+            HTTPException: If the document type is not supported.
+            FileParseError: If the document content is invalid.
+        """
+        self.validate_file_type(upload.filename)
+
         # Perform content-specific validation
-        if file_extension == ".pdf":
-            is_valid, error_message = await self.validate_pdf(file)
+        if upload.extension == ".pdf":
+            is_valid, error_message = await self.validate_pdf(upload)
             if not is_valid:
                 raise FileParseError(f"Invalid PDF file: {error_message}")
-        elif file_extension == ".xml":
-            is_valid, error_message = await self.validate_xml(file)
+        elif upload.extension == ".xml":
+            is_valid, error_message = await self.validate_xml(upload)
             if not is_valid:
                 raise FileParseError(f"Invalid XML file: {error_message}")
 
-        file.file.seek(0)
         return True
 
-    async def validate_pdf(self, file: UploadFile) -> Tuple[bool, str]:
+    async def validate_pdf(self, upload: SpooledUpload) -> Tuple[bool, str]:
         """Validate PDF structure and basic readability.
 
         This method checks if:
@@ -128,17 +196,17 @@ class DocumentHandler:
         3. The PDF is not corrupted
 
         Args:
-            file (UploadFile): The PDF file object.
+            upload (SpooledUpload): The spooled PDF file.
 
         Returns:
             Tuple[bool, str]: A tuple containing (is_valid, error_message).
         """
         try:
-            # Use PyPDF2 to validate the PDF structure
-            reader = PdfReader(file.file, strict=True)
+            # Use PyPDF2 to validate the PDF structure, reading from the spooled file in a worker thread
+            page_count = await asyncio.to_thread(self._count_pdf_pages, upload)
 
             # Check if the document has pages
-            if len(reader.pages) == 0:
+            if page_count == 0:
                 return False, "PDF document contains no pages"
 
             return True, ""
@@ -147,21 +215,25 @@ class DocumentHandler:
             logger.error(f"Error validating PDF: {e}")
             return False, f"PDF validation failed: {str(e)}"
 
-    async def validate_xml(self, file: UploadFile) -> Tuple[bool, str]:
+    @staticmethod
+    def _count_pdf_pages(upload: SpooledUpload) -> int:
+        with upload.open() as pdf_file:
+            return len(PdfReader(pdf_file, strict=True).pages)
+
+    async def validate_xml(self, upload: SpooledUpload) -> Tuple[bool, str]:
         """Validate XML structure and content.
 
         This method checks if the XML file is well-formed and contains actual content.
 
         Args:
-            file_content (bytes): The XML file content.
+            upload (SpooledUpload): The spooled XML file.
 
         Returns:
             Tuple[bool, str]: A tuple containing (is_valid, error_message).
         """
         try:
-            # Parse XML to check structure
-            file_content = await file.read()
-            root = ET.fromstring(file_content)
+            # Parse XML to check structure, streaming from the spooled file
+            root = (await asyncio.to_thread(ET.parse, upload.path)).getroot()
 
             # Check if XML has content
             if len(root) == 0 and not root.text:
@@ -177,103 +249,97 @@ class DocumentHandler:
             logger.error(f"Error validating XML: {e}")
             return False, f"XML validation failed: {str(e)}"
 
-    async def pdf_embeddings(self, file: UploadFile, file_extension: str) -> pd.DataFrame:
+    async def pdf_embeddings(
+        self,
+        upload: SpooledUpload,
+        file_extension: str,
+        writer: ChunkWriter,
+        progress: Optional[ProgressCallback] = None,
+    ) -> int:
         """Process PDF files to extract content and generate embeddings.
 
         This function handles PDF document processing by:
-        1. Creating a temporary file from the upload
-        2. Parsing the PDF document structure using the LLM Sherpa PDF parser
+        1. Sending the spooled file to the parser
+        2. Parsing the PDF document structure using the LLM Sherpa PDF parser, without blocking the event loop
         3. Chunking the content based on configured chunk size
-        4. Generating embeddings for each content chunk
-        5. Creating a structured DataFrame with document metadata and embeddings
+        4. Generating embeddings for the chunks as soon as they are chunked
+        5. Writing the chunks with document metadata and embeddings, batch by batch
 
         Args:
-            file (UploadFile): The uploaded PDF file object
+            upload (SpooledUpload): The spooled PDF file
+            file_extension (str): The extension of the file
+            writer (ChunkWriter): Stores the chunks, closed or aborted by the caller
+            progress (Optional[ProgressCallback], optional): Receives the stages of the processing. Defaults to None.
 
         Returns:
-            pd.DataFrame: DataFrame containing processed chunks with:
-                - Document metadata (filename, source, content type)
-                - Page information (start/end page numbers)
-                - Raw text content
-                - Generated embeddings
-                - Unique chunk identifiers
+            int: The number of chunks written
 
         Raises:
             HTTPException: If PDF parsing fails or encounters errors
         """
-        # Create temp directory in project root
-        project_root = Path(__file__).parent.parent.parent.parent
-        temp_dir = project_root / "temp"
-        os.makedirs(temp_dir, exist_ok=True)
-
         try:
-            # Create a temporary directory that will be automatically cleaned up
-            with tempfile.TemporaryDirectory(dir=temp_dir) as temp_dir_path:
-                temp_file_path = os.path.join(temp_dir_path, f"{file.filename}")
-
-                with open(temp_file_path, "wb") as temp_file:
-                    temp_file.write(await file.read())
-
-                doc_tree = self.pdf_parser.get_doc_tree(
-                    path_or_url=temp_file_path, file_name=file.filename, tokenizer=self.tokenizer
-                )
-
-                chunks = doc_tree.get_chunks(chunk_size=self.config["document_qa"]["chunk_size"])
-
-                # Extract chunk contents for parallel processing
-                chunk_contents = [chunk["content"] for chunk in chunks]
-
-                # Generate embeddings in parallel while preserving order
-                with ThreadPoolExecutor(max_workers=8) as executor:
-                    embeddings = list(
-                        tqdm(
-                            executor.map(self._generate_embedding_for_chunk, chunk_contents),
-                            total=len(chunk_contents),
-                            desc="Generating embeddings",
-                        )
-                    )
-
-                records = []
-                for chunk, embedding in zip(chunks, embeddings):
-                    # chunk_title = f"{file.filename} - Page {chunk['start_page']} - {chunk['end_page']}"
-                    records.append(
-                        {
-                            "Product": "user_upload",
-                            "Content": "",
-                            "root_link": "",
-                            "url": "",
-                            "Source": "user_upload",
-                            "clean_path": "",
-                            "content_type": "pdf",
-                            "published_date": "",
-                            "file_name": file.filename,
-                            "raw_text": chunk["content"],
-                            "title": "",
-                            "description": "",
-                            "chunk_id": str(uuid.uuid4()),
-                            "open_ai_embeddings": embedding,
-                        }
-                    )
-
-                if len(records) == 0 or (
-                    len(records) == 1 and records[0]["raw_text"].strip() == str(file.filename).strip(file_extension)
-                ):
-                    raise FileParseError("No valid content found in PDF file. Check the file format.")
-
-                return pd.DataFrame(records)
+            # The parser reads the spooled file by path, the upload is not copied again
+            doc_tree = await self.pdf_parser.get_doc_tree(
+                path=upload.path, file_name=upload.filename, tokenizer=self.tokenizer
+            )
+            if progress is not None:
+                progress("parsed")
+
+            def make_record(chunk: Dict[str, Any], embedding: List[float]) -> Dict[str, Any]:
+                # chunk_title = f"{upload.filename} - Page {chunk['start_page']} - {chunk['end_page']}"
+                return {
+                    "Product": "user_upload",
+                    "Content": "",
+                    "root_link": "",
+                    "url": "",
+                    "Source": "user_upload",
+                    "clean_path": "",
+                    "content_type": "pdf",
+                    "published_date": "",
+                    "file_name": upload.filename,
+                    "raw_text": chunk["content"],
+                    "title": "",
+                    "description": "",
+                    "chunk_id": str(uuid.uuid4()),
+                    "start_page": chunk.get("start_page"),
+                    "end_page": chunk.get("end_page"),
+                    "open_ai_embeddings": embedding,
+                }
+
+            # The tree is chunked in a worker thread while the first chunks are embedded and written
+            count, first_text = await self.ingest_pipeline.run(
+                doc_tree.iter_chunks(chunk_size=self.config["document_qa"]["chunk_size"]),
+                text=lambda chunk: chunk["content"],
+                embed=self._embed_chunks,
+                make_record=make_record,
+                writer=writer,
+                progress=progress,
+            )
+
+            if count == 0 or (count == 1 and first_text.strip() == upload.filename.strip(file_extension)):
+                raise FileParseError("No valid content found in PDF file. Check the file format.")
+
+            return count
 
+        except LayoutParserError as e:
+            logger.error(f"Error parsing PDF: {e}")
+            raise HTTPException(status_code=502, detail=f"Error parsing PDF: {str(e)}")
         except Exception as e:
             logger.error(f"Error parsing PDF: {e}")
             raise HTTPException(status_code=400, detail=f"Error parsing PDF: {str(e)}")
 
-    async def extract_text_from_xml(self, file: UploadFile) -> pd.DataFrame:
+    async def extract_text_from_xml(
+        self, upload: SpooledUpload, writer: ChunkWriter, progress: Optional[ProgressCallback] = None
+    ) -> int:
         """Extract text from an XML file.
 
         Args:
-            file (UploadFile): The FastAPI file object.
+            upload (SpooledUpload): The spooled XML file.
+            writer (ChunkWriter): Stores the chunks, closed or aborted by the caller.
+            progress (Optional[ProgressCallback], optional): Receives the stages of the processing. Defaults to None.
 
         Returns:
-            pd.DataFrame: A DataFrame containing the extracted text and embeddings.
+            int: The number of chunks written.
         """
         try:
             splitter = CharacterTextSplitter.from_tiktoken_encoder(
@@ -282,44 +348,44 @@ class DocumentHandler:
                 chunk_overlap=0,
                 separator="\n",
             )
-            xml_text = await file.read()
-            content_chunks = splitter.split_text(xml_text.decode("utf-8"))
-
-            # Generate embeddings in parallel while preserving order
-            with ThreadPoolExecutor(max_workers=8) as executor:
-                embeddings = list(
-                    tqdm(
-                        executor.map(self._generate_embedding_for_chunk, content_chunks),
-                        total=len(content_chunks),
-                        desc="Generating embeddings",
-                    )
-                )
-
-            records = []
-            for chunk, embedding in zip(content_chunks, embeddings):
-                records.append(
-                    {
-                        "Product": "user_upload",
-                        "Content": "",
-                        "root_link": "",
-                        "url": "",
-                        "Source": "user_upload",
-                        "clean_path": "",
-                        "content_type": "pdf",
-                        "published_date": "",
-                        "file_name": file.filename,
-                        "raw_text": chunk,
-                        "title": "",
-                        "description": file.filename,
-                        "chunk_id": str(uuid.uuid4()),
-                        "open_ai_embeddings": embedding,
-                    }
-                )
-
-            if len(records) == 0:
+            xml_text = await asyncio.to_thread(upload.read_bytes)
+            if progress is not None:
+                progress("parsed")
+
+            def iter_chunks() -> Iterator[str]:
+                yield from splitter.split_text(xml_text.decode("utf-8"))
+
+            def make_record(chunk: str, embedding: List[float]) -> Dict[str, Any]:
+                return {
+                    "Product": "user_upload",
+                    "Content": "",
+                    "root_link": "",
+                    "url": "",
+                    "Source": "user_upload",
+                    "clean_path": "",
+                    "content_type": "pdf",
+                    "published_date": "",
+                    "file_name": upload.filename,
+                    "raw_text": chunk,
+                    "title": "",
+                    "description": upload.filename,
+                    "chunk_id": str(uuid.uuid4()),
+                    "open_ai_embeddings": embedding,
+                }
+
+            count, _ = await self.ingest_pipeline.run(
+                iter_chunks(),
+                text=lambda chunk: chunk,
+                embed=self._embed_chunks,
+                make_record=make_record,
+                writer=writer,
+                progress=progress,
+            )
+
+            if count == 0:
                 raise FileParseError("No valid content found in XML file. Check the file format.")
 
-            return pd.DataFrame(records)
+            return count
 
         except Exception as e:
             logger.error(f"Error extracting text from XML: {e}")
@@ -333,10 +399,9 @@ class DocumentHandler:
         document_id: str,
         filename: str | None,
     ) -> str:
-        """Save the original document and embeddings DataFrame to S3.
+        """Save the embeddings DataFrame of a document to S3.
 
         Args:
-            file_content (BinaryIO): The original file content.
             dataframe (pd.DataFrame): The DataFrame with chunks and embeddings.
             tenant_id (str): The tenant ID.
             user_id (str): The user ID.
@@ -344,19 +409,20 @@ class DocumentHandler:
             filename (str): The original filename.
 
         Returns:
-            Dict[str, str]: A dictionary with the S3 paths of the saved files.
+            str: The S3 path of the saved chunks.
         """
-        # Construct S3 paths
-        base_path = f"tenant_id={tenant_id}/user_id={user_id}"
-        pickle_key = f"{base_path}/{document_id}_{os.path.splitext(str(filename))[0]}.pkl"
+        # Stored in the configured chunk format, float32 Arrow columns unless configured otherwise
+        writer = self.chunk_store.open(tenant_id, user_id, document_id, os.path.splitext(str(filename))[0])
 
-        # Save DataFrame as pickle
-        pickle_buffer = BytesIO()
-        dataframe.to_pickle(pickle_buffer)
-        pickle_buffer.seek(0)
-        self.s3_client.upload_fileobj(pickle_buffer, self.bucket_name, pickle_key)
+        def save() -> str:
+            try:
+                writer.write(dataframe.to_dict("records"))
+                return writer.close()
+            except BaseException:
+                writer.abort()
+                raise
 
-        return f"s3://{self.bucket_name}/{pickle_key}"
+        return await asyncio.to_thread(save)
 
     async def delete_from_s3(self, tenant_id: str, user_id: str, document_id: str) -> bool:
         """Delete document files from S3.
@@ -369,6 +435,8 @@ class DocumentHandler:
         Returns:
             bool: True if deletion was successful, False otherwise.
         """
+        # Searches stop using the document at once, even if its objects cannot be deleted
+        self.index_cache.discard(self._index_key(tenant_id, user_id, document_id))
         try:
             # List objects with the document_id prefix
             base_path = f"tenant_id={tenant_id}/user_id={user_id}"
@@ -387,26 +455,117 @@ class DocumentHandler:
             logger.error(f"Error deleting document from S3: {e}")
             return False
 
-    async def process_document(self, file: UploadFile, tenant_id: str, user_id: str) -> Dict[str, str | None]:
+    @staticmethod
+    def _index_key(tenant_id: str, user_id: str, document_id: str) -> str:
+        return f"{tenant_id}/{user_id}/{document_id}"
+
+    def _load_index(self, tenant_id: str, user_id: str, document_id: str) -> DocumentIndex:
+        """Download the chunks of a document and build their index. Blocking, call it in a thread.
+
+        Raises:
+            HTTPException: 404 if the document has no stored chunks, 409 if they are not in a columnar format.
+        """
+        prefix = f"tenant_id={tenant_id}/user_id={user_id}/{document_id}_"
+        response = self.s3_client.list_objects_v2(Bucket=self.bucket_name, Prefix=prefix)
+        keys = [obj["Key"] for obj in response.get("Contents", [])]
+        if not keys:
+            raise HTTPException(status_code=404, detail=f"No chunks stored for document {document_id}")
+        columnar = [key for key in keys if key.endswith((".arrow", ".parquet"))]
+        if not columnar:
+            raise HTTPException(
+                status_code=409, detail=f"Chunks of document {document_id} are not stored in a searchable format"
+            )
+        key = sorted(columnar)[0]
+
+        os.makedirs(self.spool_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.spool_dir, suffix=os.path.splitext(key)[1]) as file:
+            self.s3_client.download_fileobj(self.bucket_name, key, file)
+            file.flush()
+            index = DocumentIndex.from_table(read_chunks(file.name))
+        logger.info(f"Loaded the index of document {document_id}: {len(index)} chunks, {index.nbytes} bytes")
+        return index
+
+    async def search_document(
+        self, tenant_id: str, user_id: str, document_id: str, query: str, top_k: int = 5
+    ) -> List[Dict[str, Any]]:
+        """Search the chunks of a document most similar to a query.
+
+        The query is embedded while the index of the document is loaded, if it is not cached. Queries bypass the
+        chunk embedding cache, they are rarely repeated and would evict the chunks of documents. The search itself
+        runs in process on the event loop, it takes well under a millisecond for a few thousand chunks.
+
+        Args:
+            tenant_id (str): The tenant ID.
+            user_id (str): The user ID.
+            document_id (str): The document ID.
+            query (str): The query.
+            top_k (int, optional): The number of chunks to return. Defaults to 5.
+
+        Returns:
+            List[Dict[str, Any]]: The chunk ID, text, cosine similarity score and page range of the most similar
+                chunks, the most similar first.
+
+        Raises:
+            HTTPException: 404 if the document has no stored chunks, 409 if they cannot be searched.
+        """
+        embeddings, index = await asyncio.gather(
+            self.openai_utils.get_embeddings([query], model=self.embedding_deployment),
+            self.index_cache.get(
+                self._index_key(tenant_id, user_id, document_id),
+                lambda: asyncio.to_thread(self._load_index, tenant_id, user_id, document_id),
+            ),
+        )
+        try:
+            return index.search(embeddings[0], top_k)
+        except ValueError as e:
+            # The document was embedded with another model than the query
+            raise HTTPException(status_code=409, detail=f"Document {document_id} cannot be searched: {e}")
+
+    async def process_document(self, file: UploadFile, tenant_id: str, user_id: str) -> Dict[str, Any]:
         """Process a document file, generate embeddings, and save to S3.
 
+        The upload is spooled to a temp file once, and validation and parsing read that file.
+
         Args:
             file (UploadFile): The uploaded file.
             tenant_id (str): The tenant ID.
             user_id (str): The user ID.
 
         Returns:
-            Dict[str, str]: A response with document ID and status.
+            Dict[str, Any]: A response with document ID and status, and the size in bytes and SHA-256 of the file.
+        """
+        with await self.spool(file) as upload:
+            return await self.process_upload(upload, str(uuid.uuid4()), tenant_id, user_id)
+
+    async def process_upload(
+        self,
+        upload: SpooledUpload,
+        document_id: str,
+        tenant_id: str,
+        user_id: str,
+        progress: Optional[ProgressCallback] = None,
+    ) -> Dict[str, Any]:
+        """Process a spooled document, generate embeddings, and save to S3.
+
+        Args:
+            upload (SpooledUpload): The spooled upload, left open.
+            document_id (str): The document ID.
+            tenant_id (str): The tenant ID.
+            user_id (str): The user ID.
+            progress (Optional[ProgressCallback], optional): Receives the stages of the processing: validated,
+                parsed, chunked, embedded (done and total chunks) and stored. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: A response with document ID and status, and the size in bytes and SHA-256 of the file.
         """
         try:
             # Validate document
-            await self.validate_document(file)
-
-            # Generate a unique document ID
-            document_id = str(uuid.uuid4())
+            await self.validate_document(upload)
+            if progress is not None:
+                progress("validated")
 
             # Get file extension
-            file_extension = os.path.splitext(str(file.filename))[1].lower()
+            file_extension = upload.extension
 
             # # Extract text based on file type
             # if file_extension == ".docx":
@@ -425,24 +584,34 @@ class DocumentHandler:
             #         description,
             #     )
 
-            if file_extension == ".xml":
-                df = await self.extract_text_from_xml(file)
+            # The chunks are written as they are embedded, the object is completed once all are written
+            writer = self.chunk_store.open(tenant_id, user_id, document_id, os.path.splitext(str(upload.filename))[0])
+            try:
+                if file_extension == ".xml":
+                    await self.extract_text_from_xml(upload, writer, progress)
 
-            elif file_extension == ".pdf":
-                df = await self.pdf_embeddings(file, file_extension)
+                elif file_extension == ".pdf":
+                    await self.pdf_embeddings(upload, file_extension, writer, progress)
 
-            else:
-                raise HTTPException(status_code=400, detail="Unsupported file type")
+                else:
+                    raise HTTPException(status_code=400, detail="Unsupported file type")
 
-            # Save to S3
-            s3_path = await self.save_to_s3(df, tenant_id, user_id, document_id, file.filename)
+                # Save to S3
+                s3_path = await asyncio.to_thread(writer.close)
+            except BaseException:
+                await asyncio.to_thread(writer.abort)
+                raise
+            if progress is not None:
+                progress("stored")
 
             return {
                 "document_id": document_id,
-                "filename": file.filename,
+                "filename": upload.filename,
                 "status": "success",
                 "message": "Document processed and saved successfully",
                 "s3_path": s3_path,
+                "file_size": upload.size,
+                "content_sha256": upload.sha256,
             }
         except HTTPException as e:
             raise e
@@ -535,13 +704,7 @@ class DocumentHandler:
         Returns:
             List[List[float]]: A list of embedding vectors.
         """
-        embeddings = []
-
-        for chunk in chunks:
-            embedding = self.openai_utils.get_embedding(chunk)
-            embeddings.append(embedding)
-
-        return embeddings
+        return await self._embed_chunks(chunks)
 
     async def create_dataframe(
         self,
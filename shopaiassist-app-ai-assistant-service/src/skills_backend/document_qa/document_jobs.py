@@ -0,0 +1,297 @@
+"""Background processing of uploaded documents.
+
+Processing a document (validation, layout parsing, chunking, embedding and storage) takes from seconds to minutes,
+longer than the gateway timeout for large files. Uploads are spooled and accepted at once, and a
+`DocumentJobManager` processes them in the background: at most `max_concurrency` documents at a time, and at most
+`max_per_tenant` documents of the same tenant, so one tenant uploading a batch of manuals does not hold every slot.
+
+Each job keeps its progress as a list of events (validated, parsed, chunked, embedded N/M, stored), followed by the
+status endpoint and the server-sent progress stream. Jobs can be cancelled while queued or running. The final status
+of a job is written to `tb_documents` through the `store_status` callback; finished jobs stay queryable in memory for
+`retention_seconds`. Jobs still in progress when the service shuts down fail with `INTERRUPTED_ERROR`, so users know
+to upload the document again rather than seeing it as cancelled.
+
+Classes:
+    DocumentJob: The processing of one uploaded document.
+    DocumentJobManager: Processes uploaded documents in the background with global and per-tenant limits.
+"""
+
+import asyncio
+import json
+import time
+from collections.abc import AsyncIterable
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from loguru import logger
+from prometheus_client import Counter, Gauge
+
+from src.models import Authentication
+from src.skills_backend.document_qa.spooled_upload import SpooledUpload
+
+DOCUMENT_JOBS = Counter("document_jobs_total", "Document processing jobs by outcome.", ["outcome"])
+DOCUMENT_JOBS_QUEUED = Gauge("document_jobs_queued", "Document processing jobs waiting for a worker.")
+DOCUMENT_JOBS_RUNNING = Gauge("document_jobs_running", "Document processing jobs in progress.")
+
+# Statuses of a job, "processing" until it finishes
+PROCESSING = "processing"
+READY = "ready"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Error of the jobs interrupted by a shutdown of the service
+INTERRUPTED_ERROR = "Processing was interrupted by a restart of the service, please upload the document again."
+
+
+class DocumentJob:
+    """The processing of one uploaded document."""
+
+    def __init__(self, document_id: str, upload: SpooledUpload, auth: Authentication):
+        """Initialize a queued job.
+
+        Args:
+            document_id (str): The ID of the document.
+            upload (SpooledUpload): The spooled upload, owned and closed by the job.
+            auth (Authentication): The authentication of the user who uploaded the document.
+        """
+        self.document_id = document_id
+        self.upload = upload
+        self.auth = auth
+        self.tenant_id = auth.tenant_id or "unknown"
+        self.owner = auth.user_id or auth.EmailAddress
+        self.status = PROCESSING
+        self.stage = "queued"
+        self.progress: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.events: List[str] = []
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._signal = asyncio.Event()
+        self._append_event()
+
+    @property
+    def finished(self) -> bool:
+        """Whether the job is ready, failed or cancelled."""
+        return self.finished_at is not None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the status, stage and progress of the job."""
+        return {
+            "document_id": self.document_id,
+            "filename": self.upload.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": dict(self.progress),
+            "error": self.error,
+        }
+
+    def report(self, stage: str, **progress: Any) -> None:
+        """Record the progress of the processing, e.g. the "embedded" stage with `done=10, total=40`.
+
+        Args:
+            stage (str): The stage reached.
+            **progress: Details of the stage.
+        """
+        self.stage = stage
+        self.progress = progress
+        self._append_event()
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        """Mark the job as finished and wake up the readers."""
+        self.status = status
+        self.error = error
+        self.stage = status
+        self.progress = {}
+        self.finished_at = time.monotonic()
+        self._append_event()
+
+    def _append_event(self) -> None:
+        self.events.append(json.dumps(self.snapshot()))
+        signal, self._signal = self._signal, asyncio.Event()
+        signal.set()
+
+    async def follow(self, last_event_id: Optional[int] = None) -> AsyncIterable[dict]:
+        """Replay the progress events after `last_event_id` and then tail them until the job finishes.
+
+        Args:
+            last_event_id (Optional[int], optional): Id of the last event the client received, or None to read the
+                progress from the start. Defaults to None.
+
+        Yields:
+            dict: Server-sent events with an `id`, an `event` name and `data`.
+        """
+        cursor = -1 if last_event_id is None else last_event_id
+        while True:
+            # Take the signal before reading, so an event appended while we yield is never missed
+            signal = self._signal
+            for event_id in range(cursor + 1, len(self.events)):
+                cursor = event_id
+                yield {"id": str(event_id), "event": "progress", "data": self.events[event_id]}
+            if self.finished and cursor >= len(self.events) - 1:
+                return
+            await signal.wait()
+
+
+class DocumentJobManager:
+    """Processes uploaded documents in the background with global and per-tenant concurrency limits."""
+
+    def __init__(
+        self,
+        process: Callable[[DocumentJob], Awaitable[Dict[str, Any]]],
+        store_status: Callable[[DocumentJob], Awaitable[None]],
+        max_concurrency: int = 4,
+        max_per_tenant: int = 2,
+        retention_seconds: float = 600,
+    ):
+        """Initialize the manager.
+
+        Args:
+            process (Callable[[DocumentJob], Awaitable[Dict[str, Any]]]): Processes the document of a job, reporting
+                its progress with `job.report`.
+            store_status (Callable[[DocumentJob], Awaitable[None]]): Stores the final status of a job.
+            max_concurrency (int, optional): Number of documents processed at the same time. Defaults to 4.
+            max_per_tenant (int, optional): Number of documents of one tenant processed at the same time.
+                Defaults to 2.
+            retention_seconds (float, optional): How long finished jobs can be queried. Defaults to 600.
+        """
+        self.process = process
+        self.store_status = store_status
+        self.max_per_tenant = max_per_tenant
+        self.retention_seconds = retention_seconds
+        self.jobs: Dict[str, DocumentJob] = {}
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tenant_slots: Dict[str, asyncio.Semaphore] = {}
+        self._tenant_jobs: Dict[str, int] = {}
+        self._stopping = False
+
+    @classmethod
+    def from_config(
+        cls,
+        config: dict,
+        process: Callable[[DocumentJob], Awaitable[Dict[str, Any]]],
+        store_status: Callable[[DocumentJob], Awaitable[None]],
+    ) -> "DocumentJobManager":
+        """Create the manager from the `document_qa.processing` configuration section.
+
+        Args:
+            config (dict): The application configuration.
+            process (Callable[[DocumentJob], Awaitable[Dict[str, Any]]]): Processes the document of a job.
+            store_status (Callable[[DocumentJob], Awaitable[None]]): Stores the final status of a job.
+
+        Returns:
+            DocumentJobManager: The configured manager.
+        """
+        settings = config.get("document_qa", {}).get("processing", {})
+        return cls(
+            process,
+            store_status,
+            max_concurrency=settings.get("max_concurrency", 4),
+            max_per_tenant=settings.get("max_per_tenant", 2),
+            retention_seconds=settings.get("retention_seconds", 600),
+        )
+
+    def _forget_finished(self) -> None:
+        cutoff = time.monotonic() - self.retention_seconds
+        for document_id in [d for d, job in self.jobs.items() if job.finished and job.finished_at < cutoff]:
+            del self.jobs[document_id]
+
+    def submit(self, document_id: str, upload: SpooledUpload, auth: Authentication) -> DocumentJob:
+        """Queue the processing of an uploaded document.
+
+        Args:
+            document_id (str): The ID of the document.
+            upload (SpooledUpload): The spooled upload, closed by the job when it finishes.
+            auth (Authentication): The authentication of the user.
+
+        Returns:
+            DocumentJob: The queued job.
+        """
+        self._forget_finished()
+        job = DocumentJob(document_id, upload, auth)
+        self.jobs[document_id] = job
+        DOCUMENT_JOBS_QUEUED.inc()
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, document_id: str) -> Optional[DocumentJob]:
+        """Return the current or recent job of a document, None if this instance has none."""
+        return self.jobs.get(document_id)
+
+    async def cancel(self, document_id: str) -> bool:
+        """Cancel the processing of a document.
+
+        Args:
+            document_id (str): The ID of the document.
+
+        Returns:
+            bool: True if the job was cancelled, False if it is unknown or already finished.
+        """
+        job = self.jobs.get(document_id)
+        if job is None or job.finished or job.task is None:
+            return False
+        job.task.cancel()
+        await asyncio.gather(job.task, return_exceptions=True)
+        if not job.finished:
+            # The task was cancelled before it started running
+            DOCUMENT_JOBS_QUEUED.dec()
+            self._finish_cancelled(job)
+            await self._after(job)
+        return True
+
+    async def stop(self) -> None:
+        """Stop the jobs in progress, they fail with `INTERRUPTED_ERROR`."""
+        self._stopping = True
+        await asyncio.gather(*(self.cancel(document_id) for document_id in list(self.jobs)))
+
+    def _finish_cancelled(self, job: DocumentJob) -> None:
+        if self._stopping:
+            logger.warning(f"Processing of document {job.document_id} interrupted by shutdown")
+            job.finish(FAILED, error=INTERRUPTED_ERROR)
+        else:
+            logger.info(f"Processing of document {job.document_id} cancelled")
+            job.finish(CANCELLED)
+
+    def _tenant_slot(self, tenant_id: str) -> asyncio.Semaphore:
+        if tenant_id not in self._tenant_slots:
+            self._tenant_slots[tenant_id] = asyncio.Semaphore(self.max_per_tenant)
+        self._tenant_jobs[tenant_id] = self._tenant_jobs.get(tenant_id, 0) + 1
+        return self._tenant_slots[tenant_id]
+
+    def _release_tenant(self, tenant_id: str) -> None:
+        self._tenant_jobs[tenant_id] -= 1
+        if not self._tenant_jobs[tenant_id]:
+            del self._tenant_jobs[tenant_id]
+            del self._tenant_slots[tenant_id]
+
+    async def _run(self, job: DocumentJob) -> None:
+        started = False
+        try:
+            # Wait for a slot of the tenant first, so queued documents of a busy tenant do not hold global slots
+            async with self._tenant_slot(job.tenant_id), self._slots:
+                DOCUMENT_JOBS_QUEUED.dec()
+                DOCUMENT_JOBS_RUNNING.inc()
+                started = True
+                try:
+                    job.report("started")
+                    job.result = await self.process(job)
+                finally:
+                    DOCUMENT_JOBS_RUNNING.dec()
+            job.finish(READY)
+        except asyncio.CancelledError:
+            self._finish_cancelled(job)
+        except Exception as e:
+            logger.error(f"Error processing document {job.document_id}: {e}")
+            job.finish(FAILED, error=getattr(e, "detail", None) or str(e))
+        finally:
+            if not started:
+                DOCUMENT_JOBS_QUEUED.dec()
+            self._release_tenant(job.tenant_id)
+        await self._after(job)
+
+    async def _after(self, job: DocumentJob) -> None:
+        job.upload.close()
+        DOCUMENT_JOBS.labels(outcome=job.status).inc()
+        try:
+            await self.store_status(job)
+        except Exception as e:
+            logger.error(f"Error storing the status of document {job.document_id}: {e}")
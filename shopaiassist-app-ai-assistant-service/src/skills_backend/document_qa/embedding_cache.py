@@ -0,0 +1,232 @@
+"""Content-addressed cache of chunk embeddings.
+
+The same manuals and tax forms are uploaded again and again, and their chunks produce the same embeddings. This module
+keeps embeddings keyed by the embedding model and the SHA-256 of the chunk text, so that a chunk is only sent to Azure
+OpenAI the first time it is seen.
+
+Entries live in an in-memory LRU in front of a SQLite database on local disk. Vectors are stored as float32 blobs. Both
+tiers are bounded by size: the memory tier evicts least recently used entries, the disk tier deletes the least recently
+used rows once it grows over its budget. The cache is disabled by default.
+
+Classes:
+    EmbeddingCache: Two-tier (memory LRU + SQLite) cache of embeddings.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from loguru import logger
+from prometheus_client import Counter
+
+EMBEDDING_CACHE_LOOKUPS = Counter(
+    "document_embedding_cache_lookups_total", "Document chunk embedding cache lookups.", ["result"]
+)
+EMBEDDING_CACHE_SAVED_BYTES = Counter(
+    "document_embedding_cache_saved_bytes_total",
+    "Bytes of chunk text not sent to the embeddings API thanks to the cache.",
+)
+
+# Maximum number of parameters of a single SQLite statement
+_SQLITE_BATCH = 500
+
+
+class EmbeddingCache:
+    """Two-tier (memory LRU + SQLite) cache of embeddings keyed by model and chunk text hash.
+
+    The methods are blocking and thread-safe, call them with `asyncio.to_thread` from the event loop.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        path: str = "temp/embedding_cache.sqlite3",
+        memory_max_bytes: int = 64 * 1024 * 1024,
+        disk_max_bytes: int = 2 * 1024 * 1024 * 1024,
+    ):
+        """Initialize the embedding cache.
+
+        Args:
+            enabled (bool, optional): Whether the cache is used. Defaults to False.
+            path (str, optional): Path of the SQLite database. Defaults to "temp/embedding_cache.sqlite3".
+            memory_max_bytes (int, optional): Maximum size of the vectors kept in memory. Defaults to 64MB.
+            disk_max_bytes (int, optional): Maximum size of the vectors kept on disk. Defaults to 2GB.
+        """
+        self.enabled = enabled
+        self.path = path
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def from_config(cls, config: dict) -> "EmbeddingCache":
+        """Create an embedding cache from the `document_qa.embedding_cache` configuration section.
+
+        Args:
+            config (dict): The application configuration.
+
+        Returns:
+            EmbeddingCache: The configured embedding cache.
+        """
+        settings = config.get("document_qa", {}).get("embedding_cache", {})
+        return cls(
+            enabled=settings.get("enabled", False),
+            path=settings.get("path", "temp/embedding_cache.sqlite3"),
+            memory_max_bytes=settings.get("memory_max_bytes", 64 * 1024 * 1024),
+            disk_max_bytes=settings.get("disk_max_bytes", 2 * 1024 * 1024 * 1024),
+        )
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        """Build the cache key of a chunk.
+
+        Args:
+            model (str): The embedding model.
+            text (str): The chunk text.
+
+        Returns:
+            str: The content address of the embedding.
+        """
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used_idx ON embeddings (last_used)")
+            self.disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        return self._db
+
+    def _remember(self, key: str, vector: bytes) -> None:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = vector
+        self.memory_bytes += len(vector)
+        while self.memory_bytes > self.memory_max_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up the embeddings of chunks.
+
+        Args:
+            model (str): The embedding model.
+            texts (List[str]): The chunk texts.
+
+        Returns:
+            List[Optional[List[float]]]: The embedding of each chunk, or None where it is not cached.
+        """
+        keys = [self.key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+
+            missing = list({key for key in keys if key not in found})
+            if missing:
+                db = self._connection()
+                for start in range(0, len(missing), _SQLITE_BATCH):
+                    batch = missing[start : start + _SQLITE_BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = db.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch)
+                    for key, vector in rows:
+                        found[key] = vector
+                        self._remember(key, vector)
+                disk_hits = [key for key in missing if key in found]
+                if disk_hits:
+                    now = time.time()
+                    db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in disk_hits])
+                    db.commit()
+
+        results: List[Optional[List[float]]] = []
+        saved_bytes = 0
+        for key, text in zip(keys, texts):
+            vector = found.get(key)
+            if vector is None:
+                results.append(None)
+                continue
+            results.append(np.frombuffer(vector, dtype=np.float32).tolist())
+            saved_bytes += len(text.encode("utf-8"))
+
+        hits = sum(result is not None for result in results)
+        EMBEDDING_CACHE_LOOKUPS.labels(result="hit").inc(hits)
+        EMBEDDING_CACHE_LOOKUPS.labels(result="miss").inc(len(texts) - hits)
+        EMBEDDING_CACHE_SAVED_BYTES.inc(saved_bytes)
+        return results
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]) -> None:
+        """Store the embeddings of chunks.
+
+        Args:
+            model (str): The embedding model.
+            texts (List[str]): The chunk texts.
+            embeddings (List[List[float]]): The embedding of each chunk.
+        """
+        now = time.time()
+        rows = {}
+        for text, embedding in zip(texts, embeddings):
+            vector = np.asarray(embedding, dtype=np.float32).tobytes()
+            rows[self.key(model, text)] = (vector, len(vector), now)
+
+        with self._lock:
+            for key, (vector, _, _) in rows.items():
+                self._remember(key, vector)
+            db = self._connection()
+            cursor = db.cursor()
+            for key, (vector, size, last_used) in rows.items():
+                cursor.execute(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, vector, size, last_used),
+                )
+                self.disk_bytes += size * cursor.rowcount
+            db.commit()
+            if self.disk_bytes > self.disk_max_bytes:
+                self._evict_disk(db)
+
+    def _evict_disk(self, db: sqlite3.Connection) -> None:
+        """Delete the least recently used rows until the disk tier is back under 90% of its budget."""
+        target = self.disk_max_bytes * 0.9
+        evicted = 0
+        while self.disk_bytes > target:
+            rows = db.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used ASC LIMIT ?", (_SQLITE_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self.disk_bytes <= target:
+                    break
+                db.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self.disk_bytes -= size
+                evicted += 1
+        db.commit()
+        logger.info(f"Evicted {evicted} embeddings from the disk cache, {self.disk_bytes} bytes left")
+
+    def close(self) -> None:
+        """Close the SQLite database."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,198 @@
+"""Pipelined chunking, embedding and storage of uploaded documents.
+
+Document ingestion used to run its stages one after the other: the whole chunk list, then every embedding, then the
+DataFrame, the pickle and the upload. The `IngestPipeline` connects the stages with bounded queues:
+    - chunk: a worker thread walks the chunk iterator (e.g. `DocTree.iter_chunks`) and queues batches of chunks.
+    - embed: `embed_concurrency` tasks embed the queued batches as soon as they exist.
+    - store: the embedded records are handed to the `ChunkWriter` in chunk order, in a worker thread.
+
+Chunking and embedding overlap, so the wall time approaches the longest stage instead of their sum. At most
+`max_in_flight` batches are chunked but not yet stored, which bounds the memory of the pipeline for documents of any
+size; the chunk thread waits when the embedding falls behind.
+
+Classes:
+    IngestPipeline: Chunks, embeds and stores the chunks of a document with overlapping stages.
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from src.skills_backend.document_qa.chunk_store import ChunkWriter
+
+T = TypeVar("T")
+
+# Seconds between two checks for a cancelled pipeline while the chunk thread waits
+_POLL_SECONDS = 0.2
+
+
+class IngestPipeline:
+    """Chunks, embeds and stores the chunks of a document with overlapping stages."""
+
+    def __init__(self, batch_size: int = 64, embed_concurrency: int = 2, max_in_flight: int = 8):
+        """Initialize the pipeline.
+
+        Args:
+            batch_size (int, optional): Number of chunks embedded and written together. Defaults to 64.
+            embed_concurrency (int, optional): Number of batches embedded at the same time. Defaults to 2.
+            max_in_flight (int, optional): Maximum number of batches chunked but not yet stored. Defaults to 8.
+        """
+        self.batch_size = batch_size
+        self.embed_concurrency = embed_concurrency
+        self.max_in_flight = max(max_in_flight, embed_concurrency)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "IngestPipeline":
+        """Create a pipeline from the `document_qa.pipeline` configuration section.
+
+        Args:
+            config (dict): The application configuration.
+
+        Returns:
+            IngestPipeline: The configured pipeline.
+        """
+        settings = config.get("document_qa", {}).get("pipeline", {})
+        return cls(
+            batch_size=settings.get("batch_size", 64),
+            embed_concurrency=settings.get("embed_concurrency", 2),
+            max_in_flight=settings.get("max_in_flight", 8),
+        )
+
+    async def run(
+        self,
+        chunks: Iterator[T],
+        text: Callable[[T], str],
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+        make_record: Callable[[T, List[float]], Dict[str, Any]],
+        writer: ChunkWriter,
+        progress: Optional[Callable[..., None]] = None,
+    ) -> Tuple[int, Optional[str]]:
+        """Chunk, embed and store a document.
+
+        The writer is neither closed nor aborted, the caller does it depending on the outcome.
+
+        Args:
+            chunks (Iterator[T]): The chunks, iterated in a worker thread.
+            text (Callable[[T], str]): Returns the text of a chunk.
+            embed (Callable[[List[str]], Awaitable[List[List[float]]]]): Embeds a batch of texts.
+            make_record (Callable[[T, List[float]], Dict[str, Any]]): Builds the stored record of a chunk.
+            writer (ChunkWriter): Stores the records.
+            progress (Optional[Callable[..., None]], optional): Receives the "chunked" stage with the number of
+                chunks once they are all produced, and the "embedded" stage with the number of chunks embedded and
+                stored and their total when known. Defaults to None.
+
+        Returns:
+            Tuple[int, Optional[str]]: The number of chunks stored and the text of the first one.
+        """
+        run = _PipelineRun(self, chunks, text, embed, make_record, writer, progress)
+        chunk_task = asyncio.ensure_future(asyncio.to_thread(run.chunk, asyncio.get_running_loop()))
+        embed_tasks = [asyncio.ensure_future(run.embed_batches()) for _ in range(self.embed_concurrency)]
+        store_task = asyncio.ensure_future(run.store())
+        tasks = [chunk_task, *embed_tasks, store_task]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+            return store_task.result()
+        finally:
+            run.stopped.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class _PipelineRun:
+    """The stages and queues of one run of the pipeline."""
+
+    def __init__(
+        self,
+        pipeline: IngestPipeline,
+        chunks: Iterator[T],
+        text: Callable[[T], str],
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+        make_record: Callable[[T, List[float]], Dict[str, Any]],
+        writer: ChunkWriter,
+        progress: Optional[Callable[..., None]],
+    ):
+        self.pipeline = pipeline
+        self.chunks = chunks
+        self.text = text
+        self.embed = embed
+        self.make_record = make_record
+        self.writer = writer
+        self.progress = progress
+        self.batches: asyncio.Queue = asyncio.Queue()
+        self.embedded: asyncio.Queue = asyncio.Queue()
+        self.in_flight = threading.Semaphore(pipeline.max_in_flight)
+        self.stopped = threading.Event()
+        self.active_embedders = pipeline.embed_concurrency
+        self.total: Optional[int] = None
+
+    def chunk(self, loop: asyncio.AbstractEventLoop) -> None:
+        # Runs in a worker thread, waits for the slots freed by the store stage
+        count = 0
+        batch: List[T] = []
+        index = 0
+        for item in self.chunks:
+            batch.append(item)
+            count += 1
+            if len(batch) == self.pipeline.batch_size:
+                if not self._acquire_slot():
+                    return
+                loop.call_soon_threadsafe(self.batches.put_nowait, (index, batch))
+                index, batch = index + 1, []
+        if batch:
+            if not self._acquire_slot():
+                return
+            loop.call_soon_threadsafe(self.batches.put_nowait, (index, batch))
+        loop.call_soon_threadsafe(self.batches.put_nowait, None)
+        loop.call_soon_threadsafe(self._chunked, count)
+
+    def _acquire_slot(self) -> bool:
+        while not self.in_flight.acquire(timeout=_POLL_SECONDS):
+            if self.stopped.is_set():
+                return False
+        return not self.stopped.is_set()
+
+    def _chunked(self, count: int) -> None:
+        self.total = count
+        if self.progress is not None:
+            self.progress("chunked", chunks=count)
+
+    async def embed_batches(self) -> None:
+        while True:
+            item = await self.batches.get()
+            if item is None:
+                # Let the other embedders see the end of the chunks
+                self.batches.put_nowait(None)
+                break
+            index, batch = item
+            embeddings = await self.embed([self.text(chunk) for chunk in batch])
+            records = [self.make_record(chunk, embedding) for chunk, embedding in zip(batch, embeddings)]
+            self.embedded.put_nowait((index, records))
+        self.active_embedders -= 1
+        if not self.active_embedders:
+            self.embedded.put_nowait(None)
+
+    async def store(self) -> Tuple[int, Optional[str]]:
+        # Batches are embedded out of order, they are written in chunk order
+        pending: Dict[int, List[Dict[str, Any]]] = {}
+        next_index = 0
+        stored = 0
+        first_text = None
+        while True:
+            item = await self.embedded.get()
+            if item is None:
+                return stored, first_text
+            pending[item[0]] = item[1]
+            while next_index in pending:
+                records = pending.pop(next_index)
+                await asyncio.to_thread(self.writer.write, records)
+                self.in_flight.release()
+                if first_text is None and records:
+                    first_text = records[0]["raw_text"]
+                stored += len(records)
+                next_index += 1
+                if self.progress is not None:
+                    self.progress("embedded", done=stored, total=self.total)
@@ -0,0 +1,164 @@
+"""Asynchronous client of the PDF layout parser.
+
+`DocTreePDFReader` posts the PDF to the layout parser with a blocking urllib3 request, which froze the event loop, and
+every chat stream of the pod with it, for the whole parse. `LayoutParserClient` sends the request with the shared
+asynchronous httpx client, with timeouts and retries of the transient failures (connection errors, timeouts, 429 and
+5xx answers). The JSON decoding of the answer and the construction of the `Document` and `DocTree`, which take
+seconds for long documents, run in a worker thread.
+
+Classes:
+    LayoutParserError: The layout parser could not parse a document.
+    LayoutParserClient: Sends PDFs to the layout parser and builds their document tree.
+"""
+
+import asyncio
+import json
+import time
+from typing import Optional
+
+import httpx
+from loguru import logger
+from prometheus_client import Histogram
+
+from src.skills_backend.document_qa.trlabs_smartPDFParser.layout_reader import DocTree, Document
+
+PDF_PARSER_REQUEST_SECONDS = Histogram(
+    "pdf_parser_request_seconds",
+    "Duration of the requests to the PDF layout parser.",
+    ["outcome"],
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+
+
+class LayoutParserError(Exception):
+    """The layout parser could not parse a document."""
+
+    pass
+
+
+class LayoutParserClient:
+    """Sends PDFs to the layout parser and builds their document tree off the event loop."""
+
+    def __init__(
+        self,
+        url: str,
+        http_client: httpx.AsyncClient,
+        timeout_seconds: float = 120.0,
+        connect_timeout_seconds: float = 10.0,
+        max_retries: int = 2,
+        backoff_seconds: float = 1.0,
+    ):
+        """Initialize the client.
+
+        Args:
+            url (str): The URL of the layout parser.
+            http_client (httpx.AsyncClient): The shared HTTP client.
+            timeout_seconds (float, optional): Timeout of the reads of the answer. Defaults to 120.0.
+            connect_timeout_seconds (float, optional): Timeout of the connection. Defaults to 10.0.
+            max_retries (int, optional): Retries of the transient failures. Defaults to 2.
+            backoff_seconds (float, optional): Wait before the first retry, doubled for each retry. Defaults to 1.0.
+        """
+        self.url = url
+        self.http_client = http_client
+        self.timeout = httpx.Timeout(timeout_seconds, connect=connect_timeout_seconds)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+    @classmethod
+    def from_config(cls, config: dict, http_client: httpx.AsyncClient) -> "LayoutParserClient":
+        """Create a client from the `document_qa.pdf_parser_url` setting and `document_qa.pdf_parser` section.
+
+        Args:
+            config (dict): The application configuration.
+            http_client (httpx.AsyncClient): The shared HTTP client.
+
+        Returns:
+            LayoutParserClient: The configured client.
+        """
+        document_qa = config.get("document_qa", {})
+        settings = document_qa.get("pdf_parser", {})
+        return cls(
+            document_qa["pdf_parser_url"],
+            http_client,
+            timeout_seconds=settings.get("timeout_seconds", 120.0),
+            connect_timeout_seconds=settings.get("connect_timeout_seconds", 10.0),
+            max_retries=settings.get("max_retries", 2),
+            backoff_seconds=settings.get("backoff_seconds", 1.0),
+        )
+
+    async def parse(self, contents: bytes, file_name: str) -> bytes:
+        """Send a PDF to the layout parser, retrying the transient failures.
+
+        Args:
+            contents (bytes): The PDF file.
+            file_name (str): The name of the file.
+
+        Returns:
+            bytes: The raw JSON answer of the parser.
+
+        Raises:
+            LayoutParserError: If the parser rejects the file, or still fails after the retries.
+        """
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = await self.http_client.post(
+                    self.url, files={"file": (file_name, contents, "application/pdf")}, timeout=self.timeout
+                )
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code == 200:
+                    PDF_PARSER_REQUEST_SECONDS.labels(outcome="success").observe(time.monotonic() - started)
+                    return response.content
+                error = f"status {response.status_code}"
+                if response.status_code != 429 and response.status_code < 500:
+                    PDF_PARSER_REQUEST_SECONDS.labels(outcome="rejected").observe(time.monotonic() - started)
+                    raise LayoutParserError(f"Layout parser rejected {file_name} with {error}")
+
+            PDF_PARSER_REQUEST_SECONDS.labels(outcome="error").observe(time.monotonic() - started)
+            if attempt >= self.max_retries:
+                raise LayoutParserError(f"Layout parser failed on {file_name} after {attempt + 1} attempts: {error}")
+            delay = self.backoff_seconds * 2**attempt
+            logger.warning(f"Layout parser failed on {file_name} with {error}, retrying in {delay}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get_doc_tree(
+        self, path: str, file_name: str, tokenizer=None, section_only_chunking: bool = True
+    ) -> DocTree:
+        """Parse a PDF file and build its document tree.
+
+        Args:
+            path (str): The path of the PDF file.
+            file_name (str): The name of the document.
+            tokenizer (optional): Tokenizer of the chunking, see `DocTree`. Defaults to None.
+            section_only_chunking (bool, optional): Only chunk at the section level. Defaults to True.
+
+        Returns:
+            DocTree: The document tree.
+
+        Raises:
+            LayoutParserError: If the parser fails or its answer cannot be read.
+        """
+        contents = await asyncio.to_thread(_read_file, path)
+        answer = await self.parse(contents, file_name)
+        del contents
+        try:
+            return await asyncio.to_thread(_build_doc_tree, answer, file_name, tokenizer, section_only_chunking)
+        except (ValueError, KeyError, TypeError) as e:
+            raise LayoutParserError(f"Unreadable layout parser answer for {file_name}: {e}") from e
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def _build_doc_tree(answer: bytes, file_name: str, tokenizer: Optional[object], section_only_chunking: bool) -> DocTree:
+    """Decode the answer of the parser and build the document tree, in a worker thread."""
+    blocks = json.loads(answer)["return_dict"]["result"]["blocks"]
+    return DocTree(
+        doc=Document(blocks), tokenizer=tokenizer, file_name=file_name, section_only_chunking=section_only_chunking
+    )
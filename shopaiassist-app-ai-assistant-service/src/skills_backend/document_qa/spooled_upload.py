@@ -0,0 +1,112 @@
+"""Uploaded documents spooled to disk once.
+
+The validation, the parsing and the storage of an uploaded document used to read the upload several times, and the
+PDF path held the whole file in memory before writing it to a temp file for the parser. `spool_upload` streams the
+upload in chunks into a single temp file, enforcing the maximum size while reading and computing the SHA-256 of the
+content on the way. The resulting `SpooledUpload` is handed to validation and parsing, which open the file by path, so
+an upload is written once and never held in memory more than once.
+
+Classes:
+    SpooledUpload: An upload written to a temp file, with its size and content hash.
+
+Functions:
+    spool_upload: Streams an upload into a temp file.
+"""
+
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, Optional
+
+from fastapi import HTTPException, UploadFile
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+class SpooledUpload:
+    """An upload written to a temp file, with its size and content hash. Deletes the file when closed."""
+
+    def __init__(self, filename: str, path: str, size: int, sha256: str):
+        """Initialize the spooled upload.
+
+        Args:
+            filename (str): The name of the uploaded file.
+            path (str): The temp file holding the content.
+            size (int): The size of the content, in bytes.
+            sha256 (str): The hex SHA-256 of the content.
+        """
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    @property
+    def extension(self) -> str:
+        """The lowercase extension of the file name, with its dot."""
+        return os.path.splitext(self.filename)[1].lower()
+
+    def open(self) -> BinaryIO:
+        """Open the content for reading."""
+        return open(self.path, "rb")
+
+    def read_bytes(self) -> bytes:
+        """Read the whole content, for the parsers that need it in memory."""
+        with self.open() as file:
+            return file.read()
+
+    def close(self) -> None:
+        """Delete the temp file."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "SpooledUpload":
+        """Return the upload, deleted on exit."""
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Delete the temp file."""
+        self.close()
+
+
+async def spool_upload(
+    file: UploadFile, max_bytes: int, directory: Optional[str] = None, chunk_size: int = _CHUNK_SIZE
+) -> SpooledUpload:
+    """Stream an upload into a temp file, hashing it on the way.
+
+    Args:
+        file (UploadFile): The uploaded file.
+        max_bytes (int): The maximum size of the upload.
+        directory (Optional[str], optional): Directory of the temp file. Defaults to the system temp directory.
+        chunk_size (int, optional): Size of the chunks read from the upload. Defaults to 1MB.
+
+    Returns:
+        SpooledUpload: The spooled upload, to be closed by the caller.
+
+    Raises:
+        HTTPException: 413 if the upload is larger than `max_bytes`, reading stops at the limit.
+    """
+    filename = str(file.filename)
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    # Keep the extension, the PDF parser and the validators look at it
+    with tempfile.NamedTemporaryFile(dir=directory, suffix=os.path.splitext(filename)[1], delete=False) as temp_file:
+        try:
+            await file.seek(0)
+            while chunk := await file.read(chunk_size):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File size exceeds the maximum allowed size of {max_bytes / (1024 * 1024)}MB",
+                    )
+                digest.update(chunk)
+                temp_file.write(chunk)
+        except BaseException:
+            temp_file.close()
+            os.remove(temp_file.name)
+            raise
+    return SpooledUpload(filename, temp_file.name, size, digest.hexdigest())
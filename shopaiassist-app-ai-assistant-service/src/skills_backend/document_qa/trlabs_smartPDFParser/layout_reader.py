@@ -1,4 +1,4 @@
-from typing import List, Dict, Union, Tuple
+from typing import List, Dict, Union, Tuple, Iterable, Iterator
 
 
 class Block:
@@ -669,17 +669,14 @@ class Node:
                 self.subtree_text += child.subtree_text + "\n"
                 self.max_page_idx = max(self.max_page_idx, child.max_page_idx)
 
-            subtree_tokens = tokenizer.encode(self.subtree_text) if tokenizer is not None else None
-
-            self.subtree_token_count = len(subtree_tokens) if tokenizer is not None else None
+            self.tokenizer = tokenizer
 
         elif block is not None:
             # Non-root node
             self.node_text = block.to_text(include_children=False, recurse=False)
 
             self.subtree_text = block.to_text(include_children=True, recurse=True)
-            subtree_tokens = tokenizer.encode(self.subtree_text) if tokenizer is not None else None
-            self.subtree_token_count = len(subtree_tokens) if tokenizer is not None else None
+            self.tokenizer = tokenizer
 
             self.children = []
             self.tag = block.tag
@@ -696,6 +693,18 @@ class Node:
         else:
             raise ValueError("Either block or children should be provided")
 
+    @property
+    def subtree_token_count(self):
+        """
+        The number of tokens in the `subtree_text`, `None` without a tokenizer.
+        Computed on first use, the chunking only needs it for the nodes it inspects.
+        """
+        if self.tokenizer is None:
+            return None
+        if not hasattr(self, "_subtree_token_count"):
+            self._subtree_token_count = len(self.tokenizer.encode(self.subtree_text))
+        return self._subtree_token_count
+
 
 class DocTree:
     """
@@ -836,12 +845,43 @@ class DocTree:
 
         Refer [this](https://github.com/tr/labs_onesource-smartPDFParser) for more details.
         """
+        n_simple_chunking = [0]
+        chunks = list(
+            self.iter_chunks(
+                chunk_size=chunk_size,
+                simple_chunk_overlap=simple_chunk_overlap,
+                postprocess=postprocess,
+                include_file_name=include_file_name,
+                n_simple_chunking=n_simple_chunking,
+            )
+        )
+
+        if verbose:
+            print(f"Simple chunking is done {n_simple_chunking[0]} times")
+
+        return chunks
+
+    def iter_chunks(
+        self,
+        chunk_size=4096,
+        simple_chunk_overlap=50,
+        postprocess=True,
+        include_file_name=True,
+        n_simple_chunking: Union[List[int], None] = None,
+    ) -> Iterator[Dict]:
+        """
+        Generates the chunks of `get_chunks` one at a time, in the same order.
+
+        Chunks are produced while the tree is walked, so a consumer (e.g. the embedding of the chunks) can start
+        before the whole document is chunked. See `get_chunks` for the parameters and the content of the chunks.
+        """
         if self.tokenizer is None:
             raise ValueError("To get the chunks of the document, please construct the DocTree object with a tokenizer")
 
-        chunks = list()
-        n_simple_chunking = [0]
+        if n_simple_chunking is None:
+            n_simple_chunking = [0]
 
+        curr_text = ""
         if include_file_name:
             # Remove .pdf from the file name
             if self.file_name is not None:
@@ -852,22 +892,38 @@ class DocTree:
             else:
                 curr_text = ""
 
-        self._get_chunks_util(
+        chunks = self._iter_chunks_util(
             node=self.root_node,
             curr_text=curr_text,
-            chunks=chunks,
             chunk_size=chunk_size,
             n_simple_chunking=n_simple_chunking,
             simple_chunk_overlap=simple_chunk_overlap,
         )
 
-        if verbose:
-            print(f"Simple chunking is done {n_simple_chunking[0]} times")
-
         if postprocess:
-            chunks = self._postprocess_chunks(chunks=chunks, chunk_size=chunk_size)
+            chunks = self._iter_postprocessed_chunks(chunks=chunks, chunk_size=chunk_size)
 
-        return chunks
+        yield from chunks
+
+    def _iter_postprocessed_chunks(self, chunks: Iterable[Dict], chunk_size: int) -> Iterator[Dict]:
+        """
+        Streaming version of `_postprocess_chunks`: combines each chunk with the following ones while they fit.
+        """
+        combined = None
+        for chunk in chunks:
+            if combined is None:
+                combined = dict(chunk)
+                continue
+            temp_combined_chunk_txt = combined["content"] + " " + chunk["content"]
+            if self._fits(temp_combined_chunk_txt, chunk_size):
+                combined["content"] = temp_combined_chunk_txt
+                combined["end_page"] = chunk["end_page"]
+                combined["sections_info"].extend(chunk["sections_info"])
+            else:
+                yield combined
+                combined = dict(chunk)
+        if combined is not None:
+            yield combined
 
     def _postprocess_chunks(self, chunks: List[Dict], chunk_size: int):
         """
@@ -891,9 +947,7 @@ class DocTree:
             while j < chunks_len:
                 temp_combined_chunk_txt = combined_chunk_txt + " " + chunks[j]["content"]
 
-                temp_combined_chunk_len = len(self.tokenizer.encode(temp_combined_chunk_txt))
-
-                if temp_combined_chunk_len > chunk_size:
+                if not self._fits(temp_combined_chunk_txt, chunk_size):
                     break
                 else:
                     combined_chunk_txt = temp_combined_chunk_txt
@@ -921,6 +975,27 @@ class DocTree:
         chunk_size: int,
         n_simple_chunking: List[int],
         simple_chunk_overlap: int,
+    ):
+        """
+        Utility function to get the chunks of the document, appending them to `chunks`. See `_iter_chunks_util`.
+        """
+        chunks.extend(
+            self._iter_chunks_util(
+                node=node,
+                curr_text=curr_text,
+                chunk_size=chunk_size,
+                n_simple_chunking=n_simple_chunking,
+                simple_chunk_overlap=simple_chunk_overlap,
+            )
+        )
+
+    def _iter_chunks_util(
+        self,
+        node: Node,
+        curr_text: str,
+        chunk_size: int,
+        n_simple_chunking: List[int],
+        simple_chunk_overlap: int,
     ):
         """
         Utility function to get the chunks of the document.
@@ -928,8 +1003,6 @@ class DocTree:
         ----------
         `curr_text`: str
             The text to which the text of (some of) the nodes present in the subtree rooted at `node` will be appended.
-        `chunks`: List
-            The list of chunks to which the chunks will be appended.
         `chunk_size`: int
             The maximum number of tokens in a chunk.
         `n_simple_chunking`: List
@@ -937,16 +1010,14 @@ class DocTree:
         `simple_chunk_overlap`: int
             The number of tokens by which the chunks overlap if simple chunking is done.
 
-        Returns `None`.
+        Yields the chunks.
         """
         if self.tokenizer is None:
             raise ValueError("To get the chunks of the document, please construct the DocTree object with a tokenizer")
 
         # curr_text will always end with "\n"
         total_text = curr_text + node.subtree_text
-        total_token_count = len(self.tokenizer.encode(total_text))
-
-        if total_token_count > chunk_size:
+        if not self._fits(total_text, chunk_size):
             # If the total word count exceeds the chunk size
             children_len = len(node.children)
 
@@ -963,17 +1034,13 @@ class DocTree:
 
                 sections_info = [self._refine_section(curr_text)]
 
-                chunks.extend(
-                    [
-                        {
-                            "content": chnk_text,
-                            "start_page": node.page_idx + 1,
-                            "end_page": node.max_page_idx + 1,
-                            "sections_info": sections_info,
-                        }
-                        for chnk_text in simple_chunks
-                    ]
-                )
+                for chnk_text in simple_chunks:
+                    yield {
+                        "content": chnk_text,
+                        "start_page": node.page_idx + 1,
+                        "end_page": node.max_page_idx + 1,
+                        "sections_info": sections_info,
+                    }
             else:
                 # If children, then try to include as many children as possible
                 curr_text += node.node_text + "\n"
@@ -986,16 +1053,13 @@ class DocTree:
 
                 while child_idx < children_len:
                     temp_chunk_txt = chunk_txt + node.children[child_idx].subtree_text + "\n"
-                    temp_chunk_len = len(self.tokenizer.encode(temp_chunk_txt))
-
-                    if temp_chunk_len > chunk_size:
+                    if not self._fits(temp_chunk_txt, chunk_size):
                         if n_child_included == 0:
                             # If only one children exceeds the chunk size
                             # Then call the function recursively
-                            self._get_chunks_util(
+                            yield from self._iter_chunks_util(
                                 node=node.children[child_idx],
                                 curr_text=curr_text,
-                                chunks=chunks,
                                 chunk_size=chunk_size,
                                 n_simple_chunking=n_simple_chunking,
                                 simple_chunk_overlap=simple_chunk_overlap,
@@ -1004,7 +1068,7 @@ class DocTree:
 
                         else:
                             # If multiple children exceed the chunk size
-                            # Then add the current chunk to the chunks list
+                            # Then add the current chunk to the chunks
 
                             chnk = {
                                 "content": chunk_txt,
@@ -1013,7 +1077,7 @@ class DocTree:
                                 "sections_info": [self._refine_section(curr_text)],
                             }
 
-                            chunks.append(chnk)
+                            yield chnk
 
                             chunk_txt = curr_text
                             min_page_idx = -1
@@ -1034,7 +1098,7 @@ class DocTree:
 
                 if n_child_included > 0:
                     # If there are any children left
-                    # Then add the current chunk to the chunks list
+                    # Then add the current chunk to the chunks
                     chnk = {
                         "content": chunk_txt,
                         "start_page": min_page_idx + 1,
@@ -1042,11 +1106,11 @@ class DocTree:
                         "sections_info": [self._refine_section(curr_text)],
                     }
 
-                    chunks.append(chnk)
+                    yield chnk
         else:
             # If the total word count does not exceed the chunk size
             # Then add the subtree_text of the node to the curr_text
-            # And add it to the chunks list
+            # And add it to the chunks
 
             chnk = {
                 "content": total_text,
@@ -1054,9 +1118,17 @@ class DocTree:
                 "end_page": node.max_page_idx + 1,
                 "sections_info": [self._refine_section(curr_text)],
             }
-            chunks.append(chnk)
+            yield chnk
 
-        return
+    def _fits(self, text: str, chunk_size: int):
+        """
+        Check whether the text has at most `chunk_size` tokens.
+        Uses the `is_within` method of the tokenizer when it has one, which avoids encoding texts that cannot exceed it.
+        """
+        is_within = getattr(self.tokenizer, "is_within", None)
+        if is_within is not None:
+            return is_within(text, chunk_size)
+        return len(self.tokenizer.encode(text)) <= chunk_size
 
     def _get_simple_chunks(self, text: str, chunk_size: int, chunk_overlap: int):
         """
@@ -0,0 +1,223 @@
+"""In-process vector search over the chunks of uploaded documents.
+
+The embeddings of uploaded documents were only stored for the remote search service, so questions about a single
+document needed a round trip to it. A document has at most a few thousand chunks, few enough to search in process:
+a `DocumentIndex` keeps the embeddings of a document as an L2-normalised float32 matrix, so the cosine similarity of a
+query with every chunk is one matrix-vector product, and the top k chunks are selected with `np.argpartition` in
+linear time before sorting only those k.
+
+A `DocumentIndexCache` keeps the indexes of recently searched documents within a memory budget, evicting the least
+recently used ones. Concurrent searches of a document missing from the cache load it once.
+
+Classes:
+    DocumentIndex: Cosine similarity search over the chunks of one document.
+    DocumentIndexCache: LRU cache of document indexes within a memory budget.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+from loguru import logger
+from prometheus_client import Counter, Gauge, Histogram
+
+from src.skills_backend.document_qa.chunk_store import embedding_matrix
+
+DOCUMENT_INDEX_LOOKUPS = Counter("document_index_lookups_total", "Document index cache lookups.", ["result"])
+DOCUMENT_INDEX_BYTES = Gauge("document_index_cache_bytes", "Size of the document indexes kept in memory.")
+DOCUMENT_SEARCH_SECONDS = Histogram(
+    "document_search_seconds",
+    "Time of the in-process search of a document index.",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05),
+)
+
+
+class DocumentIndex:
+    """Cosine similarity search over the chunks of one document."""
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        texts: List[str],
+        chunk_ids: List[str],
+        start_pages: Optional[List[Optional[int]]] = None,
+        end_pages: Optional[List[Optional[int]]] = None,
+    ):
+        """Initialize the index, normalising a copy of the embeddings.
+
+        Args:
+            embeddings (np.ndarray): The (chunks, dimension) embedding matrix.
+            texts (List[str]): The text of each chunk.
+            chunk_ids (List[str]): The ID of each chunk.
+            start_pages (Optional[List[Optional[int]]], optional): The first page of each chunk. Defaults to None.
+            end_pages (Optional[List[Optional[int]]], optional): The last page of each chunk. Defaults to None.
+        """
+        matrix = np.array(embeddings, dtype=np.float32, ndmin=2)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        matrix /= norms
+        self.matrix = matrix
+        self.texts = texts
+        self.chunk_ids = chunk_ids
+        self.start_pages = start_pages or [None] * len(texts)
+        self.end_pages = end_pages or [None] * len(texts)
+
+    @classmethod
+    def from_table(cls, table: pa.Table) -> "DocumentIndex":
+        """Build the index of chunks read with `read_chunks`.
+
+        Args:
+            table (pa.Table): The chunks.
+
+        Returns:
+            DocumentIndex: The index, independent of the table.
+        """
+        # Chunks stored before the page range was recorded have no page columns
+        pages = {
+            name: table.column(name).to_pylist() for name in ("start_page", "end_page") if name in table.schema.names
+        }
+        return cls(
+            embedding_matrix(table),
+            table.column("raw_text").to_pylist(),
+            table.column("chunk_id").to_pylist(),
+            pages.get("start_page"),
+            pages.get("end_page"),
+        )
+
+    def __len__(self) -> int:
+        """Return the number of chunks."""
+        return len(self.texts)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by the index."""
+        return self.matrix.nbytes + sum(len(text) for text in self.texts) + 64 * len(self.texts)
+
+    def search(self, query: Sequence[float], top_k: int = 5) -> List[Dict[str, Any]]:
+        """Return the chunks most similar to a query embedding.
+
+        Args:
+            query (Sequence[float]): The embedding of the query.
+            top_k (int, optional): The number of chunks to return. Defaults to 5.
+
+        Returns:
+            List[Dict[str, Any]]: The chunk ID, text, cosine similarity score and page range of the most similar
+                chunks, the most similar first.
+
+        Raises:
+            ValueError: If the query does not have the dimension of the embeddings.
+        """
+        started = time.perf_counter()
+        vector = np.asarray(query, dtype=np.float32)
+        if vector.shape != (self.matrix.shape[1],):
+            raise ValueError(f"Query embedding must have dimension {self.matrix.shape[1]}")
+        vector = vector / (np.linalg.norm(vector) or 1)
+
+        scores = self.matrix @ vector
+        k = min(top_k, len(scores))
+        if k <= 0:
+            return []
+        # Partition the k best scores to the end, then only sort those
+        top = np.argpartition(scores, -k)[-k:] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        results = [
+            {
+                "chunk_id": self.chunk_ids[i],
+                "text": self.texts[i],
+                "score": float(scores[i]),
+                "start_page": self.start_pages[i],
+                "end_page": self.end_pages[i],
+            }
+            for i in top
+        ]
+        DOCUMENT_SEARCH_SECONDS.observe(time.perf_counter() - started)
+        return results
+
+
+class DocumentIndexCache:
+    """LRU cache of document indexes within a memory budget, used from the event loop."""
+
+    def __init__(self, memory_max_bytes: int = 256 * 1024 * 1024):
+        """Initialize the cache.
+
+        Args:
+            memory_max_bytes (int, optional): Maximum size of the indexes kept in memory. Defaults to 256MB.
+        """
+        self.memory_max_bytes = memory_max_bytes
+        self.memory_bytes = 0
+        self._indexes: "OrderedDict[str, DocumentIndex]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+
+    @classmethod
+    def from_config(cls, config: dict) -> "DocumentIndexCache":
+        """Create the cache from the `document_qa.search` configuration section.
+
+        Args:
+            config (dict): The application configuration.
+
+        Returns:
+            DocumentIndexCache: The configured cache.
+        """
+        settings = config.get("document_qa", {}).get("search", {})
+        return cls(memory_max_bytes=settings.get("memory_max_bytes", 256 * 1024 * 1024))
+
+    async def get(self, key: str, load: Callable[[], Awaitable[DocumentIndex]]) -> DocumentIndex:
+        """Return the index of a document, loading it if it is not cached.
+
+        Args:
+            key (str): The key of the document.
+            load (Callable[[], Awaitable[DocumentIndex]]): Loads the index of the document.
+
+        Returns:
+            DocumentIndex: The index.
+        """
+        index = self._indexes.get(key)
+        if index is not None:
+            DOCUMENT_INDEX_LOOKUPS.labels(result="hit").inc()
+            self._indexes.move_to_end(key)
+            return index
+
+        DOCUMENT_INDEX_LOOKUPS.labels(result="miss").inc()
+        future = self._loading.get(key)
+        if future is None:
+            future = asyncio.ensure_future(load())
+            self._loading[key] = future
+            future.add_done_callback(lambda done: self._loaded(key, done))
+        # A cancelled search does not cancel the load the other searches wait for
+        return await asyncio.shield(future)
+
+    def _loaded(self, key: str, future: asyncio.Future) -> None:
+        if self._loading.get(key) is not future:
+            # Discarded while loading
+            return
+        del self._loading[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._put(key, future.result())
+
+    def _put(self, key: str, index: DocumentIndex) -> None:
+        if index.nbytes > self.memory_max_bytes:
+            logger.warning(f"Index of {key} ({index.nbytes} bytes) exceeds the cache budget, not cached")
+            return
+        self.discard(key)
+        self._indexes[key] = index
+        self.memory_bytes += index.nbytes
+        while self.memory_bytes > self.memory_max_bytes:
+            _, evicted = self._indexes.popitem(last=False)
+            self.memory_bytes -= evicted.nbytes
+        DOCUMENT_INDEX_BYTES.set(self.memory_bytes)
+
+    def discard(self, key: str) -> None:
+        """Forget the index of a document, e.g. when it is deleted.
+
+        Args:
+            key (str): The key of the document.
+        """
+        self._loading.pop(key, None)
+        index = self._indexes.pop(key, None)
+        if index is not None:
+            self.memory_bytes -= index.nbytes
+            DOCUMENT_INDEX_BYTES.set(self.memory_bytes)
@@ -12,6 +12,7 @@ to accurately measure and limit chunk sizes for downstream processing.
 
 Functions:
     clean_namespace: Removes namespace prefixes from XML tags.
+    fits_in_tokens: Checks a text against a token budget, with the tokenizer's estimate when it has one.
     process_xml_for_chunks: Recursively processes XML elements into context-aware chunks.
     parse_xml_file: Main entry point for parsing XML files into structured chunks.
 """
@@ -26,6 +27,23 @@ def clean_namespace(tag):
     return tag
 
 
+def fits_in_tokens(tokenizer, text, max_tokens):
+    """Check whether a text has at most `max_tokens` tokens.
+
+    Args:
+        tokenizer: Tokenizer to measure token length, its `is_within` is used when it has one
+        text: The text to measure
+        max_tokens: The token budget
+
+    Returns:
+        True if the text fits the budget
+    """
+    is_within = getattr(tokenizer, "is_within", None)
+    if is_within is not None:
+        return is_within(text, max_tokens)
+    return len(tokenizer.encode(text)) <= max_tokens
+
+
 def process_xml_for_chunks(
     element, tokenizer, max_tokens=1024, depth=0, parent_path=None, current_chunk=None, chunks=None
 ):
@@ -69,9 +87,8 @@ def process_xml_for_chunks(
         line += f": {text}"
 
     current_chunk_text = "\n".join(current_chunk + [line])
-    current_tokens = len(tokenizer.encode(current_chunk_text))
 
-    if current_tokens > max_tokens and current_chunk:
+    if current_chunk and not fits_in_tokens(tokenizer, current_chunk_text, max_tokens):
         chunks.append("\n".join(current_chunk))
         current_chunk = []
 
@@ -0,0 +1,295 @@
+"""Admission control for upstream product support streams.
+
+This module bounds how many `/entry_router` streams a pod keeps open against the product support service at once.
+Requests are admitted while both the global and the per-tenant concurrency caps have room. Otherwise they wait in a
+bounded queue, and freed slots are handed out with weighted fair scheduling across tenants, so one tenant cannot
+monopolise the upstream service. Requests that cannot be queued, or that wait longer than the queue timeout, are
+rejected immediately with an `AdmissionRejected` error.
+
+Classes:
+    AdmissionRejected: Raised when a stream cannot be admitted.
+    AdmissionTicket: A single request for a stream slot, returned by `AdmissionController.request`.
+    AdmissionController: Tracks active streams and waiting requests and grants slots.
+
+Example usage:
+    ticket = admission_controller.request(tenant_id)
+    if not ticket.granted:
+        await ticket.wait()
+    try:
+        ...  # stream from the upstream service
+    finally:
+        ticket.release()
+"""
+
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from loguru import logger
+from prometheus_client import Counter, Gauge, Histogram
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "product_support_admission_queue_depth", "Number of product support requests waiting for a stream slot."
+)
+ADMISSION_ACTIVE_STREAMS = Gauge(
+    "product_support_admission_active_streams", "Number of product support streams currently admitted."
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "product_support_admission_wait_seconds",
+    "Time spent by product support requests waiting for a stream slot.",
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+ADMISSION_REJECTED = Counter(
+    "product_support_admission_rejected_total",
+    "Number of product support requests rejected by admission control.",
+    ["reason"],
+)
+
+
+class AdmissionRejected(Exception):
+    """Exception raised when a product support stream cannot be admitted."""
+
+    def __init__(self, reason: str, retry_after: int):
+        """Initialize the exception.
+
+        Args:
+            reason (str): Why the request was rejected ("queue_full" or "queue_timeout").
+            retry_after (int): Suggested number of seconds before the client retries.
+        """
+        # All the arguments are passed on, so that the exception can be pickled and copied
+        super().__init__(reason, retry_after)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def __str__(self) -> str:
+        """Return the error message."""
+        return f"Product support stream rejected: {self.reason}"
+
+
+class AdmissionTicket:
+    """A request for a product support stream slot.
+
+    A ticket is either granted immediately by `AdmissionController.request` or queued. A queued ticket must be
+    awaited with `wait`. A granted ticket must always be released with `release` once the stream is finished.
+    """
+
+    def __init__(self, controller: "AdmissionController", tenant_id: str, sequence: int):
+        """Initialize the ticket.
+
+        Args:
+            controller (AdmissionController): The controller that issued the ticket.
+            tenant_id (str): The tenant the stream is opened for.
+            sequence (int): Arrival order of the ticket, used to break scheduling ties.
+        """
+        self.controller = controller
+        self.tenant_id = tenant_id
+        self.sequence = sequence
+        self.enqueued_at = time.monotonic()
+        self.position = 0
+        self.granted = False
+        self.released = False
+        self._future: Optional[asyncio.Future] = None
+
+    async def wait(self) -> None:
+        """Wait until the ticket is granted.
+
+        Raises:
+            AdmissionRejected: If the ticket is not granted within the controller's queue timeout.
+        """
+        if self.granted:
+            return
+        assert self._future is not None
+        done, _ = await asyncio.wait({self._future}, timeout=self.controller.queue_timeout)
+        if not done:
+            self.controller._abandon(self)
+            ADMISSION_REJECTED.labels(reason="queue_timeout").inc()
+            raise AdmissionRejected("queue_timeout", retry_after=self.controller.retry_after)
+
+    def release(self) -> None:
+        """Release the stream slot held by this ticket, or leave the queue if it was never granted."""
+        if self.released:
+            return
+        self.released = True
+        if self.granted:
+            self.controller._release(self)
+        else:
+            self.controller._abandon(self)
+
+
+class AdmissionController:
+    """Admission controller with global and per-tenant stream caps and weighted fair queueing.
+
+    Fairness uses stride scheduling: every tenant has a virtual time that advances by `1 / weight` each time one of
+    its requests is granted a slot. When a slot frees up, it goes to the queued tenant with the lowest virtual time,
+    so tenants with a higher weight get proportionally more of the contended capacity.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_streams: int = 64,
+        max_streams_per_tenant: int = 8,
+        max_queue_size: int = 128,
+        queue_timeout: float = 10.0,
+        retry_after: int = 5,
+        tenant_weights: Optional[Dict[str, float]] = None,
+        default_weight: float = 1.0,
+    ):
+        """Initialize the admission controller.
+
+        Args:
+            max_concurrent_streams (int, optional): Global cap of concurrent streams. Defaults to 64.
+            max_streams_per_tenant (int, optional): Cap of concurrent streams per tenant. Defaults to 8.
+            max_queue_size (int, optional): Maximum number of waiting requests. Defaults to 128.
+            queue_timeout (float, optional): Seconds a request may wait for a slot. Defaults to 10.0.
+            retry_after (int, optional): Seconds suggested to rejected clients before retrying. Defaults to 5.
+            tenant_weights (Optional[Dict[str, float]], optional): Scheduling weight per tenant. Defaults to None.
+            default_weight (float, optional): Weight of tenants without an explicit weight. Defaults to 1.0.
+        """
+        self.max_concurrent_streams = max_concurrent_streams
+        self.max_streams_per_tenant = max_streams_per_tenant
+        self.max_queue_size = max_queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.tenant_weights = tenant_weights or {}
+        self.default_weight = default_weight
+
+        self.active_total = 0
+        self.active_by_tenant: Dict[str, int] = {}
+        self.waiting: Dict[str, Deque[AdmissionTicket]] = {}
+        self.queue_size = 0
+        self._virtual_time: Dict[str, float] = {}
+        self._sequence = itertools.count()
+
+    @classmethod
+    def from_config(cls, config: dict) -> "AdmissionController":
+        """Create an admission controller from the `product_support.admission` configuration section.
+
+        Args:
+            config (dict): The application configuration.
+
+        Returns:
+            AdmissionController: The configured admission controller.
+        """
+        settings = config.get("product_support", {}).get("admission", {})
+        return cls(
+            max_concurrent_streams=settings.get("max_concurrent_streams", 64),
+            max_streams_per_tenant=settings.get("max_streams_per_tenant", 8),
+            max_queue_size=settings.get("max_queue_size", 128),
+            queue_timeout=settings.get("queue_timeout", 10.0),
+            retry_after=settings.get("retry_after", 5),
+            tenant_weights=settings.get("tenant_weights", {}),
+            default_weight=settings.get("default_weight", 1.0),
+        )
+
+    def request(self, tenant_id: Optional[str]) -> AdmissionTicket:
+        """Request a stream slot for a tenant.
+
+        Args:
+            tenant_id (Optional[str]): The tenant the stream is opened for.
+
+        Returns:
+            AdmissionTicket: A granted ticket, or a queued ticket that must be awaited with `wait`.
+
+        Raises:
+            AdmissionRejected: If the wait queue is full.
+        """
+        tenant = tenant_id or "unknown"
+        ticket = AdmissionTicket(self, tenant, next(self._sequence))
+
+        if self._has_capacity(tenant) and not self.waiting.get(tenant):
+            self._grant(ticket)
+            return ticket
+
+        if self.queue_size >= self.max_queue_size:
+            ADMISSION_REJECTED.labels(reason="queue_full").inc()
+            logger.warning(f"Product support admission queue full, rejecting stream for tenant {tenant}")
+            raise AdmissionRejected("queue_full", retry_after=self.retry_after)
+
+        if tenant not in self.waiting or not self.waiting[tenant]:
+            # A tenant that (re)joins the queue must not bank credit from its idle time
+            self._virtual_time[tenant] = max(self._virtual_time.get(tenant, 0.0), self._min_waiting_virtual_time())
+        ticket._future = asyncio.get_running_loop().create_future()
+        self.waiting.setdefault(tenant, deque()).append(ticket)
+        self.queue_size += 1
+        ticket.position = self.queue_size
+        ADMISSION_QUEUE_DEPTH.set(self.queue_size)
+        return ticket
+
+    def _weight(self, tenant: str) -> float:
+        return max(float(self.tenant_weights.get(tenant, self.default_weight)), 1e-6)
+
+    def _has_capacity(self, tenant: str) -> bool:
+        return (
+            self.active_total < self.max_concurrent_streams
+            and self.active_by_tenant.get(tenant, 0) < self.max_streams_per_tenant
+        )
+
+    def _min_waiting_virtual_time(self) -> float:
+        times = [self._virtual_time.get(tenant, 0.0) for tenant, queue in self.waiting.items() if queue]
+        return min(times) if times else 0.0
+
+    def _grant(self, ticket: AdmissionTicket) -> None:
+        ticket.granted = True
+        self.active_total += 1
+        self.active_by_tenant[ticket.tenant_id] = self.active_by_tenant.get(ticket.tenant_id, 0) + 1
+        self._virtual_time[ticket.tenant_id] = self._virtual_time.get(ticket.tenant_id, 0.0) + 1.0 / self._weight(
+            ticket.tenant_id
+        )
+        ADMISSION_ACTIVE_STREAMS.set(self.active_total)
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - ticket.enqueued_at)
+        if ticket._future is not None and not ticket._future.done():
+            ticket._future.set_result(True)
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        self.active_total -= 1
+        remaining = self.active_by_tenant.get(ticket.tenant_id, 1) - 1
+        if remaining > 0:
+            self.active_by_tenant[ticket.tenant_id] = remaining
+        else:
+            self.active_by_tenant.pop(ticket.tenant_id, None)
+        ADMISSION_ACTIVE_STREAMS.set(self.active_total)
+        self._dispatch()
+
+    def _abandon(self, ticket: AdmissionTicket) -> None:
+        if ticket.granted:
+            # The slot was granted while the waiter was giving up, hand it on to the next tenant
+            ticket.released = True
+            self._release(ticket)
+            return
+        queue = self.waiting.get(ticket.tenant_id)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            self.queue_size -= 1
+            if not queue:
+                del self.waiting[ticket.tenant_id]
+            ADMISSION_QUEUE_DEPTH.set(self.queue_size)
+        if ticket._future is not None and not ticket._future.done():
+            ticket._future.cancel()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to queued tickets, choosing the eligible tenant with the lowest virtual time."""
+        while self.active_total < self.max_concurrent_streams:
+            eligible = [
+                tenant
+                for tenant, queue in self.waiting.items()
+                if queue and self.active_by_tenant.get(tenant, 0) < self.max_streams_per_tenant
+            ]
+            if not eligible:
+                return
+            tenant = min(eligible, key=lambda t: (self._virtual_time.get(t, 0.0), self.waiting[t][0].sequence))
+            ticket = self.waiting[tenant].popleft()
+            if not self.waiting[tenant]:
+                del self.waiting[tenant]
+            self.queue_size -= 1
+            ADMISSION_QUEUE_DEPTH.set(self.queue_size)
+            self._grant(ticket)
+
+    def stats(self) -> Dict[str, int]:
+        """Return a snapshot of the controller state.
+
+        Returns:
+            Dict[str, int]: Active streams and queue depth.
+        """
+        return {"active_streams": self.active_total, "queue_depth": self.queue_size}
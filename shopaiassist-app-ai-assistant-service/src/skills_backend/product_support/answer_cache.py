@@ -0,0 +1,258 @@
+"""Exact-match answer cache for first-turn product support questions.
+
+Many users open a chat with the same question for the same products. This module caches the accumulated
+`ResponseChunkProductSupport` of such first-turn answers, keyed by a hash of the normalised query and the request
+context, so that repeated questions can be answered without a new `/entry_router` RAG call.
+
+Only requests without chat history and without an uploaded document are cacheable. The cache is bounded both by TTL
+and by an LRU limit on entries and memory, it is disabled by default and can be enabled per tenant.
+
+Classes:
+    AnswerCache: In-memory TTL + LRU cache of complete product support responses.
+
+Functions:
+    normalize_query: Normalise a user query for exact-match lookups.
+    replay_cached_response: Replay a cached response as a synthetic fragment stream.
+"""
+
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterable
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+from prometheus_client import Counter
+
+from src.models import Authentication, ResponseChunkProductSupport, UserMessageRequest
+from src.skills_backend.product_support.stream_utils import ingest_response_chunk_product_support
+
+ANSWER_CACHE_LOOKUPS = Counter(
+    "product_support_answer_cache_lookups_total", "Product support answer cache lookups.", ["result"]
+)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Normalise a user query for exact-match lookups.
+
+    Case, surrounding whitespace, repeated whitespace and trailing punctuation do not change the key.
+
+    Args:
+        query (str): The user query.
+
+    Returns:
+        str: The normalised query.
+    """
+    return _WHITESPACE_RE.sub(" ", query).strip().casefold().rstrip("?!. ")
+
+
+class AnswerCache:
+    """In-memory TTL + LRU cache of complete product support responses."""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        ttl_seconds: int = 3600,
+        max_entries: int = 1000,
+        max_bytes: int = 50 * 1024 * 1024,
+        scope: str = "tenant",
+        tenants: Optional[Dict[str, dict]] = None,
+        fragment_size: int = 64,
+    ):
+        """Initialize the answer cache.
+
+        Args:
+            enabled (bool, optional): Whether the cache is enabled for tenants without an override. Defaults to False.
+            ttl_seconds (int, optional): Default time to live of an entry. Defaults to 3600.
+            max_entries (int, optional): Maximum number of entries. Defaults to 1000.
+            max_bytes (int, optional): Maximum approximate memory used by the entries. Defaults to 50MB.
+            scope (str, optional): "tenant" to keep answers per tenant or "global" to share them. Defaults to "tenant".
+            tenants (Optional[Dict[str, dict]], optional): Per-tenant overrides of `enabled` and `ttl_seconds`.
+            fragment_size (int, optional): Characters per fragment when replaying an answer. Defaults to 64.
+        """
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.scope = scope
+        self.tenants = tenants or {}
+        self.fragment_size = fragment_size
+
+        self._entries: "OrderedDict[str, Tuple[float, int, str]]" = OrderedDict()
+        self.current_bytes = 0
+
+    @classmethod
+    def from_config(cls, config: dict) -> "AnswerCache":
+        """Create an answer cache from the `product_support.answer_cache` configuration section.
+
+        Args:
+            config (dict): The application configuration.
+
+        Returns:
+            AnswerCache: The configured answer cache.
+        """
+        settings = config.get("product_support", {}).get("answer_cache", {})
+        return cls(
+            enabled=settings.get("enabled", False),
+            ttl_seconds=settings.get("ttl_seconds", 3600),
+            max_entries=settings.get("max_entries", 1000),
+            max_bytes=settings.get("max_bytes", 50 * 1024 * 1024),
+            scope=settings.get("scope", "tenant"),
+            tenants=settings.get("tenants", {}),
+            fragment_size=settings.get("fragment_size", 64),
+        )
+
+    def _tenant_setting(self, tenant_id: Optional[str], name: str, default):
+        return self.tenants.get(tenant_id or "", {}).get(name, default)
+
+    def is_enabled_for(self, tenant_id: Optional[str]) -> bool:
+        """Check whether the cache is enabled for a tenant.
+
+        Args:
+            tenant_id (Optional[str]): The tenant ID.
+
+        Returns:
+            bool: True if answers for this tenant may be cached.
+        """
+        return bool(self._tenant_setting(tenant_id, "enabled", self.enabled))
+
+    def key_for(self, user_message_req: UserMessageRequest, products: List[str], auth: Authentication) -> Optional[str]:
+        """Build the cache key of a request, if the request is cacheable.
+
+        Args:
+            user_message_req (UserMessageRequest): The user message request.
+            products (List[str]): The products the user has.
+            auth (Authentication): The authentication object.
+
+        Returns:
+            Optional[str]: The cache key, or None if the request must not be served from the cache.
+        """
+        user_message = user_message_req.user_message
+        if user_message_req.chat_history or user_message.document_id or not self.is_enabled_for(auth.tenant_id):
+            return None
+        context = {
+            "query": normalize_query(user_message.message),
+            "products": sorted(products or []),
+            "internal": auth.account_type == "internal",
+            "search_scope": str(user_message.search_scope.value),
+            "org_id": auth.org_id,
+            "tenant_id": auth.tenant_id if self.scope == "tenant" else None,
+        }
+        return hashlib.sha256(json.dumps(context, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[ResponseChunkProductSupport]:
+        """Look up a cached response.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            Optional[ResponseChunkProductSupport]: The cached response, or None on a miss or an expired entry.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            ANSWER_CACHE_LOOKUPS.labels(result="miss").inc()
+            return None
+        self._entries.move_to_end(key)
+        ANSWER_CACHE_LOOKUPS.labels(result="hit").inc()
+        return ResponseChunkProductSupport.model_validate_json(entry[2])
+
+    def put(self, key: str, response: ResponseChunkProductSupport, tenant_id: Optional[str] = None) -> None:
+        """Store a complete response.
+
+        Responses that did not finish normally (no final message) are not cached.
+
+        Args:
+            key (str): The cache key.
+            response (ResponseChunkProductSupport): The complete accumulated response.
+            tenant_id (Optional[str], optional): The tenant ID, used for the per-tenant TTL. Defaults to None.
+        """
+        if response.ai_message is None:
+            return
+        payload = response.model_dump_json()
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        expires_at = time.monotonic() + self._tenant_setting(tenant_id, "ttl_seconds", self.ttl_seconds)
+        self._entries[key] = (expires_at, size, payload)
+        self.current_bytes += size
+        while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def __len__(self) -> int:
+        """Return the number of cached entries."""
+        return len(self._entries)
+
+
+def _split_fragments(message: str, fragment_size: int) -> List[str]:
+    """Split a message into fragments of about `fragment_size` characters, cutting after whitespace."""
+    fragments = []
+    start = 0
+    while start < len(message):
+        end = min(start + fragment_size, len(message))
+        if end < len(message):
+            cut = message.rfind(" ", start, end)
+            if cut > start:
+                end = cut + 1
+        fragments.append(message[start:end])
+        start = end
+    return fragments
+
+
+async def replay_cached_response(
+    cached_response: ResponseChunkProductSupport,
+    complete_response: ResponseChunkProductSupport,
+    fragment_size: int = 64,
+) -> AsyncIterable[str]:
+    """Replay a cached response as a synthetic product support stream.
+
+    The cached answer is fed through `ingest_response_chunk_product_support` in the same order as the upstream
+    service sends it, so the client receives the same events and `complete_response` ends up in the same state as
+    for a live answer.
+
+    Args:
+        cached_response (ResponseChunkProductSupport): The cached complete response.
+        complete_response (ResponseChunkProductSupport): The complete response object of the current request.
+        fragment_size (int, optional): Characters per replayed fragment. Defaults to 64.
+
+    Yields:
+        str: The serialized streamable chunks.
+    """
+    chunks = []
+    if cached_response.reformulated_query_raw is not None:
+        chunks.append(ResponseChunkProductSupport(reformulated_query=cached_response.reformulated_query_raw))
+    chunks.extend(
+        ResponseChunkProductSupport(message=fragment)
+        for fragment in _split_fragments(cached_response.ai_message or "", fragment_size)
+    )
+    chunks.append(ResponseChunkProductSupport(retrieved_urls=cached_response.retrieved_urls or []))
+    if cached_response.open_ticket is not None:
+        chunks.append(
+            ResponseChunkProductSupport(
+                open_ticket=cached_response.open_ticket,
+                ticket_subject=cached_response.ticket_subject,
+                ticket_description=cached_response.ticket_description,
+                ticket_product=cached_response.ticket_product,
+            )
+        )
+
+    for chunk in chunks:
+        streamable_response = await ingest_response_chunk_product_support(
+            response_chunk=chunk, complete_response=complete_response
+        )
+        if streamable_response:
+            yield streamable_response.model_dump_json()
+    logger.info(f"Product support answer {complete_response.id} served from the answer cache")
@@ -0,0 +1,218 @@
+"""Circuit breaker for the product support upstream.
+
+When the product support ML API degrades, every request would otherwise wait for the full HTTP timeout before
+failing, while the pod keeps piling up open streams. The circuit breaker tracks the outcome of the most recent
+upstream calls and opens when too many of them fail or are slow. While open, calls fail fast with a configurable
+fallback response. After a cool-down, a limited number of probe calls are let through (half-open). A successful probe
+closes the circuit again, a failed one re-opens it.
+
+Classes:
+    CircuitState: The states of a circuit breaker.
+    CircuitBreaker: Rolling-window circuit breaker with error-rate and latency thresholds.
+
+Example usage:
+    if not circuit_breaker.allow_request():
+        return fallback
+    try:
+        ...  # call the upstream service
+        circuit_breaker.record_success(latency)
+    except httpx.HTTPError:
+        circuit_breaker.record_failure()
+"""
+
+import time
+from collections import deque
+from enum import Enum
+from typing import Deque, Dict, Tuple
+
+from loguru import logger
+from prometheus_client import Counter, Gauge
+
+CIRCUIT_STATE = Gauge(
+    "product_support_circuit_state", "State of the upstream circuit breaker (0 closed, 1 half-open, 2 open).", ["name"]
+)
+CIRCUIT_SHORT_CIRCUITED = Counter(
+    "product_support_circuit_short_circuited_total", "Upstream calls rejected by an open circuit breaker.", ["name"]
+)
+
+DEFAULT_FALLBACK_MESSAGE = (
+    "The product support assistant is temporarily unavailable. Please try again in a few minutes."
+)
+
+
+class CircuitState(str, Enum):
+    """The states of a circuit breaker."""
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+
+_STATE_VALUES = {CircuitState.CLOSED: 0, CircuitState.HALF_OPEN: 1, CircuitState.OPEN: 2}
+
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker with error-rate and latency thresholds."""
+
+    def __init__(
+        self,
+        name: str = "product_support",
+        window_size: int = 20,
+        min_calls: int = 10,
+        error_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 30.0,
+        slow_call_rate_threshold: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1,
+        fallback_message: str = DEFAULT_FALLBACK_MESSAGE,
+        unhealthy_when_open: bool = False,
+    ):
+        """Initialize the circuit breaker.
+
+        Args:
+            name (str, optional): Name of the protected upstream, used in metrics and health output.
+            window_size (int, optional): Number of most recent calls the rates are computed on. Defaults to 20.
+            min_calls (int, optional): Minimum calls in the window before the circuit can open. Defaults to 10.
+            error_rate_threshold (float, optional): Failure rate that opens the circuit. Defaults to 0.5.
+            slow_call_seconds (float, optional): Time to first byte above which a call is slow. Defaults to 30.
+            slow_call_rate_threshold (float, optional): Slow call rate that opens the circuit. Defaults to 0.8.
+            open_seconds (float, optional): Seconds the circuit stays open before probing. Defaults to 30.
+            half_open_max_calls (int, optional): Concurrent probe calls allowed while half-open. Defaults to 1.
+            fallback_message (str, optional): Message returned to users while the circuit is open.
+            unhealthy_when_open (bool, optional): Whether the health check fails while the circuit is open, so the
+                load balancer sheds traffic from the pod. Defaults to False.
+        """
+        self.name = name
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.fallback_message = fallback_message
+        self.unhealthy_when_open = unhealthy_when_open
+
+        self.state = CircuitState.CLOSED
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self._calls: Deque[Tuple[bool, bool]] = deque(maxlen=window_size)
+        CIRCUIT_STATE.labels(name=name).set(_STATE_VALUES[self.state])
+
+    @classmethod
+    def from_config(cls, config: dict) -> "CircuitBreaker":
+        """Create a circuit breaker from the `product_support.circuit_breaker` configuration section.
+
+        Args:
+            config (dict): The application configuration.
+
+        Returns:
+            CircuitBreaker: The configured circuit breaker.
+        """
+        settings = config.get("product_support", {}).get("circuit_breaker", {})
+        return cls(
+            window_size=settings.get("window_size", 20),
+            min_calls=settings.get("min_calls", 10),
+            error_rate_threshold=settings.get("error_rate_threshold", 0.5),
+            slow_call_seconds=settings.get("slow_call_seconds", 30.0),
+            slow_call_rate_threshold=settings.get("slow_call_rate_threshold", 0.8),
+            open_seconds=settings.get("open_seconds", 30.0),
+            half_open_max_calls=settings.get("half_open_max_calls", 1),
+            fallback_message=settings.get("fallback_message", DEFAULT_FALLBACK_MESSAGE),
+            unhealthy_when_open=settings.get("unhealthy_when_open", False),
+        )
+
+    def allow_request(self) -> bool:
+        """Check whether a call to the upstream may be made.
+
+        A caller that is allowed must report the outcome with `record_success`, `record_failure`, `record_slow` or
+        `record_cancelled`.
+
+        Returns:
+            bool: True if the call may proceed, False if it must fail fast.
+        """
+        if self.state == CircuitState.OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self._transition(CircuitState.HALF_OPEN)
+        if self.state == CircuitState.CLOSED:
+            return True
+        if self.state == CircuitState.HALF_OPEN and self.probes_in_flight < self.half_open_max_calls:
+            self.probes_in_flight += 1
+            return True
+        CIRCUIT_SHORT_CIRCUITED.labels(name=self.name).inc()
+        return False
+
+    def record_success(self, latency: float) -> None:
+        """Record a successful call.
+
+        Args:
+            latency (float): Seconds until the upstream started answering.
+        """
+        slow = latency > self.slow_call_seconds
+        if self.state == CircuitState.HALF_OPEN:
+            self.probes_in_flight = max(self.probes_in_flight - 1, 0)
+            self._transition(CircuitState.OPEN if slow else CircuitState.CLOSED)
+            return
+        self._record(failed=False, slow=slow)
+
+    def record_failure(self) -> None:
+        """Record a failed call."""
+        if self.state == CircuitState.HALF_OPEN:
+            self.probes_in_flight = max(self.probes_in_flight - 1, 0)
+            self._transition(CircuitState.OPEN)
+            return
+        self._record(failed=True, slow=False)
+
+    def record_slow(self) -> None:
+        """Record a call whose first byte did not arrive within `slow_call_seconds`.
+
+        Recorded as soon as the threshold passes, so a hanging upstream opens the circuit without waiting for its
+        calls to time out.
+        """
+        if self.state == CircuitState.HALF_OPEN:
+            self.probes_in_flight = max(self.probes_in_flight - 1, 0)
+            self._transition(CircuitState.OPEN)
+            return
+        self._record(failed=False, slow=True)
+
+    def record_cancelled(self) -> None:
+        """Record a call abandoned by the caller before its outcome was known."""
+        if self.state == CircuitState.HALF_OPEN:
+            self.probes_in_flight = max(self.probes_in_flight - 1, 0)
+
+    def _record(self, failed: bool, slow: bool) -> None:
+        self._calls.append((failed, slow))
+        if self.state != CircuitState.CLOSED or len(self._calls) < self.min_calls:
+            return
+        error_rate = sum(call[0] for call in self._calls) / len(self._calls)
+        slow_rate = sum(call[1] for call in self._calls) / len(self._calls)
+        if error_rate >= self.error_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+            logger.warning(
+                f"Opening {self.name} circuit: error rate {error_rate:.0%}, slow call rate {slow_rate:.0%} "
+                f"over the last {len(self._calls)} calls"
+            )
+            self._transition(CircuitState.OPEN)
+
+    def _transition(self, state: CircuitState) -> None:
+        if state == self.state:
+            if state == CircuitState.OPEN:
+                self.opened_at = time.monotonic()
+            return
+        logger.info(f"{self.name} circuit {self.state.value} -> {state.value}")
+        self.state = state
+        if state == CircuitState.OPEN:
+            self.opened_at = time.monotonic()
+        elif state == CircuitState.CLOSED:
+            self._calls.clear()
+        CIRCUIT_STATE.labels(name=self.name).set(_STATE_VALUES[state])
+
+    def health(self) -> Dict[str, str | int]:
+        """Return the breaker state for the health check.
+
+        Returns:
+            Dict[str, str | int]: The state and the number of calls in the current window.
+        """
+        if self.state == CircuitState.OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            state = CircuitState.HALF_OPEN
+        else:
+            state = self.state
+        return {"state": state.value, "window_calls": len(self._calls)}
@@ -4,17 +4,30 @@ This module provides a function to generate a product support response based on
 It uses the OpenAI API to summarize the chat and fetch data from the product support API.
 """
 
+import asyncio
+import json
 import uuid
+from contextlib import aclosing
 from datetime import datetime, timezone
 from typing import AsyncIterable, List, Dict, Optional
+import httpx
+from loguru import logger
 from src.models import (
     UserMessageRequest,
     ResponseChunkProductSupport,
     Authentication,
     ChatMetadata,
     HumanMessage,
+    AIMessage,
+    StreamStatusMessage,
+    StreamTimingsMessage,
 )
 from src.auth import get_onesource_bearer_token
+from src.history_budget import HistoryBudgeter
+from src.skills_backend.product_support.admission import AdmissionController, AdmissionRejected
+from src.skills_backend.product_support.answer_cache import AnswerCache, replay_cached_response
+from src.skills_backend.product_support.circuit_breaker import CircuitBreaker
+from src.skills_backend.product_support.stream_timings import StreamTimings
 from src.skills_backend.product_support.stream_utils import fetch_data
 from src.db import ChatManagement
 
@@ -85,6 +98,15 @@ async def product_support(
     config: dict,
     openai_chat,
     chat_mngmt: ChatManagement,
+    admission_controller: Optional[AdmissionController] = None,
+    answer_cache: Optional[AnswerCache] = None,
+    chat_logger=None,
+    circuit_breaker: Optional[CircuitBreaker] = None,
+    user_query_id: Optional[str] = None,
+    bot_resp_id: Optional[str] = None,
+    timings: Optional[StreamTimings] = None,
+    debug_timings: bool = False,
+    history_budgeter: Optional[HistoryBudgeter] = None,
 ) -> AsyncIterable:
     """Generate a product support response based on the user's message.
 
@@ -93,12 +115,169 @@ async def product_support(
         user_message_req (str): The user's message requesting product support.
         auth (Authentication): The authentication object.
         config (dict): The configuration dictionary containing API URLs and keys.
-        openai_chat: The OpenAI chat object for generating responses.
+        openai_chat: The OpenAI chat object for generating responses. Its connection pool is shared with the upstream
+            calls.
+        admission_controller (Optional[AdmissionController]): Limits concurrent upstream streams. Defaults to None.
+        answer_cache (Optional[AnswerCache]): Cache of first-turn answers. Defaults to None.
+        chat_logger (Optional[S3Logger]): S3 logger used to log answers served from the cache. Defaults to None.
+        circuit_breaker (Optional[CircuitBreaker]): Breaker guarding the upstream service. Defaults to None.
+        user_query_id (Optional[str]): The ID to give the user query. Defaults to a new UUID.
+        bot_resp_id (Optional[str]): The ID to give the AI response. Defaults to a new UUID.
+        timings (Optional[StreamTimings]): Phase timers of the request, exported when the stream ends. Defaults to
+            timers started now.
+        debug_timings (bool): Whether to end the stream with a timings event. Defaults to False.
+        history_budgeter (Optional[HistoryBudgeter]): Trims the chat history sent upstream to its token budget.
+            Defaults to None, the history is sent as is.
 
     Returns:
         AsyncIterable: A stream of product support responses.
     """
-    user_query_id, bot_resp_id = str(uuid.uuid4()), str(uuid.uuid4())
+    user_query_id = user_query_id or str(uuid.uuid4())
+    bot_resp_id = bot_resp_id or str(uuid.uuid4())
+    timings = timings or StreamTimings(auth.tenant_id, auth.org_id)
+
+    if history_budgeter is not None and user_message_req.chat_history:
+        with timings.phase("trim_history"):
+            chat_history = await history_budgeter.trim(user_message_req.chat_history)
+        user_message_req = user_message_req.model_copy(update={"chat_history": chat_history})
+
+    try:
+        async for line in _admit_and_stream(
+            chat,
+            user_message_req,
+            products,
+            auth,
+            config,
+            chat_mngmt,
+            user_query_id,
+            bot_resp_id,
+            timings,
+            admission_controller=admission_controller,
+            answer_cache=answer_cache,
+            chat_logger=chat_logger,
+            circuit_breaker=circuit_breaker,
+            http_client=openai_chat.http_client,
+        ):
+            yield line
+        if debug_timings:
+            yield StreamTimingsMessage(id=bot_resp_id, timings=timings.summary()).model_dump_json()
+    finally:
+        timings.observe()
+
+
+async def _admit_and_stream(
+    chat: ChatMetadata,
+    user_message_req: UserMessageRequest,
+    products: List[str],
+    auth: Authentication,
+    config: dict,
+    chat_mngmt: ChatManagement,
+    user_query_id: str,
+    bot_resp_id: str,
+    timings: StreamTimings,
+    admission_controller: Optional[AdmissionController] = None,
+    answer_cache: Optional[AnswerCache] = None,
+    chat_logger=None,
+    circuit_breaker: Optional[CircuitBreaker] = None,
+    http_client: Optional[httpx.AsyncClient] = None,
+) -> AsyncIterable:
+    """Serve the answer from the answer cache, or stream it from the upstream once admitted."""
+    cache_key = answer_cache.key_for(user_message_req, products, auth) if answer_cache is not None else None
+    cached_response = answer_cache.get(cache_key) if cache_key is not None else None
+    if cached_response is not None:
+        # Cache hits do not open an upstream stream, so they bypass admission control
+        async for line in _product_support_stream(
+            chat,
+            user_message_req,
+            products,
+            auth,
+            config,
+            chat_mngmt,
+            user_query_id,
+            bot_resp_id,
+            timings,
+            cached_response=cached_response,
+            answer_cache=answer_cache,
+            chat_logger=chat_logger,
+        ):
+            yield line
+        return
+
+    ticket = None
+    # The ticket is released however the stream ends, also when the client disconnects while queued: a queued ticket
+    # left behind would be granted later and hold its slot forever
+    try:
+        if admission_controller is not None:
+            try:
+                ticket = admission_controller.request(auth.tenant_id)
+                if not ticket.granted:
+                    yield StreamStatusMessage(
+                        id=bot_resp_id,
+                        status="queued",
+                        code=202,
+                        message="The assistant is busy, your question is queued.",
+                        queue_position=ticket.position,
+                    ).model_dump_json()
+                    with timings.phase("admission"):
+                        await ticket.wait()
+            except AdmissionRejected as e:
+                yield StreamStatusMessage(
+                    id=bot_resp_id,
+                    status="rejected",
+                    code=429,
+                    message="The assistant is handling too many requests. Please try again shortly.",
+                    retry_after=e.retry_after,
+                ).model_dump_json()
+                return
+
+        async for line in _product_support_stream(
+            chat,
+            user_message_req,
+            products,
+            auth,
+            config,
+            chat_mngmt,
+            user_query_id,
+            bot_resp_id,
+            timings,
+            answer_cache=answer_cache,
+            cache_key=cache_key,
+            circuit_breaker=circuit_breaker,
+            http_client=http_client,
+        ):
+            yield line
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+
+async def _timed(awaitable, timings: StreamTimings, phase: str):
+    """Await `awaitable`, recording its duration as a phase of `timings`."""
+    with timings.phase(phase):
+        return await awaitable
+
+
+async def _product_support_stream(
+    chat: ChatMetadata,
+    user_message_req: UserMessageRequest,
+    products: List[str],
+    auth: Authentication,
+    config: dict,
+    chat_mngmt: ChatManagement,
+    user_query_id: str,
+    bot_resp_id: str,
+    timings: StreamTimings,
+    cached_response: Optional[ResponseChunkProductSupport] = None,
+    answer_cache: Optional[AnswerCache] = None,
+    cache_key: Optional[str] = None,
+    chat_logger=None,
+    circuit_breaker: Optional[CircuitBreaker] = None,
+    http_client: Optional[httpx.AsyncClient] = None,
+) -> AsyncIterable:
+    """Log the user's query, stream the product support answer and log the complete response.
+
+    The answer is streamed from the upstream service, or replayed from `cached_response` on an answer cache hit.
+    """
     data = {
         "query": user_message_req.user_message.message,
         # Convert to list of dicts for JSON serializability
@@ -115,33 +294,98 @@ async def product_support(
         "email_address": auth.EmailAddress,
     }
 
-    await chat_mngmt.log_product_support_query(chat, data, user_message_req, auth, chat_mngmt.conn_write)
+    # Persist the user message in the background, the echo, the token fetch and the upstream connect do not depend on
+    # it. The write is awaited before the AI response is logged.
+    persist_task = asyncio.create_task(
+        _timed(
+            chat_mngmt.log_product_support_query(chat, data, user_message_req, auth, chat_mngmt.conn_write),
+            timings,
+            "persist_query",
+        )
+    )
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": "Bearer " + await get_onesource_bearer_token(config),
-    }
-    complete_response = ResponseChunkProductSupport(id=bot_resp_id, user_query_id=user_query_id)
-    complete_response.chat_title = chat.name
-
-    # Send back first user message
-    yield HumanMessage(
-        id=user_query_id,
-        message=user_message_req.user_message.message,
-        sent_time=datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
-    ).model_dump_json()
-
-    async for line in fetch_data(
-        # config["ml_api"]["onesource_product_support_url"] + "/product_support",
-        config["ml_api"]["onesource_product_support_url"] + "/entry_router",
-        headers,
-        data,
-        complete_response,
-    ):
-        if line:
-            yield line
+    # Awaited below on the normal path; when the stream ends early (the token fetch or upstream call failed, or the
+    # client disconnected) the finally waits for the write so that its outcome is logged rather than lost
+    persist_awaited = False
+    try:
+        complete_response = ResponseChunkProductSupport(id=bot_resp_id, user_query_id=user_query_id)
+        complete_response.chat_title = chat.name
 
-    # Log response after completion
-    await chat_mngmt.log_product_support_ai_response(
-        chat, data, user_message_req, complete_response, auth, chat_mngmt.conn_write
-    )
+        # Send back first user message
+        yield HumanMessage(
+            id=user_query_id,
+            message=user_message_req.user_message.message,
+            sent_time=datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        ).model_dump_json()
+
+        if cached_response is not None:
+            async for line in replay_cached_response(cached_response, complete_response, answer_cache.fragment_size):
+                timings.record_fragment(line)
+                yield line
+        else:
+            with timings.phase("bearer_token"):
+                bearer_token = await get_onesource_bearer_token(config)
+            headers = {
+                "Content-Type": "application/json",
+                "Authorization": "Bearer " + bearer_token,
+            }
+            async with aclosing(
+                fetch_data(
+                    # config["ml_api"]["onesource_product_support_url"] + "/product_support",
+                    config["ml_api"]["onesource_product_support_url"] + "/entry_router",
+                    headers,
+                    data,
+                    complete_response,
+                    circuit_breaker=circuit_breaker,
+                    timings=timings,
+                    http_client=http_client,
+                )
+            ) as upstream:
+                async for line in upstream:
+                    if persist_task.done() and persist_task.exception() is not None:
+                        # The user message could not be stored, stop generating an answer that cannot be logged
+                        break
+                    if line:
+                        timings.record_fragment(line)
+                        yield line
+
+        persist_awaited = True
+        try:
+            await persist_task
+        except Exception as e:
+            logger.error(f"Failed to persist user message {user_query_id}, the answer {bot_resp_id} is not logged: {e}")
+            yield AIMessage(id=bot_resp_id, message="Sorry, something went wrong. Please try again.").model_dump_json()
+            return
+
+        if cached_response is None and answer_cache is not None and cache_key is not None:
+            answer_cache.put(cache_key, complete_response, auth.tenant_id)
+
+        with timings.phase("final_logging"):
+            # Log response after completion
+            await chat_mngmt.log_product_support_ai_response(
+                chat, data, user_message_req, complete_response, auth, chat_mngmt.conn_write
+            )
+            if cached_response is not None and chat_logger is not None:
+                # The upstream service logs the conversations it answers, cached answers are logged here instead
+                try:
+                    await chat_logger.write_conversation(
+                        str(chat.id),
+                        user_query_id,
+                        bot_resp_id,
+                        tenant_id=str(auth.tenant_id),
+                        user_id=str(auth.user_id),
+                        query=data["query"],
+                        products=json.dumps(products or []),
+                        answer=complete_response.message,
+                        served_from_cache=True,
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to log cached product support answer {bot_resp_id} to S3: {e}")
+    finally:
+        if not persist_awaited:
+            try:
+                await persist_task
+            except asyncio.CancelledError:
+                logger.warning(f"Persisting user message {user_query_id} was cancelled")
+            except Exception as e:
+                logger.error(f"Failed to persist user message {user_query_id}: {e}")
@@ -0,0 +1,253 @@
+"""Resumable product support streams.
+
+A product support answer is produced by a background task that writes every event into a bounded per-stream replay
+buffer, keyed by the `bot_resp_id` of the answer. Clients read the buffer instead of the producer directly, so a
+client whose connection drops mid-answer can reconnect with the `Last-Event-ID` of the last event it received and
+get the missing events followed by the rest of the live stream, without a new upstream generation. Buffers of
+finished streams are evicted after a short TTL, and a producer nobody has read for the same TTL is cancelled, which
+releases its upstream stream and admission ticket. Eviction runs on a timer, and `stop` cancels the producers still
+running when the application shuts down.
+
+Classes:
+    ReplayBuffer: Bounded ring buffer of the events of a single stream.
+    StreamRegistry: Runs stream producers in the background and keeps their replay buffers.
+
+Example usage:
+    buffer = stream_registry.start(bot_resp_id, chat_id, user_id, product_support(...))
+    return EventSourceResponse(buffer.follow(last_event_id=None))
+"""
+
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterable
+from typing import Deque, List, Optional, Tuple
+
+from loguru import logger
+
+from src.models import AIMessage
+
+
+class ReplayBuffer:
+    """Bounded ring buffer of the events of a single product support stream.
+
+    Events get consecutive integer ids starting at 0. When the buffer is full the oldest events are dropped, so a
+    client resuming from an id older than the buffer receives the events that are still available.
+    """
+
+    def __init__(self, bot_resp_id: str, chat_id: str, owner: Optional[str], max_events: int):
+        """Initialize the replay buffer.
+
+        Args:
+            bot_resp_id (str): The ID of the AI response being streamed.
+            chat_id (str): The ID of the chat the response belongs to.
+            owner (Optional[str]): The ID of the user the stream belongs to.
+            max_events (int): Maximum number of events kept for replay.
+        """
+        self.bot_resp_id = bot_resp_id
+        self.chat_id = chat_id
+        self.owner = owner
+        self.events: Deque[Tuple[int, str]] = deque(maxlen=max_events)
+        self.next_event_id = 0
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.readers = 0
+        # Since when no reader follows the stream, None while one does
+        self.unread_since: Optional[float] = time.monotonic()
+        self._signal = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        """Whether the producer of the stream has finished."""
+        return self.finished_at is not None
+
+    def append(self, data: str) -> int:
+        """Append an event and wake up the readers.
+
+        Args:
+            data (str): The serialized event data.
+
+        Returns:
+            int: The id of the event.
+        """
+        event_id = self.next_event_id
+        self.events.append((event_id, data))
+        self.next_event_id += 1
+        self._notify()
+        return event_id
+
+    def finish(self) -> None:
+        """Mark the stream as finished and wake up the readers."""
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    def _notify(self) -> None:
+        signal, self._signal = self._signal, asyncio.Event()
+        signal.set()
+
+    async def follow(self, last_event_id: Optional[int] = None) -> AsyncIterable[dict]:
+        """Replay the events after `last_event_id` and then tail the live stream until it finishes.
+
+        Args:
+            last_event_id (Optional[int], optional): Id of the last event the client received, or None to read the
+                stream from the start. Defaults to None.
+
+        Yields:
+            dict: Server-sent events with an `id` and `data`.
+        """
+        cursor = -1 if last_event_id is None else last_event_id
+        self.readers += 1
+        self.unread_since = None
+        try:
+            while True:
+                # Take the signal before reading, so an event appended while we yield is never missed
+                signal = self._signal
+                if self.events:
+                    oldest_id = self.events[0][0]
+                    start = max(cursor + 1 - oldest_id, 0)
+                    for event_id, data in list(itertools.islice(self.events, start, None)):
+                        cursor = event_id
+                        yield {"id": str(event_id), "data": data}
+                if self.finished and cursor >= self.next_event_id - 1:
+                    return
+                await signal.wait()
+        finally:
+            self.readers -= 1
+            if not self.readers:
+                self.unread_since = time.monotonic()
+
+
+class StreamRegistry:
+    """Registry of in-flight and recently finished product support streams."""
+
+    def __init__(
+        self,
+        max_events: int = 2000,
+        ttl_seconds: float = 120.0,
+        max_streams: int = 1000,
+        sweep_interval_seconds: float = 10.0,
+    ):
+        """Initialize the stream registry.
+
+        Args:
+            max_events (int, optional): Maximum number of events kept per stream. Defaults to 2000.
+            ttl_seconds (float, optional): Seconds a finished stream stays available for resuming, and seconds a
+                producer keeps running without a reader. Defaults to 120.
+            max_streams (int, optional): Maximum number of finished streams kept. Defaults to 1000.
+            sweep_interval_seconds (float, optional): Seconds between two evictions. Defaults to 10.
+        """
+        self.max_events = max_events
+        self.ttl_seconds = ttl_seconds
+        self.max_streams = max_streams
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self._streams: "OrderedDict[str, ReplayBuffer]" = OrderedDict()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls, config: dict) -> "StreamRegistry":
+        """Create a stream registry from the `product_support.resumable_streams` configuration section.
+
+        Args:
+            config (dict): The application configuration.
+
+        Returns:
+            StreamRegistry: The configured stream registry.
+        """
+        settings = config.get("product_support", {}).get("resumable_streams", {})
+        return cls(
+            max_events=settings.get("max_events", 2000),
+            ttl_seconds=settings.get("ttl_seconds", 120.0),
+            max_streams=settings.get("max_streams", 1000),
+            sweep_interval_seconds=settings.get("sweep_interval_seconds", 10.0),
+        )
+
+    def start(self, bot_resp_id: str, chat_id: str, owner: Optional[str], source: AsyncIterable[str]) -> ReplayBuffer:
+        """Start producing a stream in the background.
+
+        The producer keeps running while no client is reading, so the answer is still complete (and logged) when
+        the client reconnects, but it is cancelled once nobody has read it for `ttl_seconds`.
+
+        Args:
+            bot_resp_id (str): The ID of the AI response being streamed.
+            chat_id (str): The ID of the chat the response belongs to.
+            owner (Optional[str]): The ID of the user the stream belongs to.
+            source (AsyncIterable[str]): The serialized events of the stream.
+
+        Returns:
+            ReplayBuffer: The replay buffer the events are written to.
+        """
+        self.evict_expired()
+        buffer = ReplayBuffer(bot_resp_id, chat_id, owner, self.max_events)
+        self._streams[bot_resp_id] = buffer
+        buffer.task = asyncio.create_task(self._produce(buffer, source))
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep())
+        return buffer
+
+    def get(self, bot_resp_id: str) -> Optional[ReplayBuffer]:
+        """Get the replay buffer of a stream that is in flight or finished recently.
+
+        Args:
+            bot_resp_id (str): The ID of the AI response.
+
+        Returns:
+            Optional[ReplayBuffer]: The replay buffer, or None if it is unknown or expired.
+        """
+        self.evict_expired()
+        return self._streams.get(bot_resp_id)
+
+    def evict_expired(self) -> None:
+        """Drop the buffers of streams that finished more than `ttl_seconds` ago, or beyond `max_streams`.
+
+        Producers that nobody has read for `ttl_seconds` are cancelled, their buffers are dropped once expired.
+        """
+        now = time.monotonic()
+        for buffer in self._streams.values():
+            if (
+                not buffer.finished
+                and buffer.unread_since is not None
+                and now - buffer.unread_since > self.ttl_seconds
+                and buffer.task is not None
+            ):
+                logger.info(f"Cancelling product support stream {buffer.bot_resp_id}, unread for {self.ttl_seconds}s")
+                buffer.task.cancel()
+        finished = [key for key, buffer in self._streams.items() if buffer.finished]
+        excess = len(finished) - self.max_streams
+        for key in finished:
+            if excess > 0 or now - self._streams[key].finished_at > self.ttl_seconds:
+                del self._streams[key]
+                excess -= 1
+
+    async def stop(self) -> None:
+        """Stop the eviction timer and cancel the producers still running, releasing their upstream streams."""
+        tasks: List[asyncio.Task] = [
+            buffer.task for buffer in self._streams.values() if buffer.task is not None and not buffer.task.done()
+        ]
+        if self._sweeper is not None:
+            tasks.append(self._sweeper)
+            self._sweeper = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _sweep(self) -> None:
+        # Ends once every stream is evicted, `start` starts it again
+        while self._streams:
+            await asyncio.sleep(self.sweep_interval_seconds)
+            self.evict_expired()
+
+    async def _produce(self, buffer: ReplayBuffer, source: AsyncIterable[str]) -> None:
+        try:
+            async for data in source:
+                if data:
+                    buffer.append(data)
+        except Exception as e:
+            logger.error(f"Product support stream {buffer.bot_resp_id} failed: {e}")
+            buffer.append(AIMessage(message="Sorry, something went wrong. Please try again.").model_dump_json())
+        finally:
+            buffer.finish()
+
+    def __len__(self) -> int:
+        """Return the number of registered streams."""
+        return len(self._streams)
@@ -0,0 +1,180 @@
+"""Phase timers and stream statistics for product support answers.
+
+A `StreamTimings` object is created for each user message and passed from `create_user_message` through
+`product_support` down to `fetch_data`. Each layer records how long its phases took (authentication, chat lookup,
+admission, bearer token, upstream connect and first byte, streaming, final logging) and every streamed fragment is
+counted, so that a slow answer can be attributed to a phase. When the stream ends the numbers are exported as
+Prometheus histograms labelled by tenant and org, and optionally returned to the client as a final timings event.
+
+Classes:
+    StreamTimings: Phase timers, time to first token, inter-fragment gaps and sizes of a single stream.
+    RequestStartMiddleware: ASGI middleware recording when each request was received.
+"""
+
+import math
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from prometheus_client import Histogram
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 180)
+
+STREAM_PHASE_SECONDS = Histogram(
+    "product_support_stream_phase_seconds",
+    "Time spent in each phase of a product support stream.",
+    ["phase", "tenant_id", "org_id"],
+    buckets=_LATENCY_BUCKETS,
+)
+STREAM_TTFT_SECONDS = Histogram(
+    "product_support_stream_ttft_seconds",
+    "Time from receiving a user message to streaming the first AI fragment.",
+    ["tenant_id", "org_id"],
+    buckets=_LATENCY_BUCKETS,
+)
+STREAM_FRAGMENT_GAP_SECONDS = Histogram(
+    "product_support_stream_fragment_gap_seconds",
+    "Time between consecutive AI fragments of a product support stream.",
+    ["tenant_id", "org_id"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+STREAM_BYTES = Histogram(
+    "product_support_stream_bytes",
+    "Bytes streamed to the client per product support answer.",
+    ["tenant_id", "org_id"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144),
+)
+STREAM_FRAGMENTS = Histogram(
+    "product_support_stream_fragments",
+    "Fragments streamed to the client per product support answer.",
+    ["tenant_id", "org_id"],
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    """Return the `q` percentile (0-100) of `values` using the nearest-rank method, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+class StreamTimings:
+    """Phase timers, time to first token, inter-fragment gaps and sizes of a single product support stream."""
+
+    def __init__(self, tenant_id: Optional[str] = None, org_id: Optional[int] = None, started: Optional[float] = None):
+        """Initialize the timings of a stream.
+
+        Args:
+            tenant_id (Optional[str], optional): The tenant the stream belongs to. Defaults to None.
+            org_id (Optional[int], optional): The org the stream belongs to. Defaults to None.
+            started (Optional[float], optional): `time.monotonic()` when the request was received. Defaults to now.
+        """
+        self.tenant_id = str(tenant_id)
+        self.org_id = str(org_id)
+        self.started = started if started is not None else time.monotonic()
+        self.phases: Dict[str, float] = {}
+        self.first_fragment_at: Optional[float] = None
+        self.last_fragment_at: Optional[float] = None
+        self.gaps: List[float] = []
+        self.bytes = 0
+        self.fragments = 0
+        self.observed = False
+
+    def add(self, phase: str, seconds: float) -> None:
+        """Add time spent in a phase.
+
+        Args:
+            phase (str): The name of the phase.
+            seconds (float): The time spent.
+        """
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, phase: str) -> Iterator[None]:
+        """Time the enclosed block as a phase.
+
+        Args:
+            phase (str): The name of the phase.
+        """
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(phase, time.monotonic() - started)
+
+    def record_fragment(self, data: str) -> None:
+        """Record a fragment streamed to the client.
+
+        Args:
+            data (str): The serialized fragment.
+        """
+        now = time.monotonic()
+        if self.first_fragment_at is None:
+            self.first_fragment_at = now
+        else:
+            self.gaps.append(now - self.last_fragment_at)
+        self.last_fragment_at = now
+        self.bytes += len(data.encode("utf-8"))
+        self.fragments += 1
+
+    @property
+    def ttft(self) -> Optional[float]:
+        """Seconds from receiving the request to the first fragment, or None if nothing was streamed."""
+        return self.first_fragment_at - self.started if self.first_fragment_at is not None else None
+
+    def summary(self) -> Dict[str, Any]:
+        """Return the timing breakdown of the stream.
+
+        Returns:
+            Dict[str, Any]: Seconds per phase, total and time to first token, gap percentiles and stream sizes.
+        """
+        return {
+            "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            "total": round(time.monotonic() - self.started, 4),
+            "ttft": round(self.ttft, 4) if self.ttft is not None else None,
+            "gap_p50": _percentile(self.gaps, 50),
+            "gap_p90": _percentile(self.gaps, 90),
+            "gap_p99": _percentile(self.gaps, 99),
+            "bytes": self.bytes,
+            "fragments": self.fragments,
+        }
+
+    def observe(self) -> None:
+        """Export the timings to the Prometheus histograms. Only the first call has an effect."""
+        if self.observed:
+            return
+        self.observed = True
+        labels = {"tenant_id": self.tenant_id, "org_id": self.org_id}
+        for name, seconds in self.phases.items():
+            STREAM_PHASE_SECONDS.labels(phase=name, **labels).observe(seconds)
+        if self.ttft is not None:
+            STREAM_TTFT_SECONDS.labels(**labels).observe(self.ttft)
+        gap_histogram = STREAM_FRAGMENT_GAP_SECONDS.labels(**labels)
+        for gap in self.gaps:
+            gap_histogram.observe(gap)
+        STREAM_BYTES.labels(**labels).observe(self.bytes)
+        STREAM_FRAGMENTS.labels(**labels).observe(self.fragments)
+
+
+class RequestStartMiddleware:
+    """ASGI middleware storing `time.monotonic()` at the start of each HTTP request in `request.state.received_at`.
+
+    This lets handlers attribute the time spent before they run (body parsing, authentication) to a phase.
+    """
+
+    def __init__(self, app):
+        """Initialize the middleware.
+
+        Args:
+            app: The wrapped ASGI application.
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        """Record the receive time and call the wrapped application."""
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["received_at"] = time.monotonic()
+        await self.app(scope, receive, send)
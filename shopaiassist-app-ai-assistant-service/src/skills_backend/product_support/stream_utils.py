@@ -5,11 +5,15 @@ This module provides utility functions to handle streaming responses from the pr
 
 from collections.abc import AsyncIterable
 import asyncio
+import time
 import httpx
 from src.models import SimpleResponseChunkProductSupport, AIMessage, ResponseChunkProductSupport
 from loguru import logger
 import json
-from typing import Any
+from typing import Any, Optional
+
+from src.skills_backend.product_support.circuit_breaker import CircuitBreaker
+from src.skills_backend.product_support.stream_timings import StreamTimings
 
 
 async def ingest_response_chunk_product_support(
@@ -79,11 +83,139 @@ async def ingest_response_chunk_product_support(
     return None
 
 
+async def _ingest_line(line: str, complete_response: ResponseChunkProductSupport) -> str | None:
+    """Parse one NDJSON line from the product support API and ingest it into the complete response.
+
+    Args:
+        line (str): The JSON line.
+        complete_response (ResponseChunkProductSupport): The complete response object.
+
+    Returns:
+        str | None: The serialized streamable message, or None if there is nothing to stream.
+    """
+    try:
+        resp_json = json.loads(line)
+    except json.JSONDecodeError:
+        logger.error(f"Failed to parse JSON from ONESOURCE: {line}")
+        return None
+    response_chunk = ResponseChunkProductSupport(**resp_json)
+    streamable_response = await ingest_response_chunk_product_support(
+        response_chunk=response_chunk,
+        complete_response=complete_response,
+    )
+    return streamable_response.model_dump_json() if streamable_response else None
+
+
+# Bound on establishing the upstream stream and on each read when no circuit breaker guards the upstream
+UPSTREAM_TIMEOUT_SECONDS = 180
+# With a circuit breaker, a call is given up after this many slow call thresholds without a byte from the upstream
+FIRST_BYTE_TIMEOUT_FACTOR = 2
+
+_default_client: Optional[httpx.AsyncClient] = None
+
+
+def _shared_client() -> httpx.AsyncClient:
+    """Return the connection pool used when the caller does not pass its own client."""
+    global _default_client
+    if _default_client is None:
+        _default_client = httpx.AsyncClient(timeout=UPSTREAM_TIMEOUT_SECONDS)
+    return _default_client
+
+
+def upstream_timeout(circuit_breaker: Optional[CircuitBreaker]) -> httpx.Timeout:
+    """Return the timeouts of an upstream call.
+
+    With a circuit breaker, connecting may take up to the slow call threshold, and the response headers and each
+    chunk up to `FIRST_BYTE_TIMEOUT_FACTOR` thresholds.
+
+    Args:
+        circuit_breaker (Optional[CircuitBreaker]): The breaker guarding the upstream, if any.
+
+    Returns:
+        httpx.Timeout: The timeouts to use for the call.
+    """
+    if circuit_breaker is None:
+        return httpx.Timeout(UPSTREAM_TIMEOUT_SECONDS)
+    return httpx.Timeout(
+        UPSTREAM_TIMEOUT_SECONDS,
+        connect=circuit_breaker.slow_call_seconds,
+        read=circuit_breaker.slow_call_seconds * FIRST_BYTE_TIMEOUT_FACTOR,
+    )
+
+
+class _UpstreamCall:
+    """Reports the outcome of one upstream call to the circuit breaker, exactly once.
+
+    The call is recorded as slow as soon as the slow call threshold passes without a first byte, rather than when
+    the call eventually completes or times out.
+    """
+
+    def __init__(self, circuit_breaker: Optional[CircuitBreaker]):
+        """Start timing the call.
+
+        Args:
+            circuit_breaker (Optional[CircuitBreaker]): The breaker guarding the upstream, if any.
+        """
+        self.circuit_breaker = circuit_breaker
+        self.recorded = circuit_breaker is None
+        self.started = time.monotonic()
+        self._slow_timer = (
+            asyncio.get_running_loop().call_later(circuit_breaker.slow_call_seconds, self.slow)
+            if circuit_breaker is not None
+            else None
+        )
+
+    def _settle(self) -> bool:
+        if self._slow_timer is not None:
+            self._slow_timer.cancel()
+        if self.recorded:
+            return False
+        self.recorded = True
+        return True
+
+    def success(self) -> None:
+        """Record that the upstream started answering."""
+        if self._settle():
+            self.circuit_breaker.record_success(time.monotonic() - self.started)
+
+    def slow(self) -> None:
+        """Record that the upstream did not answer within the slow call threshold."""
+        if self._settle():
+            logger.warning(f"No answer from the {self.circuit_breaker.name} upstream within the slow call threshold")
+            self.circuit_breaker.record_slow()
+
+    def failure(self) -> None:
+        """Record that the upstream call failed."""
+        if self._settle():
+            self.circuit_breaker.record_failure()
+
+    def error_status(self, status_code: int) -> None:
+        """Record an upstream error status.
+
+        Only server errors and throttling count as failures, other statuses are caused by the request itself.
+
+        Args:
+            status_code (int): The HTTP status of the upstream response.
+        """
+        if status_code >= 500 or status_code == 429:
+            self.failure()
+        else:
+            self.cancelled()
+
+    def cancelled(self) -> None:
+        """Record that the call ended without a known outcome."""
+        if self._settle():
+            self.circuit_breaker.record_cancelled()
+
+
 async def fetch_data(
     url: str,
     headers: dict[str, str],
     data: dict[str, Any],
     complete_response: ResponseChunkProductSupport,
+    circuit_breaker: Optional[CircuitBreaker] = None,
+    timings: Optional[StreamTimings] = None,
+    http_client: Optional[httpx.AsyncClient] = None,
 ) -> AsyncIterable[str | None]:
     """Fetch data from the given URL using HTTP POST method and stream the response.
 
@@ -91,16 +223,40 @@ async def fetch_data(
         url (str): The URL to send the request to.
         headers (dict[str, str]): The headers to include in the request.
         data (dict[str, Any]): The data to include in the request body.
+        circuit_breaker (Optional[CircuitBreaker]): Breaker guarding the upstream. While it is open, the fallback
+            message is returned without calling the upstream. The call outcome is recorded when the first byte
+            arrives, or as slow once the slow call threshold passes without one. Defaults to None.
+        timings (Optional[StreamTimings]): Records the upstream connect, first byte and streaming phases.
+            Defaults to None.
+        http_client (Optional[httpx.AsyncClient]): The shared connection pool to send the request with. Defaults to
+            a pool owned by this module.
 
     Returns:
         AsyncIterable[AIMessage | None]: An asynchronous iterable of AIMessage or None.
     """
+    if circuit_breaker is not None and not circuit_breaker.allow_request():
+        logger.warning(f"Product support circuit is open, skipping request to {url}")
+        yield AIMessage(message=circuit_breaker.fallback_message).model_dump_json()
+        return
+
     logger.debug(f"Product Support request\n: {data}")
-    async with httpx.AsyncClient(timeout=180) as client:
-        async with client.stream("POST", url, headers=headers, json=data) as response:
+    timings = timings or StreamTimings()
+    client = http_client or _shared_client()
+    call = _UpstreamCall(circuit_breaker)
+    started = call.started
+    first_byte_latency = None
+    try:
+        async with client.stream(
+            "POST", url, headers=headers, json=data, timeout=upstream_timeout(circuit_breaker)
+        ) as response:
+            timings.add("upstream_connect", time.monotonic() - started)
             if response.status_code == 200:
                 buffer = ""
                 async for chunk in response.aiter_bytes():
+                    if first_byte_latency is None:
+                        first_byte_latency = time.monotonic() - started
+                        timings.add("upstream_first_byte", first_byte_latency - timings.phases["upstream_connect"])
+                        call.success()
                     logger.debug(f"ONESOURCE response chunk: {chunk.decode('utf-8')}")
                     buffer += chunk.decode("utf-8")
 
@@ -110,36 +266,30 @@ async def fetch_data(
                         if not line:
                             continue
 
-                        try:
-                            resp_json = json.loads(line)
-                            response_chunk = ResponseChunkProductSupport(**resp_json)
-                            streamable_response = await ingest_response_chunk_product_support(
-                                response_chunk=response_chunk,
-                                complete_response=complete_response,
-                            )
-
-                            # If we have a streamable response, yield it immediately
-                            # and ensure it's flushed to the client
-                            if streamable_response:
-                                yield streamable_response.model_dump_json()
-                                # Force a small delay to ensure chunks are sent separately
-                                await asyncio.sleep(0.01)
-                        except json.JSONDecodeError:
-                            logger.error(f"Failed to parse JSON from ONESOURCE: {line}")
-                            continue
+                        # If we have a streamable response, yield it immediately
+                        # and ensure it's flushed to the client
+                        streamable_response = await _ingest_line(line, complete_response)
+                        if streamable_response:
+                            yield streamable_response
+                            # Force a small delay to ensure chunks are sent separately
+                            await asyncio.sleep(0.01)
 
                 # Process any remaining data in the buffer
                 if buffer:
-                    try:
-                        resp_json = json.loads(buffer)
-                        response_chunk = ResponseChunkProductSupport(**resp_json)
-                        streamable_response = await ingest_response_chunk_product_support(
-                            response_chunk=response_chunk,
-                            complete_response=complete_response,
-                        )
-                        if streamable_response:
-                            yield streamable_response.model_dump_json()
-                    except json.JSONDecodeError:
-                        logger.error(f"Failed to parse JSON from ONESOURCE: {buffer}")
+                    streamable_response = await _ingest_line(buffer, complete_response)
+                    if streamable_response:
+                        yield streamable_response
+
+                if first_byte_latency is not None:
+                    timings.add("streaming", time.monotonic() - started - first_byte_latency)
+                # An empty answer still completed
+                call.success()
             else:
+                call.error_status(response.status_code)
                 yield AIMessage(message="Sorry, something went wrong. Please try again.").model_dump_json()
+    except httpx.HTTPError:
+        # Failures after the first byte are not recorded, the call already counted as answered
+        call.failure()
+        raise
+    finally:
+        call.cancelled()
@@ -3,12 +3,15 @@
 Functions:
     - load_json_from_S3: Loads a JSON object from a specified S3 URI.
     - load_config: Loads configuration settings from a YAML file based on environment variables.
+    - load_local_secret: Loads a secret from the local secrets file set in LOCAL_SECRETS_FILE.
     - is_string_blank: Checks if a given string is blank.
     - _ttl_hash_gen: Generates a hash for implementing time-to-live (TTL) caching.
     - ttl_cache: Decorator function that provides caching with TTL for any callable.
     - get_parameter_from_secret: Retrieves parameters stored in AWS Secrets Manager.
     - get_salesforce_products_in_env: Retrieves Salesforce products available in the current environment.
     - get_dict_which_has_value: Finds a key in a dictionary where a nested dictionary contains a specified value.
+    - make_etag: Builds a strong ETag from the values a response depends on.
+    - etag_matches: Checks an If-None-Match header against an ETag.
 
 Constants:
     - all_intents_and_ticket: A mapping of intents to their ticket creation status and details.
@@ -33,6 +36,7 @@ import time
 from functools import lru_cache, update_wrapper
 import logging
 import json
+import hashlib
 from math import floor
 
 
@@ -45,6 +49,10 @@ def load_json_from_S3(s3_uri):
     Returns:
         Dict: The JSON object as a dictionary.
     """
+    if not s3_uri.startswith("s3://"):
+        # Local file, used when running the service without AWS (e.g. load tests)
+        with open(s3_uri, "r") as file:
+            return json.load(file)
     s3 = boto3.client("s3")
     bucket = s3_uri.split("/")[2]
     key = "/".join(s3_uri.split("/")[3:])
@@ -162,6 +170,30 @@ all_intents_and_ticket = {
 }
 
 
+def load_local_secret(secret_name: str) -> Union[Dict, None]:
+    """Load a secret from the local secrets file, for running the service without AWS (e.g. load tests).
+
+    The file is set with the LOCAL_SECRETS_FILE environment variable and maps secret names to their values.
+
+    Args:
+        secret_name (str): The name of the secret.
+
+    Returns:
+        Union[Dict, None]: The secret value, or None if no local secrets file is configured.
+
+    Raises:
+        KeyError: If the local secrets file does not contain the secret.
+    """
+    local_secrets_file = os.getenv("LOCAL_SECRETS_FILE")
+    if not local_secrets_file:
+        return None
+    with open(local_secrets_file, "r") as file:
+        secrets = json.load(file)
+    if secret_name not in secrets:
+        raise KeyError(f"Secret {secret_name} not found in {local_secrets_file}")
+    return secrets[secret_name]
+
+
 def get_parameter_from_secret(secret_name, region_name="us-east-1"):
     """Retrieve a parameter from AWS Secrets Manager.
 
@@ -175,6 +207,10 @@ def get_parameter_from_secret(secret_name, region_name="us-east-1"):
     Raises:
         Exception: If there is an error retrieving the secret.
     """
+    local_secret = load_local_secret(secret_name)
+    if local_secret is not None:
+        return local_secret
+
     client = boto3.client(service_name="secretsmanager", region_name=region_name)
 
     try:
@@ -230,6 +266,36 @@ def get_dict_which_has_value(dict: Dict[str, Dict], key_name: str, value: str) -
     return None
 
 
+def make_etag(*parts: Any) -> str:
+    """Build a strong ETag from the values a response depends on.
+
+    Args:
+        *parts (Any): The values identifying the version of the resource, e.g. its last update time.
+
+    Returns:
+        str: The quoted ETag.
+    """
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: Union[str, None], etag: str) -> bool:
+    """Check whether an If-None-Match header matches an ETag.
+
+    Args:
+        if_none_match (Union[str, None]): The If-None-Match header of the request.
+        etag (str): The current ETag of the resource.
+
+    Returns:
+        bool: True if the client's copy is current and a 304 can be returned.
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    # Weak comparison as required for If-None-Match, compressed responses may carry a W/ prefix from proxies
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
 def parse_x500_string(x500_string):
     """Parse an X.500 string into a dictionary.
 
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import pickle
+
+import pytest
+
+from src.models import Authentication
+from src.skills_backend.product_support.admission import AdmissionController, AdmissionRejected
+from src.skills_backend.product_support.stream_timings import StreamTimings
+
+
+class TestAdmissionController:
+    @pytest.mark.asyncio
+    async def test_grants_immediately_under_caps(self):
+        """Requests are granted without queueing while both caps have room."""
+        controller = AdmissionController(max_concurrent_streams=2, max_streams_per_tenant=2)
+
+        first = controller.request("tenant-a")
+        second = controller.request("tenant-b")
+
+        assert first.granted and second.granted
+        assert controller.stats() == {"active_streams": 2, "queue_depth": 0}
+
+        first.release()
+        second.release()
+        assert controller.stats() == {"active_streams": 0, "queue_depth": 0}
+
+    @pytest.mark.asyncio
+    async def test_per_tenant_cap_queues_request(self):
+        """A tenant at its own cap is queued even when global capacity is free."""
+        controller = AdmissionController(max_concurrent_streams=10, max_streams_per_tenant=1)
+
+        first = controller.request("tenant-a")
+        queued = controller.request("tenant-a")
+        other = controller.request("tenant-b")
+
+        assert first.granted
+        assert not queued.granted
+        assert other.granted
+
+        first.release()
+        await queued.wait()
+        assert queued.granted
+
+    @pytest.mark.asyncio
+    async def test_queue_full_rejects_fast(self):
+        """Requests beyond the queue size are rejected immediately."""
+        controller = AdmissionController(max_concurrent_streams=1, max_streams_per_tenant=1, max_queue_size=1)
+
+        controller.request("tenant-a")
+        controller.request("tenant-b")
+
+        with pytest.raises(AdmissionRejected) as exc_info:
+            controller.request("tenant-c")
+        assert exc_info.value.reason == "queue_full"
+
+    def test_rejection_pickles(self):
+        """The rejection keeps its reason and retry delay when pickled, and its message."""
+        rejected = pickle.loads(pickle.dumps(AdmissionRejected("queue_full", retry_after=3)))
+
+        assert (rejected.reason, rejected.retry_after) == ("queue_full", 3)
+        assert str(rejected) == "Product support stream rejected: queue_full"
+        assert repr(rejected) == "AdmissionRejected('queue_full', 3)"
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout_rejects_and_leaves_queue(self):
+        """A queued request that is not granted in time is rejected and removed from the queue."""
+        controller = AdmissionController(max_concurrent_streams=1, queue_timeout=0.01)
+
+        controller.request("tenant-a")
+        queued = controller.request("tenant-b")
+
+        with pytest.raises(AdmissionRejected) as exc_info:
+            await queued.wait()
+        assert exc_info.value.reason == "queue_timeout"
+        assert controller.stats()["queue_depth"] == 0
+
+    @pytest.mark.asyncio
+    async def test_weighted_fair_scheduling(self):
+        """Freed slots are shared between tenants proportionally to their weights."""
+        controller = AdmissionController(
+            max_concurrent_streams=1,
+            max_streams_per_tenant=1,
+            max_queue_size=100,
+            tenant_weights={"heavy": 2.0},
+        )
+        holder = controller.request("other")
+        heavy = [controller.request("heavy") for _ in range(20)]
+        light = [controller.request("light") for _ in range(20)]
+
+        order = []
+        current = holder
+        for _ in range(15):
+            current.release()
+            await asyncio.sleep(0)
+            current = next(t for t in heavy + light if t.granted and not t.released)
+            order.append(current.tenant_id)
+
+        assert order.count("heavy") == 10
+        assert order.count("light") == 5
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_leaves_queue(self):
+        """A waiter cancelled while queued and released never takes a slot."""
+        controller = AdmissionController(max_concurrent_streams=1, max_streams_per_tenant=1)
+        holder = controller.request("tenant-a")
+        queued = controller.request("tenant-b")
+
+        waiting = asyncio.ensure_future(queued.wait())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        queued.release()
+        holder.release()
+
+        assert not queued.granted
+        assert controller.stats() == {"active_streams": 0, "queue_depth": 0}
+
+    @pytest.mark.asyncio
+    async def test_disconnect_while_queued_releases_ticket(self):
+        """A product support stream cancelled while queued gives its ticket back."""
+        product_support = pytest.importorskip(
+            "src.skills_backend.product_support.product_support", exc_type=ImportError
+        )
+        controller = AdmissionController(max_concurrent_streams=1, max_streams_per_tenant=1)
+        holder = controller.request("tenant-a")
+        stream = product_support._admit_and_stream(
+            None,
+            None,
+            [],
+            Authentication(tenant_id="tenant-a"),
+            {},
+            None,
+            "query-id",
+            "response-id",
+            StreamTimings(),
+            admission_controller=controller,
+        )
+
+        assert json.loads(await stream.__anext__())["status"] == "queued"
+        waiting = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        holder.release()
+
+        assert controller.stats() == {"active_streams": 0, "queue_depth": 0}
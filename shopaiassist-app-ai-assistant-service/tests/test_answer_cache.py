@@ -0,0 +1,95 @@
+import pytest
+
+from src.models import Authentication, ResponseChunkProductSupport, UserMessageRequest
+from src.skills_backend.product_support.answer_cache import AnswerCache, normalize_query, replay_cached_response
+from src.skills_backend.product_support.stream_utils import ingest_response_chunk_product_support
+
+
+def make_request(message, chat_history=None, document_id=None):
+    return UserMessageRequest(
+        allowed_skills=[],
+        chat_history=chat_history or [],
+        user_message={"message": message, "message_type": "text", "document_id": document_id},
+    )
+
+
+def make_response(message="Restart the service.", ai_message="Restart the service."):
+    return ResponseChunkProductSupport(
+        message=message,
+        ai_message=ai_message,
+        reformulated_query_raw="how to restart",
+        retrieved_urls=[{"title": "Guide", "url": "https://example.com/guide"}],
+        open_ticket=False,
+    )
+
+
+class TestAnswerCache:
+    @pytest.fixture
+    def auth(self):
+        return Authentication(tenant_id="tenant-a", account_type="external")
+
+    def test_normalized_queries_share_key(self, auth):
+        """Case, whitespace and trailing punctuation do not change the cache key."""
+        cache = AnswerCache(enabled=True)
+
+        first = cache.key_for(make_request("How do I  restart?"), ["p1", "p2"], auth)
+        second = cache.key_for(make_request("  how do i restart"), ["p2", "p1"], auth)
+
+        assert normalize_query("How do I  restart?") == "how do i restart"
+        assert first is not None and first == second
+
+    def test_only_first_turn_questions_are_cacheable(self, auth):
+        """Requests with chat history, an uploaded document or a disabled tenant are not cached."""
+        cache = AnswerCache(enabled=True, tenants={"tenant-b": {"enabled": False}})
+
+        history = [{"role": "user", "content": "hi"}]
+        assert cache.key_for(make_request("q", chat_history=history), [], auth) is None
+        assert cache.key_for(make_request("q", document_id="doc"), [], auth) is None
+        assert cache.key_for(make_request("q"), [], Authentication(tenant_id="tenant-b")) is None
+        assert AnswerCache().key_for(make_request("q"), [], auth) is None
+
+    def test_lru_and_ttl_eviction(self, auth):
+        """Entries are evicted when over the entry limit and expire after their TTL."""
+        cache = AnswerCache(enabled=True, max_entries=2, tenants={"tenant-short": {"ttl_seconds": -1}})
+
+        cache.put("a", make_response())
+        cache.put("b", make_response())
+        assert cache.get("a") is not None
+        cache.put("c", make_response())
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert len(cache) == 2
+
+        cache.put("d", make_response(), tenant_id="tenant-short")
+        assert cache.get("d") is None
+
+    def test_incomplete_responses_are_not_stored(self):
+        """Responses without a final AI message are never cached."""
+        cache = AnswerCache(enabled=True)
+
+        cache.put("a", make_response(ai_message=None))
+
+        assert len(cache) == 0
+
+    @pytest.mark.asyncio
+    async def test_replay_rebuilds_complete_response(self):
+        """Replaying a cached answer streams fragments and rebuilds the same complete response."""
+        cached = ResponseChunkProductSupport(message="")
+        for chunk in [
+            ResponseChunkProductSupport(reformulated_query="how to restart"),
+            ResponseChunkProductSupport(message="Open the console and restart the service."),
+            ResponseChunkProductSupport(retrieved_urls=[{"title": "Guide", "url": "https://example.com/guide"}]),
+            ResponseChunkProductSupport(open_ticket=False),
+        ]:
+            await ingest_response_chunk_product_support(chunk, cached)
+
+        replayed = ResponseChunkProductSupport(id="new-id", message="")
+        lines = [line async for line in replay_cached_response(cached, replayed, fragment_size=10)]
+
+        assert len(lines) > 2
+        assert replayed.message == cached.message
+        assert replayed.ai_message == cached.ai_message
+        assert replayed.retrieved_urls == cached.retrieved_urls
+        assert replayed.open_ticket is False
+        assert replayed.id == "new-id"
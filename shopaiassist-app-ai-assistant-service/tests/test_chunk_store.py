@@ -0,0 +1,176 @@
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from src.skills_backend.document_qa.chunk_store import (
+    ChunkStore,
+    ChunkWriter,
+    S3MultipartSink,
+    embedding_matrix,
+    read_chunks,
+)
+
+
+class FakeS3:
+    """Keeps the objects and multipart uploads in memory."""
+
+    def __init__(self):
+        """Start without objects."""
+        self.objects = {}
+        self.uploads = {}
+        self.calls = []
+
+    def put_object(self, Bucket, Key, Body):
+        self.calls.append("put_object")
+        self.objects[Key] = Body
+
+    def upload_fileobj(self, fileobj, bucket, key):
+        self.calls.append("upload_fileobj")
+        self.objects[key] = fileobj.read()
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.calls.append("create_multipart_upload")
+        self.uploads["upload-1"] = {}
+        return {"UploadId": "upload-1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.calls.append("upload_part")
+        self.uploads[UploadId][PartNumber] = Body
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.calls.append("complete_multipart_upload")
+        parts = self.uploads.pop(UploadId)
+        self.objects[Key] = b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.calls.append("abort_multipart_upload")
+        del self.uploads[UploadId]
+
+
+def _records(start: int, count: int):
+    return [
+        {"file_name": "manual.pdf", "raw_text": f"chunk {i}", "chunk_id": str(i), "open_ai_embeddings": [i, 0.5]}
+        for i in range(start, start + count)
+    ]
+
+
+class TestS3MultipartSink:
+    def test_small_object_is_put(self):
+        """An object smaller than a part is uploaded with a single put."""
+        s3 = FakeS3()
+        sink = S3MultipartSink(s3, "bucket", "key")
+        sink.write(b"abc")
+        sink.close()
+
+        assert s3.calls == ["put_object"]
+        assert s3.objects["key"] == b"abc"
+
+    def test_large_object_is_uploaded_in_parts(self):
+        """Full parts are uploaded as they are written and the rest when closed."""
+        s3 = FakeS3()
+        sink = S3MultipartSink(s3, "bucket", "key", part_size=0)
+        part = b"x" * sink.part_size
+        sink.write(part + b"y")
+        assert s3.calls == ["create_multipart_upload", "upload_part"]
+        sink.write(b"z")
+        sink.close()
+
+        assert s3.calls[-2:] == ["upload_part", "complete_multipart_upload"]
+        assert s3.objects["key"] == part + b"yz"
+        assert sink.tell() == len(part) + 2
+
+    def test_abort(self):
+        """Aborting drops the uploaded parts."""
+        s3 = FakeS3()
+        sink = S3MultipartSink(s3, "bucket", "key")
+        sink.write(b"x" * sink.part_size)
+        sink.abort()
+
+        assert s3.uploads == {} and s3.objects == {}
+
+
+class TestChunkStore:
+    def test_parquet_round_trip(self):
+        """Batches are written as row groups with float32 embeddings and dictionary-encoded metadata."""
+        s3 = FakeS3()
+        store = ChunkStore(s3, "bucket", storage_format="parquet")
+        writer = store.open("tenant", "user", "doc-1", "manual")
+        writer.write(_records(0, 2))
+        writer.write(_records(2, 1))
+
+        assert writer.close() == "s3://bucket/tenant_id=tenant/user_id=user/doc-1_manual.parquet"
+        parquet_file = pq.ParquetFile(BytesIO(s3.objects["tenant_id=tenant/user_id=user/doc-1_manual.parquet"]))
+        table = parquet_file.read()
+        assert parquet_file.num_row_groups == 2
+        assert table.column("raw_text").to_pylist() == ["chunk 0", "chunk 1", "chunk 2"]
+        assert table.schema.field("open_ai_embeddings").type == pa.list_(pa.float32(), 2)
+        assert pa.types.is_dictionary(table.schema.field("file_name").type)
+        assert table.column("open_ai_embeddings").to_pylist()[2] == [2.0, 0.5]
+
+    def test_arrow_memory_mapped(self, tmp_path):
+        """The Arrow file is read memory-mapped and its embeddings as a float32 matrix."""
+        s3 = FakeS3()
+        writer = ChunkStore(s3, "bucket").open("tenant", "user", "doc-1", "manual")
+        writer.write(_records(0, 2))
+        writer.write(_records(2, 2) + [{**_records(4, 1)[0], "file_name": "other.pdf"}])
+        assert writer.close().endswith("/doc-1_manual.arrow")
+        path = tmp_path / "doc-1_manual.arrow"
+        path.write_bytes(s3.objects["tenant_id=tenant/user_id=user/doc-1_manual.arrow"])
+
+        table = read_chunks(str(path))
+        matrix = embedding_matrix(table)
+        assert table.column("file_name").to_pylist() == ["manual.pdf"] * 4 + ["other.pdf"]
+        assert table.column("description").to_pylist() == [""] * 5
+        assert matrix.dtype == np.float32 and matrix.shape == (5, 2)
+        assert matrix[:, 0].tolist() == [0, 1, 2, 3, 4]
+
+    def test_single_batch_is_not_copied(self, tmp_path):
+        """The matrix of a file with one record batch points into the mapped file."""
+        s3 = FakeS3()
+        writer = ChunkStore(s3, "bucket").open("tenant", "user", "doc-1", "manual")
+        writer.write(_records(0, 3))
+        writer.close()
+        path = tmp_path / "doc-1_manual.arrow"
+        path.write_bytes(s3.objects["tenant_id=tenant/user_id=user/doc-1_manual.arrow"])
+
+        matrix = embedding_matrix(read_chunks(str(path)))
+        assert not matrix.flags.owndata and not matrix.flags.writeable
+
+    def test_mismatched_dimensions(self):
+        """Embeddings of one document must all have the same dimension."""
+        writer = ChunkStore(FakeS3(), "bucket").open("tenant", "user", "doc-1", "manual")
+        writer.write(_records(0, 1))
+
+        with pytest.raises(ValueError, match="dimension 2"):
+            writer.write([{**_records(1, 1)[0], "open_ai_embeddings": [1.0, 2.0, 3.0]}])
+
+    def test_pickle(self):
+        """The pickle writer uploads the records as a DataFrame once closed."""
+        s3 = FakeS3()
+        writer = ChunkStore(s3, "bucket", storage_format="pickle").open("tenant", "user", "doc-1", "manual")
+        writer.write(_records(0, 2))
+        assert s3.objects == {}
+
+        assert writer.close().endswith("/doc-1_manual.pkl")
+        df = pd.read_pickle(BytesIO(s3.objects["tenant_id=tenant/user_id=user/doc-1_manual.pkl"]))
+        assert df["raw_text"].tolist() == ["chunk 0", "chunk 1"]
+
+    def test_unknown_format(self):
+        """An unknown storage format is a configuration error."""
+        with pytest.raises(ValueError):
+            ChunkStore.from_config({"document_qa": {"storage": {"format": "csv"}}}, FakeS3(), "bucket")
+
+    def test_writer_must_implement_storage(self):
+        """A chunk writer that does not implement write, close and abort cannot be created."""
+
+        class WriteOnlyWriter(ChunkWriter):
+            def write(self, records):
+                pass
+
+        with pytest.raises(TypeError, match="abort, close"):
+            WriteOnlyWriter("bucket", "key")
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from src.models import ResponseChunkProductSupport
+from src.skills_backend.product_support.circuit_breaker import CircuitBreaker, CircuitState
+from src.skills_backend.product_support.stream_utils import fetch_data
+
+
+class TestCircuitBreaker:
+    def test_opens_on_error_rate(self):
+        """The circuit opens once the failure rate over the window reaches the threshold."""
+        breaker = CircuitBreaker(window_size=4, min_calls=4, error_rate_threshold=0.5)
+
+        for _ in range(2):
+            assert breaker.allow_request()
+            breaker.record_success(0.1)
+        assert breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == CircuitState.CLOSED
+
+        assert breaker.allow_request()
+        breaker.record_failure()
+
+        assert breaker.state == CircuitState.OPEN
+        assert not breaker.allow_request()
+
+    def test_opens_on_slow_calls(self):
+        """Calls slower than the latency threshold count towards the slow call rate."""
+        breaker = CircuitBreaker(window_size=2, min_calls=2, slow_call_seconds=1.0, slow_call_rate_threshold=1.0)
+
+        breaker.record_success(5.0)
+        breaker.record_success(5.0)
+
+        assert breaker.state == CircuitState.OPEN
+
+    def test_half_open_probe_closes_circuit(self):
+        """After the cool-down a single probe is allowed, and its success closes the circuit."""
+        breaker = CircuitBreaker(min_calls=1, open_seconds=10)
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+
+        breaker.opened_at = time.monotonic() - 11
+        assert breaker.allow_request()
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert not breaker.allow_request()
+
+        breaker.record_success(0.1)
+        assert breaker.state == CircuitState.CLOSED
+        assert breaker.allow_request()
+
+    def test_failed_probe_reopens_circuit(self):
+        """A failing probe re-opens the circuit for another cool-down."""
+        breaker = CircuitBreaker(min_calls=1, open_seconds=10)
+        breaker.record_failure()
+        breaker.opened_at = time.monotonic() - 11
+
+        assert breaker.allow_request()
+        breaker.record_failure()
+
+        assert breaker.state == CircuitState.OPEN
+        assert not breaker.allow_request()
+        assert breaker.health()["state"] == "open"
+
+    def test_slow_probe_reopens_circuit(self):
+        """A probe recorded as slow re-opens the circuit, in the closed state it counts towards the slow rate."""
+        breaker = CircuitBreaker(min_calls=1, open_seconds=10, slow_call_rate_threshold=1.0)
+        breaker.record_failure()
+        breaker.opened_at = time.monotonic() - 11
+
+        assert breaker.allow_request()
+        breaker.record_slow()
+
+        assert breaker.state == CircuitState.OPEN
+        assert breaker.probes_in_flight == 0
+
+        closed = CircuitBreaker(window_size=2, min_calls=2, slow_call_rate_threshold=1.0)
+        closed.record_slow()
+        closed.record_slow()
+        assert closed.state == CircuitState.OPEN
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_returns_fallback_without_calling_upstream(self):
+        """fetch_data fails fast with the configured fallback while the circuit is open."""
+        breaker = CircuitBreaker(min_calls=1, fallback_message="Try later.")
+        breaker.record_failure()
+
+        lines = [
+            line
+            async for line in fetch_data(
+                "http://upstream.invalid/entry_router", {}, {}, ResponseChunkProductSupport(), circuit_breaker=breaker
+            )
+        ]
+
+        assert len(lines) == 1
+        assert json.loads(lines[0])["message"] == "Try later."
+
+    @pytest.mark.asyncio
+    async def test_slow_first_byte_recorded_at_threshold(self):
+        """A call still waiting for its first byte is recorded as slow once the threshold passes."""
+        breaker = CircuitBreaker(window_size=1, min_calls=1, slow_call_seconds=0.05, slow_call_rate_threshold=1.0)
+        seen = {}
+
+        async def handler(request):
+            seen["timeout"] = request.extensions["timeout"]
+            await asyncio.sleep(0.15)
+            seen["state"] = breaker.state
+            return httpx.Response(200, content=b'{"message": "late"}\n')
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            lines = [
+                line
+                async for line in fetch_data(
+                    "http://upstream.invalid/entry_router",
+                    {},
+                    {},
+                    ResponseChunkProductSupport(),
+                    circuit_breaker=breaker,
+                    http_client=client,
+                )
+            ]
+
+        assert seen["state"] == CircuitState.OPEN
+        assert seen["timeout"]["connect"] == 0.05
+        assert seen["timeout"]["read"] == 0.1
+        assert json.loads(lines[0])["message"] == "late"
+        assert list(breaker._calls) == [(False, True)]
+
+    @pytest.mark.asyncio
+    async def test_success_recorded_at_first_byte(self):
+        """The latency reaches the breaker with the first byte, before the stream ends."""
+        breaker = CircuitBreaker()
+
+        async def body():
+            yield b'{"message": "one"}\n'
+            yield b'{"message": "two"}\n'
+
+        async def handler(request):
+            return httpx.Response(200, content=body())
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            upstream = fetch_data(
+                "http://upstream.invalid/entry_router",
+                {},
+                {},
+                ResponseChunkProductSupport(),
+                circuit_breaker=breaker,
+                http_client=client,
+            )
+            first = await anext(upstream)
+            assert json.loads(first)["message"] == "one"
+            assert list(breaker._calls) == [(False, False)]
+
+            rest = [line async for line in upstream]
+
+        assert json.loads(rest[0])["message"] == "two"
+        assert len(breaker._calls) == 1
@@ -0,0 +1,159 @@
+import base64
+import math
+
+import pytest
+
+from src.count_tokens import CountTokens, TokenEstimator
+
+
+class WordEncoding:
+    """Encoding with one token per word, recording the batches it encodes."""
+
+    def __init__(self):
+        """Start without batches."""
+        self.batches = []
+
+    def encode_ordinary_batch(self, texts):
+        self.batches.append(list(texts))
+        return [text.split() for text in texts]
+
+
+class TestCountTokens:
+    @pytest.mark.asyncio
+    async def test_messages_and_tools(self):
+        """Messages and tools are counted with their per-item overheads."""
+        counter = CountTokens(encoding=WordEncoding())
+        messages = [{"role": "system", "content": "be brief"}, {"role": "user", "content": "hi", "name": "bob"}]
+        tools = [
+            {
+                "function": {
+                    "name": "search",
+                    "description": "search the docs",
+                    "parameters": {"properties": {"query": {"type": "string", "description": "the query"}}},
+                }
+            }
+        ]
+
+        # 2 * 3 per message + 3 + 6 words + 1 for the name; 3 per tool + 2 for the parameters + 6 words
+        assert await counter.get_count_tokens(messages, tools) == 16 + 11
+
+    @pytest.mark.asyncio
+    async def test_static_text_is_cached(self):
+        """Texts seen before are not encoded again, texts over the size limit are never cached."""
+        encoding = WordEncoding()
+        counter = CountTokens(encoding=encoding, cache_max_chars=20)
+        long_text = "word " * 10
+
+        await counter.count_texts(["system prompt", long_text])
+        assert await counter.count_texts(["system prompt", long_text, "new"]) == [2, 10, 1]
+
+        assert encoding.batches == [["system prompt", long_text], [long_text, "new"]]
+
+    def test_lru_bound(self):
+        """The cache keeps the most recently used counts within its size."""
+        encoding = WordEncoding()
+        counter = CountTokens(encoding=encoding, cache_size=2)
+
+        counter.count_texts_sync(["a", "b"])
+        counter.count_texts_sync(["a", "c"])
+        counter.count_texts_sync(["a", "b"])
+
+        assert encoding.batches[-1] == ["b"]
+        assert len(counter._cache) == 2
+
+    @pytest.mark.asyncio
+    async def test_large_inputs_are_offloaded(self, monkeypatch):
+        """Inputs over the offload threshold are counted in a worker thread."""
+        counter = CountTokens(encoding=WordEncoding(), offload_min_chars=10)
+        offloaded = []
+
+        async def to_thread(func, *args):
+            offloaded.append(args)
+            return func(*args)
+
+        monkeypatch.setattr("src.count_tokens.asyncio.to_thread", to_thread)
+
+        assert await counter.count_texts(["short"]) == [1]
+        assert await counter.count_texts(["a much longer text"], cache=False) == [4]
+        assert offloaded == [(["a much longer text"], False)]
+
+
+class CharEncoding:
+    """Encoding with one token per character, recording the texts it encodes."""
+
+    def __init__(self):
+        """Start without encoded texts."""
+        self.encoded = []
+
+    def encode_ordinary(self, text):
+        self.encoded.append(text)
+        return list(text)
+
+
+class TestTokenEstimator:
+    def test_bounds(self):
+        """The upper bound never exceeds the byte count and the lower bound stays below the estimate."""
+        estimator = TokenEstimator(CharEncoding())
+        text = "The quick brown fox jumps over the lazy dog, 1234567 times!\n\n"
+
+        assert estimator.lower_bound(text) <= estimator.estimate(text) <= estimator.upper_bound(text)
+        assert estimator.upper_bound("ab") == 2
+        assert estimator.upper_bound("申告書") <= len("申告書".encode("utf-8"))
+
+    def test_is_within_encodes_only_near_the_budget(self):
+        """For a calibrated encoding, texts clearly under or over the budget are decided from the estimate."""
+        encoding = CharEncoding()
+        estimator = TokenEstimator(encoding, calibrated=True)
+        text = "word " * 100
+
+        assert estimator.is_within("short", 10)
+        assert estimator.is_within(text, 10_000)
+        assert not estimator.is_within(text, 5)
+        assert encoding.encoded == []
+
+        near = math.ceil(estimator.estimate(text))
+        assert estimator.is_within(text, near) is (len(text) <= near)
+        assert encoding.encoded == [text]
+        assert (estimator.estimated_checks, estimator.exact_checks) == (3, 1)
+
+    @pytest.mark.parametrize(
+        "text",
+        [
+            base64.b64encode(bytes(range(256)) * 2).decode(),
+            bytes(range(256)).hex(),
+            "https://example.com/kb/" + "a1B2c3D4" * 20,
+        ],
+        ids=["base64", "hex", "url"],
+    )
+    def test_long_runs_without_spaces(self, text):
+        """Runs without spaces, which the estimate undercounts, are bounded by their byte length."""
+        encoding = CharEncoding()
+        estimator = TokenEstimator(encoding, calibrated=True)
+
+        assert estimator.estimated_upper_bound(text) >= len(text)
+        assert not estimator.is_within(text, len(text) - 1)
+        assert encoding.encoded == [text]
+
+    def test_uncalibrated_encoding_only_trusts_bytes(self):
+        """Without calibration, texts whose byte count exceeds the budget are always encoded."""
+        encoding = CharEncoding()
+        estimator = TokenEstimator(encoding)
+        text = "word " * 100
+
+        assert not estimator.calibrated
+        assert estimator.upper_bound(text) == len(text)
+        assert estimator.lower_bound(text) == 1
+        assert estimator.is_within("short", 10)
+        assert estimator.is_within(text, 10_000)
+        assert not estimator.is_within(text, 5)
+        assert estimator.is_within(text, len(text) - 1) is False
+        assert encoding.encoded == [text, text]
+        assert (estimator.estimated_checks, estimator.exact_checks) == (2, 2)
+
+    def test_estimate_count_tokens(self):
+        """Messages and tools are estimated with the same overheads as the exact count, without encoding."""
+        counter = CountTokens(encoding=CharEncoding())
+        messages = [{"role": "user", "content": "hi"}]
+
+        assert counter.estimate_count_tokens(messages, []) == 3 + 3 + counter.estimate("user") + counter.estimate("hi")
+        assert counter.encoding.encoded == []
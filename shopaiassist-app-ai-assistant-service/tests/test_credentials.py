@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from src.credentials import CredentialManager
+
+
+class RotatingSecret:
+    """Secret source returning the queued values, then repeating the last one."""
+
+    def __init__(self, *values):
+        """Queue the values to return."""
+        self.values = list(values)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        value = self.values[0] if len(self.values) == 1 else self.values.pop(0)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+class TestCredentialManager:
+    def test_loads_once_at_creation(self):
+        """The secret is fetched and the client built when the manager is created."""
+        fetch = RotatingSecret({"api_key": "a"})
+
+        manager = CredentialManager("test", fetch, lambda secret: ("client", secret["api_key"]))
+
+        assert manager.value == ("client", "a")
+        assert fetch.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_rebuilds_only_on_rotation(self):
+        """The client is only rebuilt when the secret changed, and then replaced as a whole."""
+        fetch = RotatingSecret({"api_key": "a"}, {"api_key": "a"}, {"api_key": "b"})
+        manager = CredentialManager("test", fetch, lambda secret: ("client", secret["api_key"]))
+        first = manager.value
+
+        assert await manager.refresh() is False
+        assert manager.value is first
+        assert await manager.refresh() is True
+        assert manager.value == ("client", "b")
+
+    @pytest.mark.asyncio
+    async def test_background_refresh_survives_errors(self):
+        """A failing refresh keeps the current client and is retried."""
+        fetch = RotatingSecret({"api_key": "a"}, RuntimeError("unavailable"), {"api_key": "b"})
+        manager = CredentialManager(
+            "test", fetch, lambda secret: secret["api_key"], refresh_seconds=0.01, retry_seconds=0.01
+        )
+
+        manager.start()
+        for _ in range(100):
+            if manager.value == "b":
+                break
+            await asyncio.sleep(0.01)
+        await manager.stop()
+
+        assert manager.value == "b"
+        assert fetch.calls >= 3
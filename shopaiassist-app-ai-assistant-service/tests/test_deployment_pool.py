@@ -0,0 +1,84 @@
+import asyncio
+
+import httpx
+import pytest
+from openai import APIStatusError, BadRequestError, RateLimitError
+
+from src.deployment_pool import Deployment, DeploymentPool
+
+
+def _error(error_class, status_code, headers=None):
+    request = httpx.Request("POST", "https://example.openai.azure.com")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return error_class("error", response=response, body=None)
+
+
+def _pool(*names, cooldown_seconds=10.0):
+    return DeploymentPool("test", [Deployment(name, name) for name in names], cooldown_seconds=cooldown_seconds)
+
+
+class TestDeploymentPool:
+    @pytest.mark.asyncio
+    async def test_least_outstanding(self):
+        """Concurrent calls are spread over the deployments with the fewest requests in flight."""
+        pool = _pool("a", "b")
+        release = asyncio.Event()
+        used = []
+
+        async def request(deployment):
+            used.append(deployment.name)
+            await release.wait()
+
+        calls = [asyncio.create_task(pool.call(request)) for _ in range(4)]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*calls)
+
+        assert sorted(used) == ["a", "a", "b", "b"]
+        assert pool.stats()["a"]["outstanding"] == 0
+
+    @pytest.mark.asyncio
+    async def test_failover_and_cooldown(self):
+        """A throttled deployment fails over to the next one and is avoided during its retry-after."""
+        pool = _pool("a", "b")
+        used = []
+
+        async def request(deployment):
+            used.append(deployment.name)
+            if deployment.name == "a":
+                raise _error(RateLimitError, 429, {"retry-after": "30"})
+            return deployment.client
+
+        assert await pool.call(request) == "b"
+        assert await pool.call(request) == "b"
+        assert used == ["a", "b", "b"]
+        stats = pool.stats()
+        assert stats["a"]["errors"] == 1 and not stats["a"]["healthy"]
+        assert stats["b"]["requests"] == 2 and stats["b"]["latency_ewma"] is not None
+
+    @pytest.mark.asyncio
+    async def test_all_deployments_failing(self):
+        """The error of the last deployment is raised once all of them were tried."""
+        pool = _pool("a", "b")
+
+        async def request(deployment):
+            raise _error(APIStatusError, 503)
+
+        with pytest.raises(APIStatusError):
+            await pool.call(request)
+        assert all(not stats["healthy"] for stats in pool.stats().values())
+
+    @pytest.mark.asyncio
+    async def test_client_errors_do_not_fail_over(self):
+        """A bad request is the caller's error and is raised without trying another deployment."""
+        pool = _pool("a", "b")
+        used = []
+
+        async def request(deployment):
+            used.append(deployment.name)
+            raise _error(BadRequestError, 400)
+
+        with pytest.raises(BadRequestError):
+            await pool.call(request)
+        assert used == ["a"]
+        assert pool.stats()["a"]["healthy"]
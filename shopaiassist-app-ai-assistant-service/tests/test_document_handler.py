@@ -1,12 +1,20 @@
+import hashlib
+import os
 import uuid
 import pytest
 import pandas as pd
+import pyarrow as pa
 from io import BytesIO
 from unittest.mock import patch, MagicMock, AsyncMock
 from fastapi import UploadFile, HTTPException
-import xml.etree.ElementTree as ET
 
+from src.skills_backend.document_qa.chunk_store import ChunkStore, ChunkWriter, read_chunks
 from src.skills_backend.document_qa.document_handler import DocumentHandler, FileParseError
+from src.skills_backend.document_qa.layout_parser_client import LayoutParserError
+from src.skills_backend.document_qa.spooled_upload import SpooledUpload
+from src.skills_backend.document_qa.vector_index import DocumentIndex
+from tests.test_chunk_store import FakeS3
+from tests.test_ingest_pipeline import ListWriter
 
 
 @pytest.fixture
@@ -17,8 +25,8 @@ def document_handler():
     ) as mock_boto3_client, patch(
         "src.skills_backend.document_qa.document_handler.OpenaiUtils"
     ) as mock_openai_utils, patch(
-        "src.skills_backend.document_qa.document_handler.DocTreePDFReader"
-    ) as mock_pdf_reader:
+        "src.skills_backend.document_qa.document_handler.LayoutParserClient"
+    ) as mock_layout_parser_client:
         #  patch("src.skills_backend.document_qa.document_handler.tiktoken.encoding_for_model") as mock_tokenizer:
 
         # Configure mocks
@@ -36,10 +44,11 @@ def document_handler():
 
         mock_openai = MagicMock()
         mock_openai_utils.return_value = mock_openai
-        mock_openai.get_embedding.return_value = [0.1, 0.2, 0.3]
+        mock_openai.get_embeddings = AsyncMock(side_effect=lambda texts, **kwargs: [[0.1, 0.2, 0.3] for _ in texts])
 
         mock_pdf = MagicMock()
-        mock_pdf_reader.return_value = mock_pdf
+        mock_pdf.get_doc_tree = AsyncMock()
+        mock_layout_parser_client.from_config.return_value = mock_pdf
 
         mock_tokenizer_instance = MagicMock()
         # mock_tokenizer.return_value = mock_tokenizer_instance
@@ -55,14 +64,16 @@ def document_handler():
         yield handler
 
 
-@pytest.fixture
-def mock_upload_file():
-    """Fixture to create a mock UploadFile object."""
-    mock_file = MagicMock(spec=UploadFile)
-    mock_file.filename = "test_document.pdf"
-    mock_file.file = BytesIO(b"test content")
-    mock_file.read = AsyncMock(return_value=b"test content")
-    return mock_file
+def _upload_file(filename, content=b"test content"):
+    """Create an UploadFile of `filename` with `content`."""
+    return UploadFile(BytesIO(content), filename=filename)
+
+
+def _spooled(tmp_path, filename, content):
+    """Write `content` to a temp file as a spooled upload of `filename`."""
+    path = tmp_path / filename
+    path.write_bytes(content)
+    return SpooledUpload(filename, str(path), len(content), "0" * 64)
 
 
 class TestDocumentHandler:
@@ -70,155 +81,171 @@ class TestDocumentHandler:
     @pytest.mark.parametrize(
         "file_size,file_extension,expected_result,should_raise",
         [
-            (5 * 1024 * 1024, ".pdf", True, False),  # Valid PDF file
-            (5 * 1024 * 1024, ".xml", True, False),  # Valid XML file
-            (15 * 1024 * 1024, ".pdf", None, True),  # File too large
-            (5 * 1024 * 1024, ".docx", None, True),  # Unsupported file type
+            (512, ".pdf", True, False),  # Valid PDF file
+            (512, ".xml", True, False),  # Valid XML file
+            (2048, ".pdf", None, True),  # File too large
+            (512, ".docx", None, True),  # Unsupported file type
         ],
     )
     async def test_validate_document(
-        self, document_handler, mock_upload_file, file_size, file_extension, expected_result, should_raise
+        self, document_handler, tmp_path, file_size, file_extension, expected_result, should_raise
     ):
         """Test document validation with various file sizes and types."""
         # Setup
-        mock_upload_file.filename = f"test_document{file_extension}"
-        mock_upload_file.file.seek = MagicMock()
-        mock_upload_file.file.tell = MagicMock(return_value=file_size)
+        document_handler.max_file_size = 1024
+        document_handler.spool_dir = str(tmp_path)
+        upload_file = _upload_file(f"test_document{file_extension}", b"x" * file_size)
 
         # Mock the content validation methods
         with patch.object(document_handler, "validate_pdf", return_value=(True, "")) as mock_validate_pdf, patch.object(
             document_handler, "validate_xml", return_value=(True, "")
         ) as mock_validate_xml:
-            # Test
+            # Test, the type and size are checked while spooling
             if should_raise:
                 with pytest.raises(HTTPException):
-                    await document_handler.validate_document(mock_upload_file)
+                    with await document_handler.spool(upload_file) as upload:
+                        await document_handler.validate_document(upload)
             else:
-                result = await document_handler.validate_document(mock_upload_file)
+                with await document_handler.spool(upload_file) as upload:
+                    result = await document_handler.validate_document(upload)
                 assert result == expected_result
+                assert upload.size == file_size
 
                 # Verify the appropriate validation method was called
-                if file_extension == ".pdf" and not should_raise:
-                    mock_validate_pdf.assert_called_once_with(mock_upload_file)
+                if file_extension == ".pdf":
+                    mock_validate_pdf.assert_called_once_with(upload)
                     mock_validate_xml.assert_not_called()
-                elif file_extension == ".xml" and not should_raise:
-                    mock_validate_xml.assert_called_once_with(mock_upload_file)
+                elif file_extension == ".xml":
+                    mock_validate_xml.assert_called_once_with(upload)
                     mock_validate_pdf.assert_not_called()
 
+        # No spooled file is left behind
+        assert os.listdir(tmp_path) == []
+
     @pytest.mark.asyncio
-    async def test_validate_pdf_valid(self, document_handler, mock_upload_file):
+    async def test_validate_pdf_valid(self, document_handler, tmp_path):
         """Test PDF validation with a valid PDF file."""
         # Setup - Create a mock for PyPDF2
         mock_pdf_reader = MagicMock()
         mock_pdf_reader.pages = [MagicMock()]
+        upload = _spooled(tmp_path, "test_document.pdf", b"test content")
 
         # Mock PyPDF2 PdfReader
-        with patch("PyPDF2.PdfReader", return_value=mock_pdf_reader):
+        with patch(
+            "src.skills_backend.document_qa.document_handler.PdfReader", return_value=mock_pdf_reader
+        ) as mock_reader_class:
             # Execute
-            is_valid, error_message = await document_handler.validate_pdf(mock_upload_file)
+            is_valid, error_message = await document_handler.validate_pdf(upload)
 
             # Assert
             assert is_valid is True
             assert error_message == ""
+            assert mock_reader_class.call_args.args[0].name == upload.path
 
     @pytest.mark.asyncio
-    async def test_validate_pdf_no_pages(self, document_handler, mock_upload_file):
+    async def test_validate_pdf_no_pages(self, document_handler, tmp_path):
         """Test PDF validation with a PDF file that has no pages."""
         # Setup - Create a mock for PyPDF2
         mock_pdf_reader = MagicMock()
         mock_pdf_reader.pages = []  # No pages
+        upload = _spooled(tmp_path, "test_document.pdf", b"test content")
 
         # Mock PyPDF2 PdfReader
-        with patch("PyPDF2.PdfReader", return_value=mock_pdf_reader):
+        with patch("src.skills_backend.document_qa.document_handler.PdfReader", return_value=mock_pdf_reader):
             # Execute
-            is_valid, error_message = await document_handler.validate_pdf(mock_upload_file)
+            is_valid, error_message = await document_handler.validate_pdf(upload)
 
             # Assert
             assert is_valid is False
             assert "contains no pages" in error_message
 
     @pytest.mark.asyncio
-    async def test_validate_pdf_error(self, document_handler, mock_upload_file):
+    async def test_validate_pdf_error(self, document_handler, tmp_path):
         """Test PDF validation with an error during processing."""
+        upload = _spooled(tmp_path, "test_document.pdf", b"test content")
+
         # Mock PyPDF2 PdfReader to raise an exception
-        with patch("PyPDF2.PdfReader", side_effect=Exception("Test error")):
+        with patch("src.skills_backend.document_qa.document_handler.PdfReader", side_effect=Exception("Test error")):
             # Execute
-            is_valid, error_message = await document_handler.validate_pdf(mock_upload_file)
+            is_valid, error_message = await document_handler.validate_pdf(upload)
 
             # Assert
             assert is_valid is False
             assert "PDF validation failed" in error_message
 
     @pytest.mark.asyncio
-    async def test_validate_xml_valid(self, document_handler, mock_upload_file):
+    async def test_validate_xml_valid(self, document_handler, tmp_path):
         """Test XML validation with a valid XML file."""
         # Setup - Valid XML content
-        mock_upload_file.read.return_value = b"<root><child>Test content</child><child>More content</child></root>"
+        upload = _spooled(
+            tmp_path, "test.xml", b"<root><child>Test content</child><child>More content</child></root>"
+        )
 
         # Execute
-        is_valid, error_message = await document_handler.validate_xml(mock_upload_file)
+        is_valid, error_message = await document_handler.validate_xml(upload)
 
         # Assert
         assert is_valid is True
         assert error_message == ""
 
     @pytest.mark.asyncio
-    async def test_validate_xml_malformed(self, document_handler, mock_upload_file):
+    async def test_validate_xml_malformed(self, document_handler, tmp_path):
         """Test XML validation with malformed XML."""
         # Setup - Malformed XML content
-        mock_upload_file.read.return_value = b"<root><child>Test content</child><child>More content</root>"
+        upload = _spooled(tmp_path, "test.xml", b"<root><child>Test content</child><child>More content</root>")
 
         # Execute
-        is_valid, error_message = await document_handler.validate_xml(mock_upload_file)
+        is_valid, error_message = await document_handler.validate_xml(upload)
 
         # Assert
         assert is_valid is False
         assert "XML syntax error" in error_message
 
     @pytest.mark.asyncio
-    async def test_validate_xml_empty(self, document_handler, mock_upload_file):
+    async def test_validate_xml_empty(self, document_handler, tmp_path):
         """Test XML validation with empty XML."""
         # Setup - Empty XML content
-        mock_upload_file.read.return_value = b"<root></root>"
+        upload = _spooled(tmp_path, "test.xml", b"<root></root>")
 
         # Execute
-        is_valid, error_message = await document_handler.validate_xml(mock_upload_file)
+        is_valid, error_message = await document_handler.validate_xml(upload)
 
         # Assert
         assert is_valid is False
         assert "empty or contains no meaningful content" in error_message
 
     @pytest.mark.asyncio
-    async def test_validate_xml_minimal_content(self, document_handler, mock_upload_file):
+    async def test_validate_xml_minimal_content(self, document_handler, tmp_path):
         """Test XML validation with minimal content."""
         # Setup - XML with minimal content
-        mock_upload_file.read.return_value = b"<root><a>x</a></root>"
+        upload = _spooled(tmp_path, "test.xml", b"<root><a>x</a></root>")
 
         # Execute
-        is_valid, error_message = await document_handler.validate_xml(mock_upload_file)
+        is_valid, error_message = await document_handler.validate_xml(upload)
 
         # Assert
         assert is_valid is False
         assert "empty or contains no meaningful content" in error_message
 
     @pytest.mark.asyncio
-    async def test_validate_xml_invalid_encoding(self, document_handler, mock_upload_file):
+    async def test_validate_xml_invalid_encoding(self, document_handler, tmp_path):
         """Test XML validation with invalid encoding."""
         # Setup - Mock a UnicodeDecodeError
-        mock_upload_file.read.return_value = b"invalid encoding"
-        with patch("xml.etree.ElementTree.fromstring", side_effect=UnicodeDecodeError("utf-8", b"", 0, 1, "invalid")):
+        upload = _spooled(tmp_path, "test.xml", b"invalid encoding")
+        with patch("xml.etree.ElementTree.parse", side_effect=UnicodeDecodeError("utf-8", b"", 0, 1, "invalid")):
             # Execute
-            is_valid, error_message = await document_handler.validate_xml(mock_upload_file)
+            is_valid, error_message = await document_handler.validate_xml(upload)
 
             # Assert
             assert is_valid is False
             assert "invalid character encoding" in error_message
 
     @pytest.mark.asyncio
-    async def test_pdf_embeddings(self, document_handler, mock_upload_file):
+    async def test_pdf_embeddings(self, document_handler, tmp_path):
         """Test PDF processing and embedding generation."""
         # Setup
-        mock_upload_file.filename = "test.pdf"
+        upload = _spooled(tmp_path, "test.pdf", b"%PDF-1.4 test content")
+        writer = ListWriter()
 
         # Mock the PDF parser's return values
         doc_tree = MagicMock()
@@ -228,72 +255,95 @@ class TestDocumentHandler:
             {"start_page": 1, "end_page": 1, "content": "Test content page 1"},
             {"start_page": 2, "end_page": 2, "content": "Test content page 2"},
         ]
-        doc_tree.get_chunks.return_value = chunks
+        doc_tree.iter_chunks.return_value = iter(chunks)
 
-        # Mock tempfile and open
-        with patch("tempfile.TemporaryDirectory"), patch("os.path.join", return_value="temp/test.pdf"), patch(
-            "builtins.open", MagicMock()
-        ), patch("os.makedirs"):
-            # Execute
-            result = await document_handler.pdf_embeddings(mock_upload_file)
+        # Execute
+        result = await document_handler.pdf_embeddings(upload, ".pdf", writer)
 
-            # Assert
-            assert isinstance(result, pd.DataFrame)
-            assert len(result) == 2  # Two chunks
-            assert "open_ai_embeddings" in result.columns
-            assert "raw_text" in result.columns
-            assert "chunk_id" in result.columns
+        # Assert
+        assert result == 2  # Two chunks
+        assert writer.batches == [["Test content page 1", "Test content page 2"]]
 
-            # Verify the PDF parser was called correctly
-            document_handler.mock_pdf.get_doc_tree.assert_called_once()
-            assert document_handler.mock_openai.get_embedding.call_count == 2
+        # Verify the spooled file was parsed by path with the async client
+        document_handler.mock_pdf.get_doc_tree.assert_awaited_once_with(
+            path=upload.path, file_name="test.pdf", tokenizer=document_handler.tokenizer
+        )
+        doc_tree.iter_chunks.assert_called_once_with(chunk_size=1000)
+        document_handler.mock_openai.get_embeddings.assert_awaited_once()
 
     @pytest.mark.asyncio
-    async def test_extract_text_from_xml(self, document_handler, mock_upload_file):
-        """Test XML text extraction and embedding generation."""
+    async def test_pdf_embeddings_parser_error(self, document_handler, tmp_path):
+        """Test that a failure of the layout parser service is reported as a bad gateway."""
         # Setup
-        mock_upload_file.filename = "test.xml"
+        upload = _spooled(tmp_path, "test.pdf", b"%PDF-1.4 test content")
+        document_handler.mock_pdf.get_doc_tree.side_effect = LayoutParserError("Layout parser returned 503")
 
-        # Mock the XML parser
-        xml_chunks = [
-            {"content": "XML content 1", "file_type": "XML Section 1"},
-            {"content": "XML content 2", "file_type": "XML Section 2"},
-        ]
+        # Execute & Assert
+        with pytest.raises(HTTPException) as exc_info:
+            await document_handler.pdf_embeddings(upload, ".pdf", ListWriter())
 
-        with patch("src.skills_backend.document_qa.document_handler.parse_xml_file", return_value=xml_chunks):
-            # Execute
-            result = await document_handler.extract_text_from_xml(mock_upload_file)
+        assert exc_info.value.status_code == 502
+        assert "Layout parser returned 503" in str(exc_info.value.detail)
+        document_handler.mock_openai.get_embeddings.assert_not_awaited()
 
-            # Assert
-            assert isinstance(result, pd.DataFrame)
-            assert len(result) == 2  # Two chunks
-            assert "open_ai_embeddings" in result.columns
-            assert "raw_text" in result.columns
-            assert "chunk_id" in result.columns
-            assert document_handler.mock_openai.get_embedding.call_count == 2
+    @pytest.mark.asyncio
+    async def test_search_document_bypasses_embedding_cache(self, document_handler):
+        """The query is embedded directly, it is neither looked up in nor written to the chunk embedding cache."""
+        # Setup
+        document_handler.embedding_cache = MagicMock(enabled=True)
+        index = DocumentIndex([[0.1, 0.2, 0.3], [0.3, 0.2, 0.1]], ["first", "second"], ["0", "1"])
+
+        # Execute
+        with patch.object(document_handler, "_load_index", return_value=index):
+            results = await document_handler.search_document("tenant", "user", "doc-1", "How do I file?", top_k=1)
+
+        # Assert
+        assert [result["chunk_id"] for result in results] == ["0"]
+        document_handler.mock_openai.get_embeddings.assert_awaited_once_with(
+            ["How do I file?"], model=document_handler.embedding_deployment
+        )
+        document_handler.embedding_cache.get_many.assert_not_called()
+        document_handler.embedding_cache.put_many.assert_not_called()
 
     @pytest.mark.asyncio
-    async def test_extract_text_from_xml_invalid_xml(self, document_handler, mock_upload_file):
+    async def test_extract_text_from_xml(self, document_handler, tmp_path):
+        """Test XML text extraction and embedding generation."""
+        # Setup - Two sections that do not fit one chunk together, split at line ends
+        document_handler.config["document_qa"]["chunk_size"] = 100
+        sections = ["<a>" + "content " * 75 + "</a>", "<b>" + "section " * 75 + "</b>"]
+        upload = _spooled(tmp_path, "test.xml", "\n".join(sections).encode("utf-8"))
+        writer = ListWriter()
+
+        # Execute
+        result = await document_handler.extract_text_from_xml(upload, writer)
+
+        # Assert
+        assert result == 2  # Two chunks
+        assert writer.batches == [sections]
+        document_handler.mock_openai.get_embeddings.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_extract_text_from_xml_invalid_xml(self, document_handler, tmp_path):
         """Test handling of invalid XML files."""
-        # Setup
-        mock_upload_file.filename = "invalid.xml"
+        # Setup - Not UTF-8
+        upload = _spooled(tmp_path, "invalid.xml", b"<root>\xff\xfe</root>")
+        writer = ListWriter()
 
-        # Mock XML parser to raise ParseError
-        with patch(
-            "src.skills_backend.document_qa.document_handler.parse_xml_file", side_effect=ET.ParseError("Invalid XML")
-        ):
-            # Execute & Assert
-            with pytest.raises(HTTPException) as exc_info:
-                await document_handler.extract_text_from_xml(mock_upload_file)
+        # Execute & Assert
+        with pytest.raises(HTTPException) as exc_info:
+            await document_handler.extract_text_from_xml(upload, writer)
 
-            assert exc_info.value.status_code == 400
-            assert "Invalid XML file" in str(exc_info.value.detail)
+        assert exc_info.value.status_code == 400
+        assert "Invalid XML file" in str(exc_info.value.detail)
+        assert writer.batches == []
 
     @pytest.mark.asyncio
-    async def test_save_to_s3(self, document_handler):
+    async def test_save_to_s3(self, document_handler, tmp_path):
         """Test saving document data to S3."""
         # Setup
         test_df = pd.DataFrame({"raw_text": ["Test content"], "open_ai_embeddings": [[0.1, 0.2, 0.3]]})
+        s3 = FakeS3()
+        document_handler.chunk_store = ChunkStore(s3, "test-bucket")
 
         tenant_id = "test-tenant"
         user_id = "test-user"
@@ -303,12 +353,18 @@ class TestDocumentHandler:
         # Execute
         result = await document_handler.save_to_s3(test_df, tenant_id, user_id, document_id, filename)
 
-        # Assert
-        expected_path = f"s3://test-bucket/tenant_id={tenant_id}/user_id={user_id}/{document_id}_test.pkl"
-        assert result == expected_path
+        # Assert - Stored as an Arrow file by default
+        key = f"tenant_id={tenant_id}/user_id={user_id}/{document_id}_test.arrow"
+        assert result == f"s3://test-bucket/{key}"
+        assert list(s3.objects) == [key]
 
-        # Verify S3 client was called correctly
-        document_handler.mock_s3.upload_fileobj.assert_called_once()
+        # Verify the embeddings are stored as fixed size float32 lists
+        path = tmp_path / "chunks.arrow"
+        path.write_bytes(s3.objects[key])
+        table = read_chunks(str(path))
+        assert table.schema.field("open_ai_embeddings").type == pa.list_(pa.float32(), 3)
+        assert table.column("raw_text").to_pylist() == ["Test content"]
+        assert table.column("open_ai_embeddings").to_pylist()[0] == pytest.approx([0.1, 0.2, 0.3])
 
     @pytest.mark.asyncio
     @pytest.mark.parametrize(
@@ -349,12 +405,15 @@ class TestDocumentHandler:
             (".docx", HTTPException),  # Unsupported type
         ],
     )
-    async def test_process_document(self, document_handler, mock_upload_file, file_extension, expected_exception):
+    async def test_process_document(self, document_handler, tmp_path, file_extension, expected_exception):
         """Test the full document processing workflow."""
         # Setup
-        mock_upload_file.filename = f"test_document{file_extension}"
+        document_handler.spool_dir = str(tmp_path)
+        upload_file = _upload_file(f"test_document{file_extension}")
         tenant_id = "test-tenant"
         user_id = "test-user"
+        writer = MagicMock(spec=ChunkWriter)
+        writer.close.return_value = "s3://test-path"
 
         # Mock UUID generation
         test_uuid = "12345678-1234-5678-1234-567812345678"
@@ -369,58 +428,75 @@ class TestDocumentHandler:
                 ) as mock_pdf_process, patch.object(
                     document_handler, "extract_text_from_xml", new_callable=AsyncMock
                 ) as mock_xml_process, patch.object(
-                    document_handler, "save_to_s3", new_callable=AsyncMock
-                ) as mock_save:
-                    test_df = pd.DataFrame({"test": ["data"]})
-                    mock_pdf_process.return_value = test_df
-                    mock_xml_process.return_value = test_df
-                    mock_save.return_value = "s3://test-path"
+                    document_handler.chunk_store, "open", return_value=writer
+                ) as mock_open:
+                    mock_pdf_process.return_value = 1
+                    mock_xml_process.return_value = 1
 
                     # Execute
                     if expected_exception:
                         with pytest.raises(expected_exception):
-                            await document_handler.process_document(mock_upload_file, tenant_id, user_id)
+                            await document_handler.process_document(upload_file, tenant_id, user_id)
+                        mock_validate.assert_not_called()
                     else:
-                        result = await document_handler.process_document(mock_upload_file, tenant_id, user_id)
+                        result = await document_handler.process_document(upload_file, tenant_id, user_id)
 
                         # Assert
                         assert result["document_id"] == test_uuid
-                        assert result["filename"] == mock_upload_file.filename
+                        assert result["filename"] == upload_file.filename
                         assert result["status"] == "success"
-                        assert "s3_path" in result
+                        assert result["s3_path"] == "s3://test-path"
+                        assert result["file_size"] == len(b"test content")
+                        assert result["content_sha256"] == hashlib.sha256(b"test content").hexdigest()
+
+                        # Validation and processing read the same spooled upload
+                        upload = mock_validate.call_args.args[0]
+                        assert isinstance(upload, SpooledUpload)
+                        assert upload.filename == upload_file.filename
+                        mock_open.assert_called_once_with(tenant_id, user_id, test_uuid, "test_document")
+                        writer.close.assert_called_once()
 
                         # Verify appropriate processing method was called
                         if file_extension == ".pdf":
-                            mock_pdf_process.assert_called_once()
+                            mock_pdf_process.assert_awaited_once_with(upload, ".pdf", writer, None)
                             mock_xml_process.assert_not_called()
                         elif file_extension == ".xml":
-                            mock_xml_process.assert_called_once()
+                            mock_xml_process.assert_awaited_once_with(upload, writer, None)
                             mock_pdf_process.assert_not_called()
 
+        # The spooled file is deleted once processed
+        assert os.listdir(tmp_path) == []
+
     @pytest.mark.asyncio
-    async def test_process_document_error_handling(self, document_handler, mock_upload_file):
+    async def test_process_document_error_handling(self, document_handler, tmp_path):
         """Test error handling in the document processing workflow."""
         # Setup
-        mock_upload_file.filename = "test.pdf"
+        document_handler.spool_dir = str(tmp_path)
         tenant_id = "test-tenant"
         user_id = "test-user"
+        writer = MagicMock(spec=ChunkWriter)
 
-        # Mock validation to raise an exception
+        # Mock validation to raise a parsing error, reported as a bad request
         with patch.object(document_handler, "validate_document", side_effect=FileParseError("Test error")):
             # Execute & Assert
             with pytest.raises(HTTPException) as exc_info:
-                await document_handler.process_document(mock_upload_file, tenant_id, user_id)
+                await document_handler.process_document(_upload_file("test.pdf"), tenant_id, user_id)
 
-            assert exc_info.value.status_code == 500
-            assert "Error processing document" in str(exc_info.value.detail)
+            assert exc_info.value.status_code == 400
+            assert "Test error" in str(exc_info.value.detail)
 
         # Test general exception handling
         with patch.object(document_handler, "validate_document", return_value=True), patch.object(
             document_handler, "pdf_embeddings", side_effect=Exception("General error")
-        ):
+        ), patch.object(document_handler.chunk_store, "open", return_value=writer):
             # Execute & Assert
             with pytest.raises(HTTPException) as exc_info:
-                await document_handler.process_document(mock_upload_file, tenant_id, user_id)
+                await document_handler.process_document(_upload_file("test.pdf"), tenant_id, user_id)
 
             assert exc_info.value.status_code == 500
             assert "Error processing document" in str(exc_info.value.detail)
+            # The partly written chunks are discarded
+            writer.abort.assert_called_once()
+            writer.close.assert_not_called()
+
+        assert os.listdir(tmp_path) == []
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from src.models import Authentication
+from src.skills_backend.document_qa.document_jobs import INTERRUPTED_ERROR, DocumentJobManager
+from src.skills_backend.document_qa.spooled_upload import SpooledUpload
+
+
+def _upload(tmp_path, name: str) -> SpooledUpload:
+    path = tmp_path / name
+    path.write_bytes(b"content")
+    return SpooledUpload(name, str(path), 7, "hash")
+
+
+def _auth(tenant_id: str = "tenant-a") -> Authentication:
+    return Authentication(tenant_id=tenant_id, user_id="user-1")
+
+
+class TestDocumentJobManager:
+    @pytest.mark.asyncio
+    async def test_progress_and_status(self, tmp_path):
+        """The job reports its stages, stores its final status and deletes the spooled file."""
+        stored = []
+
+        async def process(job):
+            job.report("parsed")
+            job.report("embedded", done=2, total=2)
+            return {"s3_path": "s3://bucket/key"}
+
+        async def store_status(job):
+            stored.append((job.document_id, job.status))
+
+        manager = DocumentJobManager(process, store_status)
+        upload = _upload(tmp_path, "manual.pdf")
+        job = manager.submit("doc-1", upload, _auth())
+        events = [json.loads(event["data"]) async for event in job.follow()]
+
+        assert [event["stage"] for event in events] == ["queued", "started", "parsed", "embedded", "ready"]
+        assert events[3]["progress"] == {"done": 2, "total": 2}
+        assert job.status == "ready" and job.result == {"s3_path": "s3://bucket/key"}
+        await asyncio.sleep(0)
+        assert stored == [("doc-1", "ready")]
+        assert not os.path.exists(upload.path)
+
+    @pytest.mark.asyncio
+    async def test_failure(self, tmp_path):
+        """A failing job is marked as failed with its error."""
+
+        async def process(job):
+            raise ValueError("no pages")
+
+        async def store_status(job):
+            pass
+
+        manager = DocumentJobManager(process, store_status)
+        job = manager.submit("doc-1", _upload(tmp_path, "manual.pdf"), _auth())
+        await job.task
+
+        assert job.status == "failed"
+        assert job.error == "no pages"
+
+    @pytest.mark.asyncio
+    async def test_per_tenant_limit(self, tmp_path):
+        """A tenant gets at most `max_per_tenant` slots, the other tenants use the remaining ones."""
+        running = []
+        release = asyncio.Event()
+
+        async def process(job):
+            running.append(job.document_id)
+            await release.wait()
+            return {}
+
+        async def store_status(job):
+            pass
+
+        manager = DocumentJobManager(process, store_status, max_concurrency=3, max_per_tenant=2)
+        jobs = [manager.submit(f"a-{i}", _upload(tmp_path, f"a-{i}.xml"), _auth("tenant-a")) for i in range(3)]
+        jobs.append(manager.submit("b-0", _upload(tmp_path, "b-0.xml"), _auth("tenant-b")))
+        await asyncio.sleep(0.01)
+
+        assert sorted(running) == ["a-0", "a-1", "b-0"]
+        release.set()
+        await asyncio.gather(*(job.task for job in jobs))
+        assert sorted(running) == ["a-0", "a-1", "a-2", "b-0"]
+        assert manager._tenant_slots == {}
+
+    @pytest.mark.asyncio
+    async def test_cancel(self, tmp_path):
+        """Running and queued jobs can be cancelled, finished jobs cannot."""
+        stored = []
+
+        async def process(job):
+            await asyncio.sleep(10)
+
+        async def store_status(job):
+            stored.append((job.document_id, job.status))
+
+        manager = DocumentJobManager(process, store_status, max_concurrency=1)
+        running = manager.submit("doc-1", _upload(tmp_path, "1.pdf"), _auth())
+        queued = manager.submit("doc-2", _upload(tmp_path, "2.pdf"), _auth())
+        await asyncio.sleep(0.01)
+
+        assert await manager.cancel("doc-2")
+        assert await manager.cancel("doc-1")
+        assert not await manager.cancel("doc-1")
+        assert running.status == queued.status == "cancelled"
+        assert sorted(stored) == [("doc-1", "cancelled"), ("doc-2", "cancelled")]
+
+    @pytest.mark.asyncio
+    async def test_cancel_before_start(self, tmp_path):
+        """A job cancelled before its task ran is still finished and its file deleted."""
+
+        async def process(job):
+            return {}
+
+        async def store_status(job):
+            pass
+
+        manager = DocumentJobManager(process, store_status)
+        upload = _upload(tmp_path, "1.pdf")
+        job = manager.submit("doc-1", upload, _auth())
+
+        assert await manager.cancel("doc-1")
+        assert job.status == "cancelled"
+        assert not os.path.exists(upload.path)
+
+    @pytest.mark.asyncio
+    async def test_stop_interrupts_jobs(self, tmp_path):
+        """Jobs stopped by a shutdown fail asking for a new upload, they are not recorded as cancelled."""
+        stored = []
+
+        async def process(job):
+            await asyncio.sleep(10)
+
+        async def store_status(job):
+            stored.append((job.document_id, job.status, job.error))
+
+        manager = DocumentJobManager(process, store_status, max_concurrency=1)
+        running = manager.submit("doc-1", _upload(tmp_path, "1.pdf"), _auth())
+        queued = manager.submit("doc-2", _upload(tmp_path, "2.pdf"), _auth())
+        await asyncio.sleep(0.01)
+
+        await manager.stop()
+
+        assert running.status == queued.status == "failed"
+        assert sorted(stored) == [("doc-1", "failed", INTERRUPTED_ERROR), ("doc-2", "failed", INTERRUPTED_ERROR)]
+
+    @pytest.mark.asyncio
+    async def test_follow_resumes_after_event(self, tmp_path):
+        """Following from a Last-Event-ID replays only the later events."""
+
+        async def process(job):
+            job.report("parsed")
+            return {}
+
+        async def store_status(job):
+            pass
+
+        manager = DocumentJobManager(process, store_status)
+        job = manager.submit("doc-1", _upload(tmp_path, "1.pdf"), _auth())
+        await job.task
+        events = [event async for event in job.follow(last_event_id=1)]
+
+        assert [event["id"] for event in events] == ["2", "3"]
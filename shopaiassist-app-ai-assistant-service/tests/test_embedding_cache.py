@@ -0,0 +1,56 @@
+from prometheus_client import REGISTRY
+
+from src.skills_backend.document_qa.embedding_cache import EmbeddingCache
+
+
+def _cache(tmp_path, **kwargs):
+    return EmbeddingCache(enabled=True, path=str(tmp_path / "embeddings.sqlite3"), **kwargs)
+
+
+class TestEmbeddingCache:
+    def test_miss_then_hit(self, tmp_path):
+        """Stored embeddings are returned in order and missing ones as None."""
+        cache = _cache(tmp_path)
+        cache.put_many("ada", ["a", "b"], [[0.5, 1.0], [0.25, -2.0]])
+
+        assert cache.get_many("ada", ["b", "c", "a"]) == [[0.25, -2.0], None, [0.5, 1.0]]
+        assert cache.get_many("other-model", ["a"]) == [None]
+
+    def test_survives_restart(self, tmp_path):
+        """Embeddings are persisted on disk and found by a new cache on the same file."""
+        cache = _cache(tmp_path)
+        cache.put_many("ada", ["a"], [[0.5, 1.0]])
+        cache.close()
+
+        assert _cache(tmp_path).get_many("ada", ["a"]) == [[0.5, 1.0]]
+
+    def test_memory_lru_eviction(self, tmp_path):
+        """The memory tier keeps the most recently used vectors within its budget, the disk still has them all."""
+        cache = _cache(tmp_path, memory_max_bytes=16)
+        cache.put_many("ada", ["a", "b", "c"], [[1.0, 1.0], [2.0, 2.0], [3.0, 3.0]])
+
+        assert cache.memory_bytes == 16
+        assert len(cache._memory) == 2
+        assert cache.get_many("ada", ["a"]) == [[1.0, 1.0]]
+
+    def test_disk_eviction(self, tmp_path):
+        """The least recently used rows are deleted once the disk tier is over its budget."""
+        cache = _cache(tmp_path, memory_max_bytes=0, disk_max_bytes=40)
+        cache.put_many("ada", ["a", "b"], [[1.0] * 4, [2.0] * 4])
+        cache.get_many("ada", ["a"])
+        cache.put_many("ada", ["c"], [[3.0] * 4])
+
+        assert cache.disk_bytes == 32
+        assert cache.get_many("ada", ["a", "b", "c"]) == [[1.0] * 4, None, [3.0] * 4]
+
+    def test_hit_metrics(self, tmp_path):
+        """Hits, misses and the bytes of chunk text not re-sent are counted."""
+        hits_before = REGISTRY.get_sample_value("document_embedding_cache_lookups_total", {"result": "hit"}) or 0
+        saved_before = REGISTRY.get_sample_value("document_embedding_cache_saved_bytes_total") or 0
+        cache = _cache(tmp_path)
+        cache.put_many("ada", ["héllo"], [[1.0]])
+
+        cache.get_many("ada", ["héllo", "missing"])
+
+        assert REGISTRY.get_sample_value("document_embedding_cache_lookups_total", {"result": "hit"}) == hits_before + 1
+        assert REGISTRY.get_sample_value("document_embedding_cache_saved_bytes_total") == saved_before + 6
@@ -0,0 +1,82 @@
+import pytest
+from prometheus_client import REGISTRY
+
+from src.count_tokens import CountTokens
+from src.history_budget import HistoryBudgeter
+from src.models import ChatMessage
+
+
+class WordEncoding:
+    """Encoding with one token per word."""
+
+    def encode_ordinary_batch(self, texts):
+        return [text.split() for text in texts]
+
+    def encode_ordinary(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+def _history(*sizes):
+    return [
+        ChatMessage(role="user" if i % 2 == 0 else "assistant", content=" ".join(f"m{i}w{j}" for j in range(size)))
+        for i, size in enumerate(sizes)
+    ]
+
+
+def _budgeter(**kwargs):
+    return HistoryBudgeter(CountTokens(encoding=WordEncoding()), "test", **kwargs)
+
+
+class TestHistoryBudgeter:
+    def test_keeps_most_recent_messages(self):
+        """The most recent messages that fit the budget are kept, in order, and the rest is counted as dropped."""
+        history = _history(10, 10, 10, 10)
+
+        kept, dropped = _budgeter(max_tokens=30, max_message_tokens=100).trim_sync(history)
+
+        assert kept == history[2:]
+        assert dropped == 20
+
+    def test_truncates_oversized_messages(self):
+        """A message over the per-message limit keeps its beginning and end."""
+        history = _history(3, 100)
+
+        kept, dropped = _budgeter(max_tokens=1000, max_message_tokens=10).trim_sync(history)
+
+        content = kept[1].content
+        assert content.startswith("m1w0 m1w1 m1w2 m1w3 m1w4")
+        assert content.endswith("m1w95 m1w96 m1w97 m1w98 m1w99")
+        assert "[... 90 tokens truncated ...]" in content
+        assert kept[0] == history[0]
+        assert 0 < dropped < 90
+
+    def test_keep_oldest(self):
+        """Budgeters naming a chat keep its first messages."""
+        history = _history(10, 10, 10)
+
+        kept, _ = _budgeter(max_tokens=20, max_message_tokens=100, keep_oldest=True).trim_sync(history)
+
+        assert kept == history[:1]
+
+    @pytest.mark.asyncio
+    async def test_dropped_tokens_metric(self):
+        """The dropped tokens are exported per consumer."""
+        before = REGISTRY.get_sample_value("chat_history_dropped_tokens_total", {"consumer": "test"}) or 0
+
+        kept = await _budgeter(max_tokens=15, max_message_tokens=100).trim(_history(10, 10))
+
+        assert len(kept) == 1
+        assert REGISTRY.get_sample_value("chat_history_dropped_tokens_total", {"consumer": "test"}) == before + 10
+
+    def test_from_config(self):
+        """Configured settings override the defaults given by the caller."""
+        config = {"history_budget": {"summarize_chat": {"max_tokens": 100}}}
+
+        budgeter = HistoryBudgeter.from_config(
+            config, "summarize_chat", CountTokens(encoding=WordEncoding()), max_tokens=10, max_message_tokens=5
+        )
+
+        assert (budgeter.max_tokens, budgeter.max_message_tokens) == (100, 5)
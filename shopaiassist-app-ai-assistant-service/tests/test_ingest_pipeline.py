@@ -0,0 +1,117 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.skills_backend.document_qa.chunk_store import ChunkWriter
+from src.skills_backend.document_qa.ingest_pipeline import IngestPipeline
+
+
+class ListWriter(ChunkWriter):
+    """Keeps the written batches."""
+
+    def __init__(self):
+        """Start without batches."""
+        super().__init__("bucket", "key")
+        self.batches = []
+
+    def write(self, records):
+        self.batches.append([record["raw_text"] for record in records])
+
+    def close(self):
+        return self.uri
+
+    def abort(self):
+        self.batches = []
+
+
+def _record(chunk, embedding):
+    return {"raw_text": chunk, "open_ai_embeddings": embedding}
+
+
+class TestIngestPipeline:
+    @pytest.mark.asyncio
+    async def test_writes_in_chunk_order(self):
+        """Batches embedded out of order are written in chunk order."""
+
+        async def embed(texts):
+            # The first batch is the slowest
+            await asyncio.sleep(0.02 if texts[0] == "0" else 0)
+            return [[float(text)] for text in texts]
+
+        writer = ListWriter()
+        events = []
+        pipeline = IngestPipeline(batch_size=2, embed_concurrency=3)
+        count, first_text = await pipeline.run(
+            (str(i) for i in range(5)), str, embed, _record, writer, lambda stage, **kw: events.append((stage, kw))
+        )
+
+        assert (count, first_text) == (5, "0")
+        assert writer.batches == [["0", "1"], ["2", "3"], ["4"]]
+        assert ("chunked", {"chunks": 5}) in events
+        assert events[-1] == ("embedded", {"done": 5, "total": 5})
+
+    @pytest.mark.asyncio
+    async def test_embedding_starts_before_chunking_ends(self):
+        """The first batch is embedded while the chunk iterator is still running."""
+        release = threading.Event()
+        embedded = asyncio.Event()
+
+        def chunks():
+            yield "a"
+            release.wait(timeout=5)
+            yield "b"
+
+        async def embed(texts):
+            embedded.set()
+            return [[0.0] for _ in texts]
+
+        async def unblock():
+            await embedded.wait()
+            release.set()
+
+        pipeline = IngestPipeline(batch_size=1)
+        _, (count, _) = await asyncio.gather(unblock(), pipeline.run(chunks(), str, embed, _record, ListWriter()))
+
+        assert count == 2
+
+    @pytest.mark.asyncio
+    async def test_bounded_in_flight(self):
+        """The chunk iterator waits while `max_in_flight` batches are not stored."""
+        produced = []
+        release = asyncio.Event()
+
+        def chunks():
+            for i in range(10):
+                produced.append(i)
+                yield str(i)
+
+        async def embed(texts):
+            await release.wait()
+            return [[0.0] for _ in texts]
+
+        pipeline = IngestPipeline(batch_size=1, embed_concurrency=1, max_in_flight=2)
+        run = asyncio.ensure_future(pipeline.run(chunks(), str, embed, _record, ListWriter()))
+        await asyncio.sleep(0.1)
+
+        # Two batches in flight, the third one chunked and waiting for a slot
+        assert len(produced) == 3
+        release.set()
+        assert (await run)[0] == 10
+
+    @pytest.mark.asyncio
+    async def test_embedding_error_stops_the_pipeline(self):
+        """An embedding error is raised and stops the chunk iterator."""
+
+        def chunks():
+            i = 0
+            while True:
+                yield str(i)
+                i += 1
+
+        async def embed(texts):
+            raise RuntimeError("rate limited")
+
+        pipeline = IngestPipeline(batch_size=1, embed_concurrency=1, max_in_flight=1)
+        with pytest.raises(RuntimeError, match="rate limited"):
+            await pipeline.run(chunks(), str, embed, _record, ListWriter())
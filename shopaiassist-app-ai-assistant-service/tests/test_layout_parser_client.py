@@ -0,0 +1,91 @@
+import json
+
+import httpx
+import pytest
+
+from src.skills_backend.document_qa.layout_parser_client import LayoutParserClient, LayoutParserError
+
+BLOCKS = [
+    {"tag": "header", "level": 0, "page_idx": 0, "block_idx": 0, "sentences": ["Filing instructions"]},
+    {"tag": "para", "level": 1, "page_idx": 0, "block_idx": 1, "sentences": ["File the return by April 15."]},
+]
+ANSWER = json.dumps({"return_dict": {"result": {"blocks": BLOCKS}}}).encode()
+
+
+def _client(handler, **kwargs) -> LayoutParserClient:
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return LayoutParserClient("http://parser/pdf", http_client, backoff_seconds=0, **kwargs)
+
+
+def _pdf(tmp_path):
+    path = tmp_path / "return.pdf"
+    path.write_bytes(b"%PDF-1.4 content")
+    return str(path)
+
+
+class TestLayoutParserClient:
+    @pytest.mark.asyncio
+    async def test_builds_doc_tree(self, tmp_path):
+        """The file is posted as multipart and the answer is built into a document tree."""
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, content=ANSWER)
+
+        doc_tree = await _client(handler).get_doc_tree(_pdf(tmp_path), "return.pdf")
+
+        assert len(requests) == 1
+        assert b'filename="return.pdf"' in requests[0].content
+        assert b"%PDF-1.4 content" in requests[0].content
+        assert doc_tree.file_name == "return.pdf"
+        assert "File the return by April 15." in doc_tree.to_text()
+
+    @pytest.mark.asyncio
+    async def test_retries_transient_failures(self, tmp_path):
+        """Connection errors and 5xx answers are retried."""
+        answers = iter([httpx.ConnectError("refused"), httpx.Response(503), httpx.Response(200, content=ANSWER)])
+
+        def handler(request):
+            answer = next(answers)
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+
+        doc_tree = await _client(handler, max_retries=2).get_doc_tree(_pdf(tmp_path), "return.pdf")
+
+        assert doc_tree.file_name == "return.pdf"
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_retries(self, tmp_path):
+        """The error is raised once the retries are exhausted."""
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(429)
+
+        with pytest.raises(LayoutParserError, match="after 2 attempts"):
+            await _client(handler, max_retries=1).get_doc_tree(_pdf(tmp_path), "return.pdf")
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_does_not_retry_rejections(self, tmp_path):
+        """A 4xx answer other than 429 is not retried."""
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(400)
+
+        with pytest.raises(LayoutParserError, match="rejected"):
+            await _client(handler).get_doc_tree(_pdf(tmp_path), "return.pdf")
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_unreadable_answer(self, tmp_path):
+        """An answer without blocks is a parser error."""
+        client = _client(lambda request: httpx.Response(200, content=b'{"return_dict": {}}'))
+
+        with pytest.raises(LayoutParserError, match="Unreadable"):
+            await client.get_doc_tree(_pdf(tmp_path), "return.pdf")
@@ -0,0 +1,106 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.count_tokens import CountTokens
+from src.deployment_pool import Deployment, DeploymentPool
+from src.openai_utils import OpenaiUtils, deployment_settings, pack_embedding_batches
+from src.rate_governor import RateGovernor
+
+
+class WordEncoding:
+    """Encoding with one token per word."""
+
+    def encode_ordinary_batch(self, texts):
+        return [text.split() for text in texts]
+
+
+class FakeEmbeddings:
+    """Embeddings endpoint returning the input position as the vector, in reverse order."""
+
+    def __init__(self):
+        """Record the requests and their concurrency."""
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.with_raw_response = SimpleNamespace(create=self.create_raw)
+
+    async def create_raw(self, model, input):
+        response = await self.create(model, input)
+        return SimpleNamespace(headers={"x-ratelimit-remaining-tokens": "1000"}, parse=lambda: response)
+
+    async def create(self, model, input):
+        self.requests.append(list(input))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        data = [SimpleNamespace(index=i, embedding=[float(text.split()[0])]) for i, text in enumerate(input)]
+        return SimpleNamespace(data=list(reversed(data)))
+
+
+@pytest.fixture
+def openai_utils():
+    utils = OpenaiUtils.__new__(OpenaiUtils)
+    utils.config = {"document_qa": {"embedding_batch": {"max_inputs": 4, "max_tokens": 10, "max_concurrency": 2}}}
+    utils.ct = CountTokens(encoding=WordEncoding())
+    pool = DeploymentPool("embedding", [Deployment("primary", SimpleNamespace(embeddings=FakeEmbeddings()))])
+    utils.embedding_credentials = SimpleNamespace(value=(None, pool))
+    utils.rate_governor = RateGovernor()
+    return utils
+
+
+class TestPackEmbeddingBatches:
+    def test_limits(self):
+        """Batches respect the input count and token limits."""
+        assert pack_embedding_batches([1] * 5, max_inputs=2, max_tokens=100) == [(0, 2), (2, 4), (4, 5)]
+        assert pack_embedding_batches([4, 4, 4, 1], max_inputs=10, max_tokens=8) == [(0, 2), (2, 4)]
+
+    def test_oversized_text_and_empty_input(self):
+        """A text above the token limit gets its own batch, no texts give no batches."""
+        assert pack_embedding_batches([2, 20, 2], max_inputs=10, max_tokens=8) == [(0, 1), (1, 2), (2, 3)]
+        assert pack_embedding_batches([], max_inputs=10, max_tokens=8) == []
+
+
+class TestGetEmbeddings:
+    @pytest.mark.asyncio
+    async def test_batched_in_order(self, openai_utils):
+        """Texts are embedded with few, bounded concurrent requests and returned in order."""
+        texts = [f"{i} word word" for i in range(10)]
+
+        embeddings = await openai_utils.get_embeddings(texts)
+
+        fake = openai_utils.openai_embedding_client.embeddings
+        assert embeddings == [[float(i)] for i in range(10)]
+        assert [len(request) for request in fake.requests] == [3, 3, 3, 1]
+        assert fake.max_in_flight == 2
+
+
+class TestDeploymentSettings:
+    def test_single_endpoint(self):
+        """Secrets without a list of deployments describe a single deployment."""
+        secret = {"api_key": "k", "api_version": "v", "embedding_model_endpoint": "https://a"}
+
+        assert deployment_settings(secret, "embedding_model_endpoint", "embedding_model_deployments") == [
+            {"name": "primary", "endpoint": "https://a", "api_key": "k", "api_version": "v"}
+        ]
+
+    def test_listed_deployments(self):
+        """Listed deployments inherit the API key and version of the secret unless they give their own."""
+        secret = {
+            "api_key": "k",
+            "api_version": "v",
+            "embedding_model_endpoint": "https://a",
+            "embedding_model_deployments": [
+                {"name": "east", "endpoint": "https://east"},
+                {"name": "west", "endpoint": "https://west", "api_key": "w"},
+            ],
+        }
+
+        deployments = deployment_settings(secret, "embedding_model_endpoint", "embedding_model_deployments")
+
+        assert [(d["name"], d["endpoint"], d["api_key"]) for d in deployments] == [
+            ("east", "https://east", "k"),
+            ("west", "https://west", "w"),
+        ]
@@ -0,0 +1,80 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from loguru import logger
+
+from src.models import Authentication
+from src.skills_backend.product_support.stream_timings import StreamTimings
+
+product_support = pytest.importorskip("src.skills_backend.product_support.product_support", exc_type=ImportError)
+
+
+@pytest.fixture
+def log_messages():
+    """Collect the messages logged during a test."""
+    messages = []
+    sink = logger.add(lambda message: messages.append(str(message)), level="WARNING")
+    yield messages
+    logger.remove(sink)
+
+
+def _stream(chat_mngmt):
+    user_message_req = SimpleNamespace(
+        user_message=SimpleNamespace(message="How do I file?", document_id=None, search_scope=None),
+        chat_history=[],
+    )
+    return product_support._product_support_stream(
+        SimpleNamespace(id="chat-1", name="Chat"),
+        user_message_req,
+        [],
+        Authentication(tenant_id="tenant-a"),
+        {"ml_api": {"onesource_product_support_url": "http://upstream"}},
+        chat_mngmt,
+        "query-id",
+        "response-id",
+        StreamTimings(),
+    )
+
+
+class TestProductSupportStream:
+    @pytest.mark.asyncio
+    async def test_persist_failure_logged_when_token_fetch_fails(self, monkeypatch, log_messages):
+        """A failed user message write is logged when the stream fails before awaiting it."""
+
+        async def failing_write(*args):
+            raise RuntimeError("database down")
+
+        async def failing_token(config):
+            await asyncio.sleep(0)
+            raise RuntimeError("token service down")
+
+        monkeypatch.setattr(product_support, "get_onesource_bearer_token", failing_token)
+        chat_mngmt = MagicMock()
+        chat_mngmt.log_product_support_query = failing_write
+        stream = _stream(chat_mngmt)
+
+        await stream.__anext__()
+        with pytest.raises(RuntimeError, match="token service down"):
+            await stream.__anext__()
+
+        assert any("Failed to persist user message query-id: database down" in message for message in log_messages)
+
+    @pytest.mark.asyncio
+    async def test_disconnect_waits_for_persist(self):
+        """A client disconnecting after the echo does not leave the user message write behind."""
+        written = asyncio.Event()
+
+        async def write(*args):
+            await asyncio.sleep(0.01)
+            written.set()
+
+        chat_mngmt = MagicMock()
+        chat_mngmt.log_product_support_query = write
+        stream = _stream(chat_mngmt)
+
+        await stream.__anext__()
+        await stream.aclose()
+
+        assert written.is_set()
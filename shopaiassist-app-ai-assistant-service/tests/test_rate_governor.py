@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import pytest
+
+from src.rate_governor import Priority, RateGovernor, TokenBucket
+
+
+class TestTokenBucket:
+    def test_delay_and_refill(self):
+        """Taking from the bucket makes the next caller wait for the refill, never longer than a full bucket."""
+        bucket = TokenBucket(per_minute=60)
+        now = bucket.updated
+
+        assert bucket.delay(60, now) == 0
+        bucket.take(60, now)
+        assert bucket.delay(30, now) == pytest.approx(30)
+        assert bucket.delay(30, now + 10) == pytest.approx(20)
+        assert bucket.delay(600, now + 10) == pytest.approx(50)
+
+    def test_unlimited(self):
+        """A bucket without capacity never waits."""
+        bucket = TokenBucket(per_minute=None)
+        bucket.take(10**9, bucket.updated)
+
+        assert bucket.delay(10**9, bucket.updated) == 0
+
+
+class TestRateGovernor:
+    def test_from_config(self):
+        """Per-deployment settings override the defaults."""
+        governor = RateGovernor.from_config(
+            {"openai_rate_limits": {"rpm": 10, "tpm": 1000, "deployments": {"ada": {"tpm": 5000}}}}
+        )
+
+        assert governor._deployment("ada").tokens.per_minute == 5000
+        assert governor._deployment("ada").requests.per_minute == 10
+        assert governor._deployment("gpt-4").tokens.per_minute == 1000
+
+    @pytest.mark.asyncio
+    async def test_interactive_before_bulk(self):
+        """Waiting interactive requests are served before bulk requests that queued earlier."""
+        governor = RateGovernor(default_rpm=600)
+        await governor.acquire("gpt-4", 1)
+        governor._deployment("gpt-4").requests.lower_to(0)
+        order = []
+
+        async def request(name, priority):
+            await governor.acquire("gpt-4", 1, priority)
+            order.append(name)
+
+        bulk = [asyncio.create_task(request(f"bulk-{i}", Priority.BULK)) for i in range(2)]
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(request("interactive", Priority.INTERACTIVE))
+        await asyncio.wait_for(asyncio.gather(*bulk, interactive), timeout=5)
+
+        assert order == ["interactive", "bulk-0", "bulk-1"]
+
+    @pytest.mark.asyncio
+    async def test_adapts_to_headers(self):
+        """Limit headers size the buckets, remaining headers lower them and a 429 pauses the deployment."""
+        governor = RateGovernor()
+        governor.update_from_headers(
+            "gpt-4",
+            {
+                "x-ratelimit-limit-tokens": "6000",
+                "x-ratelimit-remaining-tokens": "100",
+                "x-ratelimit-remaining-requests": "5",
+            },
+        )
+        state = governor._deployment("gpt-4")
+
+        assert state.tokens.per_minute == 6000
+        assert state.tokens.level == pytest.approx(100, abs=1)
+        # Without a limit header or a configured limit, what is left is not taken as the capacity
+        assert state.requests.per_minute is None
+
+        governor.update_from_headers("gpt-4", {"retry-after-ms": "100"}, throttled=True)
+        started = time.monotonic()
+        await governor.acquire("gpt-4", 1)
+
+        assert time.monotonic() - started >= 0.09
+
+    def test_remaining_headers_never_shrink_capacity(self):
+        """Remaining headers lower the level of a bucket, its capacity stays that of the limit and it refills."""
+        governor = RateGovernor(default_rpm=600)
+        for remaining in ("5", "3", "1"):
+            governor.update_from_headers("gpt-4", {"x-ratelimit-remaining-requests": remaining})
+        requests = governor._deployment("gpt-4").requests
+
+        assert requests.per_minute == 600
+        assert requests.level == pytest.approx(1, abs=1)
+        assert requests.delay(1, requests.updated + 1) == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_leaves_queue(self):
+        """A cancelled caller does not block the callers behind it."""
+        governor = RateGovernor()
+        governor.update_from_headers("ada", {"retry-after": "0.1"}, throttled=True)
+        waiter = asyncio.create_task(governor.acquire("ada", 1))
+        await asyncio.sleep(0)
+        waiter.cancel()
+
+        await asyncio.wait_for(governor.acquire("ada", 1), timeout=1)
+
+        assert governor._deployment("ada").waiters == []
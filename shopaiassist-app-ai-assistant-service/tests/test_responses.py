@@ -0,0 +1,56 @@
+import json
+
+from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from src.models import AIMessage, Chat, ChatMetadata, HumanMessage
+from src.responses import FastJSONResponse
+
+
+class TestFastJSONResponse:
+    def test_models_render_like_the_default_response(self):
+        """Models rendered directly give the same document as FastAPI's dump and JSONResponse."""
+        chat = Chat(
+            id="chat",
+            messages=[
+                HumanMessage(id="q", message="Pourquoi l'import échoue ?"),
+                AIMessage(id="a", message="## message\nAnswer", metadata={"retrieved_urls": [], "open_ticket": None}),
+            ],
+        )
+
+        fast = FastJSONResponse({"chat": chat})
+        default = JSONResponse({"chat": chat.model_dump(mode="json")})
+
+        assert json.loads(fast.body) == json.loads(default.body)
+        assert fast.headers["content-type"] == "application/json"
+
+    def test_plain_data_and_headers(self):
+        """Plain data is rendered compactly and headers are kept."""
+        response = FastJSONResponse([ChatMetadata(id="1"), {"code": 200}], headers={"ETag": '"abc"'})
+
+        assert response.body.startswith(b'[{"id":"1"')
+        assert response.body.endswith(b',{"code":200}]')
+        assert response.headers["etag"] == '"abc"'
+
+
+class TestCompression:
+    def test_event_streams_are_not_compressed(self):
+        """The GZip middleware compresses JSON responses but leaves server-sent event streams as they are."""
+        app = FastAPI()
+        app.add_middleware(GZipMiddleware, minimum_size=10)
+
+        @app.get("/json")
+        def json_route():
+            return FastJSONResponse({"message": "x" * 100})
+
+        @app.get("/stream")
+        def stream_route():
+            return StreamingResponse(iter([b"data: " + b"x" * 100 + b"\n\n"]), media_type="text/event-stream")
+
+        client = TestClient(app)
+        assert client.get("/json", headers={"Accept-Encoding": "gzip"}).headers["content-encoding"] == "gzip"
+        stream = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in stream.headers
+        assert stream.text.startswith("data: x")
@@ -0,0 +1,54 @@
+import hashlib
+import os
+from io import BytesIO
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from src.skills_backend.document_qa.spooled_upload import spool_upload
+
+
+def _upload(content: bytes, filename: str = "form.xml") -> UploadFile:
+    return UploadFile(BytesIO(content), filename=filename)
+
+
+class TestSpoolUpload:
+    @pytest.mark.asyncio
+    async def test_spools_content_and_hash(self, tmp_path):
+        """The upload is written once with its size and hash, read in several chunks."""
+        content = b"<Form>" + b"x" * 5000 + b"</Form>"
+        upload = await spool_upload(_upload(content), max_bytes=10000, directory=str(tmp_path), chunk_size=1024)
+
+        assert upload.size == len(content)
+        assert upload.sha256 == hashlib.sha256(content).hexdigest()
+        assert upload.extension == ".xml"
+        assert upload.path.endswith(".xml")
+        assert upload.read_bytes() == content
+
+    @pytest.mark.asyncio
+    async def test_close_deletes_the_file(self, tmp_path):
+        """Closing the spooled upload deletes its temp file."""
+        with await spool_upload(_upload(b"data"), max_bytes=100, directory=str(tmp_path)) as upload:
+            assert os.path.exists(upload.path)
+        assert not os.path.exists(upload.path)
+        upload.close()
+
+    @pytest.mark.asyncio
+    async def test_too_large(self, tmp_path):
+        """An upload over the limit is rejected with a 413 and leaves no temp file."""
+        with pytest.raises(HTTPException) as error:
+            await spool_upload(_upload(b"x" * 2048), max_bytes=1000, directory=str(tmp_path), chunk_size=512)
+
+        assert error.value.status_code == 413
+        assert os.listdir(tmp_path) == []
+
+    @pytest.mark.asyncio
+    async def test_reads_from_the_start(self, tmp_path):
+        """An upload already read by someone else is spooled from its beginning."""
+        file = _upload(b"content", filename="manual.PDF")
+        await file.read()
+        upload = await spool_upload(file, max_bytes=100, directory=str(tmp_path))
+
+        assert upload.read_bytes() == b"content"
+        assert upload.extension == ".pdf"
+        upload.close()
@@ -0,0 +1,142 @@
+import asyncio
+import pytest
+
+from src.skills_backend.product_support.stream_registry import StreamRegistry
+
+
+async def make_source(lines, gate=None):
+    for i, line in enumerate(lines):
+        if gate is not None and i == len(lines) // 2:
+            await gate.wait()
+        yield line
+
+
+async def _collect(events):
+    return [event["data"] async for event in events]
+
+
+class TestStreamRegistry:
+    @pytest.mark.asyncio
+    async def test_follow_streams_all_events_with_ids(self):
+        """A new reader receives every event in order, with consecutive ids."""
+        registry = StreamRegistry()
+        stream = registry.start("resp-1", "chat-1", "user-1", make_source(["a", "b", "c"]))
+
+        events = [event async for event in stream.follow()]
+
+        assert events == [{"id": "0", "data": "a"}, {"id": "1", "data": "b"}, {"id": "2", "data": "c"}]
+
+    @pytest.mark.asyncio
+    async def test_resume_replays_after_last_event_id_then_tails(self):
+        """A reconnecting reader gets the missed events and then the rest of the live stream."""
+        registry = StreamRegistry()
+        gate = asyncio.Event()
+        stream = registry.start("resp-1", "chat-1", "user-1", make_source(["a", "b", "c", "d"], gate))
+
+        first = stream.follow()
+        assert (await first.__anext__())["data"] == "a"
+        await first.aclose()  # the client connection drops
+
+        await asyncio.sleep(0)
+        resumed = stream.follow(last_event_id=0)
+        assert (await resumed.__anext__())["data"] == "b"
+        gate.set()
+        rest = [event["data"] async for event in resumed]
+
+        assert rest == ["c", "d"]
+
+    @pytest.mark.asyncio
+    async def test_producer_finishes_without_readers(self):
+        """The answer keeps being produced while no client is connected."""
+        registry = StreamRegistry()
+        stream = registry.start("resp-1", "chat-1", "user-1", make_source(["a", "b"]))
+
+        await stream.task
+
+        assert stream.finished
+        assert [event["data"] async for event in stream.follow(last_event_id=0)] == ["b"]
+
+    @pytest.mark.asyncio
+    async def test_ring_buffer_and_ttl_eviction(self):
+        """Buffers keep only the latest events and finished streams expire after the TTL."""
+        registry = StreamRegistry(max_events=2, ttl_seconds=0)
+        stream = registry.start("resp-1", "chat-1", "user-1", make_source(["a", "b", "c"]))
+        await stream.task
+
+        assert [event["id"] async for event in stream.follow()] == ["1", "2"]
+
+        await asyncio.sleep(0.01)
+        assert registry.get("resp-1") is None
+        assert len(registry) == 0
+
+    @pytest.mark.asyncio
+    async def test_producer_error_ends_stream_with_message(self):
+        """A failing producer ends the stream with an error message instead of hanging readers."""
+
+        async def failing_source():
+            yield "a"
+            raise RuntimeError("upstream closed")
+
+        registry = StreamRegistry()
+        stream = registry.start("resp-1", "chat-1", "user-1", failing_source())
+
+        events = [event["data"] async for event in stream.follow()]
+
+        assert events[0] == "a"
+        assert "something went wrong" in events[1]
+
+    @pytest.mark.asyncio
+    async def test_unread_producer_is_cancelled(self):
+        """A producer nobody reads for the TTL is cancelled by the eviction timer, closing its source."""
+        closed = asyncio.Event()
+
+        async def endless_source():
+            try:
+                yield "a"
+                await asyncio.Event().wait()
+            finally:
+                closed.set()
+
+        registry = StreamRegistry(ttl_seconds=0.05, sweep_interval_seconds=0.01)
+        stream = registry.start("resp-1", "chat-1", "user-1", endless_source())
+
+        await asyncio.wait_for(closed.wait(), timeout=1)
+        await asyncio.sleep(0.1)
+
+        assert stream.finished
+        assert registry.get("resp-1") is None
+
+    @pytest.mark.asyncio
+    async def test_read_producer_keeps_running(self):
+        """A producer with a reader is not cancelled, however long it runs."""
+        gate = asyncio.Event()
+        registry = StreamRegistry(ttl_seconds=0.02, sweep_interval_seconds=0.01)
+        stream = registry.start("resp-1", "chat-1", "user-1", make_source(["a", "b"], gate))
+        reader = asyncio.ensure_future(_collect(stream.follow()))
+
+        await asyncio.sleep(0.1)
+        assert not stream.finished
+        gate.set()
+
+        assert await asyncio.wait_for(reader, timeout=1) == ["a", "b"]
+
+    @pytest.mark.asyncio
+    async def test_stop_cancels_live_producers(self):
+        """Stopping the registry cancels the producers still running and waits for them."""
+        closed = asyncio.Event()
+
+        async def endless_source():
+            try:
+                yield "a"
+                await asyncio.Event().wait()
+            finally:
+                closed.set()
+
+        registry = StreamRegistry()
+        stream = registry.start("resp-1", "chat-1", "user-1", endless_source())
+        await asyncio.sleep(0)
+
+        await asyncio.wait_for(registry.stop(), timeout=1)
+
+        assert closed.is_set()
+        assert stream.task.done() and stream.finished
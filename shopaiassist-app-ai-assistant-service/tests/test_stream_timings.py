@@ -0,0 +1,67 @@
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from src.skills_backend.product_support.stream_timings import RequestStartMiddleware, StreamTimings
+
+
+class TestStreamTimings:
+    def test_phases_accumulate(self):
+        """Time spent in the same phase is added up."""
+        timings = StreamTimings("tenant-a", 1)
+
+        timings.add("bearer_token", 0.5)
+        timings.add("bearer_token", 0.25)
+        with timings.phase("final_logging"):
+            pass
+
+        summary = timings.summary()
+        assert summary["phases"]["bearer_token"] == 0.75
+        assert "final_logging" in summary["phases"]
+
+    def test_fragments_ttft_and_gap_percentiles(self):
+        """Fragments give the time to first token, sizes and gap percentiles."""
+        timings = StreamTimings("tenant-a", 1, started=time.monotonic() - 2)
+
+        timings.record_fragment("ab")
+        for gap in [0.1, 0.2, 0.3, 0.4]:
+            timings.last_fragment_at -= gap
+            timings.record_fragment("é")
+
+        summary = timings.summary()
+        assert summary["ttft"] >= 2
+        assert summary["fragments"] == 5
+        assert summary["bytes"] == 2 + 4 * 2
+        assert round(summary["gap_p50"], 1) == 0.2
+        assert round(summary["gap_p99"], 1) == 0.4
+
+    def test_observe_exports_histograms_once(self):
+        """Observing exports the stream to the labelled histograms exactly once."""
+        labels = {"tenant_id": "tenant-observe", "org_id": "2"}
+        timings = StreamTimings("tenant-observe", 2)
+        timings.add("admission", 0.1)
+        timings.record_fragment("x")
+
+        timings.observe()
+        timings.observe()
+
+        assert REGISTRY.get_sample_value("product_support_stream_fragments_count", labels) == 1
+        assert (
+            REGISTRY.get_sample_value("product_support_stream_phase_seconds_count", {"phase": "admission", **labels})
+            == 1
+        )
+
+    def test_request_start_middleware(self):
+        """The middleware exposes the request receive time to handlers."""
+        app = FastAPI()
+        app.add_middleware(RequestStartMiddleware)
+
+        @app.get("/")
+        async def handler(request: Request):
+            return {"elapsed": time.monotonic() - request.state.received_at}
+
+        response = TestClient(app).get("/")
+
+        assert 0 <= response.json()["elapsed"] < 1
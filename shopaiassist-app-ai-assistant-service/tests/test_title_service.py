@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from src.models import ChatMessage
+from src.skills_backend.chat_summarization.title_service import TitleGenerationService, provisional_title
+
+
+def _history(text):
+    return [ChatMessage(role="user", content=text), ChatMessage(role="assistant", content="answer")]
+
+
+class TitleBackend:
+    """Title generator and store recording their calls, the generation waits for `release`."""
+
+    def __init__(self, title="Generated title"):
+        """Record nothing yet."""
+        self.title = title
+        self.generated = []
+        self.stored = []
+        self.running = 0
+        self.max_running = 0
+        self.release = asyncio.Event()
+
+    async def generate(self, chat_history):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await self.release.wait()
+        self.running -= 1
+        self.generated.append(chat_history[0].content)
+        return self.title
+
+    async def store(self, chat_id, title, auth):
+        self.stored.append((chat_id, title))
+
+
+class TestProvisionalTitle:
+    def test_first_user_words(self):
+        """The provisional title is made of the first words of the first user message."""
+        assert provisional_title(_history("How do I   file\nform 1040?")) == "How do I file form 1040?"
+        assert provisional_title(_history("one two three four five six seven eight nine")) == (
+            "one two three four five six seven eight..."
+        )
+        assert provisional_title([ChatMessage(role="assistant", content="hi")]) == "New chat"
+
+
+class TestTitleGenerationService:
+    @pytest.mark.asyncio
+    async def test_returns_provisional_then_final_title(self):
+        """Submitting returns the provisional title at once, the final title is stored by a worker."""
+        backend = TitleBackend()
+        service = TitleGenerationService(backend.generate, backend.store)
+        service.start()
+
+        job = service.submit("chat", _history("Where is my refund"), auth=None)
+        assert (job.name, job.status) == ("Where is my refund", "pending")
+
+        backend.release.set()
+        job = await service.wait("chat", timeout=1)
+        await service.stop()
+
+        assert (job.name, job.status) == ("Generated title", "ready")
+        assert backend.stored == [("chat", "Generated title")]
+
+    @pytest.mark.asyncio
+    async def test_deduplicates_and_caps_concurrency(self):
+        """Requests for a chat waiting for its title are merged, and at most max_concurrency titles run at once."""
+        backend = TitleBackend()
+        service = TitleGenerationService(backend.generate, backend.store, max_concurrency=2)
+
+        first = service.submit("a", _history("first"), auth=None)
+        assert service.submit("a", _history("second"), auth=None) is first
+        for chat_id in ("b", "c", "d"):
+            service.submit(chat_id, _history(chat_id), auth=None)
+        service.start()
+        await asyncio.sleep(0.01)
+        assert backend.max_running == 2
+
+        backend.release.set()
+        for chat_id in ("a", "b", "c", "d"):
+            await service.wait(chat_id, timeout=1)
+        await service.stop()
+
+        assert sorted(backend.generated) == ["b", "c", "d", "second"]
+
+    @pytest.mark.asyncio
+    async def test_failure_keeps_provisional_title(self):
+        """When no title can be generated the provisional title is stored."""
+        backend = TitleBackend(title="")
+        backend.release.set()
+        service = TitleGenerationService(backend.generate, backend.store)
+        service.start()
+
+        service.submit("chat", _history("Payroll export fails"), auth=None)
+        job = await service.wait("chat", timeout=1)
+        await service.stop()
+
+        assert job.status == "failed"
+        assert backend.stored == [("chat", "Payroll export fails")]
@@ -1,4 +1,11 @@
-from src.utils import ttl_cache, is_string_blank, get_salesforce_products_in_env, get_dict_which_has_value
+from src.utils import (
+    ttl_cache,
+    is_string_blank,
+    get_salesforce_products_in_env,
+    get_dict_which_has_value,
+    make_etag,
+    etag_matches,
+)
 
 
 @ttl_cache(ttl=1)
@@ -56,3 +63,19 @@ def test_get_dict_which_has_value():
     assert get_dict_which_has_value(dictionary, "age", 35) == dictionary["key3"]
     assert get_dict_which_has_value(dictionary, "name", "Alice") is None
     assert get_dict_which_has_value(dictionary, "age", 40) is None
+
+
+def test_make_etag():
+    etag = make_etag("chat", "1", "2024-01-01T00:00:00Z", 3)
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == make_etag("chat", "1", "2024-01-01T00:00:00Z", 3)
+    assert etag != make_etag("chat", "1", "2024-01-01T00:00:00Z", 4)
+
+
+def test_etag_matches():
+    etag = make_etag("chat", "1")
+    assert etag_matches(etag, etag) is True
+    assert etag_matches(f'"other", W/{etag}', etag) is True
+    assert etag_matches("*", etag) is True
+    assert etag_matches('"other"', etag) is False
+    assert etag_matches(None, etag) is False
@@ -0,0 +1,123 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from src.skills_backend.document_qa.chunk_store import ChunkStore, read_chunks
+from src.skills_backend.document_qa.vector_index import DocumentIndex, DocumentIndexCache
+from tests.test_chunk_store import FakeS3
+
+
+def _index(count: int = 100, dimension: int = 8, seed: int = 0) -> DocumentIndex:
+    embeddings = np.random.default_rng(seed).standard_normal((count, dimension))
+    return DocumentIndex(embeddings, [f"chunk {i}" for i in range(count)], [str(i) for i in range(count)])
+
+
+class TestDocumentIndex:
+    def test_top_k_by_cosine_similarity(self):
+        """The top chunks are those of highest cosine similarity, the most similar first."""
+        index = _index()
+        query = np.random.default_rng(1).standard_normal(8)
+        results = index.search(query, top_k=5)
+
+        matrix = index.matrix.astype(np.float64)
+        expected = np.argsort(-(matrix @ (query / np.linalg.norm(query))))[:5]
+        assert [result["chunk_id"] for result in results] == [str(i) for i in expected]
+        assert results[0]["score"] >= results[-1]["score"]
+        assert np.allclose(np.linalg.norm(index.matrix, axis=1), 1, atol=1e-6)
+
+    def test_top_k_larger_than_document(self):
+        """Asking for more chunks than the document has returns them all."""
+        index = _index(count=3)
+
+        assert len(index.search(np.ones(8), top_k=10)) == 3
+
+    def test_dimension_mismatch(self):
+        """A query of another dimension is rejected."""
+        with pytest.raises(ValueError, match="dimension 8"):
+            _index().search(np.ones(4))
+
+    def test_from_stored_chunks(self, tmp_path):
+        """The index of stored chunks keeps their texts and page ranges."""
+        s3 = FakeS3()
+        writer = ChunkStore(s3, "bucket").open("tenant", "user", "doc-1", "manual")
+        writer.write(
+            [
+                {"raw_text": "Filing", "chunk_id": "a", "start_page": 1, "end_page": 2, "open_ai_embeddings": [1, 0]},
+                {"raw_text": "Refunds", "chunk_id": "b", "start_page": 3, "end_page": 3, "open_ai_embeddings": [0, 1]},
+            ]
+        )
+        writer.close()
+        path = tmp_path / "doc-1_manual.arrow"
+        path.write_bytes(s3.objects["tenant_id=tenant/user_id=user/doc-1_manual.arrow"])
+
+        results = DocumentIndex.from_table(read_chunks(str(path))).search([0.1, 0.9], top_k=1)
+
+        assert [(result["chunk_id"], result["text"]) for result in results] == [("b", "Refunds")]
+        assert (results[0]["start_page"], results[0]["end_page"]) == (3, 3)
+        assert results[0]["score"] == pytest.approx(0.9939, abs=1e-4)
+
+
+class TestDocumentIndexCache:
+    @pytest.mark.asyncio
+    async def test_evicts_least_recently_used(self):
+        """Indexes are evicted least recently used first once over the budget."""
+        indexes = {key: _index(seed=seed) for seed, key in enumerate("abc")}
+        cache = DocumentIndexCache(memory_max_bytes=2 * indexes["a"].nbytes)
+
+        def loader(key):
+            async def load():
+                return indexes[key]
+
+            return load
+
+        for key in "abac":
+            await cache.get(key, loader(key))
+
+        assert list(cache._indexes) == ["a", "c"]
+        assert cache.memory_bytes == 2 * indexes["a"].nbytes
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_load_once(self):
+        """Concurrent searches of a document missing from the cache share one load."""
+        loads = []
+
+        async def load():
+            loads.append(1)
+            await asyncio.sleep(0.01)
+            return _index()
+
+        cache = DocumentIndexCache()
+        results = await asyncio.gather(*(cache.get("a", load) for _ in range(3)))
+
+        assert len(loads) == 1
+        assert results[0] is results[1] is results[2]
+
+    @pytest.mark.asyncio
+    async def test_discard_while_loading(self):
+        """A document discarded while its index loads is not cached."""
+        cache = DocumentIndexCache()
+        release = asyncio.Event()
+
+        async def load():
+            await release.wait()
+            return _index()
+
+        search = asyncio.ensure_future(cache.get("a", load))
+        await asyncio.sleep(0)
+        cache.discard("a")
+        release.set()
+        await search
+
+        assert "a" not in cache._indexes and cache.memory_bytes == 0
+
+    @pytest.mark.asyncio
+    async def test_index_over_budget_is_not_cached(self):
+        """An index larger than the budget is returned but not kept."""
+        cache = DocumentIndexCache(memory_max_bytes=10)
+
+        async def load():
+            return _index()
+
+        assert len(await cache.get("a", load)) == 100
+        assert cache._indexes == {}